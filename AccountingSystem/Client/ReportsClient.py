@@ -38,6 +38,10 @@ class ReportsClient:
       del( result[ 'rpcStub' ] )
     return result
 
+  def getCacheStats( self ):
+    rpcClient = self.__getRPCClient()
+    return rpcClient.getCacheStats()
+
   def getReport( self, typeName, reportName, startTime, endTime, condDict, grouping, extraArgs = None ):
     rpcClient = self.__getRPCClient()
     if type( extraArgs ) != types.DictType:
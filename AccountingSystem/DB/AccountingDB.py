@@ -13,6 +13,8 @@ from DIRAC.AccountingSystem.private.TypeLoader import TypeLoader
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 
 gSynchro = ThreadSafe.Synchronizer()
+#Rollup tables that can be enabled with the Rollups option, and the bucket length of their rows
+gRollupLengths = { 'Daily' : 86400, 'Weekly' : 604800 }
 
 class AccountingDB( DB ):
 
@@ -43,6 +45,16 @@ class AccountingDB( DB ):
                                            }
                         }
                       )
+    self.compactionTableName = _getTableName( "catalog", "Compaction" )
+    if not self.__readOnly:
+      self._createTables( { self.compactionTableName : { 'Fields' : { 'name' : "VARCHAR(64) NOT NULL",
+                                                                      'bucketLength' : "INT UNSIGNED NOT NULL",
+                                                                      'startTime' : "INT UNSIGNED NOT NULL"
+                                                                    },
+                                                         'PrimaryKey' : [ 'name', 'bucketLength' ]
+                                                       }
+                          }
+                        )
     self.__loadCatalogFromDB()
     gMonitor.registerActivity( "registeradded",
                                "Register added",
@@ -244,7 +256,8 @@ class AccountingDB( DB ):
     """
     self.log.verbose( "Adding to catalog type %s" % typeName, "with length %s" % str( bucketsLength ) )
     self.dbCatalog[ typeName ] = { 'keys' : keyFields , 'values' : valueFields,
-                                   'typeFields' : [], 'bucketFields' : [], 'dataTimespan' : 0 }
+                                   'typeFields' : [], 'bucketFields' : [], 'dataTimespan' : 0, 'rollups' : [],
+                                   'disabledRollups' : [] }
     self.dbCatalog[ typeName ][ 'typeFields' ].extend( keyFields )
     self.dbCatalog[ typeName ][ 'typeFields' ].extend( valueFields )
     self.dbCatalog[ typeName ][ 'bucketFields' ] = list( self.dbCatalog[ typeName ][ 'typeFields' ] )
@@ -371,6 +384,9 @@ class AccountingDB( DB ):
           pass
       else:
         self.log.notice( "ReadOnly mode: %s is OK" % name )
+      if name in self.dbCatalog:
+        self.dbCatalog[ name ][ 'rollups' ] = [ rollupName for rollupName in self.__getEnabledRollups()
+                                                if _getTableName( "rollup", name, rollupName ) in tablesInThere ]
       return S_OK( not updateDBCatalog )
 
     if tables:
@@ -385,9 +401,114 @@ class AccountingDB( DB ):
                          [ 'name', 'keyFields', 'valueFields', 'bucketsLength' ],
                          [ name, ",".join( keyFieldsList ), ",".join( valueFieldsList ), bucketsEncoding ] )
       self.__addToCatalog( name, keyFieldsList, valueFieldsList, bucketsLength )
+    retVal = self.__checkRollups( name, tablesInThere, bucketFieldsDict, uniqueIndexFields )
+    if not retVal[ 'OK' ]:
+      self.log.error( "Can't create rollups", "for type %s: %s" % ( name, retVal[ 'Message' ] ) )
     self.log.info( "Registered type %s" % name )
     return S_OK( True )
 
+  def __getEnabledRollups( self ):
+    """
+    Get the rollups enabled with the Rollups option
+    """
+    rollups = []
+    for rollupName in self.getCSOption( "Rollups", [] ):
+      if rollupName not in gRollupLengths:
+        self.log.warn( "Unknown rollup", "%s, valid ones are %s" % ( rollupName, ", ".join( gRollupLengths ) ) )
+        continue
+      rollups.append( rollupName )
+    return rollups
+
+  def __checkRollups( self, typeName, tablesInThere, rollupFieldsDict, uniqueIndexFields ):
+    """
+    Create and fill the enabled rollup tables of a type that do not exist yet. The tables of the
+    disabled rollups are left alone, but they are no longer kept in step with the buckets: they
+    have to be dropped with dropDisabledRollups before the rollups are enabled again
+    """
+    enabledRollups = self.__getEnabledRollups()
+    self.dbCatalog[ typeName ][ 'rollups' ] = []
+    self.dbCatalog[ typeName ][ 'disabledRollups' ] = []
+    for rollupName in sorted( gRollupLengths ):
+      tableName = _getTableName( "rollup", typeName, rollupName )
+      if rollupName not in enabledRollups:
+        if tableName in tablesInThere:
+          self.log.warn( "Table of disabled rollup is no longer updated",
+                         "%s, drop it with dropDisabledRollups before enabling the rollup again" % tableName )
+          self.dbCatalog[ typeName ][ 'disabledRollups' ].append( rollupName )
+        continue
+      if tableName not in tablesInThere:
+        retVal = self._createTables( { tableName : { 'Fields' : rollupFieldsDict,
+                                                     'UniqueIndexes' : { 'UniqueConstraint' : uniqueIndexFields } } } )
+        if not retVal[ 'OK' ]:
+          return retVal
+        retVal = self.__fillRollup( typeName, rollupName )
+        if not retVal[ 'OK' ]:
+          self._update( "DROP TABLE `%s`" % tableName )
+          return retVal
+      self.dbCatalog[ typeName ][ 'rollups' ].append( rollupName )
+    return S_OK()
+
+  @gSynchro
+  def dropDisabledRollups( self, typeName ):
+    """
+    Drop the tables of the disabled rollups of a type
+    """
+    if self.__readOnly:
+      return S_ERROR( "ReadOnly mode enabled. No modification allowed" )
+    if typeName not in self.dbCatalog:
+      return S_ERROR( "Type %s does not exist" % typeName )
+    while self.dbCatalog[ typeName ][ 'disabledRollups' ]:
+      tableName = _getTableName( "rollup", typeName, self.dbCatalog[ typeName ][ 'disabledRollups' ][0] )
+      self.log.info( "Dropping table of disabled rollup", tableName )
+      retVal = self._update( "DROP TABLE `%s`" % tableName )
+      if not retVal[ 'OK' ]:
+        return retVal
+      self.dbCatalog[ typeName ][ 'disabledRollups' ].pop( 0 )
+    return S_OK()
+
+  def __fillRollup( self, typeName, rollupName, connObj = False, sqlCond = False ):
+    """
+    Fill a rollup table from the buckets of the type, or from the buckets matching a condition
+    """
+    bucketTableName = _getTableName( "bucket", typeName )
+    rollupLength = gRollupLengths[ rollupName ]
+    keyFields = [ "`%s`" % field for field in self.dbCatalog[ typeName ][ 'keys' ] ]
+    sumFields = [ "`%s`" % field for field in self.dbCatalog[ typeName ][ 'values' ] + [ 'entriesInBucket' ] ]
+    sqlSelectList = [ "IF( `bucketLength` < %d, %s, `startTime` )" % ( rollupLength,
+                                                                       _bucketizeDataField( "`startTime`",
+                                                                                            rollupLength ) ),
+                      "GREATEST( `bucketLength`, %d )" % rollupLength ]
+    sqlSelectList.extend( keyFields )
+    sqlSelectList.extend( [ "SUM( %s )" % field for field in sumFields ] )
+    cmd = "INSERT INTO `%s` ( `startTime`, `bucketLength`, %s ) SELECT %s FROM `%s`" % (
+            _getTableName( "rollup", typeName, rollupName ),
+            ", ".join( keyFields + sumFields ),
+            ", ".join( sqlSelectList ),
+            bucketTableName )
+    if sqlCond:
+      cmd += " WHERE %s" % sqlCond
+    else:
+      self.log.info( "Filling rollup %s for type %s" % ( rollupName, typeName ) )
+    cmd += " GROUP BY %s" % ", ".join( [ "1", "2" ] + keyFields )
+    return self._update( cmd, conn = connObj )
+
+  def __rebuildRollupWindow( self, typeName, rollupName, startTime, windowLength, keyValues, connObj = False ):
+    """
+    Rebuild from the buckets the rows of a rollup for some key values in a window of time. The rows
+    built from buckets longer than the rollup length can not be updated in place
+    """
+    rollupTableName = _getTableName( "rollup", typeName, rollupName )
+    bucketTableName = _getTableName( "bucket", typeName )
+    sqlCond = {}
+    for tableName in ( rollupTableName, bucketTableName ):
+      sqlCond[ tableName ] = "`%s`.`startTime` >= %d AND `%s`.`startTime` < %d AND %s" % (
+                               tableName, startTime, tableName, startTime + windowLength,
+                               self.__generateSQLConditionForKeys( typeName, keyValues, tableName ) )
+    retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( rollupTableName, sqlCond[ rollupTableName ] ), conn = connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    return self.__fillRollup( typeName, rollupName, connObj = connObj, sqlCond = sqlCond[ bucketTableName ] )
+
   def getRegisteredTypes( self ):
     """
     Get list of registered types
@@ -458,6 +579,8 @@ class AccountingDB( DB ):
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "type", typeName ) )
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "bucket", typeName ) )
     tablesToDelete.insert( 0, "`%s`" % _getTableName( "in", typeName ) )
+    for rollupName in self.dbCatalog[ typeName ][ 'rollups' ] + self.dbCatalog[ typeName ][ 'disabledRollups' ]:
+      tablesToDelete.append( "`%s`" % _getTableName( "rollup", typeName, rollupName ) )
     retVal = self._query( "DROP TABLE %s" % ", ".join( tablesToDelete ) )
     if not retVal[ 'OK' ]:
       return retVal
@@ -575,18 +698,47 @@ class AccountingDB( DB ):
       return retVal
     return S_OK( retVal[ 'lastRowId' ] )
 
+  def __insertBundleInQueueTable( self, typeName, records ):
+    """
+    Insert records of a type in the in table with one multi-row INSERT per chunk
+    """
+    typeFields = self.dbCatalog[ typeName ][ 'typeFields' ]
+    sqlFields = ", ".join( [ "`%s`" % f for f in [ 'taken', 'takenSince' ] + typeFields ] )
+    sqlRows = []
+    for startTime, endTime, valuesList in records:
+      sqlValues = list( valuesList ) + [ startTime, endTime ]
+      if len( sqlValues ) != len( typeFields ):
+        return S_ERROR( "Fields mismatch for record %s. %s fields and %s expected" % ( typeName,
+                                                                                       len( sqlValues ),
+                                                                                       len( typeFields ) ) )
+      result = self._escapeValues( sqlValues )
+      if not result[ 'OK' ]:
+        return result
+      sqlRows.append( "( 0, UTC_TIMESTAMP(), %s )" % ", ".join( result[ 'Value' ] ) )
+    sqlTableName = _getTableName( "in", typeName )
+    for rowsChunk in List.breakListIntoChunks( sqlRows, self.getCSOption( "RecordsPerInsert", 1000 ) ):
+      result = self._update( "INSERT INTO `%s` ( %s ) VALUES %s" % ( sqlTableName, sqlFields, ", ".join( rowsChunk ) ) )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK( len( sqlRows ) )
+
   def insertRecordBundleThroughQueue( self, recordsToQueue ) :
+    """
+    Insert a bundle of records in the in tables to be really inserted afterwards
+    """
     if self.__readOnly:
       return S_ERROR( "ReadOnly mode enabled. No modification allowed" )
-    recordsToProcess = []
-    now = Time.toEpoch()
+    recordsByType = {}
     for record in recordsToQueue:
       typeName, startTime, endTime, valuesList = record
-      result = self.__insertInQueueTable( typeName, startTime, endTime, valuesList )
+      if not typeName in self.dbCatalog:
+        return S_ERROR( "Type %s has not been defined in the db" % typeName )
+      recordsByType.setdefault( typeName, [] ).append( ( startTime, endTime, valuesList ) )
+    for typeName in recordsByType:
+      self.log.info( "Adding records to queue", "%s for type %s" % ( len( recordsByType[ typeName ] ), typeName ) )
+      result = self.__insertBundleInQueueTable( typeName, recordsByType[ typeName ] )
       if not result[ 'OK' ]:
         return result
-      iD = result[ 'Value' ]
-      recordsToProcess.append( ( iD, typeName, startTime, endTime, valuesList, now ) )
 
     return S_OK()
 
@@ -600,7 +752,7 @@ class AccountingDB( DB ):
     if not typeName in self.dbCatalog:
       return S_ERROR( "Type %s has not been defined in the db" % typeName )
     result = self.__insertInQueueTable( typeName, startTime, endTime, valuesList )
-    if not result[ '0K' ]:
+    if not result[ 'OK' ]:
       return result
 
     return S_OK()
@@ -610,19 +762,115 @@ class AccountingDB( DB ):
     Do the real insert and delete from the in buffer table
     """
     self.log.verbose( "Received bundle to process", "of %s elements" % len( recordTuples ) )
+    recordsByType = {}
     for record in recordTuples:
-      iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
-      result = self.insertRecordDirectly( typeName, startTime, endTime, valuesList )
-      if not result[ 'OK' ]:
-        self._update( "UPDATE `%s` SET taken=0 WHERE id=%s" % ( _getTableName( "in", typeName ), iD ) )
-        self.log.error( "Can't insert row", result[ 'Message' ] )
+      recordsByType.setdefault( record[1], [] ).append( record )
+    insertedIDs = {}
+    failedIDs = {}
+    for typeName in recordsByType:
+      typeRecords = recordsByType[ typeName ]
+      result = self.__insertBundleDirectly( typeName, [ ( record[2], record[3], record[4] ) for record in typeRecords ] )
+      if result[ 'OK' ]:
+        for record in typeRecords:
+          insertedIDs.setdefault( typeName, [] ).append( str( record[0] ) )
+          gMonitor.addMark( "insertiontime", Time.toEpoch() - record[5] )
         continue
-      result = self._update( "DELETE FROM `%s` WHERE id=%s" % ( _getTableName( "in", typeName ), iD ) )
+      #Fall back to one record at a time to isolate the faulty ones
+      self.log.warn( "Can't insert bundle, inserting records one by one", result[ 'Message' ] )
+      for record in typeRecords:
+        iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
+        result = self.insertRecordDirectly( typeName, startTime, endTime, valuesList )
+        if not result[ 'OK' ]:
+          failedIDs.setdefault( typeName, [] ).append( str( iD ) )
+          self.log.error( "Can't insert row", result[ 'Message' ] )
+          continue
+        insertedIDs.setdefault( typeName, [] ).append( str( iD ) )
+        gMonitor.addMark( "insertiontime", Time.toEpoch() - insertionEpoch )
+    #Release the failed rows and remove the processed ones with one statement per type
+    for typeName in failedIDs:
+      result = self._update( "UPDATE `%s` SET taken=0 WHERE id in (%s)" % ( _getTableName( "in", typeName ),
+                                                                            ", ".join( failedIDs[ typeName ] ) ) )
+      if not result[ 'OK' ]:
+        self.log.error( "Can't release rows of the IN table", result[ 'Message' ] )
+    for typeName in insertedIDs:
+      result = self._update( "DELETE FROM `%s` WHERE id in (%s)" % ( _getTableName( "in", typeName ),
+                                                                     ", ".join( insertedIDs[ typeName ] ) ) )
       if not result[ 'OK' ]:
-        self.log.error( "Can't delete row from the IN table", result[ 'Message' ] )
-      gMonitor.addMark( "insertiontime", Time.toEpoch() - insertionEpoch )
+        self.log.error( "Can't delete rows from the IN table", result[ 'Message' ] )
 
 
+  def __insertBundleDirectly( self, typeName, records ):
+    """
+    Add a bundle of records of a type to the type contents. The bucket contributions
+    of all the records are merged in memory so each bucket row is written once
+    """
+    if self.__readOnly:
+      return S_ERROR( "ReadOnly mode enabled. No modification allowed" )
+    if not typeName in self.dbCatalog:
+      return S_ERROR( "Type %s has not been defined in the db" % typeName )
+    gMonitor.addMark( "registeradded", len( records ) )
+    gMonitor.addMark( "registeradded:%s" % typeName, len( records ) )
+    self.log.info( "Adding records", "%s for type %s" % ( len( records ), typeName ) )
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    numKeys = len( keyFields )
+    nowEpoch = int( Time.toEpoch( Time.dateTime() ) )
+    typeRows = []
+    bucketRows = []
+    for startTime, endTime, valuesList in records:
+      keyValues = []
+      for keyPos in range( numKeys ):
+        retVal = self.__addKeyValue( typeName, keyFields[ keyPos ], valuesList[ keyPos ] )
+        if not retVal[ 'OK' ]:
+          return retVal
+        keyValues.append( retVal[ 'Value' ] )
+      retVal = self._escapeValues( keyValues + list( valuesList[ numKeys: ] ) + [ startTime, endTime ] )
+      if not retVal[ 'OK' ]:
+        return retVal
+      typeRows.append( "( %s )" % ", ".join( retVal[ 'Value' ] ) )
+      #HACK: One more value to split in the buckets to be able to count total entries
+      values = [ float( value ) for value in valuesList[ numKeys: ] ] + [ 1.0 ]
+      for bStartTime, bProportion, bLength in self.calculateBuckets( typeName, startTime, endTime, nowEpoch ):
+        bucketRows.append( ( bStartTime, bLength, tuple( keyValues ), [ value * bProportion for value in values ] ) )
+    bucketRows = _mergeBucketRows( bucketRows )
+    self.log.verbose( "Merged bundle", "of %s records in %s buckets" % ( len( records ), len( bucketRows ) ) )
+
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return retVal
+    connObj = retVal[ 'Value' ]
+    try:
+      #A deadlock rolls the whole transaction back, so the whole transaction is retried
+      for _i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__writeBundle( typeName, typeRows, bucketRows, connObj )
+        if retVal[ 'OK' ] or retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+          break
+        self.log.warn( "Deadlock while inserting the bundle, retrying", "for type %s" % typeName )
+      return retVal
+    finally:
+      connObj.close()
+
+  def __writeBundle( self, typeName, typeRows, bucketRows, connObj ):
+    """
+    Write the type rows and the bucket rows of a bundle in one transaction
+    """
+    insertSize = self.getCSOption( "RecordsPerInsert", 1000 )
+    sqlFields = ", ".join( [ "`%s`" % f for f in self.dbCatalog[ typeName ][ 'typeFields' ] ] )
+    retVal = self.__startTransaction( connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    for rowsChunk in List.breakListIntoChunks( typeRows, insertSize ):
+      retVal = self._update( "INSERT INTO `%s` ( %s ) VALUES %s" % ( _getTableName( "type", typeName ),
+                                                                     sqlFields, ", ".join( rowsChunk ) ),
+                             conn = connObj )
+      if not retVal[ 'OK' ]:
+        self.__rollbackTransaction( connObj )
+        return retVal
+    retVal = self.__upsertBuckets( typeName, bucketRows, connObj = connObj )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    return self.__commitTransaction( connObj )
+
   def insertRecordDirectly( self, typeName, startTime, endTime, valuesList ):
     """
     Add an entry to the type contents
@@ -659,14 +907,18 @@ class AccountingDB( DB ):
         return retVal
       #HACK: One more record to split in the buckets to be able to count total entries
       valuesList.append( 1 )
-      retVal = self.__startTransaction( connObj )
-      if not retVal[ 'OK' ]:
-        return retVal
-      retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj = connObj )
-      if not retVal[ 'OK' ]:
+      #A deadlock rolls the whole transaction back, so the whole transaction is retried
+      for _i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__startTransaction( connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+        retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj = connObj )
+        if retVal[ 'OK' ]:
+          return self.__commitTransaction( connObj )
         self.__rollbackTransaction( connObj )
-        return retVal
-      return self.__commitTransaction( connObj )
+        if retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+          break
+      return retVal
     finally:
       connObj.close()
 
@@ -710,34 +962,48 @@ class AccountingDB( DB ):
         sqlCond.append( "`%s`.`%s`=%s" % ( mainTable,
                                            self.dbCatalog[ typeName ][ 'typeFields' ][i],
                                            sqlValues[i] ) )
+    #HACK: One more record to split in the buckets to be able to count total entries
+    sqlValues.append( 1 )
     retVal = self._getConnection()
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
+    try:
+      #A deadlock rolls the whole transaction back, so the whole transaction is retried
+      for _i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__removeRecord( typeName, " AND ".join( sqlCond ), startTime, endTime, sqlValues, connObj )
+        if retVal[ 'OK' ] or retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+          break
+        self.log.warn( "Deadlock while deleting the record, retrying", "for type %s" % typeName )
+      return retVal
+    finally:
+      connObj.close()
+
+  def __removeRecord( self, typeName, sqlCond, startTime, endTime, valuesList, connObj ):
+    """
+    Delete the matching records of a type and take them out of the buckets in one transaction
+    """
     retVal = self.__startTransaction( connObj )
     if not retVal[ 'OK' ]:
       return retVal
-    retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( mainTable, " AND ".join( sqlCond ) ),
+    retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( _getTableName( "type", typeName ), sqlCond ),
                            conn = connObj )
     if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
       return retVal
     numInsertions = retVal[ 'Value' ]
     #Deleted from type, now the buckets
-    #HACK: One more record to split in the buckets to be able to count total entries
-    if numInsertions == 0:
-      return S_OK( 0 )
-    sqlValues.append( 1 )
-    retVal = self.__deleteFromBuckets( typeName, startTime, endTime, sqlValues, numInsertions, connObj = connObj )
-    if not retVal[ 'OK' ]:
-      self.__rollbackTransaction( connObj )
-      return retVal
+    if numInsertions:
+      retVal = self.__deleteFromBuckets( typeName, startTime, endTime, valuesList, numInsertions, connObj = connObj )
+      if not retVal[ 'OK' ]:
+        self.__rollbackTransaction( connObj )
+        return retVal
     retVal = self.__commitTransaction( connObj )
     if not retVal[ 'OK' ]:
-      self.__rollbackTransaction( connObj )
       return retVal
     return S_OK( numInsertions )
 
-  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False ):
+  def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False, rollups = True ):
     """
     Bucketize a record
     """
@@ -748,7 +1014,7 @@ class AccountingDB( DB ):
     keyValues = valuesList[ :numKeys ]
     valuesList = valuesList[ numKeys: ]
     self.log.verbose( "Splitting entry", " in %s buckets" % len( buckets ) )
-    return self.__writeBuckets( typeName, buckets, keyValues, valuesList, connObj = connObj )
+    return self.__writeBuckets( typeName, buckets, keyValues, valuesList, connObj = connObj, rollups = rollups )
 
   def __deleteFromBuckets( self, typeName, startTime, endTime, valuesList, numInsertions, connObj = False ):
     """
@@ -765,29 +1031,31 @@ class AccountingDB( DB ):
       bucketStartTime = bucketInfo[0]
       bucketProportion = bucketInfo[1]
       bucketLength = bucketInfo[2]
-      for _i in range( max( 1, self.__deadLockRetries ) ):
-        retVal = self.__extractFromBucket( typeName,
-                                           bucketStartTime,
-                                           bucketLength,
-                                           keyValues,
-                                           valuesList, bucketProportion * numInsertions, connObj = connObj )
+      for rollupName in [ False ] + self.dbCatalog[ typeName ][ 'rollups' ]:
+        if rollupName and bucketLength > gRollupLengths[ rollupName ]:
+          #The record went to the rollup rows before its buckets were compacted
+          retVal = self.__rebuildRollupWindow( typeName, rollupName, bucketStartTime, bucketLength, keyValues,
+                                               connObj = connObj )
+        else:
+          retVal = self.__extractFromBucket( typeName,
+                                             bucketStartTime,
+                                             bucketLength,
+                                             keyValues,
+                                             valuesList, bucketProportion * numInsertions, connObj = connObj,
+                                             rollupName = rollupName )
         if not retVal[ 'OK' ]:
-          #If failed because of dead lock try restarting
-          if retVal[ 'Message' ].find( "try restarting transaction" ):
-            continue
           return retVal
-        #If OK, break loop
-        if retVal[ 'OK' ]:
-          break
     return S_OK()
 
   def getBucketsDef( self, typeName ):
     return self.dbBucketsLength[ typeName ]
 
-  def __generateSQLConditionForKeys( self, typeName, keyValues ):
+  def __generateSQLConditionForKeys( self, typeName, keyValues, tableName = False ):
     """
     Generate sql condition for buckets, values are indexes to real values
     """
+    if not tableName:
+      tableName = _getTableName( "bucket", typeName )
     realCondList = []
     for keyPos in range( len( self.dbCatalog[ typeName ][ 'keys' ] ) ):
       keyField = self.dbCatalog[ typeName ][ 'keys' ][ keyPos ]
@@ -796,7 +1064,7 @@ class AccountingDB( DB ):
       if not retVal[ 'OK' ]:
         return retVal
       keyValue = retVal[ 'Value' ]
-      realCondList.append( "`%s`.`%s` = %s" % ( _getTableName( "bucket", typeName ), keyField, keyValue ) )
+      realCondList.append( "`%s`.`%s` = %s" % ( tableName, keyField, keyValue ) )
     return " AND ".join( realCondList )
 
   def __getBucketFromDB( self, typeName, startTime, bucketLength, keyValues, connObj = False ):
@@ -817,11 +1085,19 @@ class AccountingDB( DB ):
     cmd += self.__generateSQLConditionForKeys( typeName, keyValues )
     return self._query( cmd, conn = connObj )
 
-  def __extractFromBucket( self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj = False ):
+  def __extractFromBucket( self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj = False,
+                           rollupName = False ):
     """
-    Update a bucket when coming from the raw insert
+    Update a bucket, or the row of a rollup, when coming from the raw insert
     """
-    tableName = _getTableName( "bucket", typeName )
+    if rollupName:
+      tableName = _getTableName( "rollup", typeName, rollupName )
+      rollupLength = gRollupLengths[ rollupName ]
+      if bucketLength < rollupLength:
+        startTime = startTime - startTime % rollupLength
+        bucketLength = rollupLength
+    else:
+      tableName = _getTableName( "bucket", typeName )
     cmd = "UPDATE `%s` SET " % tableName
     sqlValList = []
     for pos in range( len( self.dbCatalog[ typeName ][ 'values' ] ) ):
@@ -839,14 +1115,40 @@ class AccountingDB( DB ):
                                                                             startTime,
                                                                             tableName,
                                                                             bucketLength )
-    cmd += self.__generateSQLConditionForKeys( typeName, keyValues )
+    cmd += self.__generateSQLConditionForKeys( typeName, keyValues, tableName )
     return self._update( cmd, conn = connObj )
 
 
-  def __writeBuckets( self, typeName, buckets, keyValues, valuesList, connObj = False ):
+  def __writeBuckets( self, typeName, buckets, keyValues, valuesList, connObj = False, rollups = True ):
     """ Insert or update a bucket
     """
-#     tableName = _getTableName( "bucket", typeName )
+    numKeys = len( self.dbCatalog[ typeName ][ 'keys' ] )
+    bucketRows = []
+    for bucketInfo in buckets:
+      bStartTime = bucketInfo[0]
+      bProportion = bucketInfo[1]
+      bLength = bucketInfo[2]
+      bucketRows.append( ( bStartTime, bLength, tuple( keyValues[ :numKeys ] ),
+                           [ float( value ) * bProportion for value in valuesList ] ) )
+    return self.__upsertBuckets( typeName, bucketRows, connObj = connObj, rollups = rollups )
+
+  def __upsertBuckets( self, typeName, bucketRows, connObj = False, rollups = True ):
+    """ Add ( startTime, bucketLength, keyValues, values ) rows, with entriesInBucket as last value,
+        to the buckets and, unless rollups is False, to the enabled rollups of the type
+    """
+    retVal = self.__upsertRows( _getTableName( "bucket", typeName ), typeName, bucketRows, connObj = connObj )
+    if not retVal[ 'OK' ] or not rollups:
+      return retVal
+    for rollupName in self.dbCatalog[ typeName ][ 'rollups' ]:
+      retVal = self.__upsertRows( _getTableName( "rollup", typeName, rollupName ), typeName,
+                                  _mergeBucketRows( bucketRows, gRollupLengths[ rollupName ] ), connObj = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+    return S_OK()
+
+  def __upsertRows( self, tableName, typeName, bucketRows, connObj = False ):
+    """ Add bucket rows to a bucket or rollup table, creating the missing ones
+    """
     #INSERT PART OF THE QUERY
     sqlFields = [ '`startTime`', '`bucketLength`', '`entriesInBucket`' ]
     for keyPos in range( len( self.dbCatalog[ typeName ][ 'keys' ] ) ):
@@ -856,35 +1158,25 @@ class AccountingDB( DB ):
       valueField = "`%s`" % self.dbCatalog[ typeName ][ 'values' ][ valPos ]
       sqlFields.append( valueField )
       sqlUpData.append( "%s=%s+VALUES(%s)" % ( valueField, valueField, valueField ) )
+
     valuesGroups = []
-    for bucketInfo in buckets:
-      bStartTime = bucketInfo[0]
-      bProportion = bucketInfo[1]
-      bLength = bucketInfo[2]
-      sqlValues = [ bStartTime, bLength, "(%s*%s)" % ( valuesList[-1], bProportion )]
-      for keyPos in range( len( self.dbCatalog[ typeName ][ 'keys' ] ) ):
-        sqlValues.append( keyValues[ keyPos ] )
-      for valPos in range( len( self.dbCatalog[ typeName ][ 'values' ] ) ):
-#         value = valuesList[ valPos ]
-        sqlValues.append( "(%s*%s)" % ( valuesList[ valPos ], bProportion ) )
-      valuesGroups.append( "( %s )" % ",".join( str( val ) for val in sqlValues ) )
-
-    cmd = "INSERT INTO `%s` ( %s ) " % ( _getTableName( "bucket", typeName ), ", ".join( sqlFields ) )
-    cmd += "VALUES %s " % ", ".join( valuesGroups)
-    cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join( sqlUpData )
-
-    for _i in range( max( 1, self.__deadLockRetries ) ):
+    for bStartTime, bLength, keyValues, bucketValues in bucketRows:
+      sqlValues = [ str( bStartTime ), str( bLength ), repr( bucketValues[-1] ) ]
+      sqlValues.extend( [ str( keyValue ) for keyValue in keyValues ] )
+      sqlValues.extend( [ repr( value ) for value in bucketValues[:-1] ] )
+      valuesGroups.append( "( %s )" % ",".join( sqlValues ) )
+
+    #The rows are written within the transaction of the caller, which retries it as a whole
+    #on a deadlock: after one, InnoDB has already rolled back the whole transaction
+    for groupsChunk in List.breakListIntoChunks( valuesGroups, self.getCSOption( "RecordsPerInsert", 1000 ) ):
+      cmd = "INSERT INTO `%s` ( %s ) " % ( tableName, ", ".join( sqlFields ) )
+      cmd += "VALUES %s " % ", ".join( groupsChunk )
+      cmd += "ON DUPLICATE KEY UPDATE %s" % ", ".join( sqlUpData )
       result = self._update( cmd, conn = connObj )
       if not result[ 'OK' ]:
-        #If failed because of dead lock try restarting
-        if result[ 'Message' ].find( "try restarting transaction" ):
-          continue
-        return result
-      #If OK, break loopo
-      if result[ 'OK' ]:
-        return result
+        return S_ERROR( "Cannot update bucket: %s" % result[ 'Message' ] )
 
-    return S_ERROR( "Cannot update bucket: %s" % result[ 'Message' ] )
+    return S_OK()
 
   def __checkFieldsExistsInType( self, typeName, fields, tableType ):
     """
@@ -956,6 +1248,7 @@ class AccountingDB( DB ):
     nowEpoch = Time.toEpoch( Time.dateTime () )
     bucketTimeLength = self.calculateBucketLengthForTime( typeName, nowEpoch , startTime )
     startTime = startTime - startTime % bucketTimeLength
+    rollupName = self.__getRollupForQuery( typeName, nowEpoch, bucketTimeLength, endTime )
     result = self.__queryType( typeName,
                              startTime,
                              endTime,
@@ -964,15 +1257,44 @@ class AccountingDB( DB ):
                              groupFields,
                              orderFields,
                              "bucket",
-                             connObj = connObj )
+                             connObj = connObj,
+                             rollupName = rollupName )
     gMonitor.addMark( "querytime", Time.toEpoch() - startQueryEpoch )
     return result
 
-  def __queryType( self, typeName, startTime, endTime, selectFields, condDict, groupFields, orderFields, tableType, connObj = False ):
+  def __getRollupForQuery( self, typeName, nowEpoch, bucketTimeLength, endTime ):
+    """
+    Get the coarsest rollup of a type that gives the same data as the buckets for a query. Its length
+    has to divide the bucket length at the start of the query, that is the granularity of the reports,
+    and its last row can not go further than the bucket at the end of the query, unless it is the
+    current one
+    """
+    if not endTime:
+      endTime = nowEpoch
+    endBucketLength = self.calculateBucketLengthForTime( typeName, nowEpoch, endTime )
+    currentBucketLength = self.calculateBucketLengthForTime( typeName, nowEpoch, nowEpoch )
+    queryRollup = False
+    for rollupName in self.dbCatalog[ typeName ][ 'rollups' ]:
+      rollupLength = gRollupLengths[ rollupName ]
+      if bucketTimeLength % rollupLength:
+        continue
+      if endBucketLength % rollupLength and endTime < nowEpoch - currentBucketLength:
+        continue
+      if not queryRollup or rollupLength > gRollupLengths[ queryRollup ]:
+        queryRollup = rollupName
+    if queryRollup:
+      self.log.verbose( "Querying rollup", "%s of %s" % ( queryRollup, typeName ) )
+    return queryRollup
+
+  def __queryType( self, typeName, startTime, endTime, selectFields, condDict, groupFields, orderFields, tableType, connObj = False,
+                   rollupName = False ):
     """
-    Execute a query over a main table
+    Execute a query over a main table, or over a rollup for the buckets
     """
-    tableName = _getTableName( tableType, typeName )
+    if rollupName:
+      tableName = _getTableName( "rollup", typeName, rollupName )
+    else:
+      tableName = _getTableName( tableType, typeName )
     cmd = "SELECT"
     sqlLinkList = []
     #Check if groupFields and orderFields are in ( "%s", ( field1, ) ) form
@@ -1016,12 +1338,16 @@ class AccountingDB( DB ):
         #HACK because MySQL and UNIX do not start epoch at the same time
         startTime = startTime + 3600
         startTime = self.calculateBuckets( typeName, startTime, startTime )[0][0]
+        if rollupName:
+          startTime = startTime - startTime % gRollupLengths[ rollupName ]
       sqlTimeCond.append( "`%s`.`startTime` >= %s" % ( tableName, startTime ) )
     if endTime:
       if tableType == "bucket":
         endTimeSQLVar = "startTime"
         endTime = endTime + 3600
         endTime = self.calculateBuckets( typeName, endTime, endTime )[0][0]
+        if rollupName:
+          endTime = endTime - endTime % gRollupLengths[ rollupName ]
       else:
         endTimeSQLVar = "endTime"
       sqlTimeCond.append( "`%s`.`%s` <= %s" % ( tableName, endTimeSQLVar, endTime ) )
@@ -1087,7 +1413,6 @@ class AccountingDB( DB ):
       self.__doingCompaction = True
     finally:
       gSynchro.unlock()
-    slow = True
     for typeName in self.dbCatalog:
       if typeFilter and typeName.find( typeFilter ) == -1:
         self.log.info( "[COMPACT] Skipping %s" % typeName )
@@ -1096,10 +1421,10 @@ class AccountingDB( DB ):
         self.log.info( "[COMPACT] Deleting records older that timespan for type %s" % typeName )
         self.__deleteRecordsOlderThanDataTimespan( typeName )
       self.log.info( "[COMPACT] Compacting %s" % typeName )
-      if slow:
-        self.__slowCompactBucketsForType( typeName )
-      else:
-        self.__compactBucketsForType( typeName )
+      retVal = self.__incrementalCompactBucketsForType( typeName )
+      if not retVal[ 'OK' ]:
+        self.log.error( "[COMPACT] Compaction interrupted, it will resume from its checkpoint",
+                        "%s: %s" % ( typeName, retVal[ 'Message' ] ) )
     self.log.info( "[COMPACT] Compaction finished" )
     self.__lastCompactionEpoch = int( Time.toEpoch() )
     gSynchro.lock()
@@ -1110,188 +1435,188 @@ class AccountingDB( DB ):
       gSynchro.unlock()
     return S_OK()
 
-  def __selectForCompactBuckets( self, typeName, timeLimit, bucketLength, nextBucketLength, connObj = False ):
+  def getCompactionStatus( self, typeFilter = False ):
     """
-    Nasty SQL query to get ideal buckets using grouping by date calculations and adding value contents
+    Get per type the number of buckets waiting for compaction and the compaction checkpoints,
+    both by bucket length
     """
-    tableName = _getTableName( "bucket", typeName )
-    selectSQL = "SELECT "
-    sqlSelectList = []
-    for field in self.dbCatalog[ typeName ][ 'keys' ]:
-      sqlSelectList.append( "`%s`.`%s`" % ( tableName, field ) )
-    for field in self.dbCatalog[ typeName ][ 'values' ]:
-      sqlSelectList.append( "SUM( `%s`.`%s` )" % ( tableName, field ) )
-    sqlSelectList.append( "SUM( `%s`.`entriesInBucket` )" % ( tableName ) )
-    sqlSelectList.append( "MIN( `%s`.`startTime` )" % tableName )
-    sqlSelectList.append( "MAX( `%s`.`startTime` )" % tableName )
-    selectSQL += ", ".join( sqlSelectList )
-    selectSQL += " FROM `%s`" % tableName
-    selectSQL += " WHERE `%s`.`startTime` < '%s' AND" % ( tableName, timeLimit )
-    selectSQL += " `%s`.`bucketLength` = %s" % ( tableName, bucketLength )
-    #MAGIC bucketing
-    sqlGroupList = [ _bucketizeDataField( "`%s`.`startTime`" % tableName, nextBucketLength ) ]
-    for field in self.dbCatalog[ typeName ][ 'keys' ]:
-      sqlGroupList.append( "`%s`.`%s`" % ( tableName, field ) )
-    selectSQL += " GROUP BY %s" % ", ".join( sqlGroupList )
-    return self._query( selectSQL, conn = connObj )
+    nowEpoch = int( Time.toEpoch() )
+    status = {}
+    for typeName in self.dbCatalog:
+      if typeFilter and typeName.find( typeFilter ) == -1:
+        continue
+      typeStatus = { 'RemainingBuckets' : {}, 'Checkpoints' : {} }
+      for bucketLength, timeLimit, _nextBucketLength in self.__getCompactionLevels( typeName, nowEpoch ):
+        retVal = self._query( "SELECT COUNT(*) FROM `%s` WHERE `bucketLength` = %d AND `startTime` < %d" % (
+                                _getTableName( "bucket", typeName ), bucketLength, timeLimit ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+        typeStatus[ 'RemainingBuckets' ][ bucketLength ] = retVal[ 'Value' ][0][0]
+        retVal = self.__getCompactionCheckpoint( typeName, bucketLength )
+        if not retVal[ 'OK' ]:
+          return retVal
+        typeStatus[ 'Checkpoints' ][ bucketLength ] = retVal[ 'Value' ]
+      status[ typeName ] = typeStatus
+    return S_OK( status )
 
-  def __deleteForCompactBuckets( self, typeName, timeLimit, bucketLength, connObj = False ):
+  def __getCompactionLevels( self, typeName, nowEpoch ):
     """
-    Delete compacted buckets
+    Get the ( bucketLength, timeLimit, nextBucketLength ) compaction steps of a type: the buckets of
+    bucketLength older than timeLimit are merged into buckets of nextBucketLength
     """
-    tableName = _getTableName( "bucket", typeName )
-    deleteSQL = "DELETE FROM `%s` WHERE " % tableName
-    deleteSQL += "`%s`.`startTime` < '%s' AND " % ( tableName, timeLimit )
-    deleteSQL += "`%s`.`bucketLength` = %s" % ( tableName, bucketLength )
-    return self._update( deleteSQL, conn = connObj )
+    levels = []
+    bucketsLength = self.dbBucketsLength[ typeName ]
+    for bPos in range( len( bucketsLength ) - 1 ):
+      secondsLimit, bucketLength = bucketsLength[ bPos ]
+      timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
+      levels.append( ( bucketLength, timeLimit, bucketsLength[ bPos + 1 ][1] ) )
+    return levels
 
-  def __compactBucketsForType( self, typeName ):
+  def __getCompactionCheckpoint( self, typeName, bucketLength ):
     """
-    Compact all buckets for a given type
+    Get the start time from which the compaction of the buckets of a length has to resume, 0 if none
     """
-    nowEpoch = Time.toEpoch()
-    #retVal = self.__startTransaction( connObj )
-    #if not retVal[ 'OK' ]:
-    #  return retVal
-    for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
-      self.log.info( "[COMPACT] Query %d of %d" % ( bPos + 1, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-      secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
-      bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
-      timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
-      nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
-      self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s" % ( Time.fromEpoch( timeLimit ), bucketLength ) )
-      #Retrieve the data
-      retVal = self.__selectForCompactBuckets( typeName, timeLimit, bucketLength, nextBucketLength )
+    retVal = self._query( "SELECT `startTime` FROM `%s` WHERE `name`='%s' AND `bucketLength`=%d" % ( self.compactionTableName,
+                                                                                                     typeName,
+                                                                                                     bucketLength ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    if retVal[ 'Value' ]:
+      return S_OK( retVal[ 'Value' ][0][0] )
+    return S_OK( 0 )
+
+  def __setCompactionCheckpoint( self, typeName, bucketLength, startTime ):
+    """
+    Record the progress of the compaction of the buckets of a length, a 0 startTime clears it
+    """
+    if not startTime:
+      return self._update( "DELETE FROM `%s` WHERE `name`='%s' AND `bucketLength`=%d" % ( self.compactionTableName,
+                                                                                        typeName,
+                                                                                        bucketLength ) )
+    return self._update( "INSERT INTO `%s` ( `name`, `bucketLength`, `startTime` ) VALUES ( '%s', %d, %d ) "
+                         "ON DUPLICATE KEY UPDATE `startTime`=VALUES(`startTime`)" % ( self.compactionTableName,
+                                                                                      typeName,
+                                                                                      bucketLength,
+                                                                                      startTime ) )
+
+  def __incrementalCompactBucketsForType( self, typeName ):
+    """
+    Compact the buckets of a type in slices made of the buckets of one target bucket and a range of
+    values of the first key. Each slice is moved in its own short transaction, so the insertions
+    interleave with the compaction, and the progress is checkpointed after each target bucket
+    """
+    sliceSize = self.getCSOption( "CompactionSliceSize", 10000 )
+    slicePause = self.getCSOption( "CompactionSlicePause", 0.1 )
+    tableName = _getTableName( "bucket", typeName )
+    firstKey = self.dbCatalog[ typeName ][ 'keys' ][0]
+    for bucketLength, timeLimit, nextBucketLength in self.__getCompactionLevels( typeName, int( Time.toEpoch() ) ):
+      retVal = self.__getCompactionCheckpoint( typeName, bucketLength )
       if not retVal[ 'OK' ]:
-        #self.__rollbackTransaction( connObj )
         return retVal
-      bucketsData = retVal[ 'Value' ]
-      self.log.info( "[COMPACT] Got %d records to compact" % len( bucketsData ) )
-      if len( bucketsData ) == 0:
-        continue
-      retVal = self.__deleteForCompactBuckets( typeName, timeLimit, bucketLength )
+      windowStart = retVal[ 'Value' ]
+      if windowStart:
+        self.log.info( "[COMPACT] Resuming compaction of %s buckets of %s seconds from %s" % ( typeName, bucketLength,
+                                                                                                Time.fromEpoch( windowStart ) ) )
+      self.log.info( "[COMPACT] Compacting data older than %s with bucket size %s for %s" % ( Time.fromEpoch( timeLimit ),
+                                                                                                bucketLength, typeName ) )
+      compacted = 0
+      while True:
+        retVal = self._query( "SELECT MIN(`startTime`) FROM `%s` WHERE `bucketLength` = %d AND `startTime` >= %d AND `startTime` < %d" % (
+                                tableName, bucketLength, windowStart, timeLimit ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+        nextStartTime = retVal[ 'Value' ][0][0]
+        if nextStartTime is None:
+          break
+        #Window of the buckets going to the same target bucket
+        windowStart = nextStartTime - nextStartTime % nextBucketLength
+        windowEnd = min( windowStart + nextBucketLength, timeLimit )
+        windowCond = "`bucketLength` = %d AND `startTime` >= %d AND `startTime` < %d" % ( bucketLength, windowStart, windowEnd )
+        retVal = self._query( "SELECT `%s`, COUNT(*) FROM `%s` WHERE %s GROUP BY `%s`" % ( firstKey, tableName,
+                                                                                           windowCond, firstKey ) )
+        if not retVal[ 'OK' ]:
+          return retVal
+        for lowKey, highKey in _getKeyRanges( retVal[ 'Value' ], sliceSize ):
+          sliceCond = "%s AND `%s` BETWEEN %d AND %d" % ( windowCond, firstKey, lowKey, highKey )
+          retVal = self.__compactSlice( typeName, bucketLength, nextBucketLength, sliceCond )
+          if not retVal[ 'OK' ]:
+            return retVal
+          compacted += retVal[ 'Value' ]
+          time.sleep( slicePause )
+        windowStart = windowEnd
+        retVal = self.__setCompactionCheckpoint( typeName, bucketLength, windowStart )
+        if not retVal[ 'OK' ]:
+          return retVal
+      self.log.info( "[COMPACT] Compacted %d buckets of %s seconds for %s" % ( compacted, bucketLength, typeName ) )
+      retVal = self.__setCompactionCheckpoint( typeName, bucketLength, 0 )
       if not retVal[ 'OK' ]:
-        #self.__rollbackTransaction( connObj )
         return retVal
-      self.log.info( "[COMPACT] Compacting %s records %s seconds size for %s" % ( len( bucketsData ), bucketLength, typeName ) )
-      #Add data
-      for record in bucketsData:
-        startTime = record[-2]
-        endTime = record[-1]
-        valuesList = record[:-2]
-        retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList )
-        if not retVal[ 'OK' ]:
-          #self.__rollbackTransaction( connObj )
-          self.log.error( "[COMPACT] Error while compacting data for record", "%s: %s" % ( typeName, retVal[ 'Value' ] ) )
-      self.log.info( "[COMPACT] Finished compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-    #return self.__commitTransaction( connObj )
     return S_OK()
 
-  def __slowCompactBucketsForType( self, typeName ):
+  def __compactSlice( self, typeName, bucketLength, nextBucketLength, sliceCond ):
     """
-    Compact all buckets for a given type
+    Move the buckets matching a condition into buckets of nextBucketLength in one transaction
     """
-    nowEpoch = Time.toEpoch()
-    for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
-      self.log.info( "[COMPACT] Query %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-      secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
-      bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
-      timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
-      nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
-      self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s for %s" % ( Time.fromEpoch( timeLimit ), bucketLength, typeName ) )
-      querySize = 10000
-      previousRecordsSelected = querySize
-      totalCompacted = 0
-      while previousRecordsSelected == querySize:
-        #Retrieve the data
-        self.log.info( "[COMPACT] Retrieving buckets to compact newer that %s with size %s" % ( Time.fromEpoch( timeLimit ),
-                                                                                                       bucketLength ) )
-        roundStartTime = time.time()
-        result = self.__selectIndividualForCompactBuckets( typeName, timeLimit, bucketLength,
-                                                           nextBucketLength, querySize )
-        if not result[ 'OK' ]:
-          #self.__rollbackTransaction( connObj )
-          return result
-        bucketsData = result[ 'Value' ]
-        previousRecordsSelected = len( bucketsData )
-        selectEndTime = time.time()
-        self.log.info( "[COMPACT] Got %d buckets (%d done) (took %.2f secs)" % ( previousRecordsSelected,
-                                                                                 totalCompacted,
-                                                                                 selectEndTime - roundStartTime ) )
-        if len( bucketsData ) == 0:
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return retVal
+    connObj = retVal[ 'Value' ]
+    try:
+      #A deadlock rolls the whole transaction back, so the whole transaction is retried
+      for _i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__moveSlice( typeName, bucketLength, nextBucketLength, sliceCond, connObj )
+        if retVal[ 'OK' ] or retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
           break
+        self.log.warn( "[COMPACT] Deadlock while compacting a slice, retrying", "for type %s" % typeName )
+      return retVal
+    finally:
+      connObj.close()
 
-        result = self.__deleteIndividualForCompactBuckets( typeName, bucketsData )
-        if not result[ 'OK' ]:
-          #self.__rollbackTransaction( connObj )
-          return result
-        bucketsData = result[ 'Value' ]
-        deleteEndTime = time.time()
-        self.log.info( "[COMPACT] Deleted %s out-of-bounds buckets (took %.2f secs)" % ( len( bucketsData ),
-                                                                                         deleteEndTime - selectEndTime ) )
-        #Add data
-        for record in bucketsData:
-          startTime = record[-2]
-          endTime = record[-2] + record[-1]
-          valuesList = record[:-2]
-          retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList )
-          if not retVal[ 'OK' ]:
-            self.log.error( "[COMPACT] Error while compacting data for buckets", "%s: %s" % ( typeName, retVal[ 'Value' ] ) )
-        totalCompacted += len( bucketsData )
-        insertElapsedTime = time.time() - deleteEndTime
-        self.log.info( "[COMPACT] Records compacted (took %.2f secs, %.2f secs/bucket)" % ( insertElapsedTime,
-                                                                                            insertElapsedTime / len( bucketsData ) ) )
-      self.log.info( "[COMPACT] Finised compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-    #return self.__commitTransaction( connObj )
-    return S_OK()
-
-  def __selectIndividualForCompactBuckets( self, typeName, timeLimit, bucketLength, nextBucketLength, querySize, connObj = False ):
+  def __moveSlice( self, typeName, bucketLength, nextBucketLength, sliceCond, connObj ):
     """
-    Nasty SQL query to get ideal buckets using grouping by date calculations and adding value contents
-    """
-    tableName = _getTableName( "bucket", typeName )
-    selectSQL = "SELECT "
-    sqlSelectList = []
-    for field in self.dbCatalog[ typeName ][ 'keys' ]:
-      sqlSelectList.append( "`%s`.`%s`" % ( tableName, field ) )
-    for field in self.dbCatalog[ typeName ][ 'values' ]:
-      sqlSelectList.append( "`%s`.`%s`" % ( tableName, field ) )
-    sqlSelectList.append( "`%s`.`entriesInBucket`" % ( tableName ) )
-    sqlSelectList.append( "`%s`.`startTime`" % tableName )
-    sqlSelectList.append( "`%s`.bucketLength" % ( tableName ) )
-    selectSQL += ", ".join( sqlSelectList )
-    selectSQL += " FROM `%s`" % tableName
-    selectSQL += " WHERE `%s`.`startTime` < '%s' AND" % ( tableName, timeLimit )
-    selectSQL += " `%s`.`bucketLength` = %s" % ( tableName, bucketLength )
-    #MAGIC bucketing
-    selectSQL += " LIMIT %d" % querySize
-    return self._query( selectSQL, conn = connObj )
-
-  def __deleteIndividualForCompactBuckets( self, typeName, bucketsData, connObj = False ):
-    """
-    Delete compacted buckets
+    Move the buckets of a slice in one transaction, returning the number of buckets moved
     """
     tableName = _getTableName( "bucket", typeName )
     keyFields = self.dbCatalog[ typeName ][ 'keys' ]
-    deleteQueryLimit = 50
-    deletedBuckets = []
-    for bLimit in range( 0, len( bucketsData ) , deleteQueryLimit ):
-      delCondsSQL = []
-      for record in bucketsData[ bLimit : bLimit + deleteQueryLimit ]:
-        condSQL = []
-        for iPos in range( len( keyFields ) ):
-          field = keyFields[ iPos ]
-          condSQL.append( "`%s`.`%s` = %s" % ( tableName, field, record[ iPos ] ) )
-        condSQL.append( "`%s`.`startTime` = %d" % ( tableName, record[-2] ) )
-        condSQL.append( "`%s`.`bucketLength` = %d" % ( tableName, record[-1] ) )
-        delCondsSQL.append( "(%s)" % " AND ".join( condSQL ) )
-      delSQL = "DELETE FROM `%s` WHERE %s" % ( tableName, " OR ".join( delCondsSQL ) )
-      result = self._update( delSQL, conn = connObj )
-      if not result[ 'OK' ]:
-        self.log.error( "Cannot delete individual records for compaction", result[ 'Message' ] )
-      else:
-        deletedBuckets.extend( bucketsData[ bLimit : bLimit + deleteQueryLimit ] )
-    return S_OK( deletedBuckets )
+    numKeys = len( keyFields )
+    sqlFields = keyFields + self.dbCatalog[ typeName ][ 'values' ] + [ 'entriesInBucket', 'startTime' ]
+    retVal = self.__startTransaction( connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    retVal = self._query( "SELECT %s FROM `%s` WHERE %s FOR UPDATE" % ( ", ".join( [ "`%s`" % f for f in sqlFields ] ),
+                                                                       tableName, sliceCond ), conn = connObj )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    bucketRows = [ ( row[-1], bucketLength, tuple( row[ :numKeys ] ), [ float( value ) for value in row[ numKeys:-1 ] ] )
+                   for row in retVal[ 'Value' ] ]
+    retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( tableName, sliceCond ), conn = connObj )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    #Compaction moves data between buckets, the rollups already have it
+    retVal = self.__upsertBuckets( typeName, _mergeBucketRows( bucketRows, nextBucketLength ),
+                                   connObj = connObj, rollups = False )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    retVal = self.__commitTransaction( connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    return S_OK( len( bucketRows ) )
+
+  def __deleteInSlices( self, tableName ):
+    """
+    Empty a table in bounded slices so the other operations can interleave
+    """
+    deleteLimit = self.getCSOption( "CompactionSliceSize", 10000 )
+    deleted = deleteLimit
+    while deleted >= deleteLimit:
+      retVal = self._update( "DELETE FROM `%s` LIMIT %d" % ( tableName, deleteLimit ) )
+      if not retVal[ 'OK' ]:
+        return retVal
+      deleted = retVal[ 'Value' ]
+    return S_OK()
 
   def __deleteRecordsOlderThanDataTimespan( self, typeName ):
     """
@@ -1301,8 +1626,11 @@ class AccountingDB( DB ):
     dataTimespan = self.dbCatalog[ typeName ][ 'dataTimespan' ]
     if dataTimespan < 86400 * 30:
       return
-    for table, field in ( ( _getTableName( "type", typeName ), 'endTime' ),
-                          ( _getTableName( "bucket", typeName ), 'startTime + %s' % self.dbBucketsLength[ typeName ][-1][1] ) ):
+    tablesToPurge = [ ( _getTableName( "type", typeName ), 'endTime' ),
+                      ( _getTableName( "bucket", typeName ), 'startTime + %s' % self.dbBucketsLength[ typeName ][-1][1] ) ]
+    for rollupName in self.dbCatalog[ typeName ][ 'rollups' ]:
+      tablesToPurge.append( ( _getTableName( "rollup", typeName, rollupName ), 'startTime + bucketLength' ) )
+    for table, field in tablesToPurge:
       self.log.info( "[COMPACT] Deleting old records for table %s" % table )
       deleteLimit = 100000
       deleted = deleteLimit
@@ -1331,9 +1659,14 @@ class AccountingDB( DB ):
     #if not retVal[ 'OK' ]:
     #  return retVal
     self.log.info( "[REBUCKET] Deleting buckets for %s" % typeName )
-    retVal = self._update( "DELETE FROM `%s`" % _getTableName( "bucket", typeName ) )
+    retVal = self.__deleteInSlices( _getTableName( "bucket", typeName ) )
     if not retVal[ 'OK' ]:
       return retVal
+    #The rollups are filled again with the buckets
+    for rollupName in self.dbCatalog[ typeName ][ 'rollups' ]:
+      retVal = self.__deleteInSlices( _getTableName( "rollup", typeName, rollupName ) )
+      if not retVal[ 'OK' ]:
+        return retVal
     #Generate the common part of the query
     #SELECT fields
     startTimeTableField = "`%s`.startTime" % rawTableName
@@ -1458,13 +1791,47 @@ class AccountingDB( DB ):
 def _bucketizeDataField( dataField, bucketLength ):
   return "%s - ( %s %% %s )" % ( dataField, dataField, bucketLength )
 
+def _getKeyRanges( keyCounts, sliceSize ):
+  """
+  Group ( key id, number of rows ) pairs in ranges of key ids with up to sliceSize rows. A key id
+  with more rows gets a range of its own
+  """
+  keyRanges = []
+  rangeCount = 0
+  for keyId, count in sorted( keyCounts ):
+    if keyRanges and rangeCount + count <= sliceSize:
+      keyRanges[-1][1] = keyId
+      rangeCount += count
+    else:
+      keyRanges.append( [ keyId, keyId ] )
+      rangeCount = count
+  return keyRanges
+
+def _mergeBucketRows( bucketRows, rollupLength = 0 ):
+  """
+  Add up the ( startTime, bucketLength, keyValues, values ) rows of the same bucket. Rows shorter than
+  rollupLength are moved to the row of rollupLength that contains them. Rows are returned sorted
+  """
+  mergedRows = {}
+  for bStartTime, bLength, keyValues, bucketValues in bucketRows:
+    if bLength < rollupLength:
+      bStartTime = bStartTime - bStartTime % rollupLength
+      bLength = rollupLength
+    rowKey = ( bStartTime, bLength, tuple( keyValues ) )
+    if rowKey not in mergedRows:
+      mergedRows[ rowKey ] = [ 0.0 ] * len( bucketValues )
+    rowValues = mergedRows[ rowKey ]
+    for pos in range( len( bucketValues ) ):
+      rowValues[ pos ] += bucketValues[ pos ]
+  return [ rowKey + ( mergedRows[ rowKey ], ) for rowKey in sorted( mergedRows ) ]
+
 def _getTableName( tableType, typeName, keyName = None ):
   """
   Generate table name
   """
   if not keyName:
     return "ac_%s_%s" % ( tableType, typeName )
-  elif tableType == "key" :
+  elif tableType in ( "key", "rollup" ):
     return "ac_%s_%s_%s" % ( tableType, typeName, keyName )
   else:
     raise Exception( "Call to _getTableName with tableType as key but with no keyName" )
@@ -42,7 +42,7 @@ class MultiAccountingDB( object ):
 
   def __registerMethods( self ):
     for methodName in ( 'registerType', 'changeBucketsLength', 'regenerateBuckets',
-                        'deleteType', 'insertRecordThroughQueue',
+                        'dropDisabledRollups', 'deleteType', 'insertRecordThroughQueue',
                         'deleteRecord', 'getKeyValues', 'retrieveBucketedData',
                         'calculateBuckets', 'calculateBucketLengthForTime' ):
       (lambda closure: setattr( self, closure, lambda *x: self.__mimeTypeMethod( closure, *x ) ))(methodName)
@@ -64,6 +64,15 @@ class MultiAccountingDB( object ):
   def __db( self, acType ):
     return self.__allDBs[ self.__dbByType.get( acType, self.__defaultDB ) ]
 
+  def getCompactionStatus( self, typeFilter = False ):
+    status = {}
+    for dbName in self.__allDBs:
+      res = self.__allDBs[ dbName ].getCompactionStatus( typeFilter )
+      if not res[ 'OK' ]:
+        return res
+      status.update( res[ 'Value' ] )
+    return S_OK( status )
+
   def insertRecordBundleThroughQueue( self, records ):
     recByType = {}
     for record in records:
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+########################################################################
+# $HeadURL$
+########################################################################
+"""
+Compare the per record and bulk paths of the AccountingDB queue tables
+
+To be run against a test AccountingDB with no DataStore service consuming it. Dummy
+records of the given type are queued one INSERT per record and in bundles, then
+removed from the in table one DELETE per record and in bulk.
+"""
+__RCSID__ = "$Id$"
+
+from DIRAC.Core.Base import Script
+
+Script.setUsageMessage( '\n'.join( [ __doc__.split( '\n' )[1],
+                                     '\nUsage:',
+                                     '  %s [option|cfgfile] ... TypeName [NumberOfRecords]' % Script.scriptName,
+                                     'Arguments:',
+                                     '  TypeName:        Registered accounting type, including the setup prefix',
+                                     '  NumberOfRecords: Number of records to queue (default 10000)' ] ) )
+
+Script.parseCommandLine( ignoreErrors = False )
+
+import time
+
+import DIRAC
+from DIRAC                                     import gLogger
+from DIRAC.Core.Utilities                      import List, Time
+from DIRAC.AccountingSystem.DB.AccountingDB    import AccountingDB
+
+MARKER = 'AccountingDBBenchmark'
+
+def timeCalls( label, numberOfRecords, function, *args ):
+  """ Time a function over numberOfRecords records and print the throughput
+  """
+  start = time.time()
+  result = function( *args )
+  elapsed = time.time() - start
+  if not result['OK']:
+    gLogger.error( label, result['Message'] )
+    DIRAC.exit( 1 )
+  gLogger.notice( "%-25s: %6d records in %8.3f s, %10.1f records/s" % ( label, numberOfRecords, elapsed,
+                                                                        numberOfRecords / max( elapsed, 1e-6 ) ) )
+  return result
+
+def queuePerRecord( acDB, records ):
+  """ Queue the records one INSERT at a time
+  """
+  for typeName, startTime, endTime, valuesList in records:
+    result = acDB.insertRecordThroughQueue( typeName, startTime, endTime, valuesList )
+    if not result['OK']:
+      return result
+  return DIRAC.S_OK()
+
+def getQueuedIDs( acDB, typeName ):
+  """ Get the ids of the benchmark records in the in table
+  """
+  keyField = acDB.dbCatalog[ typeName ][ 'keys' ][0]
+  result = acDB._query( "SELECT id FROM `ac_in_%s` WHERE `%s`='%s'" % ( typeName, keyField, MARKER ) )
+  if not result['OK']:
+    gLogger.error( "Failed to get the queued records", result['Message'] )
+    DIRAC.exit( 1 )
+  return [ str( row[0] ) for row in result['Value'] ]
+
+def deletePerRecord( acDB, typeName, idList ):
+  """ Remove the records one DELETE at a time
+  """
+  for iD in idList:
+    result = acDB._update( "DELETE FROM `ac_in_%s` WHERE id=%s" % ( typeName, iD ) )
+    if not result['OK']:
+      return result
+  return DIRAC.S_OK()
+
+def deleteInBulk( acDB, typeName, idList ):
+  """ Remove the records with one DELETE per chunk
+  """
+  for idChunk in List.breakListIntoChunks( idList, 1000 ):
+    result = acDB._update( "DELETE FROM `ac_in_%s` WHERE id in (%s)" % ( typeName, ", ".join( idChunk ) ) )
+    if not result['OK']:
+      return result
+  return DIRAC.S_OK()
+
+args = Script.getPositionalArgs()
+if len( args ) not in ( 1, 2 ):
+  Script.showHelp()
+typeName = args[0]
+numberOfRecords = 10000
+if len( args ) == 2:
+  numberOfRecords = int( args[1] )
+
+acDB = AccountingDB()
+if typeName not in acDB.dbCatalog:
+  gLogger.error( "Unknown accounting type", typeName )
+  DIRAC.exit( 1 )
+
+now = int( Time.toEpoch() )
+valuesList = [ MARKER ] * len( acDB.dbCatalog[ typeName ][ 'keys' ] ) + [ 1 ] * len( acDB.dbCatalog[ typeName ][ 'values' ] )
+records = [ ( typeName, now - 60, now, list( valuesList ) ) for _i in range( numberOfRecords ) ]
+
+for method, queueFunction, deleteFunction in ( ( 'per record', queuePerRecord, deletePerRecord ),
+                                               ( 'bulk', acDB.insertRecordBundleThroughQueue, deleteInBulk ) ):
+  if method == 'bulk':
+    timeCalls( "queue %s" % method, numberOfRecords, queueFunction, records )
+  else:
+    timeCalls( "queue %s" % method, numberOfRecords, queueFunction, acDB, records )
+  idList = getQueuedIDs( acDB, typeName )
+  timeCalls( "delete %s" % method, len( idList ), deleteFunction, acDB, typeName, idList )
+
+DIRAC.exit( 0 )
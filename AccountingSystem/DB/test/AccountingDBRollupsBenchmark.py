@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+########################################################################
+# $HeadURL$
+########################################################################
+"""
+Compare one year reports of the AccountingDB read from the buckets and from the rollups
+
+To be run against a test AccountingDB with the Rollups option set to Daily, Weekly. A
+synthetic year of records of the given type is inserted, then a timed report per value
+of the first key field is queried with and without the rollups.
+"""
+__RCSID__ = "$Id$"
+
+from DIRAC.Core.Base import Script
+
+Script.setUsageMessage( '\n'.join( [ __doc__.split( '\n' )[1],
+                                     '\nUsage:',
+                                     '  %s [option|cfgfile] ... TypeName [NumberOfRecords]' % Script.scriptName,
+                                     'Arguments:',
+                                     '  TypeName:        Registered accounting type, including the setup prefix',
+                                     '  NumberOfRecords: Number of records to generate (default 100000)' ] ) )
+
+Script.parseCommandLine( ignoreErrors = False )
+
+import random
+import time
+
+import DIRAC
+from DIRAC                                     import gLogger
+from DIRAC.Core.Utilities                      import List, Time
+from DIRAC.AccountingSystem.DB.AccountingDB    import AccountingDB
+
+def generateRecords( acDB, typeName, numberOfRecords, startEpoch, endEpoch ):
+  """ Generate records spread over a period, with 10 values per key field
+  """
+  keyFields = acDB.dbCatalog[ typeName ][ 'keys' ]
+  numValues = len( acDB.dbCatalog[ typeName ][ 'values' ] )
+  records = []
+  for _i in range( numberOfRecords ):
+    recordStart = random.randint( startEpoch, endEpoch - 7200 )
+    valuesList = [ "%s%d" % ( keyField, random.randint( 0, 9 ) ) for keyField in keyFields ]
+    valuesList.extend( [ random.randint( 0, 1000 ) for _j in range( numValues ) ] )
+    records.append( ( recordStart, recordStart + random.randint( 0, 7200 ), valuesList ) )
+  return records
+
+def queryYear( acDB, typeName, startEpoch, endEpoch ):
+  """ Query a report of the first value per value of the first key, as the reporters do
+  """
+  keyField = acDB.dbCatalog[ typeName ][ 'keys' ][0]
+  valueField = acDB.dbCatalog[ typeName ][ 'values' ][0]
+  return acDB.retrieveBucketedData( typeName, startEpoch, endEpoch,
+                                    ( "%s, %s, %s, SUM(%s)", [ keyField, 'startTime', 'bucketLength', valueField ] ),
+                                    {}, ( "%s, %s", [ 'startTime', keyField ] ), ( "%s", [ 'startTime' ] ) )
+
+args = Script.getPositionalArgs()
+if len( args ) not in ( 1, 2 ):
+  Script.showHelp()
+typeName = args[0]
+numberOfRecords = 100000
+if len( args ) == 2:
+  numberOfRecords = int( args[1] )
+
+acDB = AccountingDB()
+if typeName not in acDB.dbCatalog:
+  gLogger.error( "Unknown accounting type", typeName )
+  DIRAC.exit( 1 )
+rollups = acDB.dbCatalog[ typeName ][ 'rollups' ]
+if not rollups:
+  gLogger.error( "No rollup enabled for the type", typeName )
+  DIRAC.exit( 1 )
+
+endEpoch = int( Time.toEpoch() )
+startEpoch = endEpoch - 86400 * 365
+gLogger.notice( "Inserting %d records over one year" % numberOfRecords )
+start = time.time()
+for recordsChunk in List.breakListIntoChunks( generateRecords( acDB, typeName, numberOfRecords, startEpoch, endEpoch ),
+                                              1000 ):
+  result = acDB._AccountingDB__insertBundleDirectly( typeName, recordsChunk )
+  if not result['OK']:
+    gLogger.error( "Failed to insert the records", result['Message'] )
+    DIRAC.exit( 1 )
+gLogger.notice( "Inserted in %.1f s" % ( time.time() - start ) )
+
+for label, queryRollups in ( ( "buckets", [] ), ( "rollups %s" % ", ".join( rollups ), rollups ) ):
+  acDB.dbCatalog[ typeName ][ 'rollups' ] = queryRollups
+  start = time.time()
+  result = queryYear( acDB, typeName, startEpoch, endEpoch )
+  elapsed = time.time() - start
+  if not result['OK']:
+    gLogger.error( label, result['Message'] )
+    DIRAC.exit( 1 )
+  total = sum( [ float( row[3] ) for row in result['Value'] ] )
+  gLogger.notice( "%-25s: %6d rows in %8.3f s, total %.1f" % ( label, len( result['Value'] ), elapsed, total ) )
+
+DIRAC.exit( 0 )
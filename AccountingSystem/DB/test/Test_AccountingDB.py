@@ -0,0 +1,350 @@
+""" Test for the bulk insertion, the rollups, the deletion and the compaction of the AccountingDB
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR, gLogger
+from DIRAC.Core.Utilities import Time
+from DIRAC.AccountingSystem.DB.AccountingDB import AccountingDB, _mergeBucketRows, _getKeyRanges
+
+class AccountingDBTestCase( unittest.TestCase ):
+  """ Base class for the AccountingDB test cases, with an AccountingDB recording its statements
+  """
+  def setUp( self ):
+    self.statements = []
+    self.deadLocks = 0
+    self.deadLockStatement = 'INSERT INTO `ac_bucket_T`'
+    self.acDB = AccountingDB.__new__( AccountingDB )
+    self.acDB.log = gLogger
+    self.acDB.dbCatalog = { 'T' : { 'keys' : [ 'Site' ], 'values' : [ 'CPU' ],
+                                    'typeFields' : [ 'Site', 'CPU', 'startTime', 'endTime' ], 'rollups' : [],
+                                    'disabledRollups' : [] } }
+    self.acDB.dbBucketsLength = { 'T' : [ ( 86400 * 8, 3600 ), ( 15552000, 86400 ), ( 31104000, 604800 ) ] }
+    self.acDB.maxBucketTime = 604800
+    self.acDB._AccountingDB__readOnly = False
+    self.acDB._AccountingDB__deadLockRetries = 2
+    self.acDB._AccountingDB__addKeyValue = lambda typeName, keyName, keyValue: S_OK( len( keyValue ) )
+    self.acDB.calculateBuckets = lambda typeName, startTime, endTime, nowEpoch: [ ( startTime - startTime % 3600,
+                                                                                    1.0, 3600 ) ]
+    self.acDB.getCSOption = lambda optionName, defaultValue: defaultValue
+    self.acDB._escapeValues = lambda values: S_OK( [ str( value ) for value in values ] )
+    self.acDB._getConnection = lambda: S_OK( MagicMock() )
+    self.acDB._query = self.__execute
+    self.acDB._update = self.__execute
+
+  def __execute( self, cmd, conn = None ):
+    self.statements.append( cmd.split( '`' )[1] if cmd.startswith( 'INSERT' ) else cmd )
+    if cmd.startswith( self.deadLockStatement ) and self.deadLocks:
+      self.deadLocks -= 1
+      return S_ERROR( "Execution failed.: ( 1213: Deadlock found when trying to get lock; try restarting transaction )" )
+    return S_OK( 1 )
+
+class MergeBucketRows( AccountingDBTestCase ):
+
+  def test_merge( self ):
+    rows = [ ( 7200, 3600, ( 1, 2 ), [ 1.0, 1.0 ] ), ( 3600, 3600, ( 1, 2 ), [ 2.0, 0.5 ] ),
+             ( 7200, 3600, ( 1, 2 ), [ 3.0, 1.0 ] ), ( 7200, 3600, ( 1, 3 ), [ 4.0, 1.0 ] ) ]
+    self.assertEqual( _mergeBucketRows( rows ), [ ( 3600, 3600, ( 1, 2 ), [ 2.0, 0.5 ] ),
+                                                  ( 7200, 3600, ( 1, 2 ), [ 4.0, 2.0 ] ),
+                                                  ( 7200, 3600, ( 1, 3 ), [ 4.0, 1.0 ] ) ] )
+    self.assertEqual( _mergeBucketRows( [] ), [] )
+
+  def test_rollup( self ):
+    rows = [ ( 3600, 3600, ( 1, ), [ 1.0, 1.0 ] ), ( 90000, 3600, ( 1, ), [ 2.0, 1.0 ] ),
+             ( 0, 86400, ( 1, ), [ 4.0, 1.0 ] ), ( 604800, 604800, ( 1, ), [ 8.0, 1.0 ] ) ]
+    # The rows shorter than a day go to the day containing them, the longer ones stay as they are
+    self.assertEqual( _mergeBucketRows( rows, 86400 ), [ ( 0, 86400, ( 1, ), [ 5.0, 2.0 ] ),
+                                                         ( 86400, 86400, ( 1, ), [ 2.0, 1.0 ] ),
+                                                         ( 604800, 604800, ( 1, ), [ 8.0, 1.0 ] ) ] )
+
+class KeyRanges( unittest.TestCase ):
+
+  def test_boundaries( self ):
+    # A range is closed when the next key does not fit, a range filled exactly is kept
+    self.assertEqual( _getKeyRanges( [ ( 3, 1 ), ( 1, 5 ), ( 2, 5 ) ], 10 ), [ [ 1, 2 ], [ 3, 3 ] ] )
+    self.assertEqual( _getKeyRanges( [ ( 1, 4 ), ( 2, 5 ), ( 3, 2 ) ], 10 ), [ [ 1, 2 ], [ 3, 3 ] ] )
+    self.assertEqual( _getKeyRanges( [ ( 1, 4 ), ( 2, 5 ), ( 3, 1 ) ], 10 ), [ [ 1, 3 ] ] )
+
+  def test_bigKey( self ):
+    # A key with more rows than a slice gets a range of its own
+    self.assertEqual( _getKeyRanges( [ ( 1, 3 ), ( 2, 20 ), ( 3, 3 ) ], 10 ), [ [ 1, 1 ], [ 2, 2 ], [ 3, 3 ] ] )
+    self.assertEqual( _getKeyRanges( [ ( 1, 20 ) ], 10 ), [ [ 1, 1 ] ] )
+
+  def test_empty( self ):
+    self.assertEqual( _getKeyRanges( [], 10 ), [] )
+
+class BundleInsertion( AccountingDBTestCase ):
+
+  def setUp( self ):
+    AccountingDBTestCase.setUp( self )
+    self.insertBundle = getattr( self.acDB, '_AccountingDB__insertBundleDirectly' )
+    self.records = [ ( 3600, 3700, [ 'SiteA', 10 ] ), ( 3650, 3700, [ 'SiteA', 5 ] ) ]
+
+  def test_insert( self ):
+    result = self.insertBundle( 'T', self.records )
+    self.assertTrue( result['OK'] )
+    # One row per record, and the two records in one bucket row
+    self.assertEqual( self.statements, [ 'START TRANSACTION', 'ac_type_T', 'ac_bucket_T', 'COMMIT' ] )
+
+  def test_deadLock( self ):
+    # The whole transaction is retried after a deadlock, not the statement alone
+    self.deadLocks = 1
+    result = self.insertBundle( 'T', self.records )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.statements, [ 'START TRANSACTION', 'ac_type_T', 'ac_bucket_T', 'ROLLBACK',
+                                         'START TRANSACTION', 'ac_type_T', 'ac_bucket_T', 'COMMIT' ] )
+    self.statements = []
+    self.deadLocks = 2
+    result = self.insertBundle( 'T', self.records )
+    self.assertFalse( result['OK'] )
+    self.assertEqual( self.statements.count( 'START TRANSACTION' ), 2 )
+    self.assertEqual( self.statements[-1], 'ROLLBACK' )
+
+  def test_readOnly( self ):
+    self.acDB._AccountingDB__readOnly = True
+    result = self.insertBundle( 'T', self.records )
+    self.assertFalse( result['OK'] )
+    self.assertEqual( self.statements, [] )
+
+class Rollups( AccountingDBTestCase ):
+
+  def setUp( self ):
+    AccountingDBTestCase.setUp( self )
+    self.getRollupForQuery = getattr( self.acDB, '_AccountingDB__getRollupForQuery' )
+    self.now = 604800 * 2000 + 5000
+    self.acDB.dbCatalog['T']['rollups'] = [ 'Daily', 'Weekly' ]
+
+  def getRollup( self, startDaysAgo, endDaysAgo = None ):
+    startTime = self.now - startDaysAgo * 86400
+    endTime = self.now - endDaysAgo * 86400 if endDaysAgo is not None else 0
+    bucketTimeLength = self.acDB.calculateBucketLengthForTime( 'T', self.now, startTime )
+    return self.getRollupForQuery( 'T', self.now, bucketTimeLength, endTime )
+
+  def test_granularity( self ):
+    # Hourly reports can not come from the rollups
+    self.assertEqual( self.getRollup( 2 ), False )
+    # Daily reports come from the daily rollup, weekly ones from the weekly rollup
+    self.assertEqual( self.getRollup( 30 ), 'Daily' )
+    self.assertEqual( self.getRollup( 300, 200 ), 'Weekly' )
+    self.acDB.dbCatalog['T']['rollups'] = [ 'Daily' ]
+    self.assertEqual( self.getRollup( 300, 200 ), 'Daily' )
+    self.acDB.dbCatalog['T']['rollups'] = []
+    self.assertEqual( self.getRollup( 30 ), False )
+
+  def test_timeRange( self ):
+    # Up to now the last row of a rollup is the current one
+    self.assertEqual( self.getRollup( 30, 0 ), 'Daily' )
+    # Otherwise it can not go past the hourly buckets at the end of the query
+    self.assertEqual( self.getRollup( 30, 2 ), False )
+    # nor the weekly rollup past the daily buckets
+    self.assertEqual( self.getRollup( 300, 10 ), 'Daily' )
+
+  def test_disabledRollups( self ):
+    checkRollups = getattr( self.acDB, '_AccountingDB__checkRollups' )
+    # The tables of the rollups no longer enabled are kept until dropped explicitly
+    result = checkRollups( 'T', [ 'ac_bucket_T', 'ac_rollup_T_Daily' ], {}, [] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.statements, [] )
+    self.assertEqual( self.acDB.dbCatalog['T']['rollups'], [] )
+    result = self.acDB.dropDisabledRollups( 'T' )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.statements, [ 'DROP TABLE `ac_rollup_T_Daily`' ] )
+    self.assertEqual( self.acDB.dbCatalog['T']['disabledRollups'], [] )
+
+class RecordDeletion( AccountingDBTestCase ):
+
+  def setUp( self ):
+    AccountingDBTestCase.setUp( self )
+    self.acDB.dbCatalog['T']['rollups'] = [ 'Daily', 'Weekly' ]
+    self.acDB.dbCatalog['T']['definition'] = { 'values' : [ ( 'CPU', 'INT UNSIGNED' ) ] }
+    self.acDB._escapeString = lambda value: S_OK( str( value ) )
+    self.acDB._AccountingDB__lastCompactionEpoch = 0
+    self.bucketLength = 3600
+    self.acDB.calculateBuckets = lambda typeName, startTime, endTime, nowEpoch: [ ( startTime - startTime % self.bucketLength,
+                                                                                    1.0, self.bucketLength ) ]
+
+  def getTables( self ):
+    return [ cmd.split( '`' )[1] if cmd.startswith( 'UPDATE' ) else cmd.split( ' ' )[0] for cmd in self.statements ]
+
+  def test_delete( self ):
+    result = self.acDB.deleteRecord( 'T', 3600, 3700, [ 'SiteA', 10 ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.getTables(), [ 'START', 'DELETE', 'ac_bucket_T', 'ac_rollup_T_Daily', 'ac_rollup_T_Weekly',
+                                          'COMMIT' ] )
+
+  def test_deleteAfterCompaction( self ):
+    # The record went to the daily rollup rows of its hourly buckets, now compacted in a weekly bucket:
+    # the rows of the daily rollup in the week are rebuilt from the buckets
+    self.bucketLength = 604800
+    result = self.acDB.deleteRecord( 'T', 604800 + 3600, 604800 + 3700, [ 'SiteA', 10 ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.getTables(), [ 'START', 'DELETE', 'ac_bucket_T', 'DELETE', 'ac_rollup_T_Daily',
+                                          'ac_rollup_T_Weekly', 'COMMIT' ] )
+    self.assertTrue( self.statements[3].startswith( 'DELETE FROM `ac_rollup_T_Daily` WHERE' ) )
+    self.assertTrue( "`ac_rollup_T_Daily`.`startTime` >= 604800 AND `ac_rollup_T_Daily`.`startTime` < 1209600" in
+                     self.statements[3] )
+
+  def test_deadLock( self ):
+    # The whole transaction is retried after a deadlock, and the error returned when they go on
+    self.deadLockStatement = 'UPDATE `ac_rollup_T_Daily`'
+    self.deadLocks = 1
+    result = self.acDB.deleteRecord( 'T', 3600, 3700, [ 'SiteA', 10 ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.getTables(), [ 'START', 'DELETE', 'ac_bucket_T', 'ac_rollup_T_Daily', 'ROLLBACK',
+                                          'START', 'DELETE', 'ac_bucket_T', 'ac_rollup_T_Daily', 'ac_rollup_T_Weekly',
+                                          'COMMIT' ] )
+    self.statements = []
+    self.deadLocks = 2
+    result = self.acDB.deleteRecord( 'T', 3600, 3700, [ 'SiteA', 10 ] )
+    self.assertFalse( result['OK'] )
+    self.assertEqual( self.statements[-1], 'ROLLBACK' )
+
+class Compaction( AccountingDBTestCase ):
+  """ Compaction against an in memory bucket table, with the transactions applied on commit
+  """
+  def setUp( self ):
+    AccountingDBTestCase.setUp( self )
+    self.acDB.compactionTableName = 'ac_catalog_Compaction'
+    self.acDB.getCSOption = lambda optionName, defaultValue: 0 if optionName == 'CompactionSlicePause' else defaultValue
+    self.acDB._query = self.execute
+    self.acDB._update = self.execute
+    self.compact = getattr( self.acDB, '_AccountingDB__incrementalCompactBucketsForType' )
+    now = int( Time.toEpoch() )
+    self.firstDay = now - now % 86400 - 20 * 86400
+    self.secondDay = self.firstDay + 86400
+    self.failDay = None
+    # ( startTime, bucketLength, Site ) : [ CPU, entriesInBucket ]
+    self.buckets = {}
+    for day in ( self.firstDay, self.secondDay ):
+      for hour in range( 3 ):
+        for site in ( 1, 2 ):
+          self.buckets[ ( day + hour * 3600, 3600, site ) ] = [ 10.0, 1.0 ]
+    self.checkpoints = {}
+    self.transaction = None
+
+  def matches( self, bucketKey, cond ):
+    startTime, bucketLength, site = bucketKey
+    for field, op, value in re.findall( r"`(\w+)` (=|>=|<) (\d+)", cond ):
+      fieldValue = { 'bucketLength' : bucketLength, 'startTime' : startTime }[ field ]
+      if not { '=' : fieldValue == int( value ), '>=' : fieldValue >= int( value ),
+               '<' : fieldValue < int( value ) }[ op ]:
+        return False
+    for low, high in re.findall( r"`Site` BETWEEN (\d+) AND (\d+)", cond ):
+      if not int( low ) <= site <= int( high ):
+        return False
+    return True
+
+  def execute( self, cmd, conn = None ):
+    self.statements.append( cmd )
+    buckets = self.transaction if self.transaction is not None else self.buckets
+    if cmd.startswith( 'START TRANSACTION' ):
+      self.transaction = dict( [ ( key, list( value ) ) for key, value in self.buckets.items() ] )
+    elif cmd.startswith( 'COMMIT' ):
+      self.buckets = self.transaction
+      self.transaction = None
+    elif cmd.startswith( 'ROLLBACK' ):
+      self.transaction = None
+    elif 'ac_catalog_Compaction' in cmd:
+      bucketLength = int( [ group for group in re.search( r"`bucketLength`=(\d+)|'T', (\d+)", cmd ).groups() if group ][0] )
+      if cmd.startswith( 'SELECT' ):
+        if bucketLength in self.checkpoints:
+          return S_OK( ( ( self.checkpoints[ bucketLength ], ), ) )
+        return S_OK( () )
+      elif cmd.startswith( 'DELETE' ):
+        self.checkpoints.pop( bucketLength, None )
+      else:
+        self.checkpoints[ bucketLength ] = int( re.search( r"VALUES \( 'T', \d+, (\d+) \)", cmd ).group( 1 ) )
+    elif cmd.startswith( 'SELECT MIN' ):
+      startTimes = [ key[0] for key in buckets if self.matches( key, cmd ) ]
+      return S_OK( ( ( min( startTimes ) if startTimes else None, ), ) )
+    elif cmd.startswith( 'SELECT' ) and cmd.endswith( 'GROUP BY `Site`' ):
+      counts = {}
+      for key in buckets:
+        if self.matches( key, cmd ):
+          counts[ key[2] ] = counts.get( key[2], 0 ) + 1
+      return S_OK( tuple( counts.items() ) )
+    elif cmd.startswith( 'SELECT' ):
+      return S_OK( tuple( [ ( key[2], value[0], value[1], key[0] ) for key, value in buckets.items()
+                            if self.matches( key, cmd ) ] ) )
+    elif cmd.startswith( 'DELETE' ):
+      if self.failDay is not None and self.matches( ( self.failDay, 3600, 1 ), cmd ):
+        return S_ERROR( "Lost connection to MySQL server" )
+      for key in [ key for key in buckets if self.matches( key, cmd ) ]:
+        del buckets[ key ]
+    elif cmd.startswith( 'INSERT INTO `ac_bucket_T`' ):
+      if self.deadLocks:
+        self.deadLocks -= 1
+        return S_ERROR( "Execution failed.: ( 1213: Deadlock found when trying to get lock; try restarting transaction )" )
+      for row in re.findall( r"\( ([\d.,]+) \)", cmd ):
+        startTime, bucketLength, entries, site, cpu = row.split( ',' )
+        bucket = buckets.setdefault( ( int( startTime ), int( bucketLength ), int( site ) ), [ 0.0, 0.0 ] )
+        bucket[0] += float( cpu )
+        bucket[1] += float( entries )
+    return S_OK()
+
+  def getDailyBuckets( self ):
+    return dict( [ ( key, value ) for key, value in self.buckets.items() if key[1] == 86400 ] )
+
+  def test_compaction( self ):
+    result = self.compact( 'T' )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.getDailyBuckets(), { ( self.firstDay, 86400, 1 ) : [ 30.0, 3.0 ],
+                                                ( self.firstDay, 86400, 2 ) : [ 30.0, 3.0 ],
+                                                ( self.secondDay, 86400, 1 ) : [ 30.0, 3.0 ],
+                                                ( self.secondDay, 86400, 2 ) : [ 30.0, 3.0 ] } )
+    self.assertEqual( len( self.buckets ), 4 )
+    self.assertEqual( self.checkpoints, {} )
+
+  def test_resume( self ):
+    # A failure leaves the checkpoint after the last target bucket done and its slice rolled back
+    self.failDay = self.secondDay
+    result = self.compact( 'T' )
+    self.assertFalse( result['OK'] )
+    self.assertEqual( self.checkpoints, { 3600 : self.secondDay } )
+    self.assertEqual( len( self.getDailyBuckets() ), 2 )
+    self.assertEqual( len( self.buckets ), 8 )
+    # The next run starts from the checkpoint and clears it when done
+    self.failDay = None
+    self.statements = []
+    result = self.compact( 'T' )
+    self.assertTrue( result['OK'] )
+    firstWindow = [ cmd for cmd in self.statements if cmd.startswith( 'SELECT MIN' ) ][0]
+    self.assertTrue( "`startTime` >= %d " % self.secondDay in firstWindow )
+    self.assertEqual( len( self.getDailyBuckets() ), 4 )
+    self.assertEqual( len( self.buckets ), 4 )
+    self.assertEqual( self.checkpoints, {} )
+
+  def test_deadLock( self ):
+    # The slice transaction is retried as a whole after a deadlock
+    self.deadLocks = 1
+    result = self.compact( 'T' )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.statements.count( 'ROLLBACK' ), 1 )
+    self.assertEqual( sorted( self.getDailyBuckets().values() ), [ [ 30.0, 3.0 ] ] * 4 )
+    self.assertEqual( len( self.buckets ), 4 )
+
+  def test_deadLocks( self ):
+    # The compaction stops when the deadlocks go on, with the slice rolled back
+    self.deadLocks = 2
+    result = self.compact( 'T' )
+    self.assertFalse( result['OK'] )
+    self.assertEqual( self.getDailyBuckets(), {} )
+    self.assertEqual( len( self.buckets ), 12 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( AccountingDBTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( MergeBucketRows ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( KeyRanges ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( BundleInsertion ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( Rollups ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( RecordDeletion ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( Compaction ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -77,6 +77,23 @@ class DataStoreHandler( RequestHandler ):
       return S_ERROR( "Error while recalculating buckets for type:\n %s" % "\n ".join( errorsList ) )
     return S_OK()
 
+  types_dropDisabledRollups = [ types.StringType ]
+  def export_dropDisabledRollups( self, typeName ):
+    """
+      Drop the tables of the rollups that are no longer enabled. (Only for all powerful admins)
+    """
+    retVal = gConfig.getSections( "/DIRAC/Setups" )
+    if not retVal[ 'OK' ]:
+      return retVal
+    errorsList = []
+    for setup in retVal[ 'Value' ]:
+      retVal = self.__acDB.dropDisabledRollups( setup, typeName )
+      if not retVal[ 'OK' ]:
+        errorsList.append( retVal[ 'Message' ] )
+    if errorsList:
+      return S_ERROR( "Error while dropping the disabled rollups for type:\n %s" % "\n ".join( errorsList ) )
+    return S_OK()
+
   types_getRegisteredTypes = []
   def export_getRegisteredTypes( self ):
     """
@@ -141,6 +158,13 @@ class DataStoreHandler( RequestHandler ):
     """
     return self.__acDB.compactBuckets()
 
+  types_getCompactionStatus = []
+  def export_getCompactionStatus( self ):
+    """
+    Get per type the number of buckets waiting for compaction and the compaction checkpoints
+    """
+    return self.__acDB.getCompactionStatus()
+
   types_remove = [ types.StringType, Time._dateTimeType, Time._dateTimeType, types.ListType ]
   def export_remove( self, typeName, startTime, endTime, valuesList ):
     """
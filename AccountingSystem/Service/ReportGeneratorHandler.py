@@ -169,6 +169,13 @@ class ReportGeneratorHandler( RequestHandler ):
       return retVal
     return policyFilter.filterListingValues( credDict, retVal[ 'Value' ] )
 
+  types_getCacheStats = []
+  def export_getCacheStats( self ):
+    """
+    Get the hits, misses and coalesced requests counters of the report data and plot caches
+    """
+    return S_OK( gDataCache.getStats() )
+
   def __generatePlotFromFileId( self, fileId ):
     result = extractRequestFromFileId( fileId )
     if not result[ 'OK' ]:
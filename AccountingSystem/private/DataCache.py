@@ -1,4 +1,8 @@
 """ Accounting Cache
+
+  Reports and plots are cached by report hash. Concurrent requests for the same
+  missing report are coalesced: the first one computes it and the others wait
+  for it and share its result.
 """
 
 __RCSID__ = "$Id$"
@@ -10,6 +14,13 @@ import threading
 from DIRAC import S_OK, S_ERROR, gLogger, rootPath, gConfig
 from DIRAC.Core.Utilities.DictCache import DictCache
 
+class _Flight( object ):
+  """ A computation in progress, waited for by the coalesced requests
+  """
+
+  def __init__( self ):
+    self.done = threading.Event()
+    self.result = S_ERROR( "Computation of the report failed" )
 
 class DataCache( object ):
 
@@ -24,6 +35,11 @@ class DataCache( object ):
     self.__graphCache = DictCache( deleteFunction = self._deleteGraph )
     self.__dataLifeTime = 600
     self.__graphLifeTime = 3600
+    self.__flightsLock = threading.Lock()
+    self.__flights = {}
+    self.__stats = {}
+    for cacheName in ( 'Data', 'Plot' ):
+      self.__stats[ cacheName ] = { 'Hits' : 0, 'Misses' : 0, 'Coalesced' : 0 }
 
   def setGraphsLocation( self, graphsDir ):
     self.graphsLocation = graphsDir
@@ -39,25 +55,66 @@ class DataCache( object ):
       self.__graphCache.purgeExpired()
       self.__dataCache.purgeExpired()
 
+  def __getCached( self, cacheName, cache, reportHash, lifeTime, computeFunc ):
+    """
+    Get a value from a cache, else compute it once for all the concurrent requests
+    """
+    self.__flightsLock.acquire()
+    try:
+      value = cache.get( reportHash )
+      if value is not None:
+        self.__stats[ cacheName ][ 'Hits' ] += 1
+        return S_OK( value )
+      flightKey = ( cacheName, reportHash )
+      flight = self.__flights.get( flightKey )
+      leader = flight is None
+      if leader:
+        self.__stats[ cacheName ][ 'Misses' ] += 1
+        flight = _Flight()
+        self.__flights[ flightKey ] = flight
+      else:
+        self.__stats[ cacheName ][ 'Coalesced' ] += 1
+    finally:
+      self.__flightsLock.release()
+    if not leader:
+      flight.done.wait()
+      return flight.result
+    try:
+      retVal = computeFunc()
+      if retVal[ 'OK' ]:
+        cache.add( reportHash, lifeTime, retVal[ 'Value' ] )
+      flight.result = retVal
+    finally:
+      self.__flightsLock.acquire()
+      try:
+        del self.__flights[ flightKey ]
+      finally:
+        self.__flightsLock.release()
+      flight.done.set()
+    return retVal
+
+  def getStats( self ):
+    """
+    Get the Hits, Misses and Coalesced counters of the data and plot caches
+    """
+    self.__flightsLock.acquire()
+    try:
+      return dict( [ ( cacheName, dict( self.__stats[ cacheName ] ) ) for cacheName in self.__stats ] )
+    finally:
+      self.__flightsLock.release()
+
   def getReportData( self, reportRequest, reportHash, dataFunc ):
     """
     Get report data from cache if exists, else generate it
     """
-    reportData = self.__dataCache.get( reportHash )
-    if reportData is None:
-      retVal = dataFunc( reportRequest )
-      if not retVal[ 'OK' ]:
-        return retVal
-      reportData = retVal[ 'Value' ]
-      self.__dataCache.add( reportHash, self.__dataLifeTime, reportData )
-    return S_OK( reportData )
+    return self.__getCached( 'Data', self.__dataCache, reportHash, self.__dataLifeTime,
+                             lambda: dataFunc( reportRequest ) )
 
   def getReportPlot( self, reportRequest, reportHash, reportData, plotFunc ):
     """
     Get report data from cache if exists, else generate it
     """
-    plotDict = self.__graphCache.get( reportHash )
-    if plotDict is None:
+    def generatePlot():
       basePlotFileName = "%s/%s" % ( self.graphsLocation, reportHash )
       retVal = plotFunc( reportRequest, reportData, basePlotFileName )
       if not retVal[ 'OK' ]:
@@ -67,8 +124,8 @@ class DataCache( object ):
         plotDict[ 'plot' ] = "%s.png" % reportHash
       if plotDict[ 'thumbnail' ]:
         plotDict[ 'thumbnail' ] = "%s.thb.png" % reportHash
-      self.__graphCache.add( reportHash, self.__graphLifeTime, plotDict )
-    return S_OK( plotDict )
+      return S_OK( plotDict )
+    return self.__getCached( 'Plot', self.__graphCache, reportHash, self.__graphLifeTime, generatePlot )
 
   def getPlotData( self, plotFileName ):
     filename = "%s/%s" % ( self.graphsLocation, plotFileName )
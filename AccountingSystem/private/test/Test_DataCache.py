@@ -0,0 +1,70 @@
+""" Test for the coalescing of the concurrent report computations of the DataCache
+"""
+
+import threading
+import unittest
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.AccountingSystem.private.DataCache import DataCache
+
+class DataCacheTestCase( unittest.TestCase ):
+  """ Base class for the DataCache test cases
+  """
+  def setUp( self ):
+    self.dataCache = DataCache()
+    self.computations = []
+    self.release = threading.Event()
+
+  def tearDown( self ):
+    self.dataCache.alive = False
+
+  def dataFunc( self, reportRequest ):
+    self.computations.append( reportRequest )
+    self.release.wait()
+    if reportRequest == 'bad':
+      return S_ERROR( 'No data' )
+    return S_OK( { 'data' : reportRequest } )
+
+  def runConcurrently( self, reportRequest, numberOfRequests ):
+    results = []
+    threads = [ threading.Thread( target = lambda: results.append( self.dataCache.getReportData( reportRequest,
+                                                                                                reportRequest,
+                                                                                                self.dataFunc ) ) )
+                for _i in range( numberOfRequests ) ]
+    for thread in threads:
+      thread.start()
+    # Let all the requests arrive while the first one is computing
+    while self.dataCache.getStats()['Data']['Coalesced'] < numberOfRequests - 1:
+      threading.Event().wait( 0.01 )
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    return results
+
+class SingleFlight( DataCacheTestCase ):
+
+  def test_coalesced( self ):
+    results = self.runConcurrently( 'report', 5 )
+    self.assertEqual( results, [ S_OK( { 'data' : 'report' } ) ] * 5 )
+    self.assertEqual( self.computations, [ 'report' ] )
+    result = self.dataCache.getReportData( 'report', 'report', self.dataFunc )
+    self.assertEqual( result['Value'], { 'data' : 'report' } )
+    self.assertEqual( self.dataCache.getStats()['Data'], { 'Hits' : 1, 'Misses' : 1, 'Coalesced' : 4 } )
+
+  def test_failure( self ):
+    results = self.runConcurrently( 'bad', 3 )
+    self.assertEqual( [ result['OK'] for result in results ], [ False ] * 3 )
+    # Failures are not cached
+    self.dataCache.getReportData( 'bad', 'bad', self.dataFunc )
+    self.assertEqual( self.computations, [ 'bad', 'bad' ] )
+    self.assertEqual( self.dataCache.getStats()['Data']['Misses'], 2 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DataCacheTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( SingleFlight ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -210,6 +210,40 @@ class AccountingCLI( cmd.Cmd ):
     except:
       self.showTraceback()
 
+  def do_dropDisabledRollups( self, args ):
+    """
+    Drop the tables of the rollups no longer enabled for type.
+      Usage : dropDisabledRollups <typeName>
+      <DIRACRoot>/DIRAC/AccountingSystem/Client/Types/<typeName>
+       should exist and inherit the base type
+    """
+    try:
+      argList = args.split()
+      if argList:
+        typeName = argList[0].strip()
+      else:
+        gLogger.error( "No type name specified" )
+        return
+      #Try to import the type
+      try:
+        typeModule = __import__( "DIRAC.AccountingSystem.Client.Types.%s" % typeName,
+                                  globals(),
+                                  locals(), typeName )
+        typeClass  = getattr( typeModule, typeName )
+      except Exception, e:
+        gLogger.error( "Can't load type %s: %s" % ( typeName, str(e) ) )
+        return
+      gLogger.info( "Loaded type %s"  % typeClass.__name__ )
+      typeDef = typeClass().getDefinition()
+      acClient = RPCClient( "Accounting/DataStore" )
+      retVal = acClient.dropDisabledRollups( typeDef[0] )
+      if retVal[ 'OK' ]:
+        gLogger.info( "Disabled rollups dropped!" )
+      else:
+        gLogger.error( "Error: %s" % retVal[ 'Message' ] )
+    except:
+      self.showTraceback()
+
   def do_showRegisteredTypes( self, args ):
     """
     Get a list of registered types
@@ -31,6 +31,21 @@ class ConfigurationHandler( RequestHandler ):
       retDict[ 'data' ] = gServiceInterface.getCompressedConfigurationData()
     return S_OK( retDict )
 
+  types_getDeltaSince = [ types.StringType ]
+  def export_getDeltaSince( self, sClientVersion ):
+    """ Get the modifications since the client version, or the whole
+        compressed configuration if they are not available
+    """
+    sVersion = gServiceInterface.getVersion()
+    retDict = { 'newestVersion' : sVersion }
+    if sClientVersion < sVersion:
+      retVal = gServiceInterface.getDeltaSince( sClientVersion )
+      if retVal[ 'OK' ]:
+        retDict.update( retVal[ 'Value' ] )
+      else:
+        retDict[ 'data' ] = gServiceInterface.getCompressedConfigurationData()
+    return S_OK( retDict )
+
   types_publishSlaveServer = [ types.StringType ]
   def export_publishSlaveServer( self, sURL ):
     gServiceInterface.publishSlaveServer( sURL )
@@ -6,6 +6,7 @@ import zlib
 import zipfile
 import threading, thread
 import time
+from hashlib import md5
 import DIRAC
 from DIRAC.Core.Utilities import List, Time
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
@@ -28,6 +29,13 @@ class ConfigurationData:
     self.localCFG = CFG()
     self.remoteCFG = CFG()
     self.mergedCFG = CFG()
+    # Flattened read only "/Section/Option" -> value index of the merged CFG
+    self.__optionIndex = {}
+    # Modifications of the remote CFG between consecutive versions, only kept by the configuration servers
+    self.__deltaHistory = []
+    self.__deltaLock = threading.Lock()
+    self.__lastVersionCFG = None
+    self.__remoteCFGChecksum = ""
     self.remoteServerList = []
     if loadDefaultCFG:
       defaultCFGFile = os.path.join( DIRAC.rootPath, "etc", "dirac.cfg" )
@@ -37,12 +45,26 @@ class ConfigurationData:
         gLogger.warn( "Can't load %s file" % defaultCFGFile )
     self.sync()
 
+  def __buildOptionIndex( self, cfg, parentPath = "", optionIndex = None ):
+    """
+    Flatten all the options of a CFG into a path -> value dictionary
+    """
+    if optionIndex is None:
+      optionIndex = {}
+    for option in cfg.listOptions( False ):
+      optionIndex[ "%s/%s" % ( parentPath, option ) ] = cfg[ option ]
+    for section in cfg.listSections( False ):
+      self.__buildOptionIndex( cfg[ section ], "%s/%s" % ( parentPath, section ), optionIndex )
+    return optionIndex
+
   def getBackupDir( self ):
     return self.backupsDir
 
   def sync( self ):
     gLogger.debug( "Updating configuration internals" )
     self.mergedCFG = self.remoteCFG.mergeWith( self.localCFG )
+    # A new index is built every time and swapped in one assignment, so readers never need a lock
+    self.__optionIndex = self.__buildOptionIndex( self.mergedCFG )
     self.remoteServerList = []
     localServers = self.extractOptionFromCFG( "%s/Servers" % self.configurationPath,
                                         self.localCFG,
@@ -55,7 +77,65 @@ class ConfigurationData:
     if remoteServers:
       self.remoteServerList.extend( List.fromChar( remoteServers, "," ) )
     self.remoteServerList = List.uniqueElements( self.remoteServerList )
-    self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
+    remoteData = str( self.remoteCFG )
+    self.compressedConfigurationData = zlib.compress( remoteData, 9 )
+    self.__remoteCFGChecksum = md5( remoteData ).hexdigest()
+    if self._isService:
+      self.__recordDelta()
+
+  def __recordDelta( self ):
+    """
+    Keep the modifications of the remote CFG since its previous version
+    """
+    version = self.getVersion()
+    self.__deltaLock.acquire()
+    try:
+      if self.__lastVersionCFG:
+        lastVersion, lastCFG = self.__lastVersionCFG
+        if version == lastVersion:
+          return
+        # There is nothing to gain shipping the whole configuration as a delta
+        if lastVersion != "0":
+          self.__deltaHistory.append( ( lastVersion, version, lastCFG.getModifications( self.remoteCFG ) ) )
+          del self.__deltaHistory[ :-self.getDeltaHistorySize() ]
+      self.__lastVersionCFG = ( version, self.remoteCFG.clone() )
+    finally:
+      self.__deltaLock.release()
+
+  def getDeltaSince( self, version ):
+    """
+    Get the lists of modifications that bring the remote CFG from the given version to the current one,
+    and the checksum of the resulting configuration
+    """
+    self.__deltaLock.acquire()
+    try:
+      deltaHistory = list( self.__deltaHistory )
+      checksum = self.__remoteCFGChecksum
+    finally:
+      self.__deltaLock.release()
+    if deltaHistory and deltaHistory[-1][1] == self.getVersion():
+      for iP in range( len( deltaHistory ) ):
+        if deltaHistory[ iP ][0] == version:
+          return S_OK( { 'delta' : [ delta[2] for delta in deltaHistory[ iP: ] ],
+                         'checksum' : checksum } )
+    return S_ERROR( "No configuration delta available since version %s" % version )
+
+  def applyRemoteCFGDelta( self, deltaList, checksum ):
+    """
+    Apply to the remote CFG the lists of modifications returned by getDeltaSince
+    """
+    newCFG = self.remoteCFG.clone()
+    for modList in deltaList:
+      retVal = newCFG.applyModifications( modList )
+      if not retVal[ 'OK' ]:
+        return retVal
+    if md5( str( newCFG ) ).hexdigest() != checksum:
+      return S_ERROR( "Configuration does not match the server one after applying the delta" )
+    self.lock()
+    self.remoteCFG = newCFG
+    self.unlock()
+    self.sync()
+    return S_OK()
 
   def loadFile( self, fileName ):
     try:
@@ -144,7 +224,13 @@ class ConfigurationData:
 
   def extractOptionFromCFG( self, path, cfg = False, disableDangerZones = False ):
     if not cfg:
-      cfg = self.mergedCFG
+      # Options of the merged CFG are served from the flattened index
+      optionIndex = self.__optionIndex
+      value = optionIndex.get( path )
+      if value is not None:
+        return value
+      levelList = [ level.strip() for level in path.split( "/" ) if level.strip() != "" ]
+      return optionIndex.get( "/%s" % "/".join( levelList ) )
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -234,6 +320,13 @@ class ConfigurationData:
     except:
       return 300
 
+  def getDeltaHistorySize( self ):
+    try:
+      return max( 1, int( self.extractOptionFromCFG( "%s/DeltaHistorySize" % self.configurationPath,
+                                        self.mergedCFG ) ) )
+    except:
+      return 10
+
   def getSlavesGraceTime( self ):
     try:
       return int( self.extractOptionFromCFG( "%s/SlavesGraceTime" % self.configurationPath,
@@ -15,12 +15,24 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 def _updateFromRemoteLocation( serviceClient ):
   gLogger.debug( "", "Trying to refresh from %s" % serviceClient.serviceURL )
   localVersion = gConfigurationData.getVersion()
-  retVal = serviceClient.getCompressedDataIfNewer( localVersion )
+  retVal = serviceClient.getDeltaSince( localVersion )
+  if not retVal[ 'OK' ]:
+    #Servers not shipping deltas
+    retVal = serviceClient.getCompressedDataIfNewer( localVersion )
   if retVal[ 'OK' ]:
     dataDict = retVal[ 'Value' ]
     if localVersion < dataDict[ 'newestVersion' ] :
       gLogger.debug( "New version available", "Updating to version %s..." % dataDict[ 'newestVersion' ] )
-      gConfigurationData.loadRemoteCFGFromCompressedMem( dataDict[ 'data' ] )
+      if 'delta' in dataDict:
+        result = gConfigurationData.applyRemoteCFGDelta( dataDict[ 'delta' ], dataDict[ 'checksum' ] )
+        if not result[ 'OK' ]:
+          gLogger.warn( "Can't apply configuration delta, getting the full configuration", result[ 'Message' ] )
+          retVal = serviceClient.getCompressedDataIfNewer( localVersion )
+          if not retVal[ 'OK' ]:
+            return retVal
+          dataDict = retVal[ 'Value' ]
+      if 'data' in dataDict:
+        gConfigurationData.loadRemoteCFGFromCompressedMem( dataDict[ 'data' ] )
       gLogger.debug( "Updated to version %s" % gConfigurationData.getVersion() )
       gEventDispatcher.triggerEvent( "CSNewVersion", dataDict[ 'newestVersion' ], threaded = True )
     return S_OK()
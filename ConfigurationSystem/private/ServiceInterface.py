@@ -162,6 +162,9 @@ class ServiceInterface( threading.Thread ):
   def getVersion( self ):
     return gConfigurationData.getVersion()
 
+  def getDeltaSince( self, version ):
+    return gConfigurationData.getDeltaSince( version )
+
   def getCommitHistory( self ):
     files = self.__getCfgBackups( gConfigurationData.getBackupDir() )
     backups = [ ".".join( fileName.split( "." )[1:-1] ).split( "@" ) for fileName in files ]
@@ -0,0 +1,124 @@
+""" Test for the option index and the configuration deltas of ConfigurationData,
+    and a benchmark of the option lookups
+"""
+
+import timeit
+import unittest
+
+from DIRAC.Core.Utilities.CFG import CFG
+from DIRAC.ConfigurationSystem.private.ConfigurationData import ConfigurationData
+
+remoteData = """
+DIRAC
+{
+  Setup = Test
+  Configuration
+  {
+    Version = 1
+  }
+}
+Operations
+{
+  Defaults
+  {
+    JobScheduling
+    {
+      CheckJobLimits = True
+    }
+  }
+}
+"""
+
+class ConfigurationDataTestCase( unittest.TestCase ):
+  """ Base class for the ConfigurationData test cases
+  """
+  def setUp( self ):
+    self.confData = ConfigurationData( loadDefaultCFG = False )
+    self.confData.loadRemoteCFGFromMem( remoteData )
+    localCFG = CFG()
+    localCFG.loadFromBuffer( "LocalSite\n{\n  Site = DIRAC.Test.ch\n}\nDIRAC\n{\n  Setup = Local\n}\n" )
+    self.confData.mergeWithLocal( localCFG )
+
+class OptionIndex( ConfigurationDataTestCase ):
+
+  def test_lookups( self ):
+    self.assertEqual( self.confData.extractOptionFromCFG( "/LocalSite/Site" ), "DIRAC.Test.ch" )
+    # The local configuration has precedence over the remote one
+    self.assertEqual( self.confData.extractOptionFromCFG( "/DIRAC/Setup" ), "Local" )
+    self.assertEqual( self.confData.extractOptionFromCFG( " DIRAC//Configuration/Version/" ), "1" )
+    # Sections and missing paths are not options
+    self.assertEqual( self.confData.extractOptionFromCFG( "/DIRAC/Configuration" ), None )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/DIRAC/Missing" ), None )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/DIRAC/Setup", self.confData.remoteCFG ), "Test" )
+
+  def test_refresh( self ):
+    self.confData.setOptionInCFG( "/LocalSite/Site", "DIRAC.Other.ch" )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/LocalSite/Site" ), "DIRAC.Other.ch" )
+    self.confData.loadRemoteCFGFromMem( remoteData.replace( "Version = 1", "Version = 2" ) )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/DIRAC/Configuration/Version" ), "2" )
+    self.confData.deleteOptionInCFG( "/LocalSite/Site" )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/LocalSite/Site" ), None )
+
+class ConfigurationDelta( ConfigurationDataTestCase ):
+
+  def test_delta( self ):
+    server = ConfigurationData( loadDefaultCFG = False )
+    server.setAsService()
+    server.loadRemoteCFGFromMem( remoteData )
+    self.assertFalse( server.getDeltaSince( "1" )[ 'OK' ] )
+    for version in ( "2", "3" ):
+      server.setOptionInCFG( "/Operations/Defaults/Option%s" % version, version, server.remoteCFG )
+      server.setVersion( version )
+    server.deleteOptionInCFG( "/Operations/Defaults/Option2", server.remoteCFG )
+    server.setVersion( "4" )
+
+    result = server.getDeltaSince( "1" )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( len( result[ 'Value' ][ 'delta' ] ), 3 )
+    self.assertEqual( len( server.getDeltaSince( "3" )[ 'Value' ][ 'delta' ] ), 1 )
+    self.assertFalse( server.getDeltaSince( "0" )[ 'OK' ] )
+
+    result = self.confData.applyRemoteCFGDelta( result[ 'Value' ][ 'delta' ], result[ 'Value' ][ 'checksum' ] )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertEqual( str( self.confData.remoteCFG ), str( server.remoteCFG ) )
+    self.assertEqual( self.confData.getVersion(), "4" )
+    self.assertEqual( self.confData.extractOptionFromCFG( "/Operations/Defaults/Option3" ), "3" )
+
+  def test_checksumMismatch( self ):
+    server = ConfigurationData( loadDefaultCFG = False )
+    server.setAsService()
+    server.loadRemoteCFGFromMem( remoteData )
+    server.setVersion( "2" )
+    result = server.getDeltaSince( "1" )[ 'Value' ]
+    # The client configuration is not the one the delta was computed from
+    self.confData.setOptionInCFG( "/DIRAC/Extra", "yes", self.confData.remoteCFG )
+    result = self.confData.applyRemoteCFGDelta( result[ 'delta' ], result[ 'checksum' ] )
+    self.assertFalse( result[ 'OK' ] )
+    self.assertEqual( self.confData.getVersion(), "1" )
+
+class OptionIndexBenchmark( ConfigurationDataTestCase ):
+
+  def test_lookupThroughput( self ):
+    """ Compare the lookups served by the index with the walk of the merged CFG
+    """
+    optionPath = "/Operations/Defaults/JobScheduling/CheckJobLimits"
+    numCalls = 20000
+    mergedCFG = self.confData.mergedCFG
+    walkTimer = timeit.Timer( lambda: self.confData.extractOptionFromCFG( optionPath, mergedCFG ) )
+    indexTimer = timeit.Timer( lambda: self.confData.extractOptionFromCFG( optionPath ) )
+    walkCost = min( walkTimer.repeat( repeat = 3, number = numCalls ) ) / numCalls
+    indexCost = min( indexTimer.repeat( repeat = 3, number = numCalls ) ) / numCalls
+    self.assertTrue( indexCost < walkCost,
+                     "Option lookup: %.2f us walking the CFG, %.2f us with the index" % ( walkCost * 1e6, indexCost * 1e6 ) )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ConfigurationDataTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( OptionIndex ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( ConfigurationDelta ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( OptionIndexBenchmark ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -4,6 +4,7 @@ __RCSID__ = "$Id$"
 import time
 import types
 import thread
+from hashlib import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -13,6 +14,7 @@ from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import getServiceURL
 from DIRAC.Core.Security import CS
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ConnectionPool import getGlobalConnectionPool
 from DIRAC.Core.DISET.ThreadConfig import ThreadConfig
 
 class BaseClient:
@@ -32,6 +34,7 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_POOL_CONNECTIONS = "poolConnections"
 
   __threadConfig = ThreadConfig()
 
@@ -51,8 +54,9 @@ class BaseClient:
     self.__nbOfUrls = 1 #by default we always have 1 url for example: RPCClient('dips://volhcb38.cern.ch:9162/Framework/SystemAdministrator')
     self.__nbOfRetry = 3 # by default we try try times 
     self.__bannedUrls = []
+    self.__poolConnections = False
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
-                      self.__discoverURL, self.__discoverCredentialsToUse,
+                      self.__discoverURL, self.__discoverPoolConnections, self.__discoverCredentialsToUse,
                       self.__checkTransportSanity,
                       self.__setKeepAliveLapse ):
       result = initFunc()
@@ -125,6 +129,14 @@ class BaseClient:
     self.kwargs[ self.KW_TIMEOUT ] = self.timeout
     return S_OK()
 
+  def __discoverPoolConnections( self ):
+    #Reuse the connections of the process wide pool? Can be disabled per host in /DIRAC/ConnConf
+    poolConnections = self.kwargs.get( self.KW_POOL_CONNECTIONS, True )
+    if type( poolConnections ) in types.StringTypes:
+      poolConnections = poolConnections.lower() in ( "true", "yes", "y", "1" )
+    self.__poolConnections = bool( poolConnections )
+    return S_OK()
+
   def __discoverCredentialsToUse( self ):
     #Use certificates?
     if self.KW_USE_CERTIFICATES in self.kwargs:
@@ -242,12 +254,42 @@ and this is thread %s
       #raise Exception( msgTxt )
 
 
-  def _connect( self ):
+  def __getConnectionKey( self ):
+    """
+    Connections can only be shared by clients going to the same URL with the same identity
+    """
+    proxyString = self.kwargs.get( self.KW_PROXY_STRING, "" )
+    if proxyString:
+      proxyString = md5( proxyString ).hexdigest()
+    return ( self.serviceURL, self.setup, self.vo, self.timeout, self.useCertificates,
+             self.kwargs.get( self.KW_PROXY_LOCATION, "" ), proxyString,
+             self.kwargs[ self.KW_SKIP_CA_CHECK ], str( self.__extraCredentials ) )
+
+  def _connect( self, pooled = False ):
+    """
+    Connect to the service. If pooled is True an idle connection from the connection pool
+    is reused if there's one, and the returned structure has the keys to give it back
+    to the pool with _releaseConnection:
+      - connectionKey: key of the connection in the pool or False if pooling is disabled
+      - creationTime: when the connection was established
+      - reused: True if the connection comes from the pool
+    """
     self.__discoverExtraCredentials()
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     if self.__enableThreadCheck:
       self.__checkThreadID()
+    connectionKey = False
+    if pooled and self.__poolConnections:
+      connectionKey = self.__getConnectionKey()
+      pooledConnection = getGlobalConnectionPool().get( connectionKey )
+      if pooledConnection:
+        transport, creationTime = pooledConnection
+        gLogger.debug( "Reusing connection to: %s" % self.serviceURL )
+        trid = getGlobalTransportPool().add( transport )
+        retVal = S_OK( ( trid, transport ) )
+        retVal.update( { 'connectionKey' : connectionKey, 'creationTime' : creationTime, 'reused' : True } )
+        return retVal
     gLogger.debug( "Connecting to: %s" % self.serviceURL )
     try:
       transport = gProtocolDict[ self.__URLTuple[0] ][ 'transport' ]( self.__URLTuple[1:3], **self.kwargs )
@@ -266,23 +308,42 @@ and this is thread %s
             gLogger.info( "Waiting %f  second before retry all service(s)" % self.__retryDelay )
             time.sleep( self.__retryDelay )
           self.__discoverURL()
-          return self._connect()
+          return self._connect( pooled )
         else:
           return S_ERROR( "Can't connect to %s: %s" % ( self.serviceURL, retVal ) )
     except Exception, e:
       return S_ERROR( "Can't connect to %s: %s" % ( self.serviceURL, e ) )
     trid = getGlobalTransportPool().add( transport )
-    return S_OK( ( trid, transport ) )
+    retVal = S_OK( ( trid, transport ) )
+    if connectionKey:
+      getGlobalConnectionPool().countHandshake()
+      retVal.update( { 'connectionKey' : connectionKey, 'creationTime' : time.time(), 'reused' : False } )
+    return retVal
 
   def _disconnect( self, trid ):
     getGlobalTransportPool().close( trid )
 
+  def _releaseConnection( self, trid, connectionKey, creationTime ):
+    """
+    Give the connection back to the connection pool instead of closing it
+    """
+    transportPool = getGlobalTransportPool()
+    transport = transportPool.get( trid )
+    if not transport:
+      return
+    #Idle connections don't get keep alives
+    transportPool.remove( trid )
+    getGlobalConnectionPool().put( connectionKey, transport, creationTime )
+
   def _proposeAction( self, transport, action ):
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
+    if self.__poolConnections and action[0] == "RPC":
+      #Ask the server to keep the connection open once the action is done
+      stConnectionInfo += ( { 'keepConnection' : True }, )
     retVal = transport.sendData( S_OK( stConnectionInfo ) )
     if not retVal[ 'OK' ]:
       return retVal
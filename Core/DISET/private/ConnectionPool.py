@@ -0,0 +1,165 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import os
+import time
+import select
+import threading
+from DIRAC import gLogger
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+
+class ConnectionPool( object ):
+  """
+  Process wide pool of established client transports.
+
+  Transports are kept by key ( URL, credentials, setup... ) once an RPC has finished
+  cleanly and the server has agreed to keep the connection open, so the next client
+  going to the same place with the same identity can skip the connection and handshake.
+  Idle transports are not registered in the TransportPool, so no keep alives are sent
+  to a server that is not listening to them. The transports are only handed out to the
+  process that pooled them: a forked child forgets the ones inherited from its parent.
+  """
+
+  def __init__( self, maxIdleTime = 30, maxLifeTime = 600, maxConnectionsPerKey = 10 ):
+    self.__maxIdleTime = maxIdleTime
+    self.__maxLifeTime = maxLifeTime
+    self.__maxConnectionsPerKey = maxConnectionsPerKey
+    self.__lock = threading.Lock()
+    self.__pid = os.getpid()
+    # key -> [ ( transport, idleSince, creationTime ) ], most recently used last
+    self.__idle = {}
+    self.__stats = { 'Handshakes' : 0, 'HandshakesSaved' : 0, 'Evicted' : 0, 'Discarded' : 0 }
+    result = gThreadScheduler.addPeriodicTask( max( 1, maxIdleTime / 2 ), self.purge )
+    if not result[ 'OK' ]:
+      gLogger.fatal( "Cannot add task to thread scheduler", result[ 'Message' ] )
+
+  def __isHealthy( self, transport, idleSince, creationTime, now ):
+    """
+    An idle transport is only usable if it is not too old and the server has not written
+    anything to it: a readable idle socket means the peer closed it or is out of sync
+    """
+    if now - idleSince > self.__maxIdleTime or now - creationTime > self.__maxLifeTime:
+      return False
+    if transport.byteStream:
+      return False
+    try:
+      poller = select.poll()
+      poller.register( transport.getSocket(), select.POLLIN | select.POLLPRI )
+      return not poller.poll( 0 )
+    except Exception:
+      return False
+
+  def __checkFork( self ):
+    """
+    Forget the transports pooled by the parent process, without closing them
+    as they are still used by the parent
+    """
+    if self.__pid != os.getpid():
+      self.__pid = os.getpid()
+      self.__idle = {}
+
+  def __discard( self, transport, counter ):
+    self.__stats[ counter ] += 1
+    try:
+      transport.close()
+    except Exception:
+      pass
+
+  def get( self, key ):
+    """
+    Get a healthy idle transport for the key
+
+    @return: ( transport, creationTime ) or None if there's none
+    """
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      self.__checkFork()
+      idleList = self.__idle.get( key, [] )
+      while idleList:
+        transport, idleSince, creationTime = idleList.pop()
+        if self.__isHealthy( transport, idleSince, creationTime, now ):
+          self.__stats[ 'HandshakesSaved' ] += 1
+          return ( transport, creationTime )
+        self.__discard( transport, 'Discarded' )
+      self.__idle.pop( key, None )
+      return None
+    finally:
+      self.__lock.release()
+
+  def put( self, key, transport, creationTime ):
+    """
+    Give back a transport once it's ready to be reused
+    """
+    now = time.time()
+    if now - creationTime > self.__maxLifeTime:
+      self.__discard( transport, 'Evicted' )
+      return
+    self.__lock.acquire()
+    try:
+      self.__checkFork()
+      idleList = self.__idle.setdefault( key, [] )
+      idleList.append( ( transport, now, creationTime ) )
+      while len( idleList ) > self.__maxConnectionsPerKey:
+        self.__discard( idleList.pop( 0 )[0], 'Evicted' )
+    finally:
+      self.__lock.release()
+
+  def countHandshake( self ):
+    self.__lock.acquire()
+    try:
+      self.__stats[ 'Handshakes' ] += 1
+    finally:
+      self.__lock.release()
+
+  def purge( self ):
+    """
+    Close the transports that have been idle for too long
+    """
+    now = time.time()
+    self.__lock.acquire()
+    try:
+      self.__checkFork()
+      for key in list( self.__idle ):
+        idleList = []
+        for transport, idleSince, creationTime in self.__idle[ key ]:
+          if now - idleSince > self.__maxIdleTime or now - creationTime > self.__maxLifeTime:
+            self.__discard( transport, 'Evicted' )
+          else:
+            idleList.append( ( transport, idleSince, creationTime ) )
+        if idleList:
+          self.__idle[ key ] = idleList
+        else:
+          del( self.__idle[ key ] )
+    finally:
+      self.__lock.release()
+
+  def getStats( self ):
+    """
+    Number of handshakes done and saved, and of idle transports evicted, discarded
+    as unhealthy and waiting in the pool
+    """
+    self.__lock.acquire()
+    try:
+      stats = dict( self.__stats )
+      stats[ 'Idle' ] = sum( [ len( idleList ) for idleList in self.__idle.values() ] )
+    finally:
+      self.__lock.release()
+    return stats
+
+
+gConnectionPool = None
+gConnectionPoolPid = None
+gConnectionPoolLock = threading.Lock()
+
+def getGlobalConnectionPool():
+  global gConnectionPool, gConnectionPoolPid
+  gConnectionPoolLock.acquire()
+  try:
+    # A forked child gets its own pool and its own purge task
+    if not gConnectionPool or gConnectionPoolPid != os.getpid():
+      gConnectionPool = ConnectionPool()
+      gConnectionPoolPid = os.getpid()
+    return gConnectionPool
+  finally:
+    gConnectionPoolLock.release()
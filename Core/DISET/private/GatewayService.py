@@ -79,6 +79,10 @@ class GatewayService( Service ):
       self._transportPool.close( trid )
     return result
 
+  def _keepConnection( self, proposalTuple ):
+    #Connections through the gateway are not kept
+    return False
+
   def _receiveAndCheckProposal( self, trid ):
     clientTransport = self._transportPool.get( trid )
     #Get the peer credentials
@@ -202,13 +206,19 @@ class GatewayService( Service ):
 
   def __forwardRPCCall( self, targetService, clientInitArgs, method, params ):
     if targetService == "Configuration/Server":
-      if method == "getCompressedDataIfNewer":
+      if method in ( "getCompressedDataIfNewer", "getDeltaSince" ):
         #Relay CS data directly
         serviceVersion = gConfigurationData.getVersion()
         retDict = { 'newestVersion' : serviceVersion }
         clientVersion = params[0]
         if clientVersion < serviceVersion:
-          retDict[ 'data' ] = gConfigurationData.getCompressedData()
+          retVal = S_ERROR( "Full data requested" )
+          if method == "getDeltaSince":
+            retVal = gConfigurationData.getDeltaSince( clientVersion )
+          if retVal[ 'OK' ]:
+            retDict.update( retVal[ 'Value' ] )
+          else:
+            retDict[ 'data' ] = gConfigurationData.getCompressedData()
         return S_OK( retDict )
     #Default
     rpcClient = RPCClient( targetService, **clientInitArgs )
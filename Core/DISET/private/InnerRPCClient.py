@@ -12,28 +12,41 @@ class InnerRPCClient( BaseClient ):
   
   def executeRPC( self, functionName, args ):
     stub = ( self._getBaseStub(), functionName, args )
-    retVal = self._connect()
+    retVal = self._connect( pooled = True )
     if not retVal[ 'OK' ]:
       retVal[ 'rpcStub' ] = stub
       return retVal
     trid, transport = retVal[ 'Value' ]
+    connectionKey = retVal.get( 'connectionKey', False )
+    creationTime = retVal.get( 'creationTime', 0 )
+    reused = retVal.get( 'reused', False )
+    keepConnection = False
     try:
       retVal = self._proposeAction( transport, ( "RPC", functionName ) )
       if not retVal[ 'OK' ]:
+        if reused:
+          #The server closed the pooled connection while it was idle. Nothing has been executed yet
+          return self.executeRPC( functionName, args )
         if self.__retry < 3:
           self.__retry += 1
           return self.executeRPC( functionName, args )
         else:
           retVal[ 'rpcStub' ] = stub
           return retVal
+      serverKeepsConnection = type( retVal[ 'Value' ] ) == types.DictType and \
+                              retVal[ 'Value' ].get( 'keepConnection', False )
 
       retVal = transport.sendData( S_OK( args ) )
       if not retVal[ 'OK' ]:
         return retVal
       receivedData = transport.receiveData()
       if type( receivedData ) == types.DictType:
+        #Errors may come from the transport, only reuse connections after a successful call
+        keepConnection = connectionKey and serverKeepsConnection and receivedData[ 'OK' ]
         receivedData[ 'rpcStub' ] = stub
       return receivedData
     finally:
-      self._disconnect( trid )
-
+      if keepConnection:
+        self._releaseConnection( trid, connectionKey, creationTime )
+      else:
+        self._disconnect( trid )
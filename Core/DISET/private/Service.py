@@ -1,6 +1,9 @@
 
 import os
 import time
+import types
+import select
+import socket
 import DIRAC
 import threading
 from DIRAC import gConfig, gLogger, S_OK, S_ERROR
@@ -46,6 +49,11 @@ class Service:
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
     self.__maxFD = 0
+    #trid -> time since the connection is waiting for a new proposal
+    self.__keptTransports = {}
+    self.__keptTransportsLock = threading.Lock()
+    #Pipe to wake up the watcher of the kept connections
+    self.__keptTransportsWakeUp = False
 
   def setCloneProcessId( self, cloneId ):
     self.__cloneId = cloneId
@@ -115,6 +123,12 @@ class Service:
 
     gThreadScheduler.addPeriodicTask( 30, self.__reportThreadPoolContents )
 
+    if self._cfg.getKeepConnectionTime() > 0:
+      self.__keptTransportsWakeUp = os.pipe()
+      keptConnectionsThread = threading.Thread( target = self.__watchKeptConnections )
+      keptConnectionsThread.setDaemon( True )
+      keptConnectionsThread.start()
+
     return S_OK()
 
   def _discoverHandlerLocation( self ):
@@ -280,8 +294,101 @@ class Service:
     self._threadPool.generateJobAndQueueIt( self._processInThread,
                                              args = ( clientTransport, ) )
 
+  #Kept connections
+
+  def __keepConnection( self, trid ):
+    self.__keptTransportsLock.acquire()
+    try:
+      keep = len( self.__keptTransports ) < self._cfg.getMaxKeptConnections()
+      if keep:
+        self.__keptTransports[ trid ] = time.time()
+    finally:
+      self.__keptTransportsLock.release()
+    if not keep:
+      #Too many idle connections already, the client will open a new one
+      self._transportPool.close( trid )
+      return
+    os.write( self.__keptTransportsWakeUp[1], "k" )
+
+  def __watchKeptConnections( self ):
+    """
+    Wait for new proposals on the connections kept open after an RPC, and close
+    the ones that have been idle for longer than KeepConnectionTime
+    """
+    while True:
+      try:
+        self.__checkKeptConnections()
+      except Exception:
+        #The kept connections would never be served nor closed without this thread
+        gLogger.exception( "Error while watching the kept connections" )
+        time.sleep( 1 )
+
+  def __checkKeptConnections( self ):
+    """
+    Close the expired kept connections and process the ones with a new proposal
+    """
+    wakeUpFD = self.__keptTransportsWakeUp[0]
+    keepTime = self._cfg.getKeepConnectionTime()
+    now = time.time()
+    #poll is used as select does not accept file descriptors above FD_SETSIZE
+    poller = select.poll()
+    poller.register( wakeUpFD, select.POLLIN )
+    fdTrids = {}
+    self.__keptTransportsLock.acquire()
+    try:
+      for trid in list( self.__keptTransports ):
+        clientTransport = self._transportPool.get( trid )
+        if not clientTransport:
+          self.__keptTransports.pop( trid )
+        elif now - self.__keptTransports[ trid ] > keepTime:
+          self.__keptTransports.pop( trid )
+          self._transportPool.close( trid )
+        else:
+          fd = clientTransport.getSocket().fileno()
+          fdTrids[ fd ] = trid
+          poller.register( fd, select.POLLIN | select.POLLPRI )
+    finally:
+      self.__keptTransportsLock.release()
+    try:
+      events = poller.poll( 1000 )
+    except ( select.error, socket.error ):
+      time.sleep( 0.001 )
+      return
+    for fd, _event in events:
+      if fd == wakeUpFD:
+        #New connections to watch
+        os.read( wakeUpFD, 4096 )
+        continue
+      trid = fdTrids[ fd ]
+      self.__keptTransportsLock.acquire()
+      try:
+        self.__keptTransports.pop( trid, None )
+      finally:
+        self.__keptTransportsLock.release()
+      clientTransport = self._transportPool.get( trid )
+      if not clientTransport:
+        #Closed in the meantime
+        continue
+      self._threadPool.generateJobAndQueueIt( self._processInThread,
+                                               args = ( clientTransport, trid ) )
+
+  def _keepConnection( self, proposalTuple ):
+    """
+    Check if the client asked to keep the connection open once the action is done
+    """
+    if len( proposalTuple ) < 4 or type( proposalTuple[3] ) != types.DictType:
+      return False
+    if proposalTuple[1][0] != 'RPC' or not proposalTuple[3].get( 'keepConnection', False ):
+      return False
+    return self._cfg.getKeepConnectionTime() > 0
+
   #Threaded process function
-  def _processInThread( self, clientTransport ):
+  def _processInThread( self, clientTransport, trid = None ):
+    """
+    Process a new connection, or a new proposal if the trid of a kept connection is given
+    """
+    if not clientTransport:
+      return
     self.__maxFD = max( self.__maxFD, clientTransport.oSocket.fileno() )
     self._lockManager.lockGlobal()
     try:
@@ -289,22 +396,27 @@ class Service:
     except Exception, e:
       monReport = False
     try:
-      #Handshake
-      try:
-        result = clientTransport.handshake()
-        if not result[ 'OK' ]:
-          clientTransport.close()
+      keptConnection = trid is not None
+      if not keptConnection:
+        #Handshake
+        try:
+          result = clientTransport.handshake()
+          if not result[ 'OK' ]:
+            clientTransport.close()
+            return
+        except:
+          return
+        #Add to the transport pool
+        trid = self._transportPool.add( clientTransport )
+        if not trid:
           return
-      except:
-        return
-      #Add to the transport pool
-      trid = self._transportPool.add( clientTransport )
-      if not trid:
-        return
       #Receive and check proposal
-      result = self._receiveAndCheckProposal( trid )
+      result = self._receiveAndCheckProposal( trid, keptConnection = keptConnection )
       if not result[ 'OK' ]:
-        self._transportPool.sendAndClose( trid, result )
+        if result.get( 'closeTransport', False ):
+          self._transportPool.close( trid )
+        else:
+          self._transportPool.sendAndClose( trid, result )
         return
       proposalTuple = result[ 'Value' ]
       #Instantiate handler
@@ -320,6 +432,8 @@ class Service:
         if not result[ 'OK' ]:
           gLogger.error( "Error processing proposal", result[ 'Message' ] )
         self._transportPool.close( trid )
+      elif result.get( 'keepTransport', False ):
+        self.__keepConnection( trid )
       return result
     finally:
       self._lockManager.unlockGlobal()
@@ -343,13 +457,18 @@ class Service:
       identity += "(%s)" % credDict[ 'DN' ]
     return identity
 
-  def _receiveAndCheckProposal( self, trid ):
+  def _receiveAndCheckProposal( self, trid, keptConnection = False ):
     clientTransport = self._transportPool.get( trid )
     #Get the peer credentials
     credDict = clientTransport.getConnectingCredentials()
     #Receive the action proposal
     retVal = clientTransport.receiveData( 1024 )
     if not retVal[ 'OK' ]:
+      if keptConnection:
+        #Clients close the kept connections they don't need any more. Nothing to answer
+        result = S_ERROR( "Kept connection closed by the client" )
+        result[ 'closeTransport' ] = True
+        return result
       gLogger.error( "Invalid action proposal", "%s %s" % ( self._createIdentityString( credDict,
                                                                                         clientTransport ),
                                                             retVal[ 'Message' ] ) )
@@ -453,7 +572,11 @@ class Service:
 
   def _processProposal( self, trid, proposalTuple, handlerObj ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    keepConnection = self._keepConnection( proposalTuple )
+    if keepConnection:
+      retVal = self._transportPool.send( trid, S_OK( { 'keepConnection' : True } ) )
+    else:
+      retVal = self._transportPool.send( trid, S_OK() )
     if not retVal[ 'OK' ]:
       return retVal
 
@@ -482,6 +605,10 @@ class Service:
         self._msgBroker.removeTransport( trid )
 
     result[ 'closeTransport' ] = not messageConnection or not result[ 'OK' ]
+    if keepConnection and result[ 'OK' ]:
+      #The answer has been sent, wait for the next proposal of the client
+      result[ 'closeTransport' ] = False
+      result[ 'keepTransport' ] = True
     return result
 
   def _mbConnect( self, trid, handlerObj = None ):
@@ -137,3 +137,16 @@ class ServiceConfiguration:
     except:
       return 21600
 
+  def getKeepConnectionTime( self ):
+    optionValue = self.getOption( "KeepConnectionTime" )
+    try:
+      return int( optionValue )
+    except:
+      return 60
+
+  def getMaxKeptConnections( self ):
+    optionValue = self.getOption( "MaxKeptConnections" )
+    try:
+      return int( optionValue )
+    except:
+      return 1000
@@ -3,7 +3,6 @@ __RCSID__ = "$Id$"
 
 import time
 import select
-import cStringIO
 try:
   from hashlib import md5
 except:
@@ -174,18 +173,13 @@ class BaseTransport:
         self.byteStream = self.byteStream[ keepAliveMagicLen: ]
         return self.__processKeepAlive( maxBufferSize, blockAfterKeepAlive )
       #From here it must be a real message!
-      #Process the size and remove the msg length from the bytestream
+      #Process the size. The data is decoded in place from the buffer to avoid copying it
       pkgSize = int( self.byteStream[ :iSeparatorPosition ] )
-      pkgData = self.byteStream[ iSeparatorPosition + 1: ]
-      readSize = len( pkgData )
-      if readSize >= pkgSize:
-        #If we already have all the data we need
-        data = pkgData[ :pkgSize ]
-        self.byteStream = pkgData[ pkgSize: ]
-      else:
+      pkgStart = iSeparatorPosition + 1
+      readSize = len( self.byteStream ) - pkgStart
+      if readSize < pkgSize:
         #If we still need to read stuff
-        pkgMem = cStringIO.StringIO()
-        pkgMem.write( pkgData )
+        pkgChunks = [ self.byteStream ]
         #Receive while there's still data to be received
         while readSize < pkgSize:
           retVal = self._read( pkgSize - readSize, skipReadyCheck = True )
@@ -195,21 +189,22 @@ class BaseTransport:
             return S_ERROR( "Peer closed connection" )
           rcvData = retVal[ 'Value' ]
           readSize += len( rcvData )
-          pkgMem.write( rcvData )
+          pkgChunks.append( rcvData )
           if maxBufferSize and readSize > maxBufferSize:
             return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
-        #Data is here! take it out from the bytestream, dencode and return
-        if readSize == pkgSize:
-          data = pkgMem.getvalue()
-          self.byteStream = ""
-        else: #readSize > pkgSize:
-          pkgMem.seek( 0, 0 )
-          data = pkgMem.read( pkgSize )
-          self.byteStream = pkgMem.read()
+        self.byteStream = "".join( pkgChunks )
+      #Data is here! dencode it and take it out from the bytestream
+      pkgBuffer = self.byteStream
+      pkgEnd = pkgStart + pkgSize
+      self.byteStream = pkgBuffer[ pkgEnd: ]
+      #The message is not bounded by a copy of the buffer: the data following it does not
+      #matter as long as the message decodes up to its announced end
       try:
-        data = DEncode.decode( data )[0]
+        data, decodedEnd = DEncode.decode( pkgBuffer, pkgStart )
       except Exception, e:
         return S_ERROR( "Could not decode received data: %s" % str( e ) )
+      if decodedEnd != pkgEnd:
+        return S_ERROR( "Could not decode received data: length mismatch" )
       if idleReceive:
         self.receivedMessages.append( data )
         return S_OK()
@@ -0,0 +1,92 @@
+""" Test for the process wide pool of DISET client connections
+"""
+
+import socket
+import unittest
+
+from mock import patch
+
+from DIRAC.Core.DISET.private import ConnectionPool as ConnectionPoolModule
+from DIRAC.Core.DISET.private.ConnectionPool import ConnectionPool, getGlobalConnectionPool
+
+class FakeTransport( object ):
+  """ Transport over one end of a socket pair
+  """
+  def __init__( self ):
+    self.oSocket, self.peerSocket = socket.socketpair()
+    self.byteStream = ""
+    self.closed = False
+
+  def getSocket( self ):
+    return self.oSocket
+
+  def close( self ):
+    self.closed = True
+    self.oSocket.close()
+
+class ConnectionPoolTestCase( unittest.TestCase ):
+  """ Base class for the ConnectionPool test cases
+  """
+  def setUp( self ):
+    self.pool = ConnectionPool( maxIdleTime = 30, maxLifeTime = 600, maxConnectionsPerKey = 2 )
+    self.key = ( "dips://server.domain:9135/Framework/Service", "Setup", "vo", 600, True )
+
+class ConnectionReuse( ConnectionPoolTestCase ):
+
+  def test_reuse( self ):
+    self.assertEqual( self.pool.get( self.key ), None )
+    transport = FakeTransport()
+    self.pool.countHandshake()
+    self.pool.put( self.key, transport, 1000000000000 )
+    # Connections are only shared with the same key
+    self.assertEqual( self.pool.get( self.key[:-1] + ( False, ) ), None )
+    self.assertEqual( self.pool.get( self.key ), ( transport, 1000000000000 ) )
+    self.assertEqual( self.pool.get( self.key ), None )
+    stats = self.pool.getStats()
+    self.assertEqual( ( stats[ 'Handshakes' ], stats[ 'HandshakesSaved' ], stats[ 'Idle' ] ), ( 1, 1, 0 ) )
+
+  def test_healthCheck( self ):
+    closedByPeer = FakeTransport()
+    closedByPeer.peerSocket.close()
+    self.pool.put( self.key, closedByPeer, 1000000000000 )
+    self.assertEqual( self.pool.get( self.key ), None )
+    self.assertTrue( closedByPeer.closed )
+    self.assertEqual( self.pool.getStats()[ 'Discarded' ], 1 )
+
+  def test_eviction( self ):
+    transports = [ FakeTransport() for _ in range( 3 ) ]
+    for transport in transports:
+      self.pool.put( self.key, transport, 1000000000000 )
+    # Only maxConnectionsPerKey are kept, the oldest ones are closed
+    self.assertTrue( transports[0].closed )
+    # Too old connections are closed instead of being pooled
+    old = FakeTransport()
+    self.pool.put( self.key, old, 0 )
+    self.assertTrue( old.closed )
+    self.assertEqual( self.pool.getStats()[ 'Evicted' ], 2 )
+    idlePool = ConnectionPool( maxIdleTime = -1 )
+    idlePool.put( self.key, transports[1], 1000000000000 )
+    idlePool.purge()
+    self.assertTrue( transports[1].closed )
+    self.assertEqual( idlePool.getStats()[ 'Idle' ], 0 )
+
+  def test_fork( self ):
+    transport = FakeTransport()
+    self.pool.put( self.key, transport, 1000000000000 )
+    globalPool = getGlobalConnectionPool()
+    self.assertTrue( getGlobalConnectionPool() is globalPool )
+    with patch.object( ConnectionPoolModule.os, 'getpid', return_value = -1 ):
+      # A child process does not get the transports of its parent, nor closes them
+      self.assertEqual( self.pool.get( self.key ), None )
+      self.assertFalse( transport.closed )
+      self.assertFalse( getGlobalConnectionPool() is globalPool )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( ConnectionPoolTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( ConnectionReuse ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -12,6 +12,11 @@ Encoding and decoding for dirac, Ids:
  t -> tuple
  d -> dictionary
  k -> DError
+
+Lists, tuples and dictionaries handle their string members (and int members when
+decoding) inline instead of dispatching them through g_dEncodeFunctions and
+g_dDecodeFunctions, as they are the bulk of the payloads. decode accepts the position where the encoded
+data starts, so messages can be decoded in place from a transport buffer.
 """
 __RCSID__ = "$Id$"
 
@@ -24,6 +29,8 @@ _dateTimeType = type( _dateTimeObject )
 _dateType = type( _dateTimeObject.date() )
 _timeType = type( _dateTimeObject.time() )
 
+_StringType = types.StringType
+
 g_dEncodeFunctions = {}
 g_dDecodeFunctions = {}
 
@@ -173,17 +180,35 @@ g_dDecodeFunctions[ 'n' ] = decodeNone
 
 #Encode and decode a list
 def encodeList( lValue, eList ):
+  extend = eList.extend
   eList.append( "l" )
   for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+    oType = type( uObject )
+    if oType is _StringType:
+      extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+    else:
+      g_dEncodeFunctions[ oType ]( uObject, eList )
   eList.append( "e" )
 
 def decodeList( data, i ):
   oL = []
+  append = oL.append
+  index = data.index
   i += 1
-  while data[ i ] != "e":
-    ob, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oL.append( ob )
+  dataType = data[ i ]
+  while dataType != "e":
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      append( data[ colon + 1 : i ] )
+    elif dataType == "i":
+      end = index( "e", i + 1 )
+      append( int( data[ i + 1 : end ] ) )
+      i = end + 1
+    else:
+      ob, i = g_dDecodeFunctions[ dataType ]( data, i )
+      append( ob )
+    dataType = data[ i ]
   return( oL, i + 1 )
 
 g_dEncodeFunctions[ types.ListType ] = encodeList
@@ -191,9 +216,14 @@ g_dDecodeFunctions[ "l" ] = decodeList
 
 #Encode and decode a tuple
 def encodeTuple( lValue, eList ):
+  extend = eList.extend
   eList.append( "t" )
   for uObject in lValue:
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+    oType = type( uObject )
+    if oType is _StringType:
+      extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+    else:
+      g_dEncodeFunctions[ oType ]( uObject, eList )
   eList.append( "e" )
 
 def decodeTuple( data, i ):
@@ -205,18 +235,42 @@ g_dDecodeFunctions[ "t" ] = decodeTuple
 
 #Encode and decode a dictionary
 def encodeDict( dValue, eList ):
+  extend = eList.extend
   eList.append( "d" )
   for key in sorted( dValue ):
-    g_dEncodeFunctions[ type( key ) ]( key, eList )
-    g_dEncodeFunctions[ type( dValue[key] ) ]( dValue[key], eList )
+    oType = type( key )
+    if oType is _StringType:
+      extend( ( "s", str( len( key ) ), ":", key ) )
+    else:
+      g_dEncodeFunctions[ oType ]( key, eList )
+    uObject = dValue[ key ]
+    oType = type( uObject )
+    if oType is _StringType:
+      extend( ( "s", str( len( uObject ) ), ":", uObject ) )
+    else:
+      g_dEncodeFunctions[ oType ]( uObject, eList )
   eList.append( "e" )
 
 def decodeDict( data, i ):
   oD = {}
+  index = data.index
   i += 1
-  while data[ i ] != "e":
-    k, i = g_dDecodeFunctions[ data[ i ] ]( data, i )
-    oD[ k ], i = g_dDecodeFunctions[ data[ i ] ]( data, i )
+  dataType = data[ i ]
+  while dataType != "e":
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      key = data[ colon + 1 : i ]
+    else:
+      key, i = g_dDecodeFunctions[ dataType ]( data, i )
+    dataType = data[ i ]
+    if dataType == "s":
+      colon = index( ":", i + 1 )
+      i = colon + 1 + int( data[ i + 1 : colon ] )
+      oD[ key ] = data[ colon + 1 : i ]
+    else:
+      oD[ key ], i = g_dDecodeFunctions[ dataType ]( data, i )
+    dataType = data[ i ]
   return ( oD, i + 1 )
 
 g_dEncodeFunctions[ types.DictType ] = encodeDict
@@ -247,22 +301,17 @@ g_dDecodeFunctions[ "k" ] = decodeDError
 
 #Encode function
 def encode( uObject ):
-  try:
-    eList = []
-    #print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
-    return "".join( eList )
-  except Exception:
-    raise
-
-def decode( data ):
+  eList = []
+  g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+def decode( data, offset = 0 ):
+  """ Decode the object encoded in data starting at offset.
+      Returns the object and the position following it
+  """
   if not data:
     return data
-  try:
-    #print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
-  except Exception:
-    raise
+  return g_dDecodeFunctions[ data[ offset ] ]( data, offset )
 
 
 if __name__ == "__main__":
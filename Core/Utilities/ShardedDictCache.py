@@ -0,0 +1,265 @@
+"""
+  ShardedDictCache.
+
+  Drop-in replacement for DictCache for caches that are heavily used from several threads:
+
+   - every instance has its own locks and the keys are spread over several shards,
+     each one with its own lock, so different caches and different keys do not contend
+   - expiration times are kept in a heap per shard so purging expired entries costs
+     O( log n ) per purged entry instead of a scan of the whole cache
+   - the cache can be bounded with maxSize, evicting the least recently used entries
+   - hits, misses, evictions and expirations are counted and returned by getStats
+"""
+__RCSID__ = "$Id$"
+
+import datetime
+import heapq
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+def _getMonotonicClock():
+  """ Get a clock that does not follow the changes of the system time, so that the expiration
+      of the entries is not advanced or delayed by them: time.monotonic when available (python 3),
+      clock_gettime( CLOCK_MONOTONIC ) through ctypes on Linux and time.time otherwise
+  """
+  try:
+    from time import monotonic
+    return monotonic
+  except ImportError:
+    pass
+  if not sys.platform.startswith( 'linux' ):
+    return time.time
+  try:
+    import ctypes
+    import ctypes.util
+
+    class _Timespec( ctypes.Structure ):
+      _fields_ = [ ( 'tv_sec', ctypes.c_long ), ( 'tv_nsec', ctypes.c_long ) ]
+
+    # clock_gettime is in librt for the glibc older than 2.17
+    libName = ctypes.util.find_library( 'rt' ) or ctypes.util.find_library( 'c' )
+    clockGettime = ctypes.CDLL( libName, use_errno = True ).clock_gettime
+    clockGettime.argtypes = [ ctypes.c_int, ctypes.POINTER( _Timespec ) ]
+    clockMonotonic = 1
+
+    def monotonic():
+      timespec = _Timespec()
+      if clockGettime( clockMonotonic, ctypes.pointer( timespec ) ):
+        raise OSError( ctypes.get_errno(), "clock_gettime( CLOCK_MONOTONIC ) failed" )
+      return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+    monotonic()
+    return monotonic
+  except Exception:
+    return time.time
+
+_now = _getMonotonicClock()
+
+class _Shard( object ):
+  """ One independently locked part of the cache
+  """
+
+  def __init__( self ):
+    self.lock = threading.RLock()
+    # key -> [ expirationTime, value ], kept in LRU order (least recent first)
+    self.entries = OrderedDict()
+    # ( expirationTime, key ), may contain stale records of updated or deleted keys
+    self.heap = []
+
+class ShardedDictCache( object ):
+  """
+  .. class:: ShardedDictCache
+
+  lock striped dict cache with optional LRU size bound
+  """
+
+  def __init__( self, deleteFunction = False, maxSize = 0, numShards = 16 ):
+    """
+    Initialize the dict cache.
+      If a delete function is specified it will be invoked when deleting a cached object
+      If maxSize is > 0 the least recently used entries will be evicted to keep the cache
+      at that size (the bound is applied per shard, so it is approximate)
+    """
+    self.__deleteFunction = deleteFunction
+    self.__numShards = max( 1, int( numShards ) )
+    self.__shards = [ _Shard() for _ in range( self.__numShards ) ]
+    self.__maxShardSize = 0
+    if maxSize > 0:
+      self.__maxShardSize = max( 1, ( int( maxSize ) + self.__numShards - 1 ) // self.__numShards )
+    self.__statsLock = threading.Lock()
+    self.__stats = { 'Hits' : 0, 'Misses' : 0, 'Evictions' : 0, 'Expirations' : 0 }
+
+  def __shard( self, cKey ):
+    return self.__shards[ hash( cKey ) % self.__numShards ]
+
+  def __count( self, counter, amount = 1 ):
+    with self.__statsLock:
+      self.__stats[ counter ] += amount
+
+  def __deleteEntry( self, shard, cKey ):
+    """ Remove an entry from a shard. The shard lock must be held
+    """
+    entry = shard.entries.pop( cKey )
+    if self.__deleteFunction:
+      self.__deleteFunction( entry[1] )
+
+  def __lookup( self, cKey, validSeconds ):
+    """ Return ( found, value ) refreshing the LRU order of the key
+    """
+    shard = self.__shard( cKey )
+    with shard.lock:
+      entry = shard.entries.get( cKey )
+      if entry is not None:
+        if entry[0] > _now() + validSeconds:
+          if self.__maxShardSize:
+            # Move it to the most recently used end
+            del shard.entries[ cKey ]
+            shard.entries[ cKey ] = entry
+          self.__count( 'Hits' )
+          return True, entry[1]
+        self.__deleteEntry( shard, cKey )
+        self.__count( 'Expirations' )
+    self.__count( 'Misses' )
+    return False, None
+
+  def exists( self, cKey, validSeconds = 0 ):
+    """
+      Returns True/False if the key exists for the given number of seconds
+      Arguments:
+      :param cKey: identification key of the record
+      :param validSeconds: The amount of seconds the key has to be valid for
+    """
+    return self.__lookup( cKey, validSeconds )[0]
+
+  def delete( self, cKey ):
+    """
+    Delete a key from the cache
+
+    :param cKey: identification key of the record
+    """
+    shard = self.__shard( cKey )
+    with shard.lock:
+      if cKey in shard.entries:
+        self.__deleteEntry( shard, cKey )
+
+  def add( self, cKey, validSeconds, value = None ):
+    """
+    Add a record to the cache
+
+    :param cKey: identification key of the record
+    :param validSeconds: valid seconds of this record
+    :param value: value of the record
+    """
+    if max( 0, validSeconds ) == 0:
+      return
+    expTime = _now() + validSeconds
+    shard = self.__shard( cKey )
+    evicted = 0
+    with shard.lock:
+      # Re-adding a key does not call the delete function, as DictCache does
+      shard.entries.pop( cKey, None )
+      shard.entries[ cKey ] = [ expTime, value ]
+      heapq.heappush( shard.heap, ( expTime, cKey ) )
+      if self.__maxShardSize:
+        while len( shard.entries ) > self.__maxShardSize:
+          self.__deleteEntry( shard, next( iter( shard.entries ) ) )
+          evicted += 1
+      # Drop the stale heap records if they pile up
+      if len( shard.heap ) > 2 * len( shard.entries ) + 64:
+        shard.heap = [ ( entry[0], key ) for key, entry in shard.entries.iteritems() ]
+        heapq.heapify( shard.heap )
+    if evicted:
+      self.__count( 'Evictions', evicted )
+
+  def get( self, cKey, validSeconds = 0 ):
+    """
+    Get a record from the cache
+
+    :param cKey: identification key of the record
+    :param validSeconds: The amount of seconds the key has to be valid for
+    """
+    return self.__lookup( cKey, validSeconds )[1]
+
+  def showContentsInString( self ):
+    """
+    Return a human readable string to represent the contents
+    """
+    data = []
+    now = _now()
+    nowDate = datetime.datetime.now()
+    for shard in self.__shards:
+      with shard.lock:
+        for cKey, entry in shard.entries.iteritems():
+          data.append( "%s:" % str( cKey ) )
+          data.append( "\tExp: %s" % ( nowDate + datetime.timedelta( seconds = entry[0] - now ) ) )
+          if entry[1]:
+            data.append( "\tVal: %s" % entry[1] )
+    return "\n".join( data )
+
+  def getKeys( self, validSeconds = 0 ):
+    """
+    Get keys for all contents
+    """
+    keys = []
+    limitTime = _now() + validSeconds
+    for shard in self.__shards:
+      with shard.lock:
+        keys.extend( [ cKey for cKey, entry in shard.entries.iteritems() if entry[0] > limitTime ] )
+    return keys
+
+  def purgeExpired( self, expiredInSeconds = 0 ):
+    """
+    Purge all entries that are expired or will be expired in <expiredInSeconds>
+    """
+    limitTime = _now() + expiredInSeconds
+    purged = 0
+    for shard in self.__shards:
+      with shard.lock:
+        heap = shard.heap
+        while heap and heap[0][0] < limitTime:
+          expTime, cKey = heapq.heappop( heap )
+          entry = shard.entries.get( cKey )
+          # Skip the records of keys that have been updated or deleted since
+          if entry is None or entry[0] != expTime:
+            continue
+          self.__deleteEntry( shard, cKey )
+          purged += 1
+    if purged:
+      self.__count( 'Expirations', purged )
+
+  def purgeAll( self, useLock = True ):
+    """
+    Purge all entries
+    CAUTION: useLock parameter should ALWAYS be True except when called from __del__
+    """
+    for shard in self.__shards:
+      if useLock:
+        shard.lock.acquire()
+      try:
+        for cKey in shard.entries.keys():
+          self.__deleteEntry( shard, cKey )
+        shard.heap = []
+      finally:
+        if useLock:
+          shard.lock.release()
+
+  def getStats( self ):
+    """
+    Get the counters of the cache: Hits, Misses, Evictions, Expirations and current Size
+    """
+    with self.__statsLock:
+      stats = dict( self.__stats )
+    stats[ 'Size' ] = sum( [ len( shard.entries ) for shard in self.__shards ] )
+    return stats
+
+  def __len__( self ):
+    return sum( [ len( shard.entries ) for shard in self.__shards ] )
+
+  def __del__( self ):
+    """ When the cache is deleted, all the entries should be purged.
+        This is particularly useful when the cache manages files
+        CAUTION: as for DictCache, there is no guaranty that it is called
+    """
+    self.purgeAll( useLock = False )
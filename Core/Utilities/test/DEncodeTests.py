@@ -0,0 +1,149 @@
+""" :mod: DEncodeTests
+    =================
+
+    .. module: DEncodeTests
+    :synopsis: unittest and benchmark for DEncode
+
+    unittest for DEncode and benchmark of its encoding and decoding speed
+    with payloads that look like the ones of real DIRAC calls
+"""
+__RCSID__ = "$Id$"
+
+## imports
+import datetime
+import timeit
+import types
+import unittest
+## SUT
+from DIRAC.Core.Utilities import DEncode
+
+def replicasPayload( numFiles = 10000 ):
+  """ the reply of a getReplicas call """
+  successful = {}
+  for i in range( numFiles ):
+    lfn = "/lhcb/MC/2012/ALLSTREAMS.DST/00021211/0000/00021211_%08d_1.allstreams.dst" % i
+    successful[ lfn ] = { "CERN-DST" : "srm://srm-eoslhcb.cern.ch/eos/lhcb/grid/prod%s" % lfn,
+                          "CNAF-DST" : "srm://storm-fe-lhcb.cr.cnaf.infn.it/t1d1%s" % lfn }
+  return { "OK" : True, "Value" : { "Successful" : successful, "Failed" : {} } }
+
+def accountingPayload( numBuckets = 5000 ):
+  """ the reply of an accounting query: a list of rows with strings, ints, longs and floats """
+  rows = []
+  for i in range( numBuckets ):
+    rows.append( ( "LCG.CERN.ch", "user", 1400000000L + 900 * i, 900, 12.5 * i, i * 1024L ** 2 ) )
+  return { "OK" : True, "Value" : rows }
+
+def jobsPayload( numJobs = 2000 ):
+  """ the reply of a job monitoring call: job attributes with datetimes and None """
+  now = datetime.datetime( 2015, 3, 1, 12, 30, 0 )
+  jobs = {}
+  for i in range( numJobs ):
+    jobs[ i ] = { "Status" : "Running", "MinorStatus" : "Application", "Site" : "LCG.CNAF.it",
+                  "SubmissionTime" : now, "EndExecTime" : None, "RescheduleCounter" : 0,
+                  "OwnerDN" : u"/DC=ch/DC=cern/OU=Users/CN=someone", "VerifiedFlag" : True }
+  return { "OK" : True, "Value" : jobs }
+
+def dispatchEncode( uObject, eList ):
+  """ encode dispatching every member of the containers, as DEncode did before its fast paths """
+  oType = type( uObject )
+  if oType in ( types.ListType, types.TupleType ):
+    eList.append( "l" if oType is types.ListType else "t" )
+    for member in uObject:
+      dispatchEncode( member, eList )
+    eList.append( "e" )
+  elif oType is types.DictType:
+    eList.append( "d" )
+    for key in sorted( uObject ):
+      dispatchEncode( key, eList )
+      dispatchEncode( uObject[ key ], eList )
+    eList.append( "e" )
+  else:
+    DEncode.g_dEncodeFunctions[ oType ]( uObject, eList )
+
+def dispatchDecode( data, i ):
+  """ decode dispatching every member of the containers, as DEncode did before its fast paths """
+  dataType = data[ i ]
+  if dataType in ( "l", "t" ):
+    oL = []
+    i += 1
+    while data[ i ] != "e":
+      ob, i = dispatchDecode( data, i )
+      oL.append( ob )
+    if dataType == "t":
+      oL = tuple( oL )
+    return ( oL, i + 1 )
+  if dataType == "d":
+    oD = {}
+    i += 1
+    while data[ i ] != "e":
+      key, i = dispatchDecode( data, i )
+      oD[ key ], i = dispatchDecode( data, i )
+    return ( oD, i + 1 )
+  return DEncode.g_dDecodeFunctions[ dataType ]( data, i )
+
+########################################################################
+class DEncodeTests( unittest.TestCase ):
+  """
+  .. class:: DEncodeTests
+  test case for DEncode
+  """
+
+  def testRoundTrip( self ):
+    """ encode and decode all the supported types """
+    obj = { "s" : "string", 1 : [ 1, 2L, 3.5, -4, None, True, False ],
+            ( 1, "t" ) : ( u"unicod\xe9", 2.0 * 10 ** 20, 2.0 * 10 ** -10 ),
+            "dates" : [ datetime.datetime( 2015, 1, 2, 3, 4, 5, 6 ), datetime.date( 2015, 1, 2 ),
+                        datetime.time( 3, 4, 5 ) ],
+            "nested" : { "empty" : {}, "list" : [], "tuple" : () } }
+    data = DEncode.encode( obj )
+    self.assertEqual( DEncode.decode( data ), ( obj, len( data ) ) )
+    self.assertEqual( DEncode.encode( [ 1, "a", None, True ] ), "li1es1:anb1e" )
+    self.assertEqual( DEncode.encode( { "b" : 1L, "a" : ( 1.5, ) } ), "ds1:atf1.5ees1:bI1ee" )
+
+  def testOffset( self ):
+    """ decode in place from a buffer """
+    data = DEncode.encode( [ "a", { "b" : 2 } ] )
+    buf = "%s:%sTRAILING" % ( len( data ), data )
+    start = buf.index( ":" ) + 1
+    self.assertEqual( DEncode.decode( buf, start ), ( [ "a", { "b" : 2 } ], start + len( data ) ) )
+
+  def testRealisticPayloads( self ):
+    """ encode and decode large payloads of real DIRAC calls """
+    for payload in ( replicasPayload(), accountingPayload(), jobsPayload() ):
+      data = DEncode.encode( payload )
+      self.assertEqual( DEncode.decode( data ), ( payload, len( data ) ) )
+
+  def testBenchmark( self ):
+    """ encoding and decoding speed of realistic payloads, against dispatching every member """
+    def dispatchEncodePayload( payload ):
+      eList = []
+      dispatchEncode( payload, eList )
+      return "".join( eList )
+    timings = {}
+    reports = []
+    for name, payload in ( ( "getReplicas 10k LFNs", replicasPayload() ),
+                           ( "accounting 5k buckets", accountingPayload() ),
+                           ( "job attributes 2k jobs", jobsPayload() ) ):
+      data = DEncode.encode( payload )
+      self.assertEqual( dispatchEncodePayload( payload ), data )
+      self.assertEqual( dispatchDecode( data, 0 ), ( payload, len( data ) ) )
+      payloadTimings = []
+      for label, function, arg in ( ( "encode", DEncode.encode, payload ),
+                                    ( "dispatch encode", dispatchEncodePayload, payload ),
+                                    ( "decode", DEncode.decode, data ),
+                                    ( "dispatch decode", lambda data: dispatchDecode( data, 0 ), data ) ):
+        timing = min( timeit.Timer( lambda: function( arg ) ).repeat( repeat = 5, number = 1 ) )
+        timings[ label ] = timings.get( label, 0 ) + timing
+        payloadTimings.append( "%s %.3f s" % ( label, timing ) )
+      reports.append( "%s (%.1f MB): %s" % ( name, len( data ) / 1024. ** 2, ", ".join( payloadTimings ) ) )
+    # Not every payload gains from the fast paths, all together they have to
+    self.assertTrue( timings[ "encode" ] < timings[ "dispatch encode" ], "\n".join( reports ) )
+    self.assertTrue( timings[ "decode" ] < timings[ "dispatch decode" ], "\n".join( reports ) )
+
+
+# # test execution
+if __name__ == "__main__":
+  gTestLoader = unittest.TestLoader()
+  gSuite = gTestLoader.loadTestsFromTestCase( DEncodeTests )
+  gSuite = unittest.TestSuite( [ gSuite ] )
+  unittest.TextTestRunner( verbosity = 3 ).run( gSuite )
@@ -0,0 +1,91 @@
+""" :mod: ShardedDictCacheTests
+    ==========================
+
+    .. module: ShardedDictCacheTests
+    :synopsis: unittest for ShardedDictCache
+
+    unittest for ShardedDictCache
+"""
+__RCSID__ = "$Id$"
+
+## imports
+import sys
+import time
+import unittest
+## SUT
+from DIRAC.Core.Utilities import ShardedDictCache as ShardedDictCacheModule
+from DIRAC.Core.Utilities.ShardedDictCache import ShardedDictCache
+
+########################################################################
+class ShardedDictCacheTests( unittest.TestCase ):
+  """
+  .. class:: ShardedDictCacheTests
+  test case for ShardedDictCache
+  """
+
+  def setUp( self ):
+    """ test setup """
+    self.deleted = []
+    self.cache = ShardedDictCache( deleteFunction = self.deleted.append, numShards = 4 )
+
+  def testAddGet( self ):
+    """ add, get, exists and delete """
+    self.cache.add( "a", 100, 1 )
+    self.cache.add( "b", 0, 2 )
+    self.assertEqual( self.cache.get( "a" ), 1 )
+    self.assertEqual( self.cache.get( "b" ), None )
+    self.assertEqual( self.cache.exists( "a" ), True )
+    self.assertEqual( self.cache.exists( "a", validSeconds = 200 ), False )
+    # the entry is not valid for 200 secs, so it has been removed
+    self.assertEqual( self.deleted, [ 1 ] )
+    self.cache.add( "a", 100, 3 )
+    self.cache.delete( "a" )
+    self.assertEqual( self.cache.get( "a" ), None )
+    self.assertEqual( self.deleted, [ 1, 3 ] )
+
+  def testPurge( self ):
+    """ purgeExpired and purgeAll """
+    for i in range( 20 ):
+      self.cache.add( i, 10 + i, i )
+    # Refresh some keys to leave stale heap records behind
+    self.cache.add( 0, 1000, 0 )
+    self.cache.add( 1, 1000, 1 )
+    self.cache.purgeExpired( expiredInSeconds = 19.5 )
+    self.assertEqual( sorted( self.deleted ), range( 2, 10 ) )
+    self.assertEqual( sorted( self.cache.getKeys() ), [ 0, 1 ] + range( 10, 20 ) )
+    self.assertEqual( sorted( self.cache.getKeys( validSeconds = 100 ) ), [ 0, 1 ] )
+    self.cache.purgeAll()
+    self.assertEqual( self.cache.getKeys(), [] )
+    self.assertEqual( len( self.deleted ), 20 )
+
+  def testLRU( self ):
+    """ maxSize evicts least recently used entries """
+    cache = ShardedDictCache( maxSize = 3, numShards = 1 )
+    for key in ( "a", "b", "c" ):
+      cache.add( key, 100, key )
+    cache.get( "a" )
+    cache.add( "d", 100, "d" )
+    self.assertEqual( sorted( cache.getKeys() ), [ "a", "c", "d" ] )
+    stats = cache.getStats()
+    self.assertEqual( stats[ 'Evictions' ], 1 )
+    self.assertEqual( stats[ 'Hits' ], 1 )
+    self.assertEqual( stats[ 'Size' ], 3 )
+    cache.get( "b" )
+    self.assertEqual( cache.getStats()[ 'Misses' ], 1 )
+
+  def testMonotonicClock( self ):
+    """ the expiration times do not follow the system time where a monotonic clock exists """
+    now = ShardedDictCacheModule._now
+    if sys.platform.startswith( 'linux' ):
+      self.assertNotEqual( now, time.time )
+    first = now()
+    second = now()
+    self.assertTrue( second >= first )
+
+
+# # test execution
+if __name__ == "__main__":
+  gTestLoader = unittest.TestLoader()
+  gSuite = gTestLoader.loadTestsFromTestCase( ShardedDictCacheTests )
+  gSuite = unittest.TestSuite( [ gSuite ] )
+  unittest.TextTestRunner( verbosity = 3 ).run( gSuite )
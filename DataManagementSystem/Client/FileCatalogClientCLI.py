@@ -10,6 +10,7 @@ import time
 import sys
 import getopt
 
+from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.ReturnValues import returnSingleResult
 from DIRAC.Core.Security.ProxyInfo import getProxyInfo
 from DIRAC.Interfaces.API.Dirac import Dirac
@@ -1066,7 +1067,7 @@ File Catalog Client $Revision: 1.17 $Date:
   def do_ls(self,args):
     """ Lists directory entries at <path> 
 
-        usage: ls [-ltrnSh] <path>
+        usage: ls [-ltrnShU] <path>
 
      -l  --long                : Long listing.
      -t  --timeorder           : List ordering by time.
@@ -1075,6 +1076,7 @@ File Catalog Client $Revision: 1.17 $Date:
      -S  --sizeorder           : List ordering by file size.
      -H  --human-readable      : Print sizes in human readable format (e.g., 1Ki, 20Mi);
                                  powers of 2 are used (1Mi = 2^20 B).
+     -U  --unsorted            : Do not sort, print the entries page by page as they come.
     """
     
     argss = args.split()
@@ -1085,8 +1087,9 @@ File Catalog Client $Revision: 1.17 $Date:
     numericid = False
     sizeorder = False
     humanread = False
-    shortopts = 'ltrnSH'
-    longopts = ['long','timeorder','reverse','numericid','sizeorder','human-readable']
+    unsorted = False
+    shortopts = 'ltrnSHU'
+    longopts = ['long','timeorder','reverse','numericid','sizeorder','human-readable','unsorted']
     path = self.cwd
     if len(argss) > 0:
       try:
@@ -1112,6 +1115,8 @@ File Catalog Client $Revision: 1.17 $Date:
           sizeorder = True
         elif opt in ['-H', '--human-readable']:
           humanread = True
+        elif opt in ['-U', '--unsorted']:
+          unsorted = True
 
       if timeorder and sizeorder:
         options = [w.replace('--sizeorder','-S') for w in options]
@@ -1150,56 +1155,73 @@ File Catalog Client $Revision: 1.17 $Date:
       dList.printListing(reverse,timeorder,sizeorder,humanread)
       return         
     
-    # Get directory contents now
+    # Get directory contents now, page by page if the catalog can do it
     try:
-      result =  self.fc.listDirectory(path,_long)                   
-      dList = DirectoryListing()
-      if result['OK']:
-        if result['Value']['Successful']:
-          for entry in result['Value']['Successful'][path]['Files']:
-            fname = entry.split('/')[-1]
-            # print entry, fname
-            # fname = entry.replace(self.cwd,'').replace('/','')
-            if _long:
-              fileDict = result['Value']['Successful'][path]['Files'][entry]['MetaData']
-              repDict = result['Value']['Successful'][path]['Files'][entry].get( "Replicas", {} )
-              if fileDict:
-                dList.addFile(fname,fileDict,repDict,numericid)
-            else:  
-              dList.addSimpleFile(fname)
-          for entry in result['Value']['Successful'][path]['SubDirs']:
-            dname = entry.split('/')[-1]
-            # print entry, dname
-            # dname = entry.replace(self.cwd,'').replace('/','')  
-            if _long:
-              dirDict = result['Value']['Successful'][path]['SubDirs'][entry]
-              if dirDict:
-                dList.addDirectory(dname,dirDict,numericid)
-            else:    
-              dList.addSimpleFile(dname)
-          
-          for entry in result['Value']['Successful'][path]['Links']:
-            pass
-          
-          if 'Datasets' in result['Value']['Successful'][path]:
-            for entry in result['Value']['Successful'][path]['Datasets']:
-              dname = os.path.basename( entry )    
-              if _long:
-                dsDict = result['Value']['Successful'][path]['Datasets'][entry]['Metadata']  
-                if dsDict:
-                  dList.addDataset(dname,dsDict,numericid)
-              else:    
-                dList.addSimpleFile(dname)
-              
-          if _long:
-            dList.printListing(reverse,timeorder,sizeorder,humanread)
-          else:
-            dList.printOrdered()
+      if hasattr( self.fc, 'iterListDirectory' ):
+        pages = self.fc.iterListDirectory( path, _long )
       else:
-        print "Error:",result['Message']
+        pages = [ self.__listDirectory( path, _long ) ]
+      dList = DirectoryListing()
+      for result in pages:
+        if not result['OK']:
+          print "Error:",result['Message']
+          return
+        self.__addListingEntries( dList, result['Value'], _long, numericid )
+        if unsorted:
+          self.__printListing( dList, _long, reverse, timeorder, sizeorder, humanread )
+          dList = DirectoryListing()
+      if not unsorted:
+        self.__printListing( dList, _long, reverse, timeorder, sizeorder, humanread )
     except Exception, x:
       print "Error:", str(x)
 
+  def __listDirectory( self, path, _long ):
+    """ List the whole directory with the catalogs that can't do it by pages
+    """
+    result = self.fc.listDirectory( path, _long )
+    if not result['OK']:
+      return result
+    if path in result['Value']['Failed']:
+      return S_ERROR( result['Value']['Failed'][path] )
+    return S_OK( result['Value']['Successful'].get( path, { 'Files':{}, 'SubDirs':{}, 'Links':{} } ) )
+
+  def __addListingEntries( self, dList, pathDict, _long, numericid ):
+    """ Add the entries of a directory listing page to the DirectoryListing
+    """
+    for entry in pathDict['Files']:
+      fname = entry.split('/')[-1]
+      if _long:
+        fileDict = pathDict['Files'][entry]['MetaData']
+        repDict = pathDict['Files'][entry].get( "Replicas", {} )
+        if fileDict:
+          dList.addFile(fname,fileDict,repDict,numericid)
+      else:  
+        dList.addSimpleFile(fname)
+    for entry in pathDict['SubDirs']:
+      dname = entry.split('/')[-1]
+      if _long:
+        dirDict = pathDict['SubDirs'][entry]
+        if dirDict:
+          dList.addDirectory(dname,dirDict,numericid)
+      else:    
+        dList.addSimpleFile(dname)
+
+    if 'Datasets' in pathDict:
+      for entry in pathDict['Datasets']:
+        dname = os.path.basename( entry )    
+        if _long:
+          dsDict = pathDict['Datasets'][entry]['Metadata']  
+          if dsDict:
+            dList.addDataset(dname,dsDict,numericid)
+        else:    
+          dList.addSimpleFile(dname)
+
+  def __printListing( self, dList, _long, reverse, timeorder, sizeorder, humanread ):
+    if _long:
+      dList.printListing(reverse,timeorder,sizeorder,humanread)
+    else:
+      dList.printOrdered()
+
   def complete_ls(self, text, line, begidx, endidx):
     result = []
     args = line.split()
@@ -1912,22 +1934,31 @@ File Catalog Client $Revision: 1.17 $Date:
       metaDict = {}    
     if verbose: print "Query:",metaDict
 
-    result = self.fc.findFilesByMetadata(metaDict,path)
-    if not result['OK']:
-      print ("Error: %s" % result['Message']) 
-      return 
-
-    if result['Value']:
-
-      if dirsOnly:
-        listToPrint = set( os.path.dirname(fullpath) for fullpath in result['Value'] )
-      else:
-        listToPrint = result['Value']
+    # Get the files page by page if the catalog can do it
+    if hasattr( self.fc, 'iterFindFilesByMetadata' ):
+      pages = self.fc.iterFindFilesByMetadata( metaDict, path )
+    else:
+      pages = [ self.fc.findFilesByMetadata( metaDict, path ) ]
 
-      for dir_ in listToPrint:
-        print dir_
+    found = False
+    printedDirs = set()
+    for result in pages:
+      if not result['OK']:
+        print ("Error: %s" % result['Message']) 
+        return 
+
+      for fullpath in result['Value']:
+        found = True
+        if dirsOnly:
+          dir_ = os.path.dirname( fullpath )
+          if dir_ in printedDirs:
+            continue
+          printedDirs.add( dir_ )
+          print dir_
+        else:
+          print fullpath
 
-    else:
+    if not found:
       if verbose:
         print "No matching data found"      
 
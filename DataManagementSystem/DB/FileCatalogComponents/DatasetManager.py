@@ -11,7 +11,11 @@ import hashlib as md5
 import os
 
 from DIRAC import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List import stringListToString
+from DIRAC.Core.Utilities.List import stringListToString, intListToString
+from DIRAC.DataManagementSystem.Client.MetaQuery import MetaQuery
+
+# Largest number of changes pending for a dataset, more than that and its file list is rebuilt
+MAX_DATASET_CHANGES = 1000
 
 class DatasetManager( object ):
 
@@ -46,6 +50,25 @@ class DatasetManager( object ):
                                                  },
                                        "PrimaryKey": "DatasetID",
                                      }
+  # Materialized file lists of the dynamic datasets: the files are kept in FC_MetaDatasetFiles,
+  # their scope and version here, and the changes of the catalog still to apply in FC_MetaDatasetChanges
+  _tables["FC_MetaDatasetCache"] = { "Fields": {
+                                                "DatasetID": "INT NOT NULL",
+                                                "Path": "VARCHAR(1024) NOT NULL DEFAULT '/'",
+                                                "Version": "INT UNSIGNED NOT NULL DEFAULT 0",
+                                                "LastUpdate": "DATETIME"
+                                               },
+                                     "PrimaryKey": "DatasetID"
+                                   }
+  _tables["FC_MetaDatasetChanges"] = { "Fields": {
+                                                  "ChangeID": "INT AUTO_INCREMENT",
+                                                  "DatasetID": "INT NOT NULL",
+                                                  "Path": "VARCHAR(1024) NOT NULL",
+                                                  "ChangeType": "VARCHAR(16) NOT NULL"
+                                                 },
+                                       "PrimaryKey": "ChangeID",
+                                       "Indexes": { "DatasetID": ["DatasetID"] }
+                                     }
 
   def __init__( self, database = None ):
     self.db = None
@@ -305,8 +328,8 @@ class DatasetManager( object ):
       
     return S_OK( {'Successful':successful, 'Failed':failed} )  
 
-  def __getMetaQueryParameters( self, metaQuery, credDict ):
-    """ Get parameters ( hash, total size, number of files ) for the given metaquery
+  def __findMetaQueryFiles( self, metaQuery, credDict ):
+    """ Get the LFNs and the FileIDs of the files selected by the given metaquery
     """
     findMetaQuery = dict( metaQuery )
 
@@ -330,7 +353,31 @@ class DatasetManager( object ):
     lfnIDList = result.get( 'LFNIDList', [] )
     if not lfnIDList:
       lfnIDList = lfnIDDict.keys()
-    lfnList.sort()
+    if lfnList and not lfnIDList:
+      # The files selected by directory metadata only come without their FileIDs
+      result = self.db.fileManager._findFiles( lfnList )
+      if not result['OK']:
+        return result
+      lfnIDList = [ fileDict['FileID'] for fileDict in result['Value']['Successful'].values() ]
+    return S_OK( ( lfnList, lfnIDList ) )
+
+  def __getMetaQueryParameters( self, metaQuery, credDict ):
+    """ Get parameters ( hash, total size, number of files ) for the given metaquery
+    """
+    result = self.__findMetaQueryFiles( metaQuery, credDict )
+    if not result['OK']:
+      return result
+    lfnList, lfnIDList = result['Value']
+    result = self.__getLFNListParameters( lfnList )
+    if not result['OK']:
+      return result
+    result['Value']['LFNIDList'] = lfnIDList
+    return result
+
+  def __getLFNListParameters( self, lfnList ):
+    """ Get parameters ( hash, total size, number of files ) for the given list of files
+    """
+    lfnList = sorted( lfnList )
     myMd5 = md5.md5()
     myMd5.update( str( lfnList ) )
     datasetHash = myMd5.hexdigest().upper()
@@ -343,8 +390,7 @@ class DatasetManager( object ):
     result = S_OK( { 'DatasetHash': datasetHash,
                      'NumberOfFiles': numberOfFiles,
                      'TotalSize': totalSize,
-                     'LFNList': lfnList,
-                     'LFNIDList': lfnIDList } )
+                     'LFNList': lfnList } )
     return result
 
   def removeDataset( self, datasets, credDict ):
@@ -379,7 +425,8 @@ class DatasetManager( object ):
       return S_OK( 'Dataset %s does not exist' % datasetName  )
     datasetID = result['Value'][0][0]
 
-    for table in ["FC_MetaDatasetFiles","FC_MetaDatasets","FC_DatasetAnnotations"]:
+    for table in ["FC_MetaDatasetFiles","FC_MetaDatasets","FC_DatasetAnnotations",
+                  "FC_MetaDatasetCache","FC_MetaDatasetChanges"]:
       req = "DELETE FROM %s WHERE DatasetID=%s" % (table, datasetID)
       result = self.db._update( req )
 
@@ -406,8 +453,15 @@ class DatasetManager( object ):
   def __checkDataset( self, datasetName, credDict ):
     """ Check that the dataset parameters correspond to the actual state
     """
-    req = "SELECT MetaQuery,DatasetHash,TotalSize,NumberOfFiles FROM FC_MetaDatasets"
-    req += " WHERE DatasetName='%s'" % datasetName
+    result = self._findDatasets( [datasetName] )
+    if not result['OK']:
+      return result
+    if not result['Value']['Successful']:
+      return S_ERROR( 'Unknown MetaDataset %s' % datasetName )
+    datasetID = result['Value']['Successful'][datasetName]['DatasetID']
+
+    req = "SELECT MetaQuery,DatasetHash,TotalSize,NumberOfFiles,Status FROM FC_MetaDatasets"
+    req += " WHERE DatasetID=%d" % datasetID
     result = self.db._query( req )
     if not result['OK']:
       return result
@@ -420,7 +474,17 @@ class DatasetManager( object ):
     totalSizeOld = int( row[2] )
     numberOfFilesOld = int( row[3] )
 
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
+    result = self.db.fileManager._getIntStatus( int( row[4] ) )
+    if not result['OK']:
+      return result
+    if result['Value'] == 'Dynamic':
+      # The materialized file list is the current result of the metaquery
+      result = self.__getDynamicDatasetFiles( datasetID, credDict )
+      if not result['OK']:
+        return result
+      result = self.__getLFNListParameters( result['Value'] )
+    else:
+      result = self.__getMetaQueryParameters( metaQuery, credDict )
     if not result['OK']:
       return result
     totalSize = result['Value']['TotalSize']
@@ -662,8 +726,14 @@ class DatasetManager( object ):
     if not result['OK']:
       return result
     intStatus = result['Value']
+    result = self._findDatasets( [datasetName] )
+    if not result['OK']:
+      return result
+    if not result['Value']['Successful']:
+      return S_ERROR( result['Value']['Failed'][datasetName] )
+    datasetID = result['Value']['Successful'][datasetName]['DatasetID']
     req = "UPDATE FC_MetaDatasets SET Status=%d, ModificationDate=UTC_TIMESTAMP() " % intStatus
-    req += "WHERE DatasetName='%s'" % datasetName
+    req += "WHERE DatasetID=%d" % datasetID
     result = self.db._update( req )
     return result
 
@@ -688,17 +758,205 @@ class DatasetManager( object ):
       return S_ERROR( 'Unknown MetaDataset ID %d' % datasetID )
 
     metaQuery = eval( result['Value'][0][0] )
-    result = self.__getMetaQueryParameters( metaQuery, credDict )
+    result = self.__updateMaterializedFiles( datasetID, metaQuery, credDict )
+    if not result['OK']:
+      return result
+
+    return self.__getStoredDatasetFiles( datasetID, credDict )
+
+  def __updateMaterializedFiles( self, datasetID, metaQuery, credDict ):
+    """ Bring the materialized file list of a dynamic dataset up to date. The metaquery is only
+        run in full the first time and after a metadata change in the scope of the dataset. The
+        removed files are just dropped and the added ones looked for in their directories only
+    """
+    req = "SELECT Version FROM FC_MetaDatasetCache WHERE DatasetID=%d" % datasetID
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    changes = []
+    fullUpdate = not result['Value']
+    if fullUpdate:
+      # The changes are recorded from now on, before the metaquery is run
+      req = "INSERT IGNORE INTO FC_MetaDatasetCache (DatasetID,Path,Version,LastUpdate) "
+      req += "VALUES (%d,'%s',0,UTC_TIMESTAMP())" % ( datasetID, metaQuery.get( 'Path', '/' ) )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+    else:
+      req = "SELECT ChangeID,Path,ChangeType FROM FC_MetaDatasetChanges WHERE DatasetID=%d" % datasetID
+      result = self.db._query( req )
+      if not result['OK']:
+        return result
+      changes = result['Value']
+      if not changes:
+        return S_OK()
+      fullUpdate = 'Metadata' in [ changeType for _changeID, _path, changeType in changes ]
+
+    if fullUpdate:
+      result = self.__findMetaQueryFiles( metaQuery, credDict )
+      if not result['OK']:
+        return result
+      fileIDList = result['Value'][1]
+      connection = self._getConnection()
+      result = self.db._query( "START TRANSACTION; ", connection )
+      if not result['OK']:
+        return result
+      req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
+      result = self.db._update( req, connection )
+      if result['OK'] and fileIDList:
+        result = self.__insertDatasetFiles( datasetID, fileIDList, connection )
+      if not result['OK']:
+        self.db._query( "ROLLBACK;", connection )
+        return result
+      result = self.db._query( "COMMIT;", connection )
+    else:
+      req = "DELETE D FROM FC_MetaDatasetFiles AS D LEFT JOIN FC_Files AS F ON D.FileID=F.FileID"
+      req += " WHERE D.DatasetID=%d AND F.FileID IS NULL" % datasetID
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+      fileIDList = set()
+      for path in set( [ path for _changeID, path, _changeType in changes ] ):
+        result = self.__findMetaQueryFiles( dict( metaQuery, Path = path ), credDict )
+        if not result['OK']:
+          return result
+        fileIDList.update( result['Value'][1] )
+      # Files still in the catalog leave the dataset when it selects on replicas they no longer have
+      replicaPaths = set( [ path for _changeID, path, changeType in changes if changeType == 'Replicas' ] )
+      if replicaPaths:
+        result = self.db.dtree.findDirs( list( replicaPaths ) )
+        if not result['OK']:
+          return result
+        if result['Value']:
+          req = "DELETE D FROM FC_MetaDatasetFiles AS D, FC_Files AS F WHERE D.FileID=F.FileID"
+          req += " AND D.DatasetID=%d AND F.DirID IN (%s)" % ( datasetID, intListToString( result['Value'].values() ) )
+          if fileIDList:
+            req += " AND D.FileID NOT IN (%s)" % intListToString( fileIDList )
+          result = self.db._update( req )
+          if not result['OK']:
+            return result
+      if fileIDList:
+        result = self.__insertDatasetFiles( datasetID, list( fileIDList ), ignore = True )
+    if not result['OK']:
+      return result
+
+    if changes:
+      req = "DELETE FROM FC_MetaDatasetChanges WHERE DatasetID=%d AND ChangeID<=%d" % \
+            ( datasetID, max( [ changeID for changeID, _path, _changeType in changes ] ) )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+    req = "UPDATE FC_MetaDatasetCache SET Version=Version+1, LastUpdate=UTC_TIMESTAMP() WHERE DatasetID=%d" % datasetID
+    return self.db._update( req )
+
+  def __insertDatasetFiles( self, datasetID, fileIDList, connection = False, ignore = False ):
+    """ Add the given files to the dataset file list
+    """
+    valueString = ','.join( [ '(%d,%d)' % ( datasetID, fileID ) for fileID in fileIDList ] )
+    req = "INSERT %sINTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % ( 'IGNORE ' if ignore else '', valueString )
+    return self.db._update( req, connection )
+
+  def addDatasetChanges( self, paths, changeType, credDict = {} ):
+    """ Record the changes of the catalog for the dynamic datasets with a materialized file list:
+        changeType is 'Files' for files added or removed, 'Replicas' for replicas added, removed
+        or moved and 'Metadata' for metadata set or removed on the given paths. Only the datasets
+        whose scope and directory metadata can select files of the changed directories are
+        concerned, and a change already pending for a dataset is not recorded again. The changes
+        of the file and replica status are not followed, checkDataset on a frozen copy of the
+        dataset shows them
+    """
+    if not paths:
+      return S_OK()
+    if changeType != 'Metadata':
+      paths = set( [ os.path.dirname( path ) for path in paths ] )
+    scopes = set()
+    for path in paths:
+      while path not in scopes:
+        scopes.add( path )
+        path = os.path.dirname( path )
+    req = "SELECT C.DatasetID,C.Path,D.MetaQuery FROM FC_MetaDatasetCache AS C, FC_MetaDatasets AS D"
+    req += " WHERE C.DatasetID=D.DatasetID AND ( C.Path IN (%s)" % stringListToString( scopes )
+    if changeType == 'Metadata':
+      # Metadata of a parent directory of the dataset scope applies to the dataset too
+      for path in paths:
+        req += " OR C.Path LIKE '%s/%%'" % path.rstrip( '/' )
+    req += " )"
+    result = self.db._query( req )
     if not result['OK']:
       return result
+    candidates = result['Value']
+    if not candidates:
+      return S_OK()
 
-    lfnList = result['Value']['LFNList']
-    finalResult = S_OK(lfnList)
-    finalResult['FileIDList'] = result['Value']['LFNIDList']
-    return finalResult
+    dirMetaTypes = None
+    dirMetaDicts = {}
+    newChanges = {}
+    for datasetID, scope, metaQuery in candidates:
+      metaQuery = eval( metaQuery )
+      if changeType == 'Replicas' and 'SE' not in metaQuery:
+        continue
+      for path in paths:
+        if not ( self.__isInScope( path, scope ) or ( changeType == 'Metadata' and self.__isInScope( scope, path ) ) ):
+          continue
+        if changeType != 'Metadata':
+          # Files of a directory whose metadata does not match the query are not in the dataset
+          if dirMetaTypes is None:
+            result = self.db.dmeta.getMetadataFields( credDict )
+            dirMetaTypes = result['Value'] if result['OK'] else {}
+          dirQuery = dict( [ ( meta, value ) for meta, value in metaQuery.items() if meta in dirMetaTypes ] )
+          if dirQuery:
+            if path not in dirMetaDicts:
+              result = self.db.dmeta.getDirectoryMetadata( path, credDict )
+              dirMetaDicts[path] = result['Value'] if result['OK'] else None
+            if dirMetaDicts[path] is not None:
+              result = MetaQuery( dirQuery, dirMetaTypes ).applyQuery( dirMetaDicts[path] )
+              if result['OK'] and not result['Value']:
+                continue
+        newChanges.setdefault( datasetID, set() ).add( ( path, changeType ) )
+    if not newChanges:
+      return S_OK()
 
-  def __getFrozenDatasetFiles( self, datasetID, credDict ):
-    """ Get dataset lfns from a frozen snapshot
+    # Coalesce with the changes already pending
+    req = "SELECT DatasetID,Path,ChangeType FROM FC_MetaDatasetChanges WHERE DatasetID IN (%s)" % \
+          intListToString( newChanges )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    pendingChanges = {}
+    for datasetID, path, pendingType in result['Value']:
+      pendingChanges.setdefault( datasetID, set() ).add( ( path, pendingType ) )
+    changeList = []
+    rebuildIDs = []
+    for datasetID, changes in newChanges.items():
+      pending = pendingChanges.get( datasetID, set() )
+      if 'Metadata' in [ pendingType for _path, pendingType in pending ]:
+        # The whole file list is rebuilt anyway
+        continue
+      changes -= pending
+      if not changes:
+        continue
+      if changeType == 'Metadata' or len( pending ) + len( changes ) > MAX_DATASET_CHANGES:
+        # One change to rebuild the file list stands for all the others
+        rebuildIDs.append( datasetID )
+        changes = set( [ ( sorted( changes )[0][0], 'Metadata' ) ] )
+      changeList += [ "(%d,'%s','%s')" % ( datasetID, path, pathType ) for path, pathType in sorted( changes ) ]
+    if rebuildIDs:
+      req = "DELETE FROM FC_MetaDatasetChanges WHERE DatasetID IN (%s)" % intListToString( rebuildIDs )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
+    if not changeList:
+      return S_OK()
+    req = "INSERT INTO FC_MetaDatasetChanges (DatasetID,Path,ChangeType) VALUES %s" % ','.join( changeList )
+    return self.db._update( req )
+
+  def __isInScope( self, path, scope ):
+    """ Check if the path is the scope directory or below it
+    """
+    return scope == '/' or path == scope or path.startswith( scope.rstrip( '/' ) + '/' )
+
+  def __getStoredDatasetFiles( self, datasetID, credDict ):
+    """ Get dataset lfns from the stored file list, frozen snapshot or materialized one
     """
 
     req = "SELECT FileID FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
@@ -707,6 +965,10 @@ class DatasetManager( object ):
       return result
 
     fileIDList = [ row[0] for row in result['Value'] ]
+    if not fileIDList:
+      result = S_OK( [] )
+      result['FileIDList'] = []
+      return result
     result = self.db.fileManager._getFileLFNs( fileIDList )
     if not result['OK']:
       return result
@@ -738,13 +1000,13 @@ class DatasetManager( object ):
   def __getDatasetFiles( self, datasetName, credDict ):
     """ Get dataset files
     """
-    result = self.getDatasetParameters( datasetName, credDict )
+    result = self.__getDatasetParameters( datasetName, credDict )
     if not result['OK']:
       return result
     status = result['Value']['Status']
     datasetID = result['Value']['DatasetID']
     if status in ["Frozen","Static"]:
-      return self.__getFrozenDatasetFiles( datasetID, credDict )
+      return self.__getStoredDatasetFiles( datasetID, credDict )
     else:
       return self.__getDynamicDatasetFiles( datasetID, credDict )
 
@@ -769,30 +1031,23 @@ class DatasetManager( object ):
   def __freezeDataset( self, datasetName, credDict ):
     """ Freeze the contents of the dataset
     """
-    result = self.getDatasetParameters( datasetName, credDict )
+    result = self.__getDatasetParameters( datasetName, credDict )
     if not result['OK']:
       return result
     status = result['Value']['Status']
     if status == "Frozen":
       return S_OK()
 
+    # The up to date materialized file list becomes the frozen snapshot
     datasetID = result['Value']['DatasetID']
-    req = "DELETE FROM FC_MetaDatasetFiles WHERE DatasetID=%d" % datasetID
-    result = self.db._update( req )
-
     result = self.__getDynamicDatasetFiles( datasetID, credDict )
-
-    if not result['OK']:
-      return result
-    fileIDList = result['FileIDList']
-    valueList = []
-    for fileID in fileIDList:
-      valueList.append( '(%d,%d)' % (datasetID,fileID) )
-    valueString = ','.join( valueList )
-    req = "INSERT INTO FC_MetaDatasetFiles (DatasetID,FileID) VALUES %s" % valueString
-    result = self.db._update( req )
     if not result['OK']:
       return result
+    for table in ["FC_MetaDatasetCache","FC_MetaDatasetChanges"]:
+      req = "DELETE FROM %s WHERE DatasetID=%d" % ( table, datasetID )
+      result = self.db._update( req )
+      if not result['OK']:
+        return result
 
     result = self.setDatasetStatus( datasetName, 'Frozen' )
     return result
@@ -819,7 +1074,7 @@ class DatasetManager( object ):
   def __releaseDataset( self, datasetName, credDict ):
     """ return the dataset to a dynamic state
     """
-    result = self.getDatasetParameters( datasetName, credDict )
+    result = self.__getDatasetParameters( datasetName, credDict )
     if not result['OK']:
       return result
     status = result['Value']['Status']
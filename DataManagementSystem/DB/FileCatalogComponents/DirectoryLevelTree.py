@@ -12,6 +12,7 @@ __RCSID__ = "$Id$"
 import os
 from types import ListType, StringTypes
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.Utilities.List import intListToString
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryTreeBase import DirectoryTreeBase
 
 MAX_LEVELS = 15
@@ -34,6 +35,12 @@ class DirectoryLevelTree(DirectoryTreeBase):
     """
     
     dpath = os.path.normpath( path )    
+    dirID = self._getCachedDirID( dpath )
+    if dirID:
+      res = S_OK( dirID )
+      res['Level'] = 0 if dpath == '/' else dpath.count( '/' )
+      return res
+
     req = "SELECT DirID,Level from FC_DirectoryLevelTree WHERE DirName='%s'" % dpath
     result = self.db._query(req,connection)
     if not result['OK']:
@@ -42,6 +49,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not result['Value']:
       return S_OK('')
     
+    self._cacheDirID( dpath, result['Value'][0][0] )
     res = S_OK( result['Value'][0][0] )
     res['Level'] = result['Value'][0][1]
     return res
@@ -49,14 +57,26 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def findDirs( self, paths, connection=False ):
     """ Find DirIDs for the given path list
     """
-    dpaths = ','.join( [ "'"+os.path.normpath( path )+"'" for path in paths ] )
+    dirDict = {}
+    dpaths = []
+    for path in paths:
+      dpath = os.path.normpath( path )
+      dirID = self._getCachedDirID( dpath )
+      if dirID:
+        dirDict[dpath] = dirID
+      else:
+        dpaths.append( dpath )
+    if not dpaths:
+      return S_OK( dirDict )
+
+    dpaths = ','.join( [ "'"+dpath+"'" for dpath in dpaths ] )
     req = "SELECT DirName,DirID from FC_DirectoryLevelTree WHERE DirName in (%s)" % dpaths
     result = self.db._query(req,connection)
     if not result['OK']:
       return result
-    dirDict = {}
     for dirName, dirID in result['Value']:
       dirDict[dirName] = dirID
+      self._cacheDirID( dirName, dirID )
 
     return S_OK( dirDict )
   
@@ -75,6 +95,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
     dirID = result['Value']
     req = "DELETE FROM FC_DirectoryLevelTree WHERE DirID=%d" % dirID
     result = self.db._update(req)
+    self._uncacheDir( path )
     result['DirID'] = dirID
     return result
 
@@ -98,6 +119,20 @@ class DirectoryLevelTree(DirectoryTreeBase):
     result = S_OK(epathList)
     result['Level'] = level   
     return result
+
+  def __getNumericPaths( self, dirIDList, connection = False ):
+    """ Get the enumerated paths of the given directories
+    """
+    epathString = ','.join( [ 'LPATH%d' % ( i + 1 ) for i in range( MAX_LEVELS ) ] )
+    req = 'SELECT DirID,Level,%s FROM FC_DirectoryLevelTree WHERE DirID IN (%s)' % ( epathString,
+                                                                                   intListToString( dirIDList ) )
+    result = self.db._query( req, connection )
+    if not result['OK']:
+      return result
+    epathDict = {}
+    for row in result['Value']:
+      epathDict[row[0]] = list( row[2:2 + row[1]] )
+    return S_OK( epathDict )
     
   def makeDir(self,path):
     """ Create a new directory entry
@@ -182,11 +217,103 @@ class DirectoryLevelTree(DirectoryTreeBase):
     else:
       result = self.db._query( "ROLLBACK;", conn )
       
+    self._cacheDirID( path, dirID )
     result = S_OK(dirID)
     result['NewDirectory'] = True
     return result  
   
   
+  def _makeDirs( self, paths, dirIDs, credDict ):
+    """ Create directories of the same level with multi-row INSERTs
+    """
+    if paths == ['/']:
+      return DirectoryTreeBase._makeDirs( self, paths, dirIDs, credDict )
+
+    successful = {}
+    failed = {}
+    level = paths[0].count( '/' )
+    if level > MAX_LEVELS:
+      return S_ERROR( 'Too many directory levels: %d' % level )
+    result = self.db.ugManager.getUserAndGroupID( credDict )
+    if not result['OK']:
+      return result
+    l_uid, l_gid = result['Value']
+
+    parentIDs = list( set( [ dirIDs[os.path.dirname( path )] for path in paths ] ) )
+    result = self.__getNumericPaths( parentIDs )
+    if not result['OK']:
+      return result
+    epathDict = result['Value']
+
+    connection = self._getConnection()
+    lPath = "LPATH%d" % level
+    result = self.db._query( "START TRANSACTION; ", connection )
+    if not result['OK']:
+      return result
+    req = "SELECT Parent,MAX(%s) FROM FC_DirectoryLevelTree WHERE Parent IN (%s) GROUP BY Parent FOR UPDATE; " % \
+          ( lPath, intListToString( parentIDs ) )
+    result = self.db._query( req, connection )
+    if not result['OK']:
+      self.db._query( "ROLLBACK;", connection )
+      return result
+    lastIndex = dict( result['Value'] )
+
+    names = ['DirName', 'Level', 'Parent'] + [ 'LPATH%d' % i for i in range( 1, level + 1 ) ]
+    insertTuples = []
+    newPaths = []
+    for path in sorted( paths ):
+      parentID = dirIDs[os.path.dirname( path )]
+      if parentID not in epathDict:
+        failed[path] = 'Parent directory not found'
+        continue
+      lastIndex[parentID] = lastIndex.get( parentID, 0 ) + 1
+      values = [path, level, parentID] + epathDict[parentID][:level - 1] + [lastIndex[parentID]]
+      result = self.db._escapeValues( values )
+      if not result['OK']:
+        failed[path] = result['Message']
+        continue
+      insertTuples.append( "(%s)" % ','.join( result['Value'] ) )
+      newPaths.append( path )
+    if not insertTuples:
+      self.db._query( "ROLLBACK;", connection )
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+
+    req = "INSERT INTO FC_DirectoryLevelTree (%s) VALUES %s" % ( ','.join( names ), ','.join( insertTuples ) )
+    result = self.db._update( req, connection )
+    if not result['OK']:
+      self.db._query( "ROLLBACK;", connection )
+      if result['Message'].find( 'Duplicate' ) != -1:
+        # Some directories were created in the meantime, go one by one
+        return DirectoryTreeBase._makeDirs( self, paths, dirIDs, credDict )
+      return result
+    result = self.db._query( "COMMIT;", connection )
+    if not result['OK']:
+      return result
+
+    result = self.findDirs( newPaths )
+    if not result['OK']:
+      return result
+    newDirIDs = result['Value']
+    insertTuples = [ "(%d,%d,%d,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d,0)" % ( dirID, l_uid, l_gid, self.db.umask )
+                     for dirID in newDirIDs.values() ]
+    req = "INSERT INTO FC_DirectoryInfo (DirID,UID,GID,CreationDate,ModificationDate,Mode,Status) VALUES %s" % \
+          ','.join( insertTuples )
+    result = self.db._update( req )
+    if not result['OK']:
+      req = "DELETE FROM FC_DirectoryLevelTree WHERE DirID IN (%s)" % intListToString( newDirIDs.values() )
+      self.db._update( req )
+      for path in newPaths:
+        self._uncacheDir( path )
+        failed[path] = 'Failed to create directory %s' % path
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+
+    for path in newPaths:
+      if path in newDirIDs:
+        successful[path] = newDirIDs[path]
+      else:
+        failed[path] = 'Failed to create directory %s' % path
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
   def existsDir(self,path):
     """ Check the existence of a directory at the specified path
     """
@@ -280,6 +407,10 @@ class DirectoryLevelTree(DirectoryTreeBase):
         specified by its path
     """    
     
+    pathIDs = self._getCachedPathIDs( path )
+    if pathIDs:
+      return S_OK( pathIDs )
+
     elements = path.split('/')
     pelements = []
     dPath = ''
@@ -296,7 +427,9 @@ class DirectoryLevelTree(DirectoryTreeBase):
     if not result['Value']:
       return S_ERROR('Directory %s not found' % path)
        
-    return S_OK([ x[0] for x in result['Value'] ])
+    pathIDs = [ x[0] for x in result['Value'] ]
+    self._cachePathIDs( path, pathIDs )
+    return S_OK( pathIDs )
   
   def getPathIDsByID_old(self,dirID):
     """ Get IDs of all the directories in the parent hierarchy for a directory
@@ -337,6 +470,43 @@ class DirectoryLevelTree(DirectoryTreeBase):
 
     return S_OK([ x[1] for x in result['Value'] ] + [dirID] )
     
+  def getPathIDsByIDs( self, dirIDs ):
+    """ Get IDs of all the directories in the parent hierarchy for each of the directories
+        specified by their IDs, with a single lookup of all the parents
+    """
+    result = self.__getNumericPaths( dirIDs )
+    if not result['OK']:
+      return result
+    epathDict = result['Value']
+
+    # The parents are the directories whose enumerated paths start the ones of the directories
+    lpathSelects = set()
+    for dirID in dirIDs:
+      if dirID not in epathDict:
+        return S_ERROR( 'No result for the path of Directory with ID %d' % dirID )
+      lpaths = epathDict[dirID]
+      for l in range( len( lpaths ) ):
+        lpathSelects.add( ' AND '.join( ["Level=%d" % l] + [ 'LPATH%d=%d' % ( ll + 1, lpaths[ll] ) for ll in range( l ) ] ) )
+    parentDict = {}
+    if lpathSelects:
+      epathString = ','.join( [ 'LPATH%d' % ( i + 1 ) for i in range( MAX_LEVELS ) ] )
+      selection = '(' + ') OR ('.join( sorted( lpathSelects ) ) + ')'
+      req = "SELECT DirID,Level,%s FROM FC_DirectoryLevelTree WHERE %s" % ( epathString, selection )
+      result = self.db._query( req )
+      if not result['OK']:
+        return result
+      for row in result['Value']:
+        parentDict[tuple( row[2:2 + row[1]] )] = row[0]
+
+    pathIDDict = {}
+    for dirID in dirIDs:
+      lpaths = epathDict[dirID]
+      prefixes = [ tuple( lpaths[:l] ) for l in range( len( lpaths ) ) ]
+      if [ prefix for prefix in prefixes if prefix not in parentDict ]:
+        return S_ERROR( 'No result for the path of Directory with ID %d' % dirID )
+      pathIDDict[dirID] = [ parentDict[prefix] for prefix in prefixes ] + [dirID]
+    return S_OK( pathIDDict )
+
   def getChildren(self,path,connection=False):
     """ Get child directory IDs for the given directory 
     """  
@@ -461,6 +631,8 @@ class DirectoryLevelTree(DirectoryTreeBase):
   def recoverOrphanDirectories( self, credDict ):
     """ Recover orphan directories
     """
+    # The recovery changes the DirIDs and the parents of directories
+    self._clearDirCache()
     # Find out orphan directories
     treeTable = 'FC_DirectoryLevelTree'
     req = "SELECT DirID,Parent,Level FROM %s WHERE Parent NOT IN ( SELECT DirID from %s )" % (treeTable,treeTable)
@@ -531,6 +703,7 @@ class DirectoryLevelTree(DirectoryTreeBase):
       result = self.__rebuildLevelIndexes( parentID, connection)
       resUnlock = self.db._query("UNLOCK TABLES", connection )       
       
+    self._clearDirCache()
     return S_OK()
 
   def _getConnection( self, connection=False ):
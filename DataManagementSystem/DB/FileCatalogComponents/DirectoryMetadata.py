@@ -7,15 +7,20 @@
 
 __RCSID__ = "$Id$"
 
-import os, types
+import os, time, types
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Time import queryTime
 
+# Lifetime in seconds of the cardinality statistics of the metadata fields
+META_STATS_LIFETIME = 600
+
 class DirectoryMetadata:
 
   def __init__( self, database = None ):
 
     self.db = database
+    # meta -> ( time, number of directories defining it, number of distinct values )
+    self.__metaStats = {}
 
   def setDatabase( self, database ):
     self.db = database
@@ -486,13 +491,16 @@ class DirectoryMetadata:
 
     return S_OK( dirList )
 
-  def __findSubdirMissingMeta( self, meta, pathSelection ):
-    """ Find directories not having the given meta datum defined
+  def __findSubdirMissingMeta( self, meta, pathSelection, candidates = None ):
+    """ Find directories not having the given meta datum defined. If the set of
+        candidate directories is given, only those are considered
     """
     result = self.__findSubdirByMeta( meta, 'Any', pathSelection )
     if not result['OK']:
       return result
     dirList = result['Value']
+    if candidates is not None:
+      return S_OK( list( candidates - set( dirList ) ) )
     table = self.db.dtree.getTreeTable()
     dirString = ','.join( [ str( x ) for x in dirList ] )
     if dirList:
@@ -508,6 +516,57 @@ class DirectoryMetadata:
     dirList = [ x[0] for x in result['Value'] ]
     return S_OK( dirList )
 
+  def __getMetaStats( self, meta ):
+    """ Get the number of directories defining the meta datum and the number of its distinct values
+    """
+    stats = self.__metaStats.get( meta )
+    if stats and time.time() - stats[0] < META_STATS_LIFETIME:
+      return S_OK( stats[1:] )
+    req = "SELECT COUNT(*),COUNT(DISTINCT Value) FROM FC_Meta_%s" % meta
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    numDirs, numValues = result['Value'][0]
+    self.__metaStats[meta] = ( time.time(), int( numDirs ), int( numValues ) )
+    return S_OK( ( int( numDirs ), int( numValues ) ) )
+
+  def __estimateMatches( self, meta, value ):
+    """ Estimate the number of directories defining a meta datum that matches the value
+    """
+    if value == "Missing":
+      # The complement of the others, as large as the tree
+      return float( 'inf' )
+    result = self.__getMetaStats( meta )
+    if not result['OK']:
+      return float( 'inf' )
+    numDirs, numValues = result['Value']
+    perValue = float( numDirs ) / max( numValues, 1 )
+
+    if value == "Any":
+      return numDirs
+    if type( value ) == types.ListType:
+      return min( numDirs, perValue * len( value ) )
+    if type( value ) != types.DictType:
+      return perValue
+    estimate = numDirs
+    for operation, operand in value.items():
+      numOperands = len( operand ) if type( operand ) == types.ListType else 1
+      if operation in ['in', '=']:
+        estimate = min( estimate, perValue * numOperands )
+      elif operation in ['nin', '!=']:
+        estimate = min( estimate, max( 0, numDirs - perValue * numOperands ) )
+      else:
+        # Range comparison
+        estimate = min( estimate, numDirs / 3. )
+    return estimate
+
+  def __orderMetaQuery( self, metaDict ):
+    """ Order the meta data of the query by increasing number of expected matching directories
+    """
+    metaList = [ ( self.__estimateMatches( meta, value ), meta, value ) for meta, value in metaDict.items() ]
+    metaList.sort()
+    return [ ( meta, value ) for _estimate, meta, value in metaList ]
+
   def __expandMetaDictionary( self, metaDict, credDict ):
     """ Expand the dictionary with metadata query 
     """
@@ -603,25 +662,22 @@ class DirectoryMetadata:
         if not result['OK']:
           return result
         pathSelection = result['Value']
-      dirList = []
-      first = True
-      for meta, value in finalMetaDict.items():
+      # The most selective meta data first, so that an empty selection is found early
+      dirSet = None
+      for meta, value in self.__orderMetaQuery( finalMetaDict ):
         if value == "Missing":
-          result = self.__findSubdirMissingMeta( meta, pathSelection )
+          result = self.__findSubdirMissingMeta( meta, pathSelection, dirSet )
         else:
           result = self.__findSubdirByMeta( meta, value, pathSelection )
         if not result['OK']:
           return result
-        mList = result['Value']
-        if first:
-          dirList = mList
-          first = False
+        if dirSet is None:
+          dirSet = set( result['Value'] )
         else:
-          newList = []
-          for d in dirList:
-            if d in mList:
-              newList.append( d )
-          dirList = newList
+          dirSet &= set( result['Value'] )
+        if not dirSet:
+          break
+      dirList = list( dirSet )
     else:
       if pathDirID:
         result = self.db.dtree.getSubdirectoriesByID( pathDirID, includeParent = True )
@@ -733,22 +789,22 @@ class DirectoryMetadata:
     result = self.db.dtree.getAllSubdirectoriesByID( selectedDirs )
     if not result['OK']:
       return result
-    subDirs = result['Value']
+    subDirs = set( result['Value'] )
 
     # Find parent directories of the directories defining the meta datum
-    parentDirs = []
+    parentDirs = set()
     for psub in selectedDirs:
       result = self.db.dtree.getPathIDsByID( psub )
       if not result['OK']:
         return result
-      parentDirs += result['Value']
+      parentDirs.update( result['Value'] )
 
     # Constrain the output to only those that are present in the input list  
-    resDirs = parentDirs + subDirs + selectedDirs
+    resDirs = parentDirs | subDirs | set( selectedDirs )
     if fromDirs:
-      resDirs = list( set( resDirs ) & set( fromDirs ) )
+      resDirs &= set( fromDirs )
 
-    return S_OK( resDirs )
+    return S_OK( list( resDirs ) )
 
   def __findDistinctMetadata( self, metaList, dList ):
     """ Find distinct metadata values defined for the list of the input directories.
@@ -820,7 +876,7 @@ class DirectoryMetadata:
     anyMeta = True
     if metaDict:
       anyMeta = False
-      for meta, value in metaDict.items():
+      for meta, value in self.__orderMetaQuery( metaDict ):
         result = self.__findCompatibleDirectories( meta, value, fromList )
         if not result['OK']:
           return result
@@ -6,9 +6,11 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.DataManagementSystem.DB.FileCatalogComponents.Utilities  import getIDSelectString
+from DIRAC.Core.Utilities.List                                      import intListToString
 from DIRAC                                                          import S_OK, S_ERROR, gLogger
 import time, threading, os
 from types import StringTypes, ListType
+from collections import OrderedDict
 import stat
 
 DEBUG = 0
@@ -20,6 +22,16 @@ class DirectoryTreeBase:
     self.db = database
     self.lock = threading.Lock()
     self.treeTable = ''
+    # Least recently used cache of the directories: path -> [ cache time, DirID, IDs of the parent chain ]
+    self.__dirCache = OrderedDict()
+    self.__dirCacheLock = threading.Lock()
+    self.__dirCacheSize = getattr( database, 'directoryCacheSize', 10000 )
+    # Other catalog instances may remove directories, so the entries expire
+    self.__dirCacheLifeTime = getattr( database, 'directoryCacheLifeTime', 60 )
+    self.__dirCacheCounters = { 'Hits' : 0, 'Misses' : 0 }
+    # Permissions of the users on the directories: ( DirID, UID, GID ) -> [ cache time, permissions ]
+    self.__permCache = OrderedDict()
+    self.__permCacheLifeTime = getattr( database, 'permissionCacheLifeTime', 10 )
 
 ############################################################################
 #
@@ -33,14 +45,36 @@ class DirectoryTreeBase:
     return S_ERROR( "To be implemented on derived class" )
 
   def findDirs( self, paths, connection = False ):
-    """ Find DirIDs for the given path list
+    """ Find DirIDs for the given path list, one by one if the derived class
+        does not know better
     """
-    return S_ERROR( "To be implemented on derived class" )
+    dirDict = {}
+    for path in paths:
+      result = self.findDir( path )
+      if not result['OK']:
+        return result
+      if result['Value']:
+        dirDict[os.path.normpath( path )] = result['Value']
+    return S_OK( dirDict )
 
   def makeDir( self, path ):
 
     return S_ERROR( "To be implemented on derived class" )
 
+  def getPathIDsByIDs( self, dirIDs ):
+    """ Get the IDs of the directories in the parent hierarchy of each of the given directories,
+        one by one if the derived class does not know better
+
+        :returns S_OK( { dirID : [ IDs from the root down to dirID ] } )
+    """
+    pathIDDict = {}
+    for dirID in dirIDs:
+      result = self.getPathIDsByID( dirID )
+      if not result['OK']:
+        return result
+      pathIDDict[dirID] = result['Value']
+    return S_OK( pathIDDict )
+
   def removeDir( self, path ):
 
     return S_ERROR( "To be implemented on derived class" )
@@ -61,6 +95,149 @@ class DirectoryTreeBase:
     """
     return S_ERROR( "To be implemented on derived class" )
 
+##########################################################################
+#
+# Directory cache, to be used by the derived classes in the methods above
+#
+##########################################################################
+
+  def __getCacheEntry( self, path, field ):
+    """ Get a field of a cache entry if it is there and not expired
+    """
+    if not self.__dirCacheSize:
+      return None
+    path = os.path.normpath( path )
+    self.__dirCacheLock.acquire()
+    try:
+      entry = self.__dirCache.pop( path, None )
+      if entry is not None and time.time() - entry[0] > self.__dirCacheLifeTime:
+        entry = None
+      if entry is not None:
+        # Most recently used entries are at the end
+        self.__dirCache[path] = entry
+      if entry is None or entry[field] is None:
+        self.__dirCacheCounters['Misses'] += 1
+        return None
+      self.__dirCacheCounters['Hits'] += 1
+      return entry[field]
+    finally:
+      self.__dirCacheLock.release()
+
+  def __setCacheEntry( self, path, dirID, pathIDs ):
+    """ Cache the ID and/or the parent chain of a directory
+    """
+    if not self.__dirCacheSize:
+      return
+    path = os.path.normpath( path )
+    self.__dirCacheLock.acquire()
+    try:
+      entry = self.__dirCache.pop( path, None )
+      if entry is None or ( dirID is not None and entry[1] is not None and entry[1] != dirID ):
+        entry = [ time.time(), None, None ]
+      if dirID is not None:
+        entry[1] = dirID
+      if pathIDs is not None:
+        entry[2] = list( pathIDs )
+      self.__dirCache[path] = entry
+      while len( self.__dirCache ) > self.__dirCacheSize:
+        self.__dirCache.popitem( last = False )
+    finally:
+      self.__dirCacheLock.release()
+
+  def _getCachedDirID( self, path ):
+    """ Get the cached DirID of the path, None if it's not cached
+    """
+    return self.__getCacheEntry( path, 1 )
+
+  def _getCachedPathIDs( self, path ):
+    """ Get the cached IDs of the parent chain of the path, None if they're not cached
+    """
+    return self.__getCacheEntry( path, 2 )
+
+  def _cacheDirID( self, path, dirID ):
+    """ Cache the DirID of an existing directory
+    """
+    if dirID:
+      self.__setCacheEntry( path, dirID, None )
+
+  def _cachePathIDs( self, path, pathIDs ):
+    """ Cache the IDs of the parent chain of an existing directory
+    """
+    if pathIDs:
+      self.__setCacheEntry( path, None, pathIDs )
+
+  def _uncacheDir( self, path ):
+    """ Drop a directory and all its subdirectories from the cache
+    """
+    path = os.path.normpath( path )
+    prefix = path.rstrip( '/' ) + '/'
+    self.__dirCacheLock.acquire()
+    try:
+      for cachedPath in self.__dirCache.keys():
+        if cachedPath == path or cachedPath.startswith( prefix ):
+          del self.__dirCache[cachedPath]
+    finally:
+      self.__dirCacheLock.release()
+
+  def _clearDirCache( self ):
+    """ Drop all the cached directories, when the DirIDs are changed
+    """
+    self.__dirCacheLock.acquire()
+    try:
+      self.__dirCache.clear()
+    finally:
+      self.__dirCacheLock.release()
+
+  def __getCachedPermissions( self, dirID, uid, gid ):
+    """ Get a copy of the cached permissions of the user on the directory, None if they're not cached
+    """
+    if not self.__dirCacheSize:
+      return None
+    self.__dirCacheLock.acquire()
+    try:
+      entry = self.__permCache.get( ( dirID, uid, gid ) )
+      if entry is None or time.time() - entry[0] > self.__permCacheLifeTime:
+        return None
+      return dict( entry[1] )
+    finally:
+      self.__dirCacheLock.release()
+
+  def __cachePermissions( self, dirID, uid, gid, permissions ):
+    """ Cache the permissions of the user on the directory
+    """
+    if not self.__dirCacheSize:
+      return
+    self.__dirCacheLock.acquire()
+    try:
+      self.__permCache.pop( ( dirID, uid, gid ), None )
+      self.__permCache[( dirID, uid, gid )] = [ time.time(), dict( permissions ) ]
+      # The entries are in the order they were cached, the oldest go first
+      while len( self.__permCache ) > self.__dirCacheSize:
+        self.__permCache.popitem( last = False )
+    finally:
+      self.__dirCacheLock.release()
+
+  def _clearPermCache( self ):
+    """ Drop all the cached permissions, when the owner, group or mode of directories change
+    """
+    self.__dirCacheLock.acquire()
+    try:
+      self.__permCache.clear()
+    finally:
+      self.__dirCacheLock.release()
+
+  def getDirCacheCounters( self ):
+    """ Get the directory cache hits, misses and size
+    """
+    self.__dirCacheLock.acquire()
+    try:
+      return S_OK( { 'Directory cache hits' : self.__dirCacheCounters['Hits'],
+                     'Directory cache misses' : self.__dirCacheCounters['Misses'],
+                     'Directory cache size' : len( self.__dirCache ),
+                     'Permission cache size' : len( self.__permCache ) } )
+    finally:
+      self.__dirCacheLock.release()
+
 ##########################################################################
 
 
@@ -127,8 +304,14 @@ class DirectoryTreeBase:
     """Make all the directories recursively in the path. The return value
        is the dictionary containing all the parameters of the newly created
        directory
+
+       If path is a list, all the directories are made at once and the return
+       value is S_OK( { 'Successful' : { path : DirID }, 'Failed' : { path : error } } )
     """
 
+    if type( path ) == ListType:
+      return self.__makeDirectoriesBulk( path, credDict )
+
     if not path or path[0] != '/':
       return S_ERROR( 'Not an absolute path' )
 
@@ -158,6 +341,80 @@ class DirectoryTreeBase:
 
     return result
 
+  def __makeDirectoriesBulk( self, paths, credDict ):
+    """ Make the directories of the list and all their missing parents. The existing
+        directories are looked up together and the missing ones are created level by level
+    """
+    successful = {}
+    failed = {}
+    allDirs = set()
+    for path in paths:
+      if not path or path[0] != '/':
+        failed[path] = 'Not an absolute path'
+        continue
+      dpath = os.path.normpath( path )
+      while dpath not in allDirs:
+        allDirs.add( dpath )
+        if dpath == '/':
+          break
+        dpath = os.path.dirname( dpath )
+
+    result = self.findDirs( list( allDirs ) )
+    if not result['OK']:
+      return result
+    dirIDs = result['Value']
+
+    levelDict = {}
+    for dpath in allDirs:
+      if dpath not in dirIDs:
+        level = 0 if dpath == '/' else dpath.count( '/' )
+        levelDict.setdefault( level, [] ).append( dpath )
+
+    # The parents are always created before their children
+    dirErrors = {}
+    for level in sorted( levelDict ):
+      levelPaths = []
+      for dpath in levelDict[level]:
+        parentDir = os.path.dirname( dpath )
+        if dpath != '/' and parentDir not in dirIDs:
+          dirErrors[dpath] = dirErrors.get( parentDir, 'Failed to create parent directory' )
+        else:
+          levelPaths.append( dpath )
+      if not levelPaths:
+        continue
+      result = self._makeDirs( levelPaths, dirIDs, credDict )
+      if not result['OK']:
+        for dpath in levelPaths:
+          dirErrors[dpath] = result['Message']
+        continue
+      dirIDs.update( result['Value']['Successful'] )
+      dirErrors.update( result['Value']['Failed'] )
+
+    for path in paths:
+      if path in failed:
+        continue
+      dpath = os.path.normpath( path )
+      if dpath in dirIDs:
+        successful[path] = dirIDs[dpath]
+      else:
+        failed[path] = dirErrors.get( dpath, 'Failed to create directory %s' % dpath )
+
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
+  def _makeDirs( self, paths, dirIDs, credDict ):
+    """ Make directories of the same level whose parents exist. The IDs of the parents
+        are in dirIDs. Derived classes can create them all together
+    """
+    successful = {}
+    failed = {}
+    for path in paths:
+      result = self.makeDirectory( path, credDict )
+      if not result['OK']:
+        failed[path] = result['Message']
+      else:
+        successful[path] = result['Value']
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
 #####################################################################
   def exists( self, lfns ):
     successful = {}
@@ -212,11 +469,13 @@ class DirectoryTreeBase:
     """
     successful = {}
     failed = {}
-    for dir in dirs:
-      result = self.makeDirectories( dir, credDict )
-      if not result['OK']:
+    result = self.makeDirectories( list( dirs ), credDict )
+    if not result['OK']:
+      for dir in dirs:
         failed[dir] = result['Message']
-      else:
+    else:
+      failed = result['Value']['Failed']
+      for dir in result['Value']['Successful']:
         successful[dir] = True
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
@@ -275,6 +534,8 @@ class DirectoryTreeBase:
         failed[dir] = result['Message']
       else:
         successful[dir] = result
+    if dirList:
+      self._clearPermCache()
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
 #####################################################################
@@ -484,6 +745,7 @@ class DirectoryTreeBase:
       else:
         successful[path] = True
 
+    self._clearPermCache()
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   #####################################################################
@@ -493,50 +755,71 @@ class DirectoryTreeBase:
     return self._setDirectoryParameter( path, 'Status', status )
 
   def getPathPermissions( self, lfns, credDict ):
-    """ Get permissions for the given user/group to manipulate the given lfns 
-    """
-    successful = {}
-    failed = {}
-    for path in lfns:
-      result = self.getDirectoryPermissions( path, credDict )
-      if not result['OK']:
-        failed[path] = result['Message']
-      else:
-        successful[path] = result['Value']
-
-    return S_OK( {'Successful':successful, 'Failed':failed} )
-
-  #####################################################################
-  def getDirectoryPermissions( self, path, credDict ):
-    """ Get permissions for the given user/group to manipulate the given directory 
+    """ Get permissions for the given user/group to manipulate the given lfns.
+        The permissions of a path are the ones of its nearest existing directory:
+        the directories of all the paths and of all their parents are looked up at once
     """
     result = self.db.ugManager.getUserAndGroupID( credDict )
     if not result['OK']:
       return result
     uid, gid = result['Value']
 
-    result = self.getDirectoryParameters( path )
+    # Existing directories of each path, the nearest first
+    ancestors = {}
+    for path in lfns:
+      dpath = os.path.normpath( path )
+      ancestors[path] = [ dpath ]
+      while dpath != '/' and os.path.dirname( dpath ):
+        dpath = os.path.dirname( dpath )
+        ancestors[path].append( dpath )
+    allPaths = set()
+    for pathList in ancestors.values():
+      allPaths.update( pathList )
+    result = self.findDirs( list( allPaths ) )
     if not result['OK']:
-      if "not found" in result['Message'] or "not exist" in result['Message']:
-        # If the directory does not exist, check the nearest parent for the permissions
-        if path == '/':
+      return result
+    dirDict = result['Value']
+    toResolve = {}
+    for path, pathList in ancestors.items():
+      toResolve[path] = [ dirDict[dpath] for dpath in pathList if dirDict.get( dpath ) ]
+
+    successful = {}
+    while toResolve:
+      modes = {}
+      toGet = set()
+      for path, dirIDs in toResolve.items():
+        if not dirIDs:
           # Nothing yet exists, starting from the scratch
-          resultDict = {}  
-          resultDict['Write'] = True
-          resultDict['Read'] = True 
-          resultDict['Execute'] = True
-          return S_OK( resultDict )
+          successful[path] = { 'Read' : True, 'Write' : True, 'Execute' : True }
+          toResolve.pop( path )
+          continue
+        permissions = self.__getCachedPermissions( dirIDs[0], uid, gid )
+        if permissions is not None:
+          successful[path] = permissions
+          toResolve.pop( path )
         else:
-          pDir = os.path.dirname( path )
-          result = self.getDirectoryPermissions( pDir, credDict )
+          toGet.add( dirIDs[0] )
+      if toGet:
+        result = self._getDirectoryModes( list( toGet ) )
+        if not result['OK']:
           return result
-      else:
-        return result
+        modes = result['Value']
+      for path, dirIDs in toResolve.items():
+        dirID = dirIDs.pop( 0 )
+        if dirID not in modes:
+          # No parameters for this directory, check the next parent
+          continue
+        dUid, dGid, mode = modes[dirID]
+        permissions = self.__getPermissionsFromMode( uid, gid, dUid, dGid, mode )
+        self.__cachePermissions( dirID, uid, gid, permissions )
+        successful[path] = permissions
+        toResolve.pop( path )
 
-    dUid = result['Value']['UID']
-    dGid = result['Value']['GID']
-    mode = result['Value']['Mode']
+    return S_OK( {'Successful':successful, 'Failed':{}} )
 
+  def __getPermissionsFromMode( self, uid, gid, dUid, dGid, mode ):
+    """ Get the permissions of the user/group on a directory with the given owner and mode
+    """
     owner = uid == dUid
     group = gid == dGid
 
@@ -547,7 +830,7 @@ class DirectoryTreeBase:
       resultDict['Read'] = ( owner and mode & stat.S_IRUSR > 0 )\
                            or ( group and mode & stat.S_IRGRP > 0 )\
                            or mode & stat.S_IROTH > 0
-                           
+
     resultDict['Write'] = ( owner and mode & stat.S_IWUSR > 0 )\
                           or ( group and mode & stat.S_IWGRP > 0 )\
                           or mode & stat.S_IWOTH > 0
@@ -556,7 +839,29 @@ class DirectoryTreeBase:
                             or ( group and mode & stat.S_IXGRP > 0 )\
                             or mode & stat.S_IXOTH > 0
 
-    return S_OK( resultDict )
+    return resultDict
+
+  def _getDirectoryModes( self, dirIDs ):
+    """ Get the owner, group and mode of the given directories
+
+        :returns S_OK( { dirID : ( UID, GID, Mode ) } )
+    """
+    if not dirIDs:
+      return S_OK( {} )
+    req = "SELECT DirID,UID,GID,Mode FROM FC_DirectoryInfo WHERE DirID IN ( %s )" % intListToString( dirIDs )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    return S_OK( dict( [ ( row[0], tuple( [ int( x ) for x in row[1:] ] ) ) for row in result['Value'] ] ) )
+
+  #####################################################################
+  def getDirectoryPermissions( self, path, credDict ):
+    """ Get permissions for the given user/group to manipulate the given directory 
+    """
+    result = self.getPathPermissions( [path], credDict )
+    if not result['OK']:
+      return result
+    return S_OK( result['Value']['Successful'][path] )
 
   def getFileIDsInDirectoryWithLimits( self, dirID, credDict, startItem = 1, maxItems = 25 ):
     """ Get file IDs for the given directory
@@ -633,7 +938,7 @@ class DirectoryTreeBase:
     result['LFNIDList'] = lfnIDList
     return result
 
-  def _getDirectoryContents( self, path, details = False ):
+  def _getDirectoryContents( self, path, details = False, withFiles = True ):
     """ Get contents of a given directory
     """
     result = self.findDir( path )
@@ -662,10 +967,11 @@ class DirectoryTreeBase:
           directories[dirName] = result['Value']
       else:
         directories[dirName] = True
-    result = self.db.fileManager.getFilesInDirectory( directoryID, verbose = details )
-    if not result['OK']:
-      return result
-    files = result['Value']
+    if withFiles:
+      result = self.db.fileManager.getFilesInDirectory( directoryID, verbose = details )
+      if not result['OK']:
+        return result
+      files = result['Value']
     result = self.db.datasetManager.getDatasetsInDirectory( directoryID, verbose = details )
     if not result['OK']:
       return result
@@ -688,6 +994,31 @@ class DirectoryTreeBase:
         successful[path] = result['Value']
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
+
+  def listDirectoryPage( self, path, verbose = False, lastFileID = 0, maxFiles = 1000 ):
+    """ Get a page of the directory listing with at most maxFiles files following lastFileID.
+        The first page, for lastFileID 0, also has the subdirectories, links and datasets.
+        LastFileID in the result is the one to get the next page with, 0 after the last page
+    """
+    result = self.findDir( path )
+    if not result['OK']:
+      return result
+    directoryID = result['Value']
+    if not directoryID:
+      return S_ERROR( 'Directory %s not found' % path )
+
+    pathDict = {'Files':{}, 'SubDirs':{}, 'Links':{}, 'Datasets':{} }
+    if not lastFileID:
+      result = self._getDirectoryContents( path, details = verbose, withFiles = False )
+      if not result['OK']:
+        return result
+      pathDict = result['Value']
+    result = self.db.fileManager.getFilesInDirectoryPage( directoryID, lastFileID, maxFiles, verbose = verbose )
+    if not result['OK']:
+      return result
+    pathDict['Files'] = result['Value']
+    pathDict['LastFileID'] = result['LastFileID']
+    return S_OK( pathDict )
   
   def getDirectoryReplicas( self, lfns, allStatus = False ):
     """ Get replicas for files in the given directories
@@ -1003,6 +1334,118 @@ class DirectoryTreeBase:
 
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
+  def verifyDirectoryUsage( self, lastDirID = 0, maxDirs = 100, fix = False ):
+    """ Check the storage usage of up to maxDirs directories following lastDirID. The usage of
+        a directory is the one of its own files and replicas plus the usage of its subdirectories.
+        The differences found are reported and, with fix, applied to the directory and to its
+        parents, so that checking all the directories little by little, in any order, puts
+        FC_DirectoryUsage right
+
+        :returns S_OK( dict ) with LastDirID, to continue with, 0 once all the directories are checked,
+                 Checked, the number of directories checked, Differences, the differences found
+                 as { dirID : { seID : { 'Size' : size, 'Files' : files } } }, and Fixed, whether
+                 they were applied
+    """
+    resultDict = { 'LastDirID' : lastDirID, 'Checked' : 0, 'Differences' : {}, 'Fixed' : False }
+    # Only one checker at a time for all the catalog instances, or they would fix twice
+    result = self.db._query( "SELECT GET_LOCK('FC_DirectoryUsageCheck',0)" )
+    if not result['OK']:
+      return result
+    if not result['Value'] or not result['Value'][0][0]:
+      return S_OK( resultDict )
+    try:
+      req = "SELECT DirID FROM %s WHERE DirID>%d ORDER BY DirID LIMIT %d" % ( self.getTreeTable(), lastDirID, maxDirs )
+      result = self.db._query( req )
+      if not result['OK']:
+        return result
+      dirIDs = [ row[0] for row in result['Value'] ]
+      if not dirIDs:
+        resultDict['LastDirID'] = 0
+        return S_OK( resultDict )
+
+      # Changes made meanwhile go to both the files and the usage, so a consistent snapshot of
+      # the two gives the right differences even if they are applied after it
+      result = self.db._query( "START TRANSACTION WITH CONSISTENT SNAPSHOT" )
+      if not result['OK']:
+        return result
+      try:
+        result = self.__getDirectoryUsageDifferences( dirIDs )
+      finally:
+        self.db._query( "COMMIT" )
+      if not result['OK']:
+        return result
+      fixDict = result['Value']
+
+      for dirID, seDict in fixDict.items():
+        gLogger.warn( "Storage usage differences of directory %d" % dirID, str( seDict ) )
+      if fixDict and fix:
+        gLogger.info( "Fixing the storage usage of %d directories" % len( fixDict ) )
+        result = self.db.fileManager._updateDirectoryUsage( fixDict, '+' )
+        if not result['OK']:
+          return result
+        resultDict['Fixed'] = True
+      resultDict['LastDirID'] = dirIDs[-1]
+      resultDict['Checked'] = len( dirIDs )
+      resultDict['Differences'] = fixDict
+      return S_OK( resultDict )
+    finally:
+      self.db._query( "SELECT RELEASE_LOCK('FC_DirectoryUsageCheck')" )
+
+  def __getDirectoryUsageDifferences( self, dirIDs ):
+    """ Get the differences between the usage the given directories should have, after their
+        files, replicas and subdirectories, and the one they have
+    """
+    # dirID -> seID -> [ size, files ]
+    expected = dict( [ ( dirID, {} ) for dirID in dirIDs ] )
+
+    def addUsage( dirID, seID, size, files ):
+      usage = expected[dirID].setdefault( seID, [0, 0] )
+      usage[0] += int( size )
+      usage[1] += int( files )
+
+    dirString = intListToString( dirIDs )
+    req = "SELECT DirID,SUM(Size),COUNT(*) FROM FC_Files WHERE DirID IN (%s) GROUP BY DirID" % dirString
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    for dirID, size, files in result['Value']:
+      addUsage( dirID, 0, size, files )
+    req = "SELECT F.DirID,R.SEID,SUM(F.Size),COUNT(*) FROM FC_Files as F, FC_Replicas as R"
+    req += " WHERE F.FileID=R.FileID AND F.DirID IN (%s) GROUP BY F.DirID,R.SEID" % dirString
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    for dirID, seID, size, files in result['Value']:
+      addUsage( dirID, seID, size, files )
+
+    parentDict = {}
+    for dirID in dirIDs:
+      result = self.getChildren( dirID )
+      if not result['OK']:
+        return result
+      for childID in result['Value']:
+        parentDict[childID] = dirID
+    req = "SELECT DirID,SEID,SESize,SEFiles FROM FC_DirectoryUsage WHERE DirID IN (%s)"
+    req = req % intListToString( dirIDs + parentDict.keys() )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    current = dict( [ ( dirID, {} ) for dirID in dirIDs ] )
+    for dirID, seID, size, files in result['Value']:
+      if dirID in parentDict:
+        addUsage( parentDict[dirID], seID, size, files )
+      if dirID in current:
+        current[dirID][seID] = [ int( size ), int( files ) ]
+
+    fixDict = {}
+    for dirID in dirIDs:
+      for seID in set( expected[dirID] ) | set( current[dirID] ):
+        size, files = expected[dirID].get( seID, [0, 0] )
+        currentSize, currentFiles = current[dirID].get( seID, [0, 0] )
+        if size != currentSize or files != currentFiles:
+          fixDict.setdefault( dirID, {} )[seID] = { 'Size' : size - currentSize, 'Files' : files - currentFiles }
+    return S_OK( fixDict )
+
   def _rebuildDirectoryUsage( self ):
     """ Recreate and replenish the Storage Usage tables
     """
@@ -265,9 +265,14 @@ class FileManager( FileManagerBase ):
       directorySESizeDict[dirID][0]['Size'] += lfns[lfn]['Size']
       directorySESizeDict[dirID][0]['Files'] += 1
 
+    # The files and the storage usage change together or not at all
+    res = self.db._query( "START TRANSACTION; ", connection )
+    if not res['OK']:
+      return res
     req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % (','.join(insertTuples))
     res = self.db._update(req,connection)
     if not res['OK']:
+      self.db._query( "ROLLBACK;", connection )
       return res
     # Get the fileIDs for the inserted files
     res = self._findFiles(lfns.keys(),['FileID'],connection=connection)
@@ -282,7 +287,6 @@ class FileManager( FileManagerBase ):
       for lfn,fileDict in res['Value']['Successful'].items():
         lfns[lfn]['FileID'] = fileDict['FileID']
     insertTuples = []
-    toDelete = []
     for lfn in lfns.keys():
       fileInfo = lfns[lfn]     
       fileID = fileInfo['FileID']
@@ -291,22 +295,23 @@ class FileManager( FileManagerBase ):
       checksumtype = fileInfo.get('ChecksumType','Adler32')
       guid = fileInfo.get('GUID','')
       mode = fileInfo.get('Mode',self.db.umask)
-      toDelete.append(fileID)
       insertTuples.append("(%d,'%s','%s','%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d)" % (fileID,guid,checksum,checksumtype,mode))
     if insertTuples:
       req = "INSERT INTO FC_FileInfo (FileID,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode) VALUES %s" % ','.join( insertTuples )
-      res = self.db._update(req)
+      res = self.db._update(req,connection)
+      if res['OK']:
+        # Update the directory usage
+        res = self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
+      if res['OK']:
+        res = self.db._query( "COMMIT;", connection )
       if not res['OK']:
-        self._deleteFiles(toDelete,connection=connection)
+        self.db._query( "ROLLBACK;", connection )
         for lfn in lfns.keys():
           failed[lfn] = res['Message']
           lfns.pop(lfn)
-      else:
-        # Update the directory usage
-        result = self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
-        if not result['OK']:
-          gLogger.warn( "Failed to insert FC_DirectoryUsage", result['Message'] )
-          
+    else:
+      self.db._query( "ROLLBACK;", connection )
+
     return S_OK({'Successful':lfns,'Failed':failed})
 
   def _getFileIDFromGUID(self,guid,connection=False):
@@ -447,13 +452,19 @@ class FileManager( FileManagerBase ):
     if not insertTuples:
       return S_OK({'Successful':successful,'Failed':failed})
 
+    # The replicas and the storage usage change together or not at all
+    res = self.db._query( "START TRANSACTION; ", connection )
+    if not res['OK']:
+      return res
     req = "INSERT INTO FC_Replicas (FileID,SEID,Status) VALUES %s" % \
           (','.join(["(%d,%d,%d)" % (tuple_[0],tuple_[1],statusID) for tuple_ in insertTuples]))
     res = self.db._update(req,connection)
     if not res['OK']:
+      self.db._query( "ROLLBACK;", connection )
       return res
     res = self._getRepIDsForReplica(insertTuples, connection=connection)
     if not res['OK']:
+      self.db._query( "ROLLBACK;", connection )
       return res
     replicaDict = res['Value']
     directorySESizeDict = {}
@@ -471,26 +482,29 @@ class FileManager( FileManagerBase ):
     if master:
       replicaType = 'Master'
     insertReplicas = []
-    toDelete = []
     for lfn in lfns.keys():
       fileDict = lfns[lfn]
       repID = fileDict.get( 'RepID', 0 )
       if repID:
         pfn = fileDict['PFN']
-        toDelete.append(repID)
         insertReplicas.append("(%d,'%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),'%s')" % (repID,replicaType,pfn))    
     if insertReplicas:
       req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % (','.join(insertReplicas))
       res = self.db._update(req,connection)
+      if res['OK']:
+        # Update the directory usage
+        res = self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
+      if res['OK']:
+        res = self.db._query( "COMMIT;", connection )
       if not res['OK']:
+        self.db._query( "ROLLBACK;", connection )
         for lfn in lfns.keys():
           failed[lfn] = res['Message']
-        self.__deleteReplicas(toDelete,connection=connection)
       else:
-        # Update the directory usage
-        self._updateDirectoryUsage(directorySESizeDict,'+',connection=connection)
         for lfn in lfns.keys():
           successful[lfn] = True
+    else:
+      self.db._query( "ROLLBACK;", connection )
     return S_OK({'Successful':successful,'Failed':failed})
 
   def _getRepIDsForReplica(self,replicaTuples,connection=False):
@@ -529,7 +543,7 @@ class FileManager( FileManagerBase ):
 
     lfnFileIDDict = res['Value']['Successful']
     toRemove = []
-    directorySESizeDict = {}
+    fileIDDict = {}
     for lfn,fileDict in lfnFileIDDict.items():
       fileID = fileDict['FileID']
       se = lfns[lfn]['SE']
@@ -539,30 +553,38 @@ class FileManager( FileManagerBase ):
           return res
       seID = res['Value']
       toRemove.append( ( fileID, seID ) )
-      # Now prepare the storage usage update
-      dirID = fileDict['DirID']
-      directorySESizeDict.setdefault( dirID, {} )
-      directorySESizeDict[dirID].setdefault( seID, {'Files':0,'Size':0} )
-      directorySESizeDict[dirID][seID]['Size'] += fileDict['Size']
-      directorySESizeDict[dirID][seID]['Files'] += 1
-    res = self._getRepIDsForReplica( toRemove, connection )
-    if not res['OK']:
-      for lfn in lfnFileIDDict.keys():
-        failed[lfn] = res['Message']
-    else:
+      fileIDDict[fileID] = fileDict
+
+    # The replicas and the storage usage change together or not at all
+    res = self.db._query( "START TRANSACTION; ", connection )
+    if res['OK']:
+      res = self._getRepIDsForReplica( toRemove, connection )
+    if res['OK']:
       repIDs = []
+      directorySESizeDict = {}
       for fileID,seDict in res['Value'].items():
+        fileDict = fileIDDict[fileID]
         for seID,repID in seDict.items():
-          repIDs.append(repID)    
+          repIDs.append(repID)
+          # Only the replicas that exist count in the storage usage update
+          dirID = fileDict['DirID']
+          directorySESizeDict.setdefault( dirID, {} )
+          directorySESizeDict[dirID].setdefault( seID, {'Files':0,'Size':0} )
+          directorySESizeDict[dirID][seID]['Size'] += fileDict['Size']
+          directorySESizeDict[dirID][seID]['Files'] += 1
       res = self.__deleteReplicas( repIDs, connection = connection )
-      if not res['OK']:
-        for lfn in lfnFileIDDict.keys():
-          failed[lfn] = res['Message']
-      else:
+      if res['OK']:
         # Update the directory usage
-        self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
-        for lfn in lfnFileIDDict.keys():
-          successful[lfn] = True
+        res = self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
+      if res['OK']:
+        res = self.db._query( "COMMIT;", connection )
+    if not res['OK']:
+      self.db._query( "ROLLBACK;", connection )
+      for lfn in lfnFileIDDict.keys():
+        failed[lfn] = res['Message']
+    else:
+      for lfn in lfnFileIDDict.keys():
+        successful[lfn] = True
     return S_OK( {"Successful":successful, "Failed":failed} )
 
   def __deleteReplicas( self, repIDs, connection = False ):
@@ -620,8 +642,36 @@ class FileManager( FileManagerBase ):
     if not res['Value']:
       return res
     repID = res['Value']
+    result = self.db.seManager.findSE( se )
+    if not result['OK']:
+      return result
+    seID = result['Value']
     req = "UPDATE FC_Replicas SET SEID=%d WHERE RepID = %d;" % (newSE,repID)
-    return self.db._update(req,connection)
+    if seID == newSE:
+      return self.db._update(req,connection)
+    result = self.db._query( "SELECT DirID,Size FROM FC_Files WHERE FileID=%d" % fileID, connection )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_ERROR( "File %d not found" % fileID )
+    dirID, size = result['Value'][0]
+
+    # Move the replica and its usage to the new SE together or not at all
+    result = self.db._query( "START TRANSACTION; ", connection )
+    if not result['OK']:
+      return result
+    res = self.db._update(req,connection)
+    if res['OK']:
+      directorySESizeDict = { dirID : { seID : { 'Files' : -1, 'Size' : -size },
+                                        newSE : { 'Files' : 1, 'Size' : size } } }
+      result = self._updateDirectoryUsage( directorySESizeDict, '+', connection = connection )
+      if result['OK']:
+        result = self.db._query( "COMMIT;", connection )
+      if not result['OK']:
+        res = result
+    if not res['OK']:
+      self.db._query( "ROLLBACK;", connection )
+    return res
     
   def _setReplicaParameter( self, fileID, se, paramName, paramValue, connection = False ):
     connection = self._getConnection(connection)
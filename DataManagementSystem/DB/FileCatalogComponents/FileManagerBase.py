@@ -8,7 +8,7 @@
 __RCSID__ = "$Id$"
 
 from DIRAC                                  import S_OK, S_ERROR, gLogger
-from DIRAC.Core.Utilities.List              import intListToString
+from DIRAC.Core.Utilities.List              import intListToString, breakListIntoChunks
 from DIRAC.Core.Utilities.Pfn               import pfnparse, pfnunparse
 
 import os
@@ -272,12 +272,18 @@ class FileManagerBase( object ):
     if masterLfns:
       # Create the directories for the supplied files and store their IDs
       directories = self._getFileDirectories( masterLfns.keys() )
+      res = self.db.dtree.makeDirectories( directories.keys(), credDict )
+      if not res['OK']:
+        dirErrors = dict( [ ( directory, res['Message'] ) for directory in directories ] )
+        dirIDs = {}
+      else:
+        dirErrors = res['Value']['Failed']
+        dirIDs = res['Value']['Successful']
       for directory, fileNames in directories.items():
-        res = self.db.dtree.makeDirectories( directory, credDict )
-        if not res['OK']:
+        if directory in dirErrors:
           for fileName in fileNames:
             lfn = os.path.join( directory, fileName )
-            failed[lfn] = res['Message']
+            failed[lfn] = dirErrors[directory]
             masterLfns.pop( lfn )
           continue
         for fileName in fileNames:
@@ -288,13 +294,7 @@ class FileManagerBase( object ):
 
           lfn = "%s/%s" % ( directory, fileName )
           lfn = lfn.replace( '//', '/' )
-
-          # This condition should never be true, we would not be here otherwise...
-          if not res['OK']:
-            failed[lfn] = "Failed to create directory for file"
-            masterLfns.pop( lfn )
-          else:
-            masterLfns[lfn]['DirID'] = res['Value']
+          masterLfns[lfn]['DirID'] = dirIDs[directory]
 
     # If we still have files left to register
     if masterLfns:
@@ -377,82 +377,153 @@ class FileManagerBase( object ):
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def _updateDirectoryUsage( self, directorySEDict, change, connection = False ):
+    """ Apply the changes of the storage usage of the given directories to them and to all
+        their parents in a single statement, so that either all of them are applied or none
+
+        :param dict directorySEDict: { dirID : { seID : { 'Size' : size, 'Files' : files } } }
+        :param str change: '+' or '-'
+    """
     connection = self._getConnection( connection )
-    for directoryID in directorySEDict.keys():
-      result = self.db.dtree.getPathIDsByID( directoryID )
-      if not result['OK']:
-        return result
-      parentIDs = result['Value']
-      dirDict = directorySEDict[directoryID]
-      for seID in dirDict.keys() :
-        seDict = dirDict[seID]
-        files = seDict['Files']
-        size = seDict['Size']
-        insertTuples = []
-        for dirID in parentIDs:
-          insertTuples.append( '(%d,%d,%d,%d,UTC_TIMESTAMP())' % ( dirID, seID, size, files ) )
-    
-        req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) "
-        req += "VALUES %s" % ','.join( insertTuples )
-        req += " ON DUPLICATE KEY UPDATE SESize=SESize%s%d, SEFiles=SEFiles%s%d, LastUpdate=UTC_TIMESTAMP() " \
-                                                           % ( change, size, change, files )
-        res = self.db._update( req )
-        if not res['OK']:
-          gLogger.warn( "Failed to update FC_DirectoryUsage", res['Message'] )
-    return S_OK()
+    if not directorySEDict:
+      return S_OK()
+    result = self.db.dtree.getPathIDsByIDs( directorySEDict.keys() )
+    if not result['OK']:
+      return result
+    parentIDDict = result['Value']
+    sign = -1 if change == '-' else 1
+    # The changes of the directories sharing parents add up: ( dirID, seID ) -> [ size, files ]
+    usageDict = {}
+    for directoryID, dirDict in directorySEDict.items():
+      for dirID in parentIDDict[directoryID]:
+        for seID, seDict in dirDict.items():
+          usage = usageDict.setdefault( ( dirID, seID ), [0, 0] )
+          usage[0] += sign * seDict['Size']
+          usage[1] += sign * seDict['Files']
+
+    # Always in the same order, for concurrent updates not to deadlock
+    insertTuples = [ '(%d,%d,%d,%d,UTC_TIMESTAMP())' % ( dirID, seID, size, files )
+                     for ( dirID, seID ), ( size, files ) in sorted( usageDict.items() ) if size or files ]
+    if not insertTuples:
+      return S_OK()
+    req = "INSERT INTO FC_DirectoryUsage (DirID,SEID,SESize,SEFiles,LastUpdate) "
+    req += "VALUES %s" % ','.join( insertTuples )
+    req += " ON DUPLICATE KEY UPDATE SESize=SESize+VALUES(SESize), SEFiles=SEFiles+VALUES(SEFiles), LastUpdate=UTC_TIMESTAMP()"
+    res = self.db._update( req, connection )
+    if not res['OK']:
+      gLogger.warn( "Failed to update FC_DirectoryUsage", res['Message'] )
+    return res
     
-  def _populateFileAncestors( self, lfns, connection = False ):
+  def _populateFileAncestors( self, lfns, connection = False, propagate = False ):
+    """ Insert the ancestors of the given files together with the ancestors of these ancestors,
+        FC_FileAncestors holding the transitive closure of the ancestry. All the files are treated
+        at once, with a single query per step. With propagate, the new ancestors are also given
+        to the descendents already registered for the files
+    """
     connection = self._getConnection( connection )
     successful = {}
     failed = {}
+    fileAncestors = {}
     for lfn, lfnDict in lfns.items():
-      originalFileID = lfnDict['FileID']
-      originalDepth = lfnDict.get( 'AncestorDepth', 1 )
       ancestors = lfnDict.get( 'Ancestors', [] )
       if type( ancestors ) == type( ' ' ):
         ancestors = [ancestors]
-      if lfn in ancestors:
-        ancestors.remove( lfn )
-      if not ancestors:
+      ancestors = [ ancestor for ancestor in ancestors if ancestor != lfn ]
+      if ancestors:
+        fileAncestors[lfn] = ancestors
+      else:
         successful[lfn] = True
-        continue
-      res = self._findFiles( ancestors, connection = connection )
-      if res['Value']['Failed']:
+    if not fileAncestors:
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+
+    allAncestors = set()
+    for ancestors in fileAncestors.values():
+      allAncestors.update( ancestors )
+    res = self._findFiles( list( allAncestors ), connection = connection )
+    if not res['OK']:
+      return res
+    ancestorFiles = res['Value']['Successful']
+    ancestorIDs = set()
+    for lfn, ancestors in fileAncestors.items():
+      if [ ancestor for ancestor in ancestors if ancestor not in ancestorFiles ]:
         failed[lfn] = "Failed to resolve ancestor files"
-        continue
-      ancestorIDs = res['Value']['Successful']
-      fileIDLFNs = {}
-      toInsert = {}
-      for ancestor in ancestorIDs.keys():
-        fileIDLFNs[ancestorIDs[ancestor]['FileID']] = ancestor
-        toInsert[ancestorIDs[ancestor]['FileID']] = originalDepth
-      res = self._getFileAncestors( fileIDLFNs.keys() )
-      if not res['OK']:
+        fileAncestors.pop( lfn )
+      else:
+        ancestorIDs.update( [ ancestorFiles[ancestor]['FileID'] for ancestor in ancestors ] )
+    if not fileAncestors:
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+
+    # The ancestry of the ancestors is already complete
+    res = self._getFileAncestors( list( ancestorIDs ), connection = connection )
+    if not res['OK']:
+      for lfn in fileAncestors:
         failed[lfn] = "Failed to obtain all ancestors"
-        continue
-      fileIDAncestorDict = res['Value']
-      for fileIDDict in fileIDAncestorDict.values():
-        for ancestorID, relativeDepth in fileIDDict.items():
-          toInsert[ancestorID] = relativeDepth + originalDepth
-      res = self._insertFileAncestors( originalFileID, toInsert, connection = connection )
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+    fileIDAncestorDict = res['Value']
+    toInsert = {}
+    for lfn, ancestors in fileAncestors.items():
+      originalDepth = lfns[lfn].get( 'AncestorDepth', 1 )
+      fileToInsert = {}
+      ancestorIDs = [ ancestorFiles[ancestor]['FileID'] for ancestor in ancestors ]
+      for ancestorID in ancestorIDs:
+        fileToInsert[ancestorID] = originalDepth
+      for ancestorID in ancestorIDs:
+        for grandAncestorID, relativeDepth in fileIDAncestorDict.get( ancestorID, {} ).items():
+          fileToInsert[grandAncestorID] = relativeDepth + originalDepth
+      toInsert[lfns[lfn]['FileID']] = fileToInsert
+
+    descendentDict = {}
+    if propagate:
+      res = self._getFileDescendents( toInsert.keys(), [], connection = connection )
       if not res['OK']:
-        if "Duplicate" in res['Message']:
-          failed[lfn] = "Failed to insert ancestor files: duplicate entry"
-        else:              
-          failed[lfn] = "Failed to insert ancestor files"
-      else:
+        return res
+      descendentDict = res['Value']
+
+    fileIDLFNs = dict( [ ( lfns[lfn]['FileID'], lfn ) for lfn in fileAncestors ] )
+    res = self._insertFileAncestors( toInsert, connection = connection )
+    if res['OK']:
+      for lfn in fileAncestors:
         successful[lfn] = True
+    else:
+      # Find out the faulty files, the failed statement having inserted nothing
+      for fileID, fileToInsert in toInsert.items():
+        res = self._insertFileAncestors( { fileID : fileToInsert }, connection = connection )
+        if not res['OK']:
+          if "Duplicate" in res['Message']:
+            failed[fileIDLFNs[fileID]] = "Failed to insert ancestor files: duplicate entry"
+          else:
+            failed[fileIDLFNs[fileID]] = "Failed to insert ancestor files"
+          descendentDict.pop( fileID, None )
+        else:
+          successful[fileIDLFNs[fileID]] = True
+
+    # The descendents of the files get their new ancestors as well
+    toPropagate = {}
+    for fileID, descendents in descendentDict.items():
+      for descendentID, descendentDepth in descendents.items():
+        descendentToInsert = toPropagate.setdefault( descendentID, {} )
+        for ancestorID, depth in toInsert[fileID].items():
+          descendentToInsert[ancestorID] = descendentDepth + depth
+    if toPropagate:
+      res = self._insertFileAncestors( toPropagate, ignore = True, connection = connection )
+      if not res['OK']:
+        gLogger.error( "Failed to propagate the ancestors to the descendent files", res['Message'] )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
-  def _insertFileAncestors( self, fileID, ancestorDict, connection = False ):
+  def _insertFileAncestors( self, fileAncestorDict, ignore = False, connection = False ):
+    """ Insert the ancestors of several files in one statement
+
+        :param dict fileAncestorDict: { FileID : { AncestorID : AncestorDepth } }
+        :param bool ignore: skip the already existing FileID, AncestorID pairs
+    """
     connection = self._getConnection( connection )
     ancestorTuples = []
-    for ancestorID, depth in ancestorDict.items():
-      ancestorTuples.append( "(%d,%d,%d)" % ( fileID, ancestorID, depth ) )
+    for fileID, ancestorDict in fileAncestorDict.items():
+      for ancestorID, depth in ancestorDict.items():
+        ancestorTuples.append( "(%d,%d,%d)" % ( fileID, ancestorID, depth ) )
     if not ancestorTuples:
       return S_OK()
-    req = "INSERT INTO FC_FileAncestors (FileID, AncestorID, AncestorDepth) VALUES %s" \
-                              % intListToString( ancestorTuples )
+    req = "INSERT %sINTO FC_FileAncestors (FileID, AncestorID, AncestorDepth) VALUES %s" \
+                              % ( 'IGNORE ' if ignore else '', intListToString( ancestorTuples ) )
     return self.db._update( req, connection )
 
   def _getFileAncestors( self, fileIDs, depths = [], connection = False ):
@@ -505,14 +576,19 @@ class FileManagerBase( object ):
     for lfn in  result['Value']['Successful']:
       lfns[lfn]['FileID'] = result['Value']['Successful'][lfn]['FileID']
     
-    result = self._populateFileAncestors(lfns, connection)
+    result = self._populateFileAncestors( lfns, connection = connection, propagate = True )
     if not result['OK']:
       return result
     failed.update(result['Value']['Failed'])
     successful = result['Value']['Successful']
     return S_OK({'Successful':successful,'Failed':failed})                                           
     
-  def _getFileRelatives( self, lfns, depths, relation, connection = False ):
+  def _getFileRelatives( self, lfns, depths, relation, connection = False, relativeLFNs = None ):
+    """ Get the ancestors or the descendents of the given files. FC_FileAncestors holding the
+        transitive closure of the ancestry, the relatives of all the files at any depth come with
+        one query, and their LFNs with another one. relativeLFNs is an optional FileID -> LFN
+        cache of the already resolved relatives
+    """
     connection = self._getConnection( connection )
     failed = {}
     successful = {}
@@ -538,24 +614,37 @@ class FileManagerBase( object ):
             
     if not result['OK']:
       return result
-   
-    failed = {}
-    successful = {}
+
     relDict = result['Value']
+    if relativeLFNs is None:
+      relativeLFNs = {}
+    relativeIDs = set()
+    for relatives in relDict.values():
+      relativeIDs.update( relatives )
+    relativeIDs = list( relativeIDs.difference( relativeLFNs ) )
+    lfnError = False
+    failedIDs = {}
+    if relativeIDs:
+      result = self._getFileLFNs( relativeIDs )
+      if not result['OK']:
+        lfnError = True
+      else:
+        relativeLFNs.update( result['Value']['Successful'] )
+        failedIDs = result['Value']['Failed']
+
     for id_ in inputIDs:
       if id_ in relDict:
-        aList = relDict[id_].keys()
-        result = self._getFileLFNs(aList)       
-        if not result['OK']:
-          failed[inputIDDict[id]] = "Failed to find %s" % relation    
-        else:
-          if result['Value']['Successful']:
-            resDict = {}
-            for aID in result['Value']['Successful']:        
-              resDict[ result['Value']['Successful'][aID] ] = relDict[id_][aID]         
-            successful[inputIDDict[id_]] = resDict
-          for aID in result['Value']['Failed']:
-            failed[inputIDDict[id_]] = "Failed to get the ancestor LFN"             
+        if lfnError:
+          failed[inputIDDict[id_]] = "Failed to find %s" % relation
+          continue
+        resDict = {}
+        for aID, depth in relDict[id_].items():
+          if aID in failedIDs:
+            failed[inputIDDict[id_]] = "Failed to get the %s LFN" % relation
+          elif aID in relativeLFNs:
+            resDict[ relativeLFNs[aID] ] = depth
+        if resDict:
+          successful[inputIDDict[id_]] = resDict
       else:
         successful[inputIDDict[id_]] = {}                                     
       
@@ -564,6 +653,23 @@ class FileManagerBase( object ):
   def getFileAncestors( self, lfns, depths, connection = False ):
     return self._getFileRelatives(lfns, depths, 'ancestor', connection)
 
+  def getFileAncestorsBulk( self, lfns, depths, chunkSize = 1000, connection = False ):
+    """ Get the ancestors of a large number of files, chunkSize files at a time. The ancestors
+        shared between the files, as the RAW files of a processing chain, are only resolved once
+    """
+    connection = self._getConnection( connection )
+    successful = {}
+    failed = {}
+    relativeLFNs = {}
+    for lfnChunk in breakListIntoChunks( lfns.keys(), chunkSize ):
+      chunkDict = dict( [ ( lfn, lfns[lfn] ) for lfn in lfnChunk ] )
+      result = self._getFileRelatives( chunkDict, depths, 'ancestor', connection, relativeLFNs )
+      if not result['OK']:
+        return result
+      successful.update( result['Value']['Successful'] )
+      failed.update( result['Value']['Failed'] )
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
   def getFileDescendents( self, lfns, depths, connection = False ):
     return self._getFileRelatives(lfns, depths, 'descendent', connection)
 
@@ -652,14 +758,24 @@ class FileManagerBase( object ):
       return res
     directorySESizeDict = res['Value']
 
-    # Now do removal
+    # Now do removal, together with the usage update if the file manager keeps the usage
+    if directorySESizeDict:
+      res = self.db._query( "START TRANSACTION; ", connection )
+      if not res['OK']:
+        return res
     res = self._deleteFiles( fileIDLfns.keys(), connection = connection )
+    if res['OK']:
+      # Update the directory usage
+      res = self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
+    if directorySESizeDict:
+      if res['OK']:
+        res = self.db._query( "COMMIT;", connection )
+      if not res['OK']:
+        self.db._query( "ROLLBACK;", connection )
     if not res['OK']:
       for lfn in fileIDLfns.values():
         failed[lfn] = res['Message']
     else:
-      # Update the directory usage
-      self._updateDirectoryUsage( directorySESizeDict, '-', connection = connection )
       for lfn in fileIDLfns.values():
         successful[lfn] = True
     return S_OK( {"Successful":successful, "Failed":failed} )
@@ -790,18 +906,37 @@ class FileManagerBase( object ):
     connection = self._getConnection( connection )
     successful = {}
     failed = {}
+    lfnList = []
     for lfn, info in lfns.items():
       res = self._checkInfo( info, ['SE', 'Status'] )
       if not res['OK']:
         failed[lfn] = res['Message']
         continue
-      status = info['Status']
-      se = info['SE']
-      res = self._findFiles( [lfn], ['FileID'], connection = connection )
-      if not res['Value']['Successful'].has_key( lfn ):
-        failed[lfn] = res['Value']['Failed'][lfn]
-        continue
-      fileID = res['Value']['Successful'][lfn]['FileID']
+      lfnList.append( lfn )
+    if not lfnList:
+      return S_OK( {'Successful':successful, 'Failed':failed} )
+    res = self._findFiles( lfnList, ['FileID'], connection = connection )
+    if not res['OK']:
+      return res
+    failed.update( res['Value']['Failed'] )
+    replicas = {}
+    for lfn, fileDict in res['Value']['Successful'].items():
+      replicas[lfn] = ( fileDict['FileID'], lfns[lfn]['SE'], lfns[lfn]['Status'] )
+    res = self._setMultipleReplicaStatus( replicas, connection = connection )
+    if not res['OK']:
+      return res
+    successful.update( res['Value']['Successful'] )
+    failed.update( res['Value']['Failed'] )
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
+  def _setMultipleReplicaStatus( self, replicas, connection = False ):
+    """ Set the status of several replicas, one at a time unless the file manager can do better
+
+        :param dict replicas: { lfn : ( fileID, se, status ) }
+    """
+    successful = {}
+    failed = {}
+    for lfn, ( fileID, se, status ) in replicas.items():
       res = self._setReplicaStatus( fileID, se, status, connection = connection )
       if res['OK']:
         successful[lfn] = res['Value']
@@ -1122,10 +1257,10 @@ class FileManagerBase( object ):
     """
     return self._getDirectoryFileIDs( dirID, requestString = requestString )
 
-  def getFilesInDirectory( self, dirID, verbose = False, connection = False ):
+  def getFilesInDirectory( self, dirID, verbose = False, connection = False, fileNames = None ):
     connection = self._getConnection( connection )
     files = {}
-    res = self._getDirectoryFiles( dirID, [], ['FileID', 'Size', 'GUID',
+    res = self._getDirectoryFiles( dirID, fileNames or [], ['FileID', 'Size', 'GUID',
                                                'Checksum', 'ChecksumType',
                                                'Type', 'UID',
                                                'GID', 'CreationDate',
@@ -1151,6 +1286,26 @@ class FileManagerBase( object ):
         
     return S_OK( files )
 
+  def getFilesInDirectoryPage( self, dirID, lastFileID = 0, maxFiles = 1000, verbose = False, connection = False ):
+    """ Get at most maxFiles files of the directory following lastFileID in the FileID order.
+        LastFileID in the result is the one to get the next page with, 0 after the last page
+    """
+    connection = self._getConnection( connection )
+    req = "SELECT FileID,FileName FROM FC_Files WHERE DirID=%d AND FileID>%d ORDER BY FileID LIMIT %d" % \
+          ( dirID, lastFileID, maxFiles )
+    res = self.db._query( req, connection )
+    if not res['OK']:
+      return res
+    if not res['Value']:
+      result = S_OK( {} )
+    else:
+      result = self.getFilesInDirectory( dirID, verbose = verbose, connection = connection,
+                                         fileNames = [ row[1] for row in res['Value'] ] )
+      if not result['OK']:
+        return result
+    result['LastFileID'] = res['Value'][-1][0] if len( res['Value'] ) == maxFiles else 0
+    return result
+
   def getDirectoryReplicas( self, dirID, path, allStatus = False, connection = False ):
     """ Get the replicas for all the Files in the given Directory
         :param DirID : ID of the directory
@@ -8,9 +8,11 @@
 
 __RCSID__ = "$Id$"
 
+import uuid
 from types import IntType, ListType, LongType, DictType, StringTypes, FloatType
 from DIRAC import S_OK, S_ERROR
 from DIRAC.Core.Utilities.Time import queryTime
+from DIRAC.Core.Utilities.ShardedDictCache import ShardedDictCache
 from DIRAC.Core.Utilities.List import intListToString
 from DIRAC.DataManagementSystem.Client.MetaQuery import FILE_STANDARD_METAKEYS, \
                                                         FILES_TABLE_METAKEYS, \
@@ -21,6 +23,10 @@ class FileMetadata:
   def __init__( self, database = None ):
 
     self.db = database
+    # Directory selections of the paged metadata searches:
+    # SelectionID -> ( query key, list of DirIDs, selection flag )
+    self.__dirSelections = ShardedDictCache( maxSize = 100 )
+    self.__dirSelectionLifeTime = 600
 
   def setDatabase( self, database ):
     self.db = database
@@ -496,9 +502,10 @@ class FileMetadata:
     return S_OK( resultList )
 
 
-  def __findFilesByMetadata( self, metaDict, dirList, credDict ):
+  def __findFilesByMetadata( self, metaDict, dirList, credDict, lastFileID = 0, maxFiles = 0 ):
     """ Find a list of file IDs meeting the metaDict requirements and belonging
-        to directories in dirList
+        to directories in dirList. If maxFiles is given, only that many files following
+        lastFileID in the FileID order are returned
     """
     # 1.- classify Metadata keys
     storageElements = None
@@ -563,9 +570,14 @@ class FileMetadata:
         condition = condition % table
       conditions.append( condition )
 
+    if maxFiles:
+      conditions.append( "F.FileID > %d" % lastFileID )
+
     query += ' '.join( tables )
     if conditions:
       query += ' WHERE %s' % ' AND '.join( conditions )
+    if maxFiles:
+      query += ' ORDER BY F.FileID LIMIT %d' % maxFiles
 
     result = self.db._query( query )
     if not result['OK']:
@@ -640,3 +652,59 @@ class FileMetadata:
       result['LFNIDDict'] = lfnIdDict
 
     return result
+
+  def findFilesByMetadataPage( self, metaDict, path, credDict, lastFileID = 0, maxFiles = 1000, selectionID = '' ):
+    """ Find at most maxFiles files satisfying the given metadata following lastFileID
+        in the FileID order. Returns the LFNs and the LastFileID to get the next page with,
+        0 after the last page. The directory selection is computed for the first page and
+        kept for some time under the returned SelectionID, the following pages of the same
+        search given that SelectionID reuse it instead of running the directory query again
+    """
+    if not path:
+      path = '/'
+    resultDict = { 'LFNs' : [], 'LastFileID' : 0, 'SelectionID' : '' }
+
+    queryKey = ( repr( sorted( metaDict.items() ) ), path, credDict.get( 'DN' ), credDict.get( 'group' ) )
+    cachedSelection = None
+    if selectionID:
+      cachedSelection = self.__dirSelections.get( selectionID )
+    if cachedSelection is not None and cachedSelection[0] == queryKey:
+      dirList, dirFlag = cachedSelection[1:]
+    else:
+      result = self.db.dmeta.findDirIDsByMetadata( metaDict, path, credDict )
+      if not result['OK']:
+        return result
+      dirList = result['Value']
+      dirFlag = result['Selection']
+      selectionID = uuid.uuid4().hex
+    if dirFlag == 'None':
+      return S_OK( resultDict )
+    if dirFlag == 'All':
+      dirList = []
+
+    result = self.getFileMetadataFields( credDict )
+    if not result['OK']:
+      return result
+    fileMetaKeys = result['Value'].keys() + FILE_STANDARD_METAKEYS.keys()
+    fileMetaDict = dict( item for item in metaDict.items() if item[0] in fileMetaKeys )
+    if not fileMetaDict and not dirList:
+      # No metadata at all in the query, the search is empty as for findFilesByMetadata
+      return S_OK( resultDict )
+
+    result = self.__findFilesByMetadata( fileMetaDict, dirList, credDict, lastFileID, maxFiles )
+    if not result['OK']:
+      return result
+    fileList = result['Value']
+    if not fileList:
+      return S_OK( resultDict )
+
+    result = self.db.fileManager._getFileLFNs( fileList )
+    if not result['OK']:
+      return result
+    lfnDict = result['Value']['Successful']
+    resultDict['LFNs'] = [ lfnDict[fileID] for fileID in fileList if fileID in lfnDict ]
+    if len( fileList ) == maxFiles:
+      resultDict['LastFileID'] = fileList[-1]
+      resultDict['SelectionID'] = selectionID
+      self.__dirSelections.add( selectionID, self.__dirSelectionLifeTime, ( queryKey, dirList, dirFlag ) )
+    return S_OK( resultDict )
@@ -43,6 +43,12 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
 
     dpath = os.path.normpath( path )
+    dirID = self._getCachedDirID( dpath )
+    if dirID:
+      res = S_OK( dirID )
+      res['Level'] = 0 if dpath == '/' else dpath.count( '/' )
+      return res
+
     result = self.db.executeStoredProcedure( 'ps_find_dir', ( dpath, 'ret1', 'ret2' ), outputIds = [1, 2] )
     if not result['OK']:
       return result
@@ -50,6 +56,7 @@ class DirectoryClosure( DirectoryTreeBase ):
     if not result['Value']:
       return S_OK( 0 )
 
+    self._cacheDirID( dpath, result['Value'][0] )
     res = S_OK( result['Value'][0] )
     res['Level'] = result['Value'][1]
     return res
@@ -63,14 +70,23 @@ class DirectoryClosure( DirectoryTreeBase ):
     """
 
     dirDict = {}
-    if not paths:
+    dpaths = []
+    for path in paths:
+      dpath = os.path.normpath( path )
+      dirID = self._getCachedDirID( dpath )
+      if dirID:
+        dirDict[dpath] = dirID
+      else:
+        dpaths.append( dpath )
+    if not dpaths:
       return S_OK( dirDict )
-    dpaths = stringListToString( [os.path.normpath( path ) for path in paths ] )
+    dpaths = stringListToString( dpaths )
     result = self.db.executeStoredProcedureWithCursor( 'ps_find_dirs', ( dpaths, ) )
     if not result['OK']:
       return result
     for dirName, dirID in result['Value']:
       dirDict[dirName] = dirID
+      self._cacheDirID( dirName, dirID )
 
     return S_OK( dirDict )
 
@@ -97,6 +113,7 @@ class DirectoryClosure( DirectoryTreeBase ):
 
     dirId = result['Value']
     result = self.db.executeStoredProcedure( 'ps_remove_dir', ( dirId, ), outputIds = [] )
+    self._uncacheDir( path )
     if not result['OK']:
       return result
 
@@ -178,6 +195,10 @@ class DirectoryClosure( DirectoryTreeBase ):
         :returns S_OK( list of ids ), S_ERROR if not found
     """
 
+    pathIDs = self._getCachedPathIDs( path )
+    if pathIDs:
+      return S_OK( pathIDs )
+
     result = self.findDir( path )
     if not result['OK']:
       return result
@@ -186,7 +207,10 @@ class DirectoryClosure( DirectoryTreeBase ):
 
     dirID = result['Value']
 
-    return self.getPathIDsByID(dirID)
+    result = self.getPathIDsByID( dirID )
+    if result['OK']:
+      self._cachePathIDs( path, result['Value'] )
+    return result
 
 
 
@@ -209,6 +233,12 @@ class DirectoryClosure( DirectoryTreeBase ):
 
 
 
+  def verifyDirectoryUsage( self, lastDirID = 0, maxDirs = 100, fix = False ):
+    """ Nothing to check: the storage usage is kept by triggers in the DB, per directory
+    """
+    return S_OK( { 'LastDirID' : 0, 'Checked' : 0, 'Differences' : {}, 'Fixed' : False } )
+
+
   def getChildren( self, path, connection = False ):
     """ Get child directory IDs for the given directory
     """
@@ -325,7 +355,6 @@ class DirectoryClosure( DirectoryTreeBase ):
 #  Some methods could be inherited in the future if we have perf problems. For example
 #  * removeDirectory
 #  * changeDirectory[Group/Owner/Mode]
-#  * getDirectoryPermissions (when called by getPathPermissions, we could buffer the getUserAndGroupID call)
 #  * getFileIDsInDirectory (used only by DirectoryMetadata)
 #  * getFilesInDirectory (used only by DirectoryMetadata)
 #  * getFileLFNsInDirectory (used only by FileMetadata)
@@ -393,6 +422,7 @@ class DirectoryClosure( DirectoryTreeBase ):
         return result
 
       dirId = result['Value'][0][0]
+      self._cacheDirID( dpath, dirId )
 
       result = S_OK( dirId )
       result['NewDirectory'] = True
@@ -483,6 +513,22 @@ class DirectoryClosure( DirectoryTreeBase ):
     return S_OK( rowDict )
 
 
+  def _getDirectoryModes( self, dirIDs ):
+    """ Get the owner, group and mode of the given directories
+
+        :param dirIDs : list of directory ids
+
+        :returns S_OK( { dirID : ( UID, GID, Mode ) } )
+    """
+    if not dirIDs:
+      return S_OK( {} )
+    req = "SELECT DirID,UID,GID,Mode FROM FC_DirectoryList WHERE DirID IN ( %s )" % intListToString( dirIDs )
+    result = self.db._query( req )
+    if not result['OK']:
+      return result
+    return S_OK( dict( [ ( row[0], tuple( [ int( x ) for x in row[1:] ] ) ) for row in result['Value'] ] ) )
+
+
   def _setDirectoryParameter( self, path, pname, pvalue, recursive = False ):
     """ Set a numerical directory parameter
 
@@ -688,4 +734,5 @@ class DirectoryClosure( DirectoryTreeBase ):
       else:
         successful[path] = True
 
+    self._clearPermCache()
     return S_OK( {'Successful':successful, 'Failed':failed} )
@@ -24,6 +24,8 @@ class FileManagerPs( FileManagerBase ):
   
   def __init__(self, database = None ):
     super( FileManagerPs, self ).__init__( database )
+    # Number of replicas treated by a single call of the ps_*_multiple_replica* procedures
+    self.replicaChunkSize = 1000
 
   
 
@@ -597,20 +599,25 @@ class FileManagerPs( FileManagerBase ):
 
     replicaDict = {}
 
-    for fileID,seID in replicaTuples:
-      result = self.db.executeStoredProcedure( 'ps_get_replica_id', ( fileID, seID, 'repIdOut' ), outputIds = [2] )
+    for replicaChunk in self.__chunks( list( replicaTuples ), self.replicaChunkSize ):
+      result = self.db.executeStoredProcedureWithCursor( 'ps_get_multiple_replica_id',
+                                                         ( self.__getReplicaDescString( replicaChunk ), ) )
       if not result['OK']:
         return result
 
-      repID = result['Value'][0]
-
-      # if the replica exists, we add it to the dict
-      if repID:
+      # only the existing replicas are returned
+      for fileID, seID, repID in result['Value']:
         replicaDict.setdefault( fileID, {} ).setdefault( seID, repID )
 
 
     return S_OK( replicaDict )
 
+  def __getReplicaDescString( self, replicaTuples ):
+    """ Format (fileID, seID) couples as the replicaDesc argument of the ps_*_multiple_replica* procedures,
+        like " (r.FileID = x AND r.SEID = y) OR (r.FileID = u AND r.SEID = v)"
+    """
+    return " OR ".join( [ "(r.FileID = %d AND r.SEID = %d)" % ( fileID, seID ) for fileID, seID in replicaTuples ] )
+
   ######################################################
   #
   # _deleteReplicas related methods
@@ -638,6 +645,7 @@ class FileManagerPs( FileManagerBase ):
         failed[lfn] = error
 
     lfnFileIDDict = res['Value']['Successful']
+    replicaLfns = {}
     for lfn,fileDict in lfnFileIDDict.items():
       fileID = fileDict['FileID']
 
@@ -648,8 +656,21 @@ class FileManagerPs( FileManagerBase ):
       if not res['OK']:
         return res
       seID = res['Value']
+      replicaLfns[( fileID, seID )] = lfn
+
+    # Remove the replicas chunk by chunk, and one by one those of the chunks that failed
+    replicasToRetry = []
+    for replicaChunk in self.__chunks( replicaLfns.keys(), self.replicaChunkSize ):
+      result = self.db.executeStoredProcedureWithCursor( 'ps_delete_multiple_replica',
+                                                         ( self.__getReplicaDescString( replicaChunk ), ) )
+      if result['OK'] and not result['Value'][0][0]:
+        for replica in replicaChunk:
+          successful[replicaLfns[replica]] = True
+      else:
+        replicasToRetry.extend( replicaChunk )
 
-      # Finally remove the replica
+    for fileID, seID in replicasToRetry:
+      lfn = replicaLfns[( fileID, seID )]
       result = self.db.executeStoredProcedureWithCursor( 'ps_delete_replica_from_file_and_se_ids', ( fileID, seID ) )
       if not result['OK']:
         failed[lfn] = result['Message']
@@ -707,6 +728,56 @@ class FileManagerPs( FileManagerBase ):
     else:
       return S_OK()
 
+  def _setMultipleReplicaStatus( self, replicas, connection = False ):
+    """ Set the status of many replicas, with one procedure call per status and chunk of replicas
+
+      :param replicas : { lfn : ( fileID, se, status ) }, se being the se name or se id
+
+      :returns successful/failed convention, with successful[lfn] = True
+    """
+    connection = self._getConnection(connection)
+    successful = {}
+    failed = {}
+
+    # { statusID : { ( fileID, seID ) : lfn } }
+    statusReplicas = {}
+    statusIDs = {}
+    for lfn, ( fileID, se, status ) in replicas.items():
+      if not status in self.db.validReplicaStatus:
+        failed[lfn] = 'Invalid replica status %s' % status
+        continue
+      if not status in statusIDs:
+        res = self._getStatusInt( status, connection = connection )
+        if not res['OK']:
+          return res
+        statusIDs[status] = res['Value']
+
+      # Then we get our StorageElement Id (cached in seManager)
+      res = self.db.seManager.findSE( se )
+      if not res['OK']:
+        failed[lfn] = res['Message']
+        continue
+      statusReplicas.setdefault( statusIDs[status], {} )[( fileID, res['Value'] )] = lfn
+
+    for statusID, replicaLfns in statusReplicas.items():
+      for replicaChunk in self.__chunks( replicaLfns.keys(), self.replicaChunkSize ):
+        result = self.db.executeStoredProcedureWithCursor( 'ps_set_multiple_replica_status',
+                                                           ( self.__getReplicaDescString( replicaChunk ), statusID ) )
+        if not result['OK']:
+          for replica in replicaChunk:
+            failed[replicaLfns[replica]] = result['Message']
+          continue
+
+        # The procedure returns the replicas that exist
+        existing = set( [ ( fileID, seID ) for fileID, seID in result['Value'] ] )
+        for replica in replicaChunk:
+          if replica in existing:
+            successful[replicaLfns[replica]] = True
+          else:
+            failed[replicaLfns[replica]] = "Replica does not exist"
+
+    return S_OK( {'Successful':successful, 'Failed':failed} )
+
 
   def _setReplicaHost( self, fileID, se, newSE, connection = False ):
     """ Move a replica from one SE to another (I don't think this should be called
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+########################################################################
+# $HeadURL$
+########################################################################
+"""
+Compare the per replica and bulk stored procedure calls of FileManagerPs
+
+To be run against a test FileCatalogDB created from FileCatalogWithFkAndPsDB.sql. The
+replicas at the given SE of the files of the given directory get their status changed
+and restored, then their replica IDs looked up, one replica per procedure call and in bulk.
+"""
+__RCSID__ = "$Id$"
+
+from DIRAC.Core.Base import Script
+
+Script.setUsageMessage( '\n'.join( [ __doc__.split( '\n' )[1],
+                                     '\nUsage:',
+                                     '  %s [option|cfgfile] ... Directory SE [Status]' % Script.scriptName,
+                                     'Arguments:',
+                                     '  Directory: Catalog directory with the files to use',
+                                     '  SE:        Name of the Storage Element of the replicas',
+                                     '  Status:    Temporary replica status (default Probing)' ] ) )
+
+Script.parseCommandLine( ignoreErrors = False )
+
+import time
+
+import DIRAC
+from DIRAC                                                   import gLogger
+from DIRAC.DataManagementSystem.DB.FileCatalogDB             import FileCatalogDB
+
+def timeCalls( label, numberOfReplicas, function, *args ):
+  """ Time a function over numberOfReplicas replicas and print the throughput
+  """
+  start = time.time()
+  result = function( *args )
+  elapsed = time.time() - start
+  if not result['OK']:
+    gLogger.error( label, result['Message'] )
+    DIRAC.exit( 1 )
+  gLogger.notice( "%-30s: %6d replicas in %8.3f s, %10.1f replicas/s" % ( label, numberOfReplicas, elapsed,
+                                                                         numberOfReplicas / max( elapsed, 1e-6 ) ) )
+  return result
+
+def setStatusPerReplica( fileManager, replicas ):
+  """ Set the replica status one procedure call at a time
+  """
+  for fileID, se, status in replicas.values():
+    result = fileManager._setReplicaStatus( fileID, se, status )
+    if not result['OK']:
+      return result
+  return DIRAC.S_OK()
+
+def getReplicaIDsPerReplica( fileManager, replicaTuples ):
+  """ Get the replica IDs one procedure call at a time
+  """
+  for fileID, seID in replicaTuples:
+    result = fileManager.db.executeStoredProcedure( 'ps_get_replica_id', ( fileID, seID, 'repIdOut' ), outputIds = [2] )
+    if not result['OK']:
+      return result
+  return DIRAC.S_OK()
+
+args = Script.getPositionalArgs()
+if len( args ) not in ( 2, 3 ):
+  Script.showHelp()
+directory, se = args[:2]
+tmpStatus = 'Probing'
+if len( args ) == 3:
+  tmpStatus = args[2]
+
+db = FileCatalogDB()
+result = db.setConfig( { 'UniqueGUID' : False, 'GlobalReadAccess' : True, 'LFNPFNConvention' : 'Strong',
+                         'ResolvePFN' : True, 'DefaultUmask' : 0775,
+                         'ValidFileStatus' : ['AprioriGood', 'Trash', 'Removing', 'Probing'],
+                         'ValidReplicaStatus' : ['AprioriGood', 'Trash', 'Removing', 'Probing', tmpStatus],
+                         'VisibleFileStatus' : ['AprioriGood'], 'VisibleReplicaStatus' : ['AprioriGood'],
+                         'UserGroupManager' : 'UserAndGroupManagerDB', 'SEManager' : 'SEManagerDB',
+                         'SecurityManager' : 'NoSecurityManager', 'DirectoryManager' : 'DirectoryClosure',
+                         'FileManager' : 'FileManagerPs', 'DirectoryMetadata' : 'DirectoryMetadata',
+                         'FileMetadata' : 'FileMetadata', 'DatasetManager' : 'DatasetManager' } )
+if not result['OK']:
+  gLogger.error( "Failed to configure the FileCatalogDB", result['Message'] )
+  DIRAC.exit( 1 )
+fileManager = db.fileManager
+
+result = db.dtree.findDir( directory )
+if not result['OK'] or not result['Value']:
+  gLogger.error( "Unknown directory", directory )
+  DIRAC.exit( 1 )
+result = fileManager.getFilesInDirectoryPage( result['Value'], 0, db.maxPageSize )
+if not result['OK']:
+  gLogger.error( "Failed to list the directory", result['Message'] )
+  DIRAC.exit( 1 )
+fileIDs = [ fileDict['FileID'] for fileDict in result['Value'].values() ]
+result = db.seManager.findSE( se )
+if not result['OK']:
+  gLogger.error( "Unknown SE", se )
+  DIRAC.exit( 1 )
+seID = result['Value']
+numberOfReplicas = len( fileIDs )
+
+# The per replica calls first, the bulk ones then restore the status
+for status, method in ( ( tmpStatus, 'per replica' ), ( 'AprioriGood', 'bulk' ) ):
+  replicas = dict( [ ( fileID, ( fileID, se, status ) ) for fileID in fileIDs ] )
+  if method == 'bulk':
+    timeCalls( "setReplicaStatus %s" % method, numberOfReplicas, fileManager._setMultipleReplicaStatus, replicas )
+  else:
+    timeCalls( "setReplicaStatus %s" % method, numberOfReplicas, setStatusPerReplica, fileManager, replicas )
+
+replicaTuples = [ ( fileID, seID ) for fileID in fileIDs ]
+timeCalls( "getReplicaIDs per replica", numberOfReplicas, getReplicaIDsPerReplica, fileManager, replicaTuples )
+timeCalls( "getReplicaIDs bulk", numberOfReplicas, fileManager._getRepIDsForReplica, replicaTuples )
+
+DIRAC.exit( 0 )
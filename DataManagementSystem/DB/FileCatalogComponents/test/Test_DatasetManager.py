@@ -0,0 +1,186 @@
+""" Test for the materialized file lists of the dynamic datasets
+"""
+
+import os
+import re
+import unittest
+
+from mock import MagicMock, patch
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager import DatasetManager
+
+class DatasetManagerTestCase( unittest.TestCase ):
+  """ Base class for the DatasetManager test cases
+  """
+  def setUp( self ):
+    # LFN -> ( FileID, Run )
+    self.files = { '/vo/data/a/f1' : ( 1, 1 ), '/vo/data/a/f2' : ( 2, 2 ), '/vo/data/b/f1' : ( 3, 1 ),
+                   '/vo/other/f1' : ( 4, 1 ) }
+    self.metaQuery = { 'Path' : '/vo/data', 'Run' : 1 }
+    # LFN -> SEs of its replicas
+    self.replicas = dict( [ ( lfn, set( [ 'SE1' ] ) ) for lfn in self.files ] )
+    self.dirIDs = { '/vo/data/a' : 11, '/vo/data/b' : 12, '/vo/data/c' : 13, '/vo/other' : 14 }
+    # Directory metadata
+    self.dirMeta = { '/vo/data/a' : { 'Year' : 2015 }, '/vo/data/b' : { 'Year' : 2015 }, '/vo/data/c' : { 'Year' : 2014 } }
+    # Tables of the materialized file lists
+    self.cache = {}
+    self.datasetFiles = set()
+    self.changes = []
+    self.lastChangeID = 0
+    self.db = MagicMock()
+    self.db._query.side_effect = self.__query
+    self.db._update.side_effect = self.__update
+    self.db._createTables.return_value = S_OK( [] )
+    self.db.fmeta.findFilesByMetadata.side_effect = self.__findFilesByMetadata
+    self.db.fileManager._getFileLFNs.side_effect = self.__getFileLFNs
+    self.db.dtree.findDirs.side_effect = lambda paths: S_OK( dict( [ ( path, self.dirIDs[path] ) for path in paths ] ) )
+    self.db.dmeta.getMetadataFields.return_value = S_OK( { 'Year' : 'INT' } )
+    self.db.dmeta.getDirectoryMetadata.side_effect = lambda path, credDict: S_OK( self.dirMeta.get( path, {} ) )
+    self.datasetManager = DatasetManager( self.db )
+    self.getDatasetFiles = getattr( self.datasetManager, '_DatasetManager__getDynamicDatasetFiles' )
+
+  def __findFilesByMetadata( self, metaDict, path, credDict, extra = False ):
+    lfnIDDict = dict( [ ( fileID, lfn ) for lfn, ( fileID, run ) in self.files.items()
+                        if lfn.startswith( path + '/' ) and run == metaDict['Run'] and
+                        ( 'SE' not in metaDict or metaDict['SE'] in self.replicas[lfn] ) ] )
+    result = S_OK( lfnIDDict.values() )
+    result['LFNIDDict'] = lfnIDDict
+    return result
+
+  def __getFileLFNs( self, fileIDs ):
+    lfns = dict( [ ( fileID, lfn ) for lfn, ( fileID, _run ) in self.files.items() if fileID in fileIDs ] )
+    return S_OK( { 'Successful' : lfns, 'Failed' : {} } )
+
+  def __query( self, req, connection = False ):
+    if req.startswith( "SELECT MetaQuery" ):
+      return S_OK( ( ( str( self.metaQuery ), ), ) )
+    if req.startswith( "SELECT Version" ):
+      return S_OK( tuple( [ ( self.cache[1]['Version'], ) ] if 1 in self.cache else [] ) )
+    if req.startswith( "SELECT ChangeID" ):
+      return S_OK( tuple( self.changes ) )
+    if req.startswith( "SELECT FileID" ):
+      return S_OK( tuple( [ ( fileID, ) for fileID in self.datasetFiles ] ) )
+    if req.startswith( "SELECT C.DatasetID,C.Path,D.MetaQuery" ):
+      return S_OK( tuple( [ ( datasetID, cache['Path'], str( self.metaQuery ) ) for datasetID, cache in self.cache.items() ] ) )
+    if req.startswith( "SELECT DatasetID,Path,ChangeType" ):
+      return S_OK( tuple( [ ( 1, path, changeType ) for _changeID, path, changeType in self.changes ] ) )
+    return S_OK( () )
+
+  def __update( self, req, connection = False ):
+    if req.startswith( "INSERT IGNORE INTO FC_MetaDatasetCache" ):
+      self.cache[1] = { 'Path' : req.split( "'" )[1], 'Version' : 0 }
+    elif req.startswith( "UPDATE FC_MetaDatasetCache" ):
+      self.cache[1]['Version'] += 1
+    elif req.startswith( "DELETE FROM FC_MetaDatasetFiles" ):
+      self.datasetFiles = set()
+    elif "INTO FC_MetaDatasetFiles" in req:
+      self.datasetFiles.update( [ int( fileID ) for fileID in re.findall( '\(1,(\d+)\)', req ) ] )
+    elif req.startswith( "DELETE D FROM FC_MetaDatasetFiles" ) and "LEFT JOIN" in req:
+      self.datasetFiles.intersection_update( [ fileID for fileID, _run in self.files.values() ] )
+    elif req.startswith( "DELETE D FROM FC_MetaDatasetFiles" ):
+      dirIDs = [ int( x ) for x in re.search( 'DirID IN \(([\d,]+)\)', req ).group( 1 ).split( ',' ) ]
+      match = re.search( 'NOT IN \(([\d,]+)\)', req )
+      keep = [ int( x ) for x in match.group( 1 ).split( ',' ) ] if match else []
+      for lfn, ( fileID, _run ) in self.files.items():
+        if self.dirIDs[os.path.dirname( lfn )] in dirIDs and fileID not in keep:
+          self.datasetFiles.discard( fileID )
+    elif req.startswith( "INSERT INTO FC_MetaDatasetChanges" ):
+      for datasetID, path, changeType in re.findall( "\((\d+),'([^']*)','(\w+)'\)", req ):
+        self.lastChangeID += 1
+        self.changes.append( ( self.lastChangeID, path, changeType ) )
+    elif req.startswith( "DELETE FROM FC_MetaDatasetChanges WHERE DatasetID IN" ):
+      self.changes = []
+    elif req.startswith( "DELETE FROM FC_MetaDatasetChanges" ):
+      lastChangeID = int( req.split( '<=' )[1] )
+      self.changes = [ change for change in self.changes if change[0] > lastChangeID ]
+    return S_OK()
+
+class MaterializedFiles( DatasetManagerTestCase ):
+
+  def test_materialization( self ):
+    result = self.getDatasetFiles( 1, {} )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( sorted( result['Value'] ), [ '/vo/data/a/f1', '/vo/data/b/f1' ] )
+    self.assertEqual( self.cache[1], { 'Path' : '/vo/data', 'Version' : 1 } )
+    # Without changes, the metaquery is not run again
+    result = self.getDatasetFiles( 1, {} )
+    self.assertEqual( sorted( result['Value'] ), [ '/vo/data/a/f1', '/vo/data/b/f1' ] )
+    self.assertEqual( self.db.fmeta.findFilesByMetadata.call_count, 1 )
+
+  def test_fileChanges( self ):
+    self.getDatasetFiles( 1, {} )
+    self.files['/vo/data/c/f1'] = ( 5, 1 )
+    self.files['/vo/other/f2'] = ( 6, 1 )
+    self.files.pop( '/vo/data/a/f1' )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/c/f1', '/vo/other/f2' ], 'Files' )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f1' ], 'Files' )
+    self.assertEqual( [ change[1] for change in self.changes ], [ '/vo/data/c', '/vo/data/a' ] )
+    result = self.getDatasetFiles( 1, {} )
+    self.assertEqual( sorted( result['Value'] ), [ '/vo/data/b/f1', '/vo/data/c/f1' ] )
+    # Only the directories of the changes are looked at
+    paths = sorted( [ call[0][1] for call in self.db.fmeta.findFilesByMetadata.call_args_list[1:] ] )
+    self.assertEqual( paths, [ '/vo/data/a', '/vo/data/c' ] )
+    self.assertEqual( ( self.changes, self.cache[1]['Version'] ), ( [], 2 ) )
+
+  def test_metadataChanges( self ):
+    self.getDatasetFiles( 1, {} )
+    self.files['/vo/data/a/f2'] = ( 2, 1 )
+    # The metadata of a parent directory of the dataset scope concern it as well
+    self.datasetManager.addDatasetChanges( [ '/vo' ], 'Metadata' )
+    result = self.getDatasetFiles( 1, {} )
+    self.assertEqual( len( result['Value'] ), 3 )
+    self.assertEqual( self.db.fmeta.findFilesByMetadata.call_args[0][1], '/vo/data' )
+
+  def test_directoryMetadata( self ):
+    self.metaQuery['Year'] = 2015
+    self.getDatasetFiles( 1, {} )
+    self.files['/vo/data/c/f1'] = ( 5, 1 )
+    self.files['/vo/data/a/f3'] = ( 6, 1 )
+    # The files of /vo/data/c cannot be in the dataset after the metadata of their directory
+    self.datasetManager.addDatasetChanges( [ '/vo/data/c/f1', '/vo/data/a/f3' ], 'Files' )
+    self.assertEqual( [ change[1] for change in self.changes ], [ '/vo/data/a' ] )
+
+  def test_coalescing( self ):
+    self.getDatasetFiles( 1, {} )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f3', '/vo/data/a/f4' ], 'Files' )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f5' ], 'Files' )
+    self.assertEqual( [ change[1:] for change in self.changes ], [ ( '/vo/data/a', 'Files' ) ] )
+    # A metadata change stands for all the others
+    self.datasetManager.addDatasetChanges( [ '/vo/data/b' ], 'Metadata' )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/c/f1' ], 'Files' )
+    self.assertEqual( [ change[1:] for change in self.changes ], [ ( '/vo/data/b', 'Metadata' ) ] )
+
+  def test_pruning( self ):
+    self.getDatasetFiles( 1, {} )
+    with patch( 'DIRAC.DataManagementSystem.DB.FileCatalogComponents.DatasetManager.MAX_DATASET_CHANGES', 2 ):
+      self.datasetManager.addDatasetChanges( [ '/vo/data/a/f3', '/vo/data/b/f3' ], 'Files' )
+      self.assertEqual( len( self.changes ), 2 )
+      self.datasetManager.addDatasetChanges( [ '/vo/data/c/f3' ], 'Files' )
+    self.assertEqual( [ change[2] for change in self.changes ], [ 'Metadata' ] )
+
+  def test_replicaChanges( self ):
+    self.getDatasetFiles( 1, {} )
+    self.replicas['/vo/data/a/f1'] = set()
+    # Without an SE in the query the replicas do not matter
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f1' ], 'Replicas' )
+    self.assertEqual( self.changes, [] )
+
+    self.metaQuery['SE'] = 'SE1'
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f1' ], 'Replicas' )
+    result = self.getDatasetFiles( 1, {} )
+    self.assertEqual( sorted( result['Value'] ), [ '/vo/data/b/f1' ] )
+    self.replicas['/vo/data/a/f1'] = set( [ 'SE1' ] )
+    self.datasetManager.addDatasetChanges( [ '/vo/data/a/f1' ], 'Replicas' )
+    result = self.getDatasetFiles( 1, {} )
+    self.assertEqual( sorted( result['Value'] ), [ '/vo/data/a/f1', '/vo/data/b/f1' ] )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DatasetManagerTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( MaterializedFiles ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
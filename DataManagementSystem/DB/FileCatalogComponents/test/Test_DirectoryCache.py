@@ -0,0 +1,78 @@
+""" Test for the path to DirID cache of the directory trees of the FileCatalog
+"""
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+class DirectoryCacheTestCase( unittest.TestCase ):
+  """ Base class for the directory cache test cases
+  """
+  def setUp( self ):
+    self.db = MagicMock()
+    self.db.directoryCacheSize = 3
+    self.db.directoryCacheLifeTime = 60
+    self.db._query.side_effect = self.__query
+    self.dirIDs = { '/' : 1, '/vo' : 2, '/vo/user' : 3, '/vo/data' : 4, '/vo/data/run1' : 5 }
+    self.dtree = DirectoryLevelTree( self.db )
+
+  def __query( self, req, connection = False ):
+    if req.startswith( "SELECT DirID,Level" ):
+      path = req.split( "'" )[1]
+      if path not in self.dirIDs:
+        return S_OK( () )
+      return S_OK( ( ( self.dirIDs[path], path.count( '/' ) ), ) )
+    if req.startswith( "SELECT DirName,DirID" ):
+      paths = [ path for path in req.split( "'" )[1::2] if path in self.dirIDs ]
+      return S_OK( tuple( [ ( path, self.dirIDs[path] ) for path in paths ] ) )
+    return S_OK( () )
+
+class DirectoryCache( DirectoryCacheTestCase ):
+
+  def test_findDir( self ):
+    result = self.dtree.findDir( '/vo/user/' )
+    self.assertEqual( ( result['Value'], result['Level'] ), ( 3, 2 ) )
+    result = self.dtree.findDir( '/vo/user' )
+    self.assertEqual( ( result['Value'], result['Level'] ), ( 3, 2 ) )
+    self.assertEqual( self.db._query.call_count, 1 )
+    # Missing directories are not cached
+    self.assertEqual( self.dtree.findDir( '/vo/missing' )['Value'], '' )
+    self.assertEqual( self.dtree.findDir( '/vo/missing' )['Value'], '' )
+    self.assertEqual( self.db._query.call_count, 3 )
+    counters = self.dtree.getDirCacheCounters()['Value']
+    self.assertEqual( ( counters['Directory cache hits'], counters['Directory cache misses'] ), ( 1, 3 ) )
+
+  def test_findDirs( self ):
+    self.dtree.findDir( '/vo' )
+    result = self.dtree.findDirs( [ '/vo', '/vo/user', '/vo/data' ] )
+    self.assertEqual( result['Value'], { '/vo' : 2, '/vo/user' : 3, '/vo/data' : 4 } )
+    # Only the directories that were not cached are queried
+    self.assertEqual( self.db._query.call_args[0][0].count( "'" ), 4 )
+    self.assertEqual( self.dtree.findDirs( [ '/vo/user', '/vo/data' ] )['Value'], { '/vo/user' : 3, '/vo/data' : 4 } )
+    self.assertEqual( self.db._query.call_count, 2 )
+    # The least recently used directory goes away
+    self.dtree.findDir( '/vo/data/run1' )
+    self.assertEqual( self.dtree.getDirCacheCounters()['Value']['Directory cache size'], 3 )
+    self.dtree.findDir( '/vo' )
+    self.assertEqual( self.db._query.call_count, 4 )
+
+  def test_invalidation( self ):
+    self.dtree.findDirs( [ '/vo/data', '/vo/data/run1', '/vo/user' ] )
+    self.dtree._uncacheDir( '/vo/data' )
+    self.assertEqual( self.dtree.getDirCacheCounters()['Value']['Directory cache size'], 1 )
+    self.assertEqual( self.dtree.findDir( '/vo/user' )['Value'], 3 )
+    self.dtree._clearDirCache()
+    self.assertEqual( self.dtree.getDirCacheCounters()['Value']['Directory cache size'], 0 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryCacheTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryCache ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
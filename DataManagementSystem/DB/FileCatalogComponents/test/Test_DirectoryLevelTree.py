@@ -0,0 +1,101 @@
+""" Test for the bulk creation of directories of the DirectoryLevelTree
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+
+class FakeLevelTreeDB( object ):
+  """ Just enough of the FC_DirectoryLevelTree table to create directories
+  """
+  def __init__( self ):
+    self.umask = 0775
+    self.directoryCacheSize = 0
+    self.ugManager = MagicMock()
+    self.ugManager.getUserAndGroupID.return_value = S_OK( ( 2, 3 ) )
+    # DirName -> [ DirID, Level, Parent, LPATH1... ]
+    self.dirs = { '/' : [ 1, 0, 0 ], '/vo' : [ 2, 1, 1, 1 ] }
+    self.dirInfo = {}
+    self.queries = []
+
+  def _getConnection( self ):
+    return S_OK( 'connection' )
+
+  def _escapeValues( self, values ):
+    return S_OK( [ "'%s'" % value for value in values ] )
+
+  def _query( self, req, connection = False ):
+    self.queries.append( req )
+    if req.startswith( "SELECT DirName,DirID" ):
+      names = re.findall( "'([^']*)'", req )
+      return S_OK( tuple( [ ( name, self.dirs[name][0] ) for name in names if name in self.dirs ] ) )
+    if req.startswith( "SELECT DirID,Level,LPATH" ):
+      dirIDs = [ int( dirID ) for dirID in req.split( 'IN (' )[1].rstrip( ')' ).split( ',' ) ]
+      return S_OK( tuple( [ tuple( row[:2] + row[3:] ) for row in self.dirs.values() if row[0] in dirIDs ] ) )
+    if req.startswith( "SELECT Parent,MAX" ):
+      level = int( re.search( 'MAX\(LPATH(\d+)\)', req ).group( 1 ) )
+      maxDict = {}
+      for row in self.dirs.values():
+        if row[1] == level:
+          maxDict[row[2]] = max( maxDict.get( row[2], 0 ), row[2 + level] )
+      return S_OK( tuple( maxDict.items() ) )
+    return S_OK( () )
+
+  def _update( self, req, connection = False ):
+    self.queries.append( req )
+    if req.startswith( "INSERT INTO FC_DirectoryLevelTree" ):
+      for row in eval( "[%s]" % req.split( 'VALUES ' )[1] ):
+        self.dirs[row[0]] = [ len( self.dirs ) + 1 ] + [ int( value ) for value in row[1:] ]
+    elif req.startswith( "INSERT INTO FC_DirectoryInfo" ):
+      for row in re.findall( '\((\d+),(\d+),(\d+),', req ):
+        self.dirInfo[int( row[0] )] = ( int( row[1] ), int( row[2] ) )
+    return S_OK()
+
+class DirectoryLevelTreeTestCase( unittest.TestCase ):
+  """ Base class for the DirectoryLevelTree test cases
+  """
+  def setUp( self ):
+    self.db = FakeLevelTreeDB()
+    self.dtree = DirectoryLevelTree( self.db )
+
+class MakeDirectories( DirectoryLevelTreeTestCase ):
+
+  def test_bulk( self ):
+    paths = [ '/vo/data/run1', '/vo/data/run2', '/vo/user/a/', '/vo', 'relative' ]
+    result = self.dtree.makeDirectories( paths, {} )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Failed'].keys(), [ 'relative' ] )
+    successful = result['Value']['Successful']
+    self.assertEqual( successful['/vo'], 2 )
+    self.assertEqual( sorted( successful ), sorted( paths[:-1] ) )
+    # One lookup of all the paths, then one insert per level
+    inserts = [ req for req in self.db.queries if req.startswith( "INSERT INTO FC_DirectoryLevelTree" ) ]
+    self.assertEqual( len( inserts ), 2 )
+    self.assertEqual( len( [ req for req in self.db.queries if req.startswith( "SELECT DirName" ) ] ), 3 )
+    # The enumerated paths are the ones the directories would get one by one
+    self.assertEqual( self.db.dirs['/vo/data'][1:], [ 2, 2, 1, 1 ] )
+    self.assertEqual( self.db.dirs['/vo/user'][1:], [ 2, 2, 1, 2 ] )
+    self.assertEqual( self.db.dirs['/vo/data/run2'][1:], [ 3, self.db.dirs['/vo/data'][0], 1, 1, 2 ] )
+    self.assertEqual( self.db.dirInfo[successful['/vo/user/a/']], ( 2, 3 ) )
+    self.assertEqual( len( self.db.dirInfo ), 5 )
+
+  def test_existing( self ):
+    self.dtree.makeDirectories( [ '/vo/data' ], {} )
+    numQueries = len( self.db.queries )
+    result = self.dtree.makeDirectories( [ '/vo/data', '/vo' ], {} )
+    self.assertEqual( result['Value']['Successful'], { '/vo/data' : 3, '/vo' : 2 } )
+    self.assertEqual( len( self.db.queries ), numQueries + 1 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryLevelTreeTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( MakeDirectories ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,80 @@
+""" Test for the planning of the directory metadata queries
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryMetadata import DirectoryMetadata
+
+class DirectoryMetadataTestCase( unittest.TestCase ):
+  """ Base class for the DirectoryMetadata test cases
+  """
+  def setUp( self ):
+    # meta -> { DirID : Value }
+    self.metaTables = { 'Year' : dict( [ ( dirID, 2010 + dirID % 5 ) for dirID in range( 10, 60 ) ] ),
+                        'Run' : dict( [ ( dirID, dirID ) for dirID in range( 10, 60 ) ] ),
+                        'Type' : { 10 : 'RAW', 11 : 'DST' } }
+    self.db = MagicMock()
+    self.db._query.side_effect = self.__query
+    self.db.dtree.getAllSubdirectoriesByID.return_value = S_OK( [] )
+    self.db.dtree.getPathIDsByID.side_effect = lambda dirID: S_OK( [ 1, dirID ] )
+    self.dmeta = DirectoryMetadata( self.db )
+    self.queries = []
+
+  def __query( self, req ):
+    self.queries.append( req )
+    if req.startswith( "SELECT MetaName,MetaType" ):
+      return S_OK( ( ( 'Year', 'INT' ), ( 'Run', 'INT' ), ( 'Type', 'VARCHAR(128)' ) ) )
+    meta = re.search( 'FC_Meta_(\w+)', req ).group( 1 )
+    table = self.metaTables[meta]
+    if req.startswith( "SELECT COUNT(*)" ):
+      return S_OK( ( ( len( table ), len( set( table.values() ) ) ), ) )
+    if req.startswith( "SELECT DISTINCT" ):
+      return S_OK( tuple( [ ( value, ) for value in set( table.values() ) ] ) )
+    if "M.DirID IN (" in req:
+      # Check of the parent directories of the path
+      return S_OK( () )
+    match = re.search( "Value='?(\w+)'?", req )
+    value = match.group( 1 ) if match else None
+    return S_OK( tuple( [ ( dirID, ) for dirID, dirValue in table.items()
+                          if value is None or str( dirValue ) == value ] ) )
+
+class QueryPlanning( DirectoryMetadataTestCase ):
+
+  def test_order( self ):
+    result = self.dmeta.findDirIDsByMetadata( { 'Year' : 2011, 'Run' : 11, 'Type' : 'DST' }, '/', {} )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], [ 11 ] )
+    selections = [ re.search( 'FC_Meta_(\w+)', req ).group( 1 ) for req in self.queries
+                   if req.startswith( " SELECT M.DirID" ) ]
+    self.assertEqual( selections, [ 'Run', 'Type', 'Year' ] )
+
+  def test_emptySelection( self ):
+    result = self.dmeta.findDirIDsByMetadata( { 'Year' : 2011, 'Run' : 12, 'Type' : 'DST' }, '/', {} )
+    self.assertEqual( ( result['Value'], result['Selection'] ), ( [], 'None' ) )
+    # The least selective meta datum is not even looked at
+    selections = [ req for req in self.queries if req.startswith( " SELECT M.DirID" ) ]
+    self.assertEqual( len( selections ), 2 )
+    # The statistics are kept
+    numQueries = len( self.queries )
+    self.dmeta.findDirIDsByMetadata( { 'Run' : 12 }, '/', {} )
+    self.assertEqual( len( self.queries ), numQueries + 3 )
+
+  def test_compatibleMetadata( self ):
+    result = self.dmeta.getCompatibleMetadata( { 'Type' : 'RAW' }, '/', {} )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( sorted( result['Value'] ), [ 'Run', 'Type', 'Year' ] )
+    self.assertEqual( self.db.dtree.getPathIDsByID.call_count, 1 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryMetadataTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( QueryPlanning ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
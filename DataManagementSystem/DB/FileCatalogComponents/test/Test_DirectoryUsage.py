@@ -0,0 +1,195 @@
+""" Test for the incremental maintenance and the verification of the directory storage usage
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+
+class DirectoryUsageTestCase( unittest.TestCase ):
+  """ Base class for the directory usage test cases
+  """
+  def setUp( self ):
+    # DirID -> enumerated path
+    self.dirs = { 1 : [], 2 : [1], 3 : [1, 1], 4 : [1, 2], 5 : [1, 1, 1] }
+    # FileID -> ( DirID, Size, SEIDs of the replicas )
+    self.files = { 1 : ( 5, 10, [7] ), 2 : ( 5, 20, [7, 8] ), 3 : ( 4, 5, [8] ), 4 : ( 2, 1, [] ) }
+    # ( DirID, SEID ) -> [ SESize, SEFiles ]
+    self.usage = {}
+    self.queries = []
+    self.failUsageUpdate = False
+    self.db = MagicMock()
+    self.db.seManager.findSE.side_effect = lambda seName: S_OK( int( seName[2:] ) )
+    self.db.directoryCacheSize = 0
+    self.db._query.side_effect = self.__query
+    self.db._update.side_effect = self.__update
+    self.db.dtree = DirectoryLevelTree( self.db )
+    self.db.fileManager = FileManager( self.db )
+
+  def __query( self, req, connection = False ):
+    self.queries.append( req )
+    if req.startswith( "SELECT DirID,Level,LPATH" ) and "DirID IN" in req:
+      dirIDs = [ int( x ) for x in re.search( 'IN \(([\d,]+)\)', req ).group( 1 ).split( ',' ) ]
+      return S_OK( tuple( [ ( dirID, len( self.dirs[dirID] ) ) + tuple( self.dirs[dirID] + [0] * ( 15 - len( self.dirs[dirID] ) ) )
+                            for dirID in dirIDs ] ) )
+    if req.startswith( "SELECT DirID,Level,LPATH" ):
+      rows = []
+      for selection in re.findall( '\(([^()]+)\)', req.split( 'WHERE' )[1] ):
+        level = int( re.search( 'Level=(\d+)', selection ).group( 1 ) )
+        lpaths = [ int( x ) for x in re.findall( 'LPATH\d+=(\d+)', selection ) ]
+        for dirID, epath in self.dirs.items():
+          if len( epath ) == level and epath[:len( lpaths )] == lpaths:
+            rows.append( ( dirID, level ) + tuple( epath + [0] * ( 15 - level ) ) )
+      return S_OK( tuple( rows ) )
+    if req.startswith( "SELECT GET_LOCK" ):
+      return S_OK( ( ( 1, ), ) )
+    if req.startswith( "SELECT DirID FROM FC_DirectoryLevelTree WHERE DirID>" ):
+      lastDirID, limit = [ int( x ) for x in re.search( 'DirID>(\d+) .* LIMIT (\d+)', req ).groups() ]
+      return S_OK( tuple( [ ( dirID, ) for dirID in sorted( self.dirs ) if dirID > lastDirID ][:limit] ) )
+    if req.startswith( "SELECT DirID FROM FC_DirectoryLevelTree WHERE Parent=" ):
+      epath = self.dirs[int( req.split( '=' )[1] )]
+      return S_OK( tuple( [ ( dirID, ) for dirID, childPath in self.dirs.items()
+                            if len( childPath ) == len( epath ) + 1 and childPath[:len( epath )] == epath ] ) )
+    if req.startswith( "SELECT RepID,FileID,SEID FROM FC_Replicas" ):
+      rows = []
+      for fileID, seID in re.findall( '\((\d+),(\d+)\)', req ):
+        if int( seID ) in self.files[int( fileID )][2]:
+          rows.append( ( 10 * int( fileID ) + int( seID ), int( fileID ), int( seID ) ) )
+      return S_OK( tuple( rows ) )
+    if req.startswith( "SELECT DirID,Size FROM FC_Files WHERE FileID=" ):
+      return S_OK( ( self.files[int( req.split( '=' )[1] )][:2], ) )
+    match = re.search( 'IN \(([\d,]+)\)', req )
+    dirIDs = [ int( x ) for x in match.group( 1 ).split( ',' ) ] if match else []
+    if req.startswith( "SELECT DirID,SUM(Size),COUNT(*) FROM FC_Files" ):
+      usage = self.__getOwnUsage( dirIDs )
+      return S_OK( tuple( [ ( dirID, size, files ) for ( dirID, seID ), ( size, files ) in usage.items() if seID == 0 ] ) )
+    if req.startswith( "SELECT F.DirID,R.SEID" ):
+      usage = self.__getOwnUsage( dirIDs )
+      return S_OK( tuple( [ ( dirID, seID, size, files ) for ( dirID, seID ), ( size, files ) in usage.items() if seID ] ) )
+    if req.startswith( "SELECT DirID,SEID,SESize,SEFiles FROM FC_DirectoryUsage" ):
+      return S_OK( tuple( [ key + tuple( value ) for key, value in self.usage.items() if key[0] in dirIDs ] ) )
+    return S_OK( () )
+
+  def __update( self, req, connection = False ):
+    self.queries.append( req )
+    if req.startswith( "UPDATE FC_Replicas SET SEID=" ):
+      newSEID, repID = [ int( x ) for x in re.findall( '=\s*(\d+)', req ) ]
+      self.files[repID / 10][2].remove( repID % 10 )
+      self.files[repID / 10][2].append( newSEID )
+    if req.startswith( "INSERT INTO FC_DirectoryUsage" ) and self.failUsageUpdate:
+      return S_ERROR( "Lock wait timeout exceeded" )
+    if req.startswith( "INSERT INTO FC_DirectoryUsage" ):
+      for dirID, seID, size, files in re.findall( '\((\d+),(\d+),(-?\d+),(-?\d+),UTC_TIMESTAMP\(\)\)', req ):
+        usage = self.usage.setdefault( ( int( dirID ), int( seID ) ), [0, 0] )
+        usage[0] += int( size )
+        usage[1] += int( files )
+    return S_OK()
+
+  def __getOwnUsage( self, dirIDs ):
+    usage = {}
+    for dirID, size, seIDs in self.files.values():
+      if dirID in dirIDs:
+        for seID in [0] + seIDs:
+          seUsage = usage.setdefault( ( dirID, seID ), [0, 0] )
+          seUsage[0] += size
+          seUsage[1] += 1
+    return usage
+
+  def getExpectedUsage( self ):
+    """ Usage of the directories after all the files of their subtrees
+    """
+    usage = {}
+    for dirID, size, seIDs in self.files.values():
+      epath = self.dirs[dirID]
+      for parentID, parentPath in self.dirs.items():
+        if epath[:len( parentPath )] == parentPath:
+          for seID in [0] + seIDs:
+            seUsage = usage.setdefault( ( parentID, seID ), [0, 0] )
+            seUsage[0] += size
+            seUsage[1] += 1
+    return usage
+
+class DirectoryUsage( DirectoryUsageTestCase ):
+
+  def test_pathIDs( self ):
+    result = self.db.dtree.getPathIDsByIDs( [ 5, 4, 1 ] )
+    self.assertEqual( result['Value'], { 5 : [ 1, 2, 3, 5 ], 4 : [ 1, 2, 4 ], 1 : [ 1 ] } )
+    self.assertEqual( len( self.queries ), 2 )
+
+  def test_update( self ):
+    directorySEDict = {}
+    for dirID, size, seIDs in self.files.values():
+      for seID in [0] + seIDs:
+        seUsage = directorySEDict.setdefault( dirID, {} ).setdefault( seID, { 'Size' : 0, 'Files' : 0 } )
+        seUsage['Size'] += size
+        seUsage['Files'] += 1
+    result = self.db.fileManager._updateDirectoryUsage( directorySEDict, '+' )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.usage, self.getExpectedUsage() )
+    # All the parents are updated at once
+    self.assertEqual( len( [ req for req in self.queries if req.startswith( "INSERT" ) ] ), 1 )
+    self.db.fileManager._updateDirectoryUsage( { 5 : { 8 : { 'Size' : 20, 'Files' : 1 } } }, '-' )
+    self.assertEqual( self.usage[( 1, 8 )], [ 5, 1 ] )
+    self.assertEqual( self.usage[( 3, 8 )], [ 0, 0 ] )
+
+  def test_verify( self ):
+    self.usage = self.getExpectedUsage()
+    # A change missed by /vo/a/x and its parents, one by /vo only and one at an SE that is gone
+    for dirID in [ 1, 2, 3, 5 ]:
+      self.usage[( dirID, 7 )][0] -= 10
+    self.usage[( 2, 0 )][1] += 3
+    self.usage[( 4, 9 )] = [ 100, 1 ]
+    self.usage[( 1, 9 )] = [ 100, 1 ]
+    self.usage[( 2, 9 )] = [ 100, 1 ]
+    wrongUsage = dict( [ ( key, list( value ) ) for key, value in self.usage.items() ] )
+
+    # By default the differences are only reported
+    result = self.db.dtree.verifyDirectoryUsage( 0, 5 )
+    self.assertTrue( result['OK'] )
+    self.assertFalse( result['Value']['Fixed'] )
+    self.assertEqual( result['Value']['Differences'][5], { 7 : { 'Size' : 10, 'Files' : 0 } } )
+    self.assertEqual( self.usage, wrongUsage )
+
+    lastDirID = 0
+    checked = 0
+    while True:
+      result = self.db.dtree.verifyDirectoryUsage( lastDirID, 2, fix = True )
+      self.assertTrue( result['OK'] )
+      checked += result['Value']['Checked']
+      lastDirID = result['Value']['LastDirID']
+      if not lastDirID:
+        break
+    self.assertEqual( checked, 5 )
+    self.assertEqual( dict( [ ( key, value ) for key, value in self.usage.items() if value != [0, 0] ] ),
+                      self.getExpectedUsage() )
+
+  def test_setReplicaHost( self ):
+    self.usage = self.getExpectedUsage()
+    result = self.db.fileManager._setReplicaHost( 2, 'SE7', 'SE9' )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( dict( [ ( key, value ) for key, value in self.usage.items() if value != [0, 0] ] ),
+                      self.getExpectedUsage() )
+    # The replica and its usage move in the same transaction
+    writes = [ req.split()[0] for req in self.queries if not req.startswith( 'SELECT' ) ]
+    self.assertEqual( writes, [ 'START', 'UPDATE', 'INSERT', 'COMMIT;' ] )
+
+  def test_setReplicaHostFailure( self ):
+    self.failUsageUpdate = True
+    result = self.db.fileManager._setReplicaHost( 2, 'SE7', 'SE9' )
+    self.assertFalse( result['OK'] )
+    writes = [ req.split()[0] for req in self.queries if not req.startswith( 'SELECT' ) ]
+    self.assertEqual( writes, [ 'START', 'UPDATE', 'INSERT', 'ROLLBACK;' ] )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryUsageTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( DirectoryUsage ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,105 @@
+""" Test for the bulk registration and lookup of the file ancestry
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+
+class FileAncestorsTestCase( unittest.TestCase ):
+  """ Base class for the file ancestry test cases
+  """
+  def setUp( self ):
+    # Processing chain RAW -> RECO -> DST, FileID = 10 * level + index
+    self.files = { '/vo/raw/1' : 11, '/vo/raw/2' : 12, '/vo/reco/1' : 21, '/vo/reco/2' : 22,
+                   '/vo/dst/1' : 31, '/vo/user/1' : 41 }
+    # ( FileID, AncestorID ) -> AncestorDepth
+    self.ancestry = { ( 21, 11 ) : 1, ( 22, 12 ) : 1, ( 31, 21 ) : 1, ( 31, 22 ) : 1,
+                      ( 31, 11 ) : 2, ( 31, 12 ) : 2 }
+    self.db = MagicMock()
+    self.db._query.side_effect = self.__query
+    self.db._update.side_effect = self.__update
+    self.fileManager = FileManager( self.db )
+    self.fileManager._findFiles = MagicMock( side_effect = self.__findFiles )
+    self.queries = []
+
+  def __findFiles( self, lfns, metadata = [], connection = False ):
+    self.queries.append( 'findFiles' )
+    successful = dict( [ ( lfn, { 'FileID' : self.files[lfn] } ) for lfn in lfns if lfn in self.files ] )
+    failed = dict( [ ( lfn, 'No such file or directory' ) for lfn in lfns if lfn not in self.files ] )
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  def __query( self, req, connection = False ):
+    self.queries.append( req )
+    fileIDs = [ int( fileID ) for fileID in re.search( 'IN \(([^)]*)\)', req ).group( 1 ).split( ',' ) ]
+    match = re.search( 'AncestorDepth IN \(([^)]*)\)', req )
+    depths = [ int( depth ) for depth in match.group( 1 ).split( ',' ) ] if match else []
+    ancestry = [ ( fileID, ancestorID, depth ) for ( fileID, ancestorID ), depth in self.ancestry.items()
+                 if not depths or depth in depths ]
+    if req.startswith( "SELECT FileID, AncestorID" ):
+      return S_OK( tuple( [ row for row in ancestry if row[0] in fileIDs ] ) )
+    if req.startswith( "SELECT AncestorID, FileID" ):
+      return S_OK( tuple( [ ( row[1], row[0], row[2] ) for row in ancestry if row[1] in fileIDs ] ) )
+    lfns = dict( [ ( fileID, lfn ) for lfn, fileID in self.files.items() ] )
+    return S_OK( tuple( [ ( fileID, lfns[fileID] ) for fileID in fileIDs if fileID in lfns ] ) )
+
+  def __update( self, req, connection = False ):
+    self.queries.append( req )
+    for fileID, ancestorID, depth in re.findall( '\((\d+),(\d+),(\d+)\)', req ):
+      self.ancestry.setdefault( ( int( fileID ), int( ancestorID ) ), int( depth ) )
+    return S_OK()
+
+class FileAncestors( FileAncestorsTestCase ):
+
+  def test_getAncestors( self ):
+    result = self.fileManager.getFileAncestors( { '/vo/dst/1' : True, '/vo/reco/1' : True, '/vo/raw/1' : True }, [] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'],
+                      { '/vo/dst/1' : { '/vo/reco/1' : 1, '/vo/reco/2' : 1, '/vo/raw/1' : 2, '/vo/raw/2' : 2 },
+                        '/vo/reco/1' : { '/vo/raw/1' : 1 },
+                        '/vo/raw/1' : {} } )
+    # Whatever the number of files and the depth of the chain
+    self.assertEqual( len( self.queries ), 3 )
+
+  def test_bulk( self ):
+    self.files['/vo/dst/2'] = 32
+    self.ancestry.update( { ( 32, 21 ) : 1, ( 32, 22 ) : 1 } )
+    result = self.fileManager.getFileAncestorsBulk( { '/vo/dst/1' : True, '/vo/dst/2' : True,
+                                                      '/vo/dst/3' : True }, [ 1 ], chunkSize = 1 )
+    self.assertEqual( result['Value']['Successful'],
+                      { '/vo/dst/1' : { '/vo/reco/1' : 1, '/vo/reco/2' : 1 },
+                        '/vo/dst/2' : { '/vo/reco/1' : 1, '/vo/reco/2' : 1 } } )
+    self.assertEqual( result['Value']['Failed'].keys(), [ '/vo/dst/3' ] )
+    # The LFNs of the ancestors shared by the files are looked up only once
+    lfnQueries = [ req for req in self.queries if req.startswith( "SELECT F.FileID" ) ]
+    self.assertEqual( len( lfnQueries ), 1 )
+
+  def test_addAncestors( self ):
+    # The user file gets the whole chain, and the ancestors of the RECO files go down to the DST
+    self.files['/vo/raw/0'] = 10
+    result = self.fileManager.addFileAncestors( { '/vo/user/1' : { 'Ancestors' : [ '/vo/dst/1' ] },
+                                                  '/vo/reco/1' : { 'Ancestors' : '/vo/raw/0' } } )
+    self.assertEqual( result['Value']['Successful'], { '/vo/user/1' : True, '/vo/reco/1' : True } )
+    self.assertEqual( self.db._update.call_count, 2 )
+    result = self.fileManager.getFileAncestors( { '/vo/user/1' : True }, [] )
+    self.assertEqual( result['Value']['Successful']['/vo/user/1'],
+                      { '/vo/dst/1' : 1, '/vo/reco/1' : 2, '/vo/reco/2' : 2, '/vo/raw/1' : 3, '/vo/raw/2' : 3 } )
+    self.assertEqual( self.ancestry[( 31, 10 )], 2 )
+
+  def test_missingAncestor( self ):
+    result = self.fileManager.addFileAncestors( { '/vo/user/1' : { 'Ancestors' : [ '/vo/dst/2' ] } } )
+    self.assertEqual( result['Value']['Failed'], { '/vo/user/1' : "Failed to resolve ancestor files" } )
+    self.assertFalse( self.db._update.called )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileAncestorsTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( FileAncestors ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,64 @@
+""" Test for the paged listing of the files of a directory
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileManager import FileManager
+
+class FileManagerTestCase( unittest.TestCase ):
+  """ Base class for the FileManager test cases
+  """
+  def setUp( self ):
+    # FileID -> FileName of the files in the directory
+    self.files = dict( [ ( fileID, 'file_%03d' % fileID ) for fileID in range( 10, 35 ) ] )
+    self.db = MagicMock()
+    self.db._query.side_effect = self.__query
+    self.fileManager = FileManager( self.db )
+    self.fileManager._getDirectoryFiles = MagicMock( side_effect = self.__getDirectoryFiles )
+    self.fileManager._getFileReplicas = MagicMock( return_value = S_OK( {} ) )
+
+  def __query( self, req, connection = False ):
+    lastFileID, maxFiles = [ int( x ) for x in re.search( 'FileID>(\d+) .* LIMIT (\d+)', req ).groups() ]
+    fileIDs = sorted( [ fileID for fileID in self.files if fileID > lastFileID ] )[:maxFiles]
+    return S_OK( tuple( [ ( fileID, self.files[fileID] ) for fileID in fileIDs ] ) )
+
+  def __getDirectoryFiles( self, dirID, fileNames, metadata, connection = False ):
+    return S_OK( dict( [ ( fileName, { 'FileID' : int( fileName[5:] ) } ) for fileName in fileNames ] ) )
+
+class FilesInDirectoryPage( FileManagerTestCase ):
+
+  def test_pages( self ):
+    fileNames = []
+    lastFileID = 0
+    numPages = 0
+    while True:
+      result = self.fileManager.getFilesInDirectoryPage( 1, lastFileID, 10, verbose = True )
+      self.assertTrue( result['OK'] )
+      self.assertTrue( len( result['Value'] ) <= 10 )
+      fileNames += result['Value'].keys()
+      numPages += 1
+      lastFileID = result['LastFileID']
+      if not lastFileID:
+        break
+    self.assertEqual( numPages, 3 )
+    self.assertEqual( sorted( fileNames ), sorted( self.files.values() ) )
+
+  def test_emptyLastPage( self ):
+    result = self.fileManager.getFilesInDirectoryPage( 1, 24, 10 )
+    self.assertEqual( ( len( result['Value'] ), result['LastFileID'] ), ( 10, 34 ) )
+    result = self.fileManager.getFilesInDirectoryPage( 1, 34, 10 )
+    self.assertEqual( ( result['Value'], result['LastFileID'] ), ( {}, 0 ) )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileManagerTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( FilesInDirectoryPage ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
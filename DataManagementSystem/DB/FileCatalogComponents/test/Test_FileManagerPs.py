@@ -0,0 +1,92 @@
+""" Test for the bulk replica operations of FileManagerPs
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.WithFkAndPs.FileManagerPs import FileManagerPs
+
+class FileManagerPsTestCase( unittest.TestCase ):
+  """ Base class for the FileManagerPs test cases
+  """
+  def setUp( self ):
+    self.seIDs = { 'SE-A' : 1, 'SE-B' : 2 }
+    self.statusIDs = { 'AprioriGood' : 1, 'Trash' : 2 }
+    # ( FileID, SEID ) -> StatusID
+    self.replicas = dict( [ ( ( fileID, 1 ), 1 ) for fileID in range( 1, 11 ) ] )
+    self.files = dict( [ ( '/vo/f%d' % fileID, fileID ) for fileID in range( 1, 11 ) ] )
+    self.calls = []
+    self.db = MagicMock()
+    self.db.validReplicaStatus = self.statusIDs.keys()
+    self.db.executeStoredProcedureWithCursor.side_effect = self.__executeStoredProcedure
+    self.db.seManager.findSE.side_effect = lambda se: S_OK( self.seIDs[se] ) if se in self.seIDs \
+                                                      else S_ERROR( 'Unknown SE %s' % se )
+    self.fileManager = FileManagerPs( self.db )
+    self.fileManager.replicaChunkSize = 4
+    self.fileManager._findFiles = MagicMock( side_effect = self.__findFiles )
+    self.fileManager._getStatusInt = MagicMock( side_effect = lambda status, connection = False:
+                                                S_OK( self.statusIDs[status] ) )
+
+  def __findFiles( self, lfns, metadata = ['FileID'], allStatus = False, connection = False ):
+    successful = dict( [ ( lfn, { 'FileID' : self.files[lfn] } ) for lfn in lfns if lfn in self.files ] )
+    failed = dict( [ ( lfn, 'No such file or directory' ) for lfn in lfns if lfn not in self.files ] )
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  def __executeStoredProcedure( self, procedure, args ):
+    self.calls.append( procedure )
+    replicas = [ ( int( fileID ), int( seID ) ) for fileID, seID in
+                 re.findall( 'r.FileID = (\d+) AND r.SEID = (\d+)', args[0] ) ]
+    existing = [ replica for replica in replicas if replica in self.replicas ]
+    if procedure == 'ps_get_multiple_replica_id':
+      return S_OK( tuple( [ replica + ( 100 + replica[0], ) for replica in existing ] ) )
+    if procedure == 'ps_delete_multiple_replica':
+      for replica in existing:
+        self.replicas.pop( replica )
+      return S_OK( ( ( 0, 'OK' ), ) )
+    if procedure == 'ps_set_multiple_replica_status':
+      for replica in existing:
+        self.replicas[replica] = args[1]
+      return S_OK( tuple( existing ) )
+    return S_ERROR( 'Unexpected procedure %s' % procedure )
+
+class BulkReplicas( FileManagerPsTestCase ):
+
+  def test_replicaIDs( self ):
+    result = self.fileManager._getRepIDsForReplica( [ ( fileID, 1 ) for fileID in range( 1, 11 ) ] + [ ( 1, 2 ) ] )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value'], dict( [ ( fileID, { 1 : 100 + fileID } ) for fileID in range( 1, 11 ) ] ) )
+    self.assertEqual( len( self.calls ), 3 )
+
+  def test_setReplicaStatus( self ):
+    lfns = dict( [ ( lfn, { 'SE' : 'SE-A', 'Status' : 'Trash' } ) for lfn in self.files ] )
+    lfns['/vo/f1']['Status'] = 'AprioriGood'
+    lfns['/vo/f2']['SE'] = 'SE-B'
+    lfns['/vo/f3']['Status'] = 'Unknown'
+    result = self.fileManager.setReplicaStatus( lfns )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( sorted( result['Value']['Failed'] ), [ '/vo/f2', '/vo/f3' ] )
+    self.assertEqual( result['Value']['Failed']['/vo/f2'], "Replica does not exist" )
+    self.assertEqual( len( result['Value']['Successful'] ), 8 )
+    # One call for the replica going back to AprioriGood, two chunks for the 7 others
+    self.assertEqual( len( self.calls ), 3 )
+    self.assertEqual( [ self.replicas[( fileID, 1 )] for fileID in range( 1, 5 ) ], [ 1, 1, 1, 2 ] )
+
+  def test_removeReplica( self ):
+    lfns = dict( [ ( lfn, { 'SE' : 'SE-A' } ) for lfn in self.files ] )
+    lfns['/vo/missing'] = { 'SE' : 'SE-A' }
+    result = self.fileManager.removeReplica( lfns )
+    self.assertEqual( len( result['Value']['Successful'] ), 11 )
+    self.assertEqual( ( self.replicas, len( self.calls ) ), ( {}, 3 ) )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileManagerPsTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( BulkReplicas ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
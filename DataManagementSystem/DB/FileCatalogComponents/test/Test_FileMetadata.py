@@ -0,0 +1,73 @@
+""" Test for the paged metadata searches of the files
+"""
+
+import re
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.FileMetadata import FileMetadata
+
+class FileMetadataTestCase( unittest.TestCase ):
+  """ Base class for the FileMetadata test cases
+  """
+  def setUp( self ):
+    # FileID -> DirID
+    self.files = dict( [ ( fileID, 10 + fileID % 3 ) for fileID in range( 1, 26 ) ] )
+    self.db = MagicMock()
+    self.db._query.side_effect = self.__query
+    self.db.dmeta.findDirIDsByMetadata.return_value = S_OK( [ 10, 11 ] )
+    self.db.dmeta.findDirIDsByMetadata.return_value[ 'Selection' ] = 'Some'
+    self.db.fileManager._getFileLFNs.side_effect = lambda fileIDs: S_OK( { 'Successful' : dict( [ ( fileID, "/lfn/%s" % fileID )
+                                                                                                   for fileID in fileIDs ] ),
+                                                                            'Failed' : {} } )
+    self.fmeta = FileMetadata( self.db )
+    self.credDict = { 'DN' : '/DN/user', 'group' : 'user' }
+
+  def __query( self, req ):
+    if req.startswith( "SELECT MetaName,MetaType" ):
+      return S_OK( () )
+    dirIDs = [ int( x ) for x in re.search( 'DirID in \(([\d,]+)\)', req ).group( 1 ).split( ',' ) ]
+    lastFileID, limit = [ int( x ) for x in re.search( 'FileID > (\d+) ORDER BY F.FileID LIMIT (\d+)', req ).groups() ]
+    return S_OK( tuple( [ ( fileID, ) for fileID in sorted( self.files )
+                          if self.files[fileID] in dirIDs and fileID > lastFileID ][:limit] ) )
+
+class FindFilesByMetadataPage( FileMetadataTestCase ):
+
+  def _getAllPages( self, metaDict ):
+    lfns = []
+    lastFileID = 0
+    selectionID = ''
+    while True:
+      result = self.fmeta.findFilesByMetadataPage( metaDict, '/', self.credDict, lastFileID = lastFileID,
+                                                   maxFiles = 5, selectionID = selectionID )
+      self.assertTrue( result['OK'] )
+      lfns.extend( result['Value']['LFNs'] )
+      lastFileID = result['Value']['LastFileID']
+      selectionID = result['Value']['SelectionID']
+      if not lastFileID:
+        return lfns
+
+  def test_pages( self ):
+    lfns = self._getAllPages( { 'Year' : 2015 } )
+    self.assertEqual( lfns, [ "/lfn/%s" % fileID for fileID in sorted( self.files ) if self.files[fileID] != 12 ] )
+    # The directory selection is only computed for the first page
+    self.assertEqual( self.db.dmeta.findDirIDsByMetadata.call_count, 1 )
+
+  def test_otherSearch( self ):
+    result = self.fmeta.findFilesByMetadataPage( { 'Year' : 2015 }, '/', self.credDict, maxFiles = 5 )
+    self.assertTrue( result['OK'] )
+    selectionID = result['Value']['SelectionID']
+    # A selection is only reused for the same search
+    result = self.fmeta.findFilesByMetadataPage( { 'Year' : 2016 }, '/', self.credDict, lastFileID = 5,
+                                                 maxFiles = 5, selectionID = selectionID )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( self.db.dmeta.findDirIDsByMetadata.call_count, 2 )
+    self.assertNotEqual( result['Value']['SelectionID'], selectionID )
+
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileMetadataTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( FindFilesByMetadataPage ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,86 @@
+""" Test for the resolution of the path permissions of the DirectorySecurityManager
+"""
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.DirectoryLevelTree import DirectoryLevelTree
+from DIRAC.DataManagementSystem.DB.FileCatalogComponents.SecurityManager import DirectorySecurityManager
+
+class SecurityManagerTestCase( unittest.TestCase ):
+  """ Base class for the SecurityManager test cases
+  """
+  def setUp( self ):
+    self.db = MagicMock()
+    self.db.directoryCacheSize = 100
+    self.db.directoryCacheLifeTime = 60
+    self.db.permissionCacheLifeTime = 10
+    self.db.globalReadAccess = False
+    self.db._query.side_effect = self.__query
+    # Users 2 and 3 of group 5
+    self.db.ugManager.getUserAndGroupID.side_effect = lambda credDict: S_OK( ( credDict['uid'], 5 ) )
+    # DirName -> DirID
+    self.dirIDs = { '/' : 1, '/vo' : 2, '/vo/user' : 3, '/vo/user/a' : 4 }
+    # DirID -> ( UID, GID, Mode )
+    self.modes = { 1 : ( 1, 1, 0755 ), 2 : ( 1, 5, 0775 ), 3 : ( 1, 1, 0755 ), 4 : ( 2, 5, 0755 ) }
+    self.db.dtree = DirectoryLevelTree( self.db )
+    self.securityManager = DirectorySecurityManager( self.db )
+
+  def __query( self, req, connection = False ):
+    if req.startswith( "SELECT DirName,DirID" ):
+      paths = [ path for path in req.split( "'" )[1::2] if path in self.dirIDs ]
+      return S_OK( tuple( [ ( path, self.dirIDs[path] ) for path in paths ] ) )
+    if req.startswith( "SELECT DirID,UID,GID,Mode" ):
+      dirIDs = [ int( dirID ) for dirID in req.split( '(' )[1].rstrip( ' )' ).split( ',' ) ]
+      return S_OK( tuple( [ ( dirID, ) + self.modes[dirID] for dirID in dirIDs if dirID in self.modes ] ) )
+    return S_OK( () )
+
+class PathPermissions( SecurityManagerTestCase ):
+
+  def test_nearestDirectory( self ):
+    paths = [ '/vo/user/a/new/deep/file', '/vo/user/b', '/vo/new', '/vo/user/a' ]
+    result = self.securityManager.getPathPermissions( paths, { 'uid' : 2 } )
+    self.assertTrue( result['OK'] )
+    writable = dict( [ ( path, permissions['Write'] ) for path, permissions in result['Value']['Successful'].items() ] )
+    self.assertEqual( writable, { '/vo/user/a/new/deep/file' : True, '/vo/user/b' : False,
+                                  '/vo/new' : True, '/vo/user/a' : True } )
+    # One lookup of all the parent directories and one of their modes, whatever the depth
+    self.assertEqual( self.db._query.call_count, 2 )
+
+  def test_cache( self ):
+    self.securityManager.getPathPermissions( [ '/vo/user/a' ], { 'uid' : 2 } )
+    self.securityManager.getPathPermissions( [ '/vo/user/a', '/vo/user/a/' ], { 'uid' : 2 } )
+    self.assertEqual( self.db._query.call_count, 2 )
+    # The permissions are cached per user
+    result = self.securityManager.getPathPermissions( [ '/vo/user/a' ], { 'uid' : 3 } )
+    self.assertEqual( self.db._query.call_count, 3 )
+    self.assertFalse( result['Value']['Successful']['/vo/user/a']['Write'] )
+    # and are dropped when the mode of a directory changes
+    self.modes[4] = ( 2, 5, 0775 )
+    self.db.fileManager.getFileIDsInDirectory.return_value = S_OK( '' )
+    self.db.dtree.changeDirectoryMode( { '/vo/user/a' : 0775 } )
+    result = self.securityManager.getPathPermissions( [ '/vo/user/a/file' ], { 'uid' : 3 } )
+    self.assertTrue( result['Value']['Successful']['/vo/user/a/file']['Write'] )
+
+  def test_missingInfo( self ):
+    # A directory without parameters has the permissions of its parent
+    del self.modes[4]
+    result = self.securityManager.getPathPermissions( [ '/vo/user/a/file' ], { 'uid' : 3 } )
+    self.assertEqual( result['Value']['Successful']['/vo/user/a/file'],
+                      { 'Read' : True, 'Write' : False, 'Execute' : True } )
+    self.dirIDs = {}
+    self.db.dtree._clearDirCache()
+    result = self.securityManager.getPathPermissions( [ '/vo' ], { 'uid' : 3 } )
+    self.assertEqual( result['Value']['Successful']['/vo'], { 'Read' : True, 'Write' : True, 'Execute' : True } )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( SecurityManagerTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( PathPermissions ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -58,6 +58,18 @@ class FileCatalogDB( DB ):
     self.validReplicaStatus = databaseConfig['ValidReplicaStatus']
     self.visibleFileStatus = databaseConfig['VisibleFileStatus']
     self.visibleReplicaStatus = databaseConfig['VisibleReplicaStatus']
+    # Size and lifetime of the path to DirID cache of the directory manager
+    self.directoryCacheSize = databaseConfig.get( 'DirectoryCacheSize', 10000 )
+    self.directoryCacheLifeTime = databaseConfig.get( 'DirectoryCacheLifeTime', 60 )
+    # Lifetime of the cached permissions of the users on the directories
+    self.permissionCacheLifeTime = databaseConfig.get( 'PermissionCacheLifeTime', 10 )
+    # Number of directories whose storage usage is checked at a time, whether the differences
+    # found are applied, and where the check is
+    self.usageCheckSize = databaseConfig.get( 'DirectoryUsageCheckSize', 100 )
+    self.usageCheckFix = databaseConfig.get( 'DirectoryUsageCheckFix', False )
+    self.usageCheckDirID = 0
+    # Largest number of files in a page of the paged listings
+    self.maxPageSize = databaseConfig.get( 'MaxPageSize', 10000 )
 
     try:
       # Obtain the plugins to be used for DB interaction
@@ -398,6 +410,7 @@ class FileCatalogDB( DB ):
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__addDatasetChanges( successful.keys(), 'Files', credDict )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def setFileStatus( self, lfns, credDict ):
@@ -448,8 +461,19 @@ class FileCatalogDB( DB ):
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__addDatasetChanges( successful.keys(), 'Files', credDict )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
+  def __addDatasetChanges( self, paths, changeType, credDict ):
+    """ Let the dynamic datasets know about the changes of the catalog, the failure to do so
+        only leaving their materialized file lists out of date
+    """
+    if not paths:
+      return
+    result = self.datasetManager.addDatasetChanges( paths, changeType, credDict )
+    if not result['OK']:
+      gLogger.error( "Failed to record the catalog changes for the datasets", result['Message'] )
+
   def addReplica( self, lfns, credDict ):
     """
        Add a replica to a File
@@ -474,6 +498,7 @@ class FileCatalogDB( DB ):
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__addDatasetChanges( successful.keys(), 'Replicas', credDict )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def removeReplica( self, lfns, credDict ):
@@ -500,6 +525,7 @@ class FileCatalogDB( DB ):
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__addDatasetChanges( successful.keys(), 'Replicas', credDict )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def setReplicaStatus( self, lfns, credDict ):
@@ -542,6 +568,7 @@ class FileCatalogDB( DB ):
       return res
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
+    self.__addDatasetChanges( successful.keys(), 'Replicas', credDict )
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
   def addFileAncestors( self, lfns, credDict ):
@@ -714,6 +741,25 @@ class FileCatalogDB( DB ):
     failed.update( res['Value']['Failed'] )
     successful = res['Value']['Successful']
     return S_OK( {'Successful':successful,'Failed':failed} )        
+
+  def getFileAncestorsBulk( self, lfns, depths, credDict ):
+    """ Get the ancestors of a large number of files, as the input files of a transformation
+    """
+    res = self._checkPathPermissions( 'getFileAncestors', lfns, credDict )
+    if not res['OK']:
+      return res
+    failed = res['Value']['Failed']
+
+    # if no successful, just return
+    if not res['Value']['Successful']:
+      return S_OK( {'Successful':{}, 'Failed':failed} )
+
+    res = self.fileManager.getFileAncestorsBulk( res['Value']['Successful'], depths )
+    if not res['OK']:
+      return res
+    failed.update( res['Value']['Failed'] )
+    successful = res['Value']['Successful']
+    return S_OK( {'Successful':successful,'Failed':failed} )
     
   def getFileDescendents(self, lfns, depths, credDict):
     res = self._checkPathPermissions( 'getFileDescendents', lfns, credDict )
@@ -878,6 +924,26 @@ class FileCatalogDB( DB ):
     successful = res['Value']['Successful']
     return S_OK( {'Successful':successful, 'Failed':failed} )
 
+  def listDirectoryPage( self, lfn, credDict, verbose = False, lastFileID = 0, maxFiles = 1000 ):
+    """
+        List a page of a directory, with at most maxFiles files following lastFileID
+        :param str lfn: directory
+        :param creDict credential
+
+        :return the directory contents as for listDirectory, the subdirectories, links and
+                datasets being only in the first page. LastFileID is the one to get the next
+                page with, 0 after the last page
+    """
+
+    res = self._checkPathPermissions( 'listDirectory', { lfn : True }, credDict )
+    if not res['OK']:
+      return res
+    if lfn in res['Value']['Failed']:
+      return S_ERROR( res['Value']['Failed'][lfn] )
+
+    return self.dtree.listDirectoryPage( lfn, verbose = verbose, lastFileID = lastFileID,
+                                         maxFiles = min( maxFiles, self.maxPageSize ) )
+
   def isDirectory( self, lfns, credDict ):
     """
         Checks whether a list of LFNS are directories or not
@@ -977,6 +1043,17 @@ class FileCatalogDB( DB ):
     result = self.dtree._rebuildDirectoryUsage()
     return result
 
+  def verifyDirectoryUsage( self ):
+    """ Check the storage usage of the next directories, starting again
+        with the first ones once all of them are checked
+    """
+    result = self.dtree.verifyDirectoryUsage( self.usageCheckDirID, self.usageCheckSize, self.usageCheckFix )
+    if not result['OK']:
+      gLogger.error( "Failed to verify the directory usage", result['Message'] )
+      return result
+    self.usageCheckDirID = result['Value']['LastDirID']
+    return result
+
   def repairCatalog( self, directoryFlag = True, credDict = {} ):
     """ Repair catalog inconsistencies
     """
@@ -1009,10 +1086,13 @@ class FileCatalogDB( DB ):
       return S_ERROR( 'Failed to determine the path type' )
     if result['Value']['Successful'][path]:
       # This is a directory
-      return self.dmeta.setMetadata( path, metadataDict, credDict )
+      result = self.dmeta.setMetadata( path, metadataDict, credDict )
     else:
       # This is a file
-      return self.fmeta.setMetadata( path, metadataDict, credDict )
+      result = self.fmeta.setMetadata( path, metadataDict, credDict )
+    if result['OK']:
+      self.__addDatasetChanges( [path], 'Metadata', credDict )
+    return result
 
   def setMetadataBulk( self, pathMetadataDict, credDict ):
     """  Add metadata for the given paths
@@ -1060,10 +1140,13 @@ class FileCatalogDB( DB ):
       return S_ERROR( 'Failed to determine the path type' )
     if result['Value']['Successful'][path]:
       # This is a directory
-      return self.dmeta.removeMetadata( path, metadata, credDict )
+      result = self.dmeta.removeMetadata( path, metadata, credDict )
     else:
       # This is a file
-      return self.fmeta.removeMetadata( path, metadata, credDict )
+      result = self.fmeta.removeMetadata( path, metadata, credDict )
+    if result['OK']:
+      self.__addDatasetChanges( [path], 'Metadata', credDict )
+    return result
 
   #######################################################################
   #
@@ -1093,6 +1176,10 @@ class FileCatalogDB( DB ):
     if not res['OK']:
       return res
     counterDict.update( res['Value'] )
+    res = self.dtree.getDirCacheCounters()
+    if not res['OK']:
+      return res
+    counterDict.update( res['Value'] )
     return S_OK( counterDict )
 
   ########################################################################
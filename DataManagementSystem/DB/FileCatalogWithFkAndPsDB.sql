@@ -1039,6 +1039,27 @@ DELIMITER ;
 
 
 
+-- ps_get_multiple_replica_id : get the replica IDs for many files and ses together
+-- replicaDesc : replicas formated like " (r.FileID = x AND r.SEID = y) OR (r.FileID = u AND r.SEID = v)"
+--
+-- output : FileID, SEID, RepID of the existing replicas
+
+DROP PROCEDURE IF EXISTS ps_get_multiple_replica_id;
+DELIMITER //
+CREATE PROCEDURE ps_get_multiple_replica_id
+(IN replicaDesc LONGTEXT)
+BEGIN
+
+  SET @sql = CONCAT('SELECT SQL_NO_CACHE FileID, SEID, RepID FROM FC_Replicas r WHERE ', replicaDesc);
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
+
 -- ps_delete_replica_from_file_and_se_ids : delete a given replica and update the DirectoryUsage
 --
 -- file_id : id of the file the replica refers to
@@ -1066,6 +1087,51 @@ BEGIN
 END //
 DELIMITER ;
 
+-- ps_delete_multiple_replica : delete many replicas together and update the DirectoryUsage table
+-- replicaDesc : replicas to delete formated like " (r.FileID = x AND r.SEID = y) OR (r.FileID = u AND r.SEID = v)"
+--
+-- output : 0, 'OK'
+
+DROP PROCEDURE IF EXISTS ps_delete_multiple_replica;
+DELIMITER //
+CREATE PROCEDURE ps_delete_multiple_replica
+(IN replicaDesc LONGTEXT)
+BEGIN
+
+  -- The usage and the replicas change together or not at all
+  DECLARE EXIT HANDLER FOR SQLEXCEPTION BEGIN
+    ROLLBACK;
+    RESIGNAL;
+  END;
+
+  START TRANSACTION;
+
+  SET @sql = CONCAT('UPDATE FC_DirectoryUsage d,
+                      (SELECT f.DirID, r.SEID, SUM(f.Size) as t_size, count(*) as t_file
+                        FROM FC_Files f, FC_Replicas r
+                        WHERE r.FileID = f.FileID
+                        AND (', replicaDesc, ')
+                        GROUP BY f.DirID, r.SEID ) t
+                     SET d.SESize = d.SESize - t.t_size,
+                         d.SEFiles = d.SEFiles - t.t_file
+                     WHERE d.DirID = t.DirID
+                     AND d.SEID = t.SEID');
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+  SET @sql = CONCAT('DELETE r FROM FC_Replicas r WHERE ', replicaDesc);
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+  COMMIT;
+
+  SELECT 0, 'OK';
+
+END //
+DELIMITER ;
+
 -- ps_set_replica_status : set the replica status
 --
 -- file_id : id of the file
@@ -1088,6 +1154,34 @@ DELIMITER ;
 
 
 
+-- ps_set_multiple_replica_status : set the same status to many replicas together
+--
+-- replicaDesc : replicas formated like " (r.FileID = x AND r.SEID = y) OR (r.FileID = u AND r.SEID = v)"
+-- status_id : new status id
+--
+-- output : FileID, SEID of the existing replicas
+
+DROP PROCEDURE IF EXISTS ps_set_multiple_replica_status;
+DELIMITER //
+CREATE PROCEDURE ps_set_multiple_replica_status
+(IN replicaDesc LONGTEXT, IN status_id INT)
+BEGIN
+
+  SET @sql = CONCAT('UPDATE FC_Replicas r SET r.Status = ', status_id, ' WHERE ', replicaDesc);
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+  SET @sql = CONCAT('SELECT SQL_NO_CACHE FileID, SEID FROM FC_Replicas r WHERE ', replicaDesc);
+  PREPARE stmt FROM @sql;
+  EXECUTE stmt;
+  DEALLOCATE PREPARE stmt;
+
+END //
+DELIMITER ;
+
+
+
 -- ps_set_replica_host : 'move' a replica to another SE and updates the DirectoryUsage
 --
 -- file_id : id of the file
@@ -21,6 +21,7 @@ from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.FrameworkSystem.Client.MonitoringClient import gMonitor
 from DIRAC.DataManagementSystem.DB.FileCatalogDB import FileCatalogDB
 from DIRAC.Core.Utilities.List import sortList
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
 
 # This is a global instance of the FileCatalogDB class
 gFileCatalogDB = None
@@ -60,7 +61,14 @@ def initializeFileCatalogHandler( serviceInfo ):
                     'ValidFileStatus'     : ['AprioriGood','Trash','Removing','Probing'],
                     'ValidReplicaStatus'  : ['AprioriGood','Trash','Removing','Probing'],
                     'VisibleFileStatus'   : ['AprioriGood'],
-                    'VisibleReplicaStatus': ['AprioriGood']}
+                    'VisibleReplicaStatus': ['AprioriGood'],
+                    'DirectoryCacheSize'  : 10000,
+                    'DirectoryCacheLifeTime' : 60,
+                    'PermissionCacheLifeTime' : 10,
+                    'DirectoryUsageCheckPeriod' : 0,
+                    'DirectoryUsageCheckSize' : 100,
+                    'DirectoryUsageCheckFix' : False,
+                    'MaxPageSize'         : 10000 }
   for configKey in sortList( defaultConfig.keys() ):
     defaultValue = defaultConfig[configKey]
     configValue = getServiceOption( serviceInfo, configKey, defaultValue )
@@ -68,6 +76,13 @@ def initializeFileCatalogHandler( serviceInfo ):
     databaseConfig[configKey] = configValue
   res = gFileCatalogDB.setConfig( databaseConfig )
 
+  # Check the directory usage little by little in the background, if asked to
+  if res['OK'] and databaseConfig['DirectoryUsageCheckPeriod'] > 0:
+    result = gThreadScheduler.addPeriodicTask( databaseConfig['DirectoryUsageCheckPeriod'],
+                                               gFileCatalogDB.verifyDirectoryUsage )
+    if not result['OK']:
+      gLogger.error( "Cannot add the directory usage check to the thread scheduler", result['Message'] )
+
   gMonitor.registerActivity( "AddFile", "Amount of addFile calls",
                                "FileCatalogHandler", "calls/min", gMonitor.OP_SUM )
   gMonitor.registerActivity( "AddFileSuccessful", "Files successfully added",
@@ -315,7 +330,7 @@ class FileCatalogHandler( RequestHandler ):
     """ Get the status for the supplied replicas """
     return gFileCatalogDB.getReplicaStatus( lfns, self.getRemoteCredentials() )
 
-  types_getFileAncestors = [ ListType, [ ListType, IntType, LongType ] ]
+  types_getFileAncestors = [ [ ListType, DictType ], [ ListType, IntType, LongType ] ]
   def export_getFileAncestors( self, lfns, depths ):
     """ Get the status for the supplied replicas """
     dList = depths
@@ -324,7 +339,18 @@ class FileCatalogHandler( RequestHandler ):
     lfnDict = dict.fromkeys( lfns, True )
     return gFileCatalogDB.getFileAncestors( lfnDict, dList, self.getRemoteCredentials() )
 
-  types_getFileDescendents = [ ListType, [ ListType, IntType, LongType ] ]
+  types_getFileAncestorsBulk = [ [ ListType, DictType ], [ ListType, IntType, LongType ] ]
+  def export_getFileAncestorsBulk( self, lfns, depths ):
+    """ Get the ancestors of a large number of files, at the given depths or at all depths
+        if the depth list is empty
+    """
+    dList = depths
+    if type( dList ) != ListType:
+      dList = [ depths ]
+    lfnDict = dict.fromkeys( lfns, True )
+    return gFileCatalogDB.getFileAncestorsBulk( lfnDict, dList, self.getRemoteCredentials() )
+
+  types_getFileDescendents = [ [ ListType, DictType ], [ ListType, IntType, LongType ] ]
   def export_getFileDescendents( self, lfns, depths ):
     """ Get the status for the supplied replicas """
     dList = depths
@@ -364,6 +390,15 @@ class FileCatalogHandler( RequestHandler ):
     gMonitor.addMark( 'ListDirectory', 1 )
     return gFileCatalogDB.listDirectory( lfns, self.getRemoteCredentials(), verbose = verbose )
 
+  types_listDirectoryPage = [ StringTypes, BooleanType, [ IntType, LongType ], [ IntType, LongType ] ]
+  def export_listDirectoryPage( self, lfn, verbose, lastFileID, maxFiles ):
+    """ List a page of the contents of a directory, with at most maxFiles files
+        following lastFileID
+    """
+    gMonitor.addMark( 'ListDirectory', 1 )
+    return gFileCatalogDB.listDirectoryPage( lfn, self.getRemoteCredentials(), verbose = verbose,
+                                             lastFileID = lastFileID, maxFiles = maxFiles )
+
   types_isDirectory = [ [ ListType, DictType ] + list( StringTypes ) ]
   def export_isDirectory( self, lfns ):
     """ Determine whether supplied path is a directory """
@@ -491,6 +526,16 @@ class FileCatalogHandler( RequestHandler ):
     """
     return gFileCatalogDB.fmeta.findFilesByMetadata( metaDict, path, self.getRemoteCredentials() )
 
+  types_findFilesByMetadataPage = [ DictType, StringTypes, [ IntType, LongType ], [ IntType, LongType ] ]
+  def export_findFilesByMetadataPage( self, metaDict, path, lastFileID, maxFiles, selectionID = '' ):
+    """ Find at most maxFiles files satisfying the given metadata set following lastFileID.
+        The SelectionID returned with a page is given back to get the next one
+    """
+    return gFileCatalogDB.fmeta.findFilesByMetadataPage( metaDict, path, self.getRemoteCredentials(),
+                                                         lastFileID = lastFileID,
+                                                         maxFiles = min( maxFiles, gFileCatalogDB.maxPageSize ),
+                                                         selectionID = selectionID )
+
   types_getReplicasByMetadata = [ DictType, StringTypes, BooleanType ]
   def export_getReplicasByMetadata( self, metaDict, path = '/', allStatus = False ):
     """ Find all the files satisfying the given metadata set
@@ -427,13 +427,15 @@ CREATE  TABLE IF NOT EXISTS `AgentPersistentData` (
   def insertMessage( self, message, site, nodeFQDN, userDN, userGroup, remoteAddress ):
     """ This function inserts the Log message into the DB
     """
-    messageDate = Time.toString( message.getTime() )
-    messageDate = messageDate[:messageDate.find( '.' )]
-    messageName = message.getName()
-    messageSubSystemName = message.getSubSystemName()
+    return self.insertMessages( [ message ], site, nodeFQDN, userDN, userGroup, remoteAddress )
 
-    fieldsList = [ 'MessageTime', 'VariableText' ]
-    messageList = [ messageDate, message.getVariableMessage() ]
+  def insertMessages( self, messageList, site, nodeFQDN, userDN, userGroup, remoteAddress ):
+    """ This function inserts a bundle of Log messages coming from the same client into the DB.
+        The keys of the auxiliary tables are resolved once per distinct value and all the
+        messages are inserted with a single multi-row INSERT
+    """
+    if not messageList:
+      return S_OK( 0 )
 
     inValues = [ userDN, userGroup ]
     inFields = [ 'OwnerDN', 'OwnerGroup' ]
@@ -441,8 +443,7 @@ CREATE  TABLE IF NOT EXISTS `AgentPersistentData` (
     result = self.__insertIntoAuxiliaryTable( 'UserDNs', outFields, inFields, inValues )
     if not result['OK']:
       return result
-    messageList.append( result['Value'] )
-    fieldsList.extend( outFields )
+    userDNIDKey = result['Value']
 
     if not site:
       site = 'Unknown'
@@ -460,45 +461,57 @@ CREATE  TABLE IF NOT EXISTS `AgentPersistentData` (
     result = self.__insertIntoAuxiliaryTable( 'ClientIPs', outFields, inFields, inValues )
     if not result['OK']:
       return result
-    messageList.append( result['Value'] )
-    fieldsList.extend( outFields )
-
-
-    messageList.append( message.getLevel() )
-    fieldsList.append( 'LogLevel' )
-
-
-    if not messageName:
-      messageName = 'Unknown'
-    inFields = [ 'SystemName' ]
-    inValues = [ messageName ]
-    outFields = [ 'SystemID'  ]
-    result = self.__insertIntoAuxiliaryTable( 'Systems', outFields, inFields, inValues )
-    if not result['OK']:
-      return result
-    systemIDKey = result['Value']
-
-    if not messageSubSystemName:
-      messageSubSystemName = 'Unknown'
-    inFields = [ 'SubSystemName', 'SystemID' ]
-    inValues = [ messageSubSystemName, systemIDKey  ]
-    outFields = [ 'SubSystemID' ]
-    result = self.__insertIntoAuxiliaryTable( 'SubSystems', outFields, inFields, inValues )
-    if not result['OK']:
-      return result
-    subSystemIDKey = result['Value']
-
-    inFields = [ 'FixedTextString' , 'SubSystemID' ]
-    inValues = [ message.getFixedMessage(), subSystemIDKey ]
-    outFields = [ 'FixedTextID' ]
-    result = self.__insertIntoAuxiliaryTable( 'FixedTextMessages', outFields, inFields,
-                              inValues )
-    if not result['OK']:
-      return result
-    messageList.append( result['Value'] )
-    fieldsList.extend( outFields )
+    clientIPIDKey = result['Value']
+
+    systemIDKeys = {}
+    subSystemIDKeys = {}
+    fixedTextIDKeys = {}
+    rowList = []
+    for message in messageList:
+      messageDate = Time.toString( message.getTime() )
+      messageDate = messageDate[:messageDate.find( '.' )]
+
+      messageName = message.getName()
+      if not messageName:
+        messageName = 'Unknown'
+      if messageName not in systemIDKeys:
+        result = self.__insertIntoAuxiliaryTable( 'Systems', [ 'SystemID' ], [ 'SystemName' ],
+                                                  [ messageName ] )
+        if not result['OK']:
+          return result
+        systemIDKeys[ messageName ] = result['Value']
+      systemIDKey = systemIDKeys[ messageName ]
+
+      messageSubSystemName = message.getSubSystemName()
+      if not messageSubSystemName:
+        messageSubSystemName = 'Unknown'
+      subSystemKey = ( messageSubSystemName, systemIDKey )
+      if subSystemKey not in subSystemIDKeys:
+        result = self.__insertIntoAuxiliaryTable( 'SubSystems', [ 'SubSystemID' ],
+                                                  [ 'SubSystemName', 'SystemID' ], list( subSystemKey ) )
+        if not result['OK']:
+          return result
+        subSystemIDKeys[ subSystemKey ] = result['Value']
+      subSystemIDKey = subSystemIDKeys[ subSystemKey ]
+
+      fixedTextKey = ( message.getFixedMessage(), subSystemIDKey )
+      if fixedTextKey not in fixedTextIDKeys:
+        result = self.__insertIntoAuxiliaryTable( 'FixedTextMessages', [ 'FixedTextID' ],
+                                                  [ 'FixedTextString' , 'SubSystemID' ], list( fixedTextKey ) )
+        if not result['OK']:
+          return result
+        fixedTextIDKeys[ fixedTextKey ] = result['Value']
+
+      result = self._escapeValues( [ messageDate, message.getVariableMessage(), userDNIDKey,
+                                     clientIPIDKey, message.getLevel(), fixedTextIDKeys[ fixedTextKey ] ] )
+      if not result['OK']:
+        return result
+      rowList.append( '(%s)' % ', '.join( result['Value'] ) )
 
-    return self.insertFields( 'MessageRepository', fieldsList, messageList )
+    fieldsList = [ 'MessageTime', 'VariableText', 'UserDNID', 'ClientIPNumberID', 'LogLevel', 'FixedTextID' ]
+    cmd = 'INSERT INTO MessageRepository (%s) VALUES %s' % ( ', '.join( [ '`%s`' % f for f in fieldsList ] ),
+                                                             ', '.join( rowList ) )
+    return self._update( cmd )
 
   def _insertDataIntoAgentTable( self, agentName, data ):
     """Insert the persistent data needed by the agents running on top of
@@ -37,9 +37,9 @@ class SystemLoggingHandler( RequestHandler ):
   """ This is server
   """
 
-  def __addMessage( self, messageObject, site, nodeFQDN ):
-    """  
-    This is the function that actually adds the Message to 
+  def __addMessages( self, messageList, site, nodeFQDN ):
+    """
+    This is the function that actually adds the Messages to
     the log Database
     """
     credentials = self.getRemoteCredentials()
@@ -53,7 +53,7 @@ class SystemLoggingHandler( RequestHandler ):
       userGroup = 'unknown'
 
     remoteAddress = self.getRemoteAddress()[0]
-    return gLogDB.insertMessage( messageObject, site, nodeFQDN, userDN, userGroup, remoteAddress )
+    return gLogDB.insertMessages( messageList, site, nodeFQDN, userDN, userGroup, remoteAddress )
 
 
   types_addMessages = [ ListType, StringTypes, StringTypes ]
@@ -71,12 +71,11 @@ class SystemLoggingHandler( RequestHandler ):
       S_ERROR if an exception was raised
 
     """
-    for messageTuple in messagesList:
-      messageObject = tupleToMessage( messageTuple )
-      result = self.__addMessage( messageObject, site, nodeFQDN )
-      if not result['OK']:
-        gLogger.error( 'The Log Message could not be inserted into the DB',
-                       'because: "%s"' % result['Message'] )
-        return S_ERROR( result['Message'] )
+    messageList = [ tupleToMessage( messageTuple ) for messageTuple in messagesList ]
+    result = self.__addMessages( messageList, site, nodeFQDN )
+    if not result['OK']:
+      gLogger.error( 'The Log Messages could not be inserted into the DB',
+                     'because: "%s"' % result['Message'] )
+      return S_ERROR( result['Message'] )
     return S_OK()
 
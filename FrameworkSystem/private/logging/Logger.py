@@ -6,7 +6,6 @@ __RCSID__ = "$Id$"
 
 import sys
 import traceback
-import inspect
 from DIRAC.FrameworkSystem.private.logging.LogLevels import LogLevels
 from DIRAC.FrameworkSystem.private.logging.Message import Message
 from DIRAC.Core.Utilities import Time, List
@@ -16,12 +15,26 @@ import DIRAC
 
 DEBUG = 1
 
+# Numeric value used to filter each level, as done by Logger.__testLevel
+_levelValues = dict( [ ( levelName, abs( LogLevels().getLevelValue( levelName ) ) ) for levelName in LogLevels().getLevels() ] )
+_NOTICE = _levelValues[ 'NOTICE' ]
+_INFO = _levelValues[ 'INFO' ]
+_VERBOSE = _levelValues[ 'VERB' ]
+_DEBUG = _levelValues[ 'DEBUG' ]
+_WARN = _levelValues[ 'WARN' ]
+_ERROR = _levelValues[ 'ERROR' ]
+_EXCEPTION = _levelValues[ 'EXCEPT' ]
+_FATAL = _levelValues[ 'FATAL' ]
+
 class Logger:
 
   defaultLogLevel = 'NOTICE'
 
   def __init__( self ):
     self._minLevel = 0
+    # Level used to discard messages before building them. For the master logger
+    # it is its own level, sub loggers cache the one of their master
+    self._effectiveMinLevel = 0
     self._showCallingFrame = False
     self._systemName = False
     self._outputList = []
@@ -53,7 +66,7 @@ class Logger:
   def __preinitialize ( self ):
     self._systemName = "Framework"
     self.registerBackends( [ 'stdout' ] )
-    self._minLevel = self._logLevels.getLevelValue( "NOTICE" )
+    self.setLevel( "NOTICE" )
     #HACK to take into account dev levels before the command line if fully parsed
     debLevs = 0
     for arg in sys.argv:
@@ -125,115 +138,103 @@ class Logger:
     levelName = levelName.upper()
     if levelName in self._logLevels.getLevels():
       self._minLevel = abs( self._logLevels.getLevelValue( levelName ) )
+      self._propagateLevel()
       return True
     return False
 
+  def _getFilterLevel( self ):
+    """ Level that filters the messages of this logger
+    """
+    return self._minLevel
+
+  def _propagateLevel( self ):
+    """ Refresh the cached filtering level of this logger and its sub loggers
+    """
+    self._effectiveMinLevel = self._getFilterLevel()
+    for subLogger in self._subLoggersDict.values():
+      subLogger._propagateLevel()
+
   def getLevel( self ):
     return self._logLevels.getLevel( self._minLevel )
 
   def shown( self, levelName ):
     levelName = levelName.upper()
-    if levelName in self._logLevels.getLevels():
-      return self._logLevels.getLevelValue( levelName ) <= levelName
+    if levelName in _levelValues:
+      return _levelValues[ levelName ] >= self._effectiveMinLevel
     return False
 
   def getName( self ):
     return self._systemName
 
-  def always( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.always,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def always( self, sMsg, sVarMsg = '', *args ):
+    return self._sendMessage( self._logLevels.always, sMsg, sVarMsg, args )
 
-  def notice( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.notice,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def notice( self, sMsg, sVarMsg = '', *args ):
+    if _NOTICE < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.notice, sMsg, sVarMsg, args )
 
-  def info( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.info,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def info( self, sMsg, sVarMsg = '', *args ):
+    if _INFO < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.info, sMsg, sVarMsg, args )
 
-  def verbose( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.verbose,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def verbose( self, sMsg, sVarMsg = '', *args ):
+    if _VERBOSE < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.verbose, sMsg, sVarMsg, args )
 
-  def debug( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.debug,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def debug( self, sMsg, sVarMsg = '', *args ):
+    if _DEBUG < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.debug, sMsg, sVarMsg, args )
 
-  def warn( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.warn,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def warn( self, sMsg, sVarMsg = '', *args ):
+    if _WARN < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.warn, sMsg, sVarMsg, args )
 
-  def error( self, sMsg, sVarMsg = '' ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.error,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+  def error( self, sMsg, sVarMsg = '', *args ):
+    if _ERROR < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.error, sMsg, sVarMsg, args )
 
   def exception( self, sMsg = "", sVarMsg = '', lException = False, lExcInfo = False ):
+    if _EXCEPTION < self._effectiveMinLevel:
+      return True
     if sVarMsg:
       sVarMsg += "\n%s" % self.__getExceptionString( lException, lExcInfo )
     else:
       sVarMsg = "\n%s" % self.__getExceptionString( lException, lExcInfo )
-    messageObject = Message( self._systemName,
-                             self._logLevels.exception,
-                             Time.dateTime(),
-                             sMsg,
-                             sVarMsg,
-                             self.__discoverCallingFrame() )
-    return self.processMessage( messageObject )
+    return self._sendMessage( self._logLevels.exception, sMsg, sVarMsg, () )
+
+  def fatal( self, sMsg, sVarMsg = '', *args ):
+    if _FATAL < self._effectiveMinLevel:
+      return True
+    return self._sendMessage( self._logLevels.fatal, sMsg, sVarMsg, args )
+
+  def showStack( self ):
+    if _DEBUG < self._effectiveMinLevel:
+      return
+    self._sendMessage( self._logLevels.debug, "", self.__getStackString(), () )
 
-  def fatal( self, sMsg, sVarMsg = '' ):
+  def _sendMessage( self, level, sMsg, sVarMsg, args ):
+    """ Build the message once it is known that it has to be shown.
+        The variable message is %-formatted with args only at this point
+    """
+    if args:
+      try:
+        sVarMsg = sVarMsg % args
+      except ( TypeError, ValueError ):
+        sVarMsg = "%s %s" % ( sVarMsg, " ".join( [ str( arg ) for arg in args ] ) )
     messageObject = Message( self._systemName,
-                             self._logLevels.fatal,
+                             level,
                              Time.dateTime(),
                              sMsg,
                              sVarMsg,
                              self.__discoverCallingFrame() )
     return self.processMessage( messageObject )
 
-  def showStack( self ):
-    messageObject = Message( self._systemName,
-                             self._logLevels.debug,
-                             Time.dateTime(),
-                             "",
-                             self.__getStackString(),
-                             self.__discoverCallingFrame() )
-    self.processMessage( messageObject )
-
   def processMessage( self, messageObject ):
     if self.__testLevel( messageObject.getLevel() ):
       if not messageObject.getName():
@@ -284,10 +285,9 @@ class Logger:
 
   def __discoverCallingFrame( self ):
     if self.__testLevel( self._logLevels.debug ) and self._showCallingFrame:
-      oActualFrame = inspect.currentframe()
-      lOuterFrames = inspect.getouterframes( oActualFrame )
-      lCallingFrame = lOuterFrames[2]
-      return "%s:%s" % ( lCallingFrame[1].replace( sys.path[0], "" )[1:], lCallingFrame[2] )
+      # Skip this method, _sendMessage and the logging method itself
+      oCallingFrame = sys._getframe( 3 )
+      return "%s:%s" % ( oCallingFrame.f_code.co_filename.replace( sys.path[0], "" )[1:], oCallingFrame.f_lineno )
     else:
       return ""
 
@@ -343,7 +343,7 @@ class Logger:
 
   def getSubLogger( self, subName, child = True ):
     from DIRAC.FrameworkSystem.private.logging.SubSystemLogger import SubSystemLogger
-    if not subName in self._subLoggersDict.keys():
+    if not subName in self._subLoggersDict:
       self._subLoggersDict[ subName ] = SubSystemLogger( subName, self, child )
     return self._subLoggersDict[ subName ]
 
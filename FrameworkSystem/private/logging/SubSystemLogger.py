@@ -8,15 +8,20 @@ from DIRAC.FrameworkSystem.Client.Logger import Logger
 class SubSystemLogger( Logger ):
 
   def __init__( self, subName, masterLogger, child = True ):
+    # The master has to be known before the level is set in Logger.__init__
+    self.__masterLogger = masterLogger
     Logger.__init__( self )
     self.__child = child
     for attrName in dir( masterLogger ):
       attrValue = getattr( masterLogger, attrName )
       if type( attrValue ) == types.StringType:
         setattr( self, attrName, attrValue )
-    self.__masterLogger = masterLogger
     self._subName = subName
 
+  def _getFilterLevel( self ):
+    # Messages are filtered by the master logger
+    return self.__masterLogger._effectiveMinLevel
+
   def processMessage( self, messageObject ):
     if self.__child:
       messageObject.setSubSystemName( self._subName )
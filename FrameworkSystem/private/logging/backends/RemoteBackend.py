@@ -3,9 +3,15 @@ __RCSID__ = "$Id$"
 """This Backend sends the Log Messages to a Log Server
 It will only report to the server ERROR, EXCEPTION, FATAL
 and ALWAYS messages.
+
+Messages are kept in a bounded buffer where identical messages (same system,
+subsystem, level and fixed text) are aggregated into a single entry with a
+repetition count. When the buffer is full the oldest entry is dropped. The buffer
+is flushed every SleepTime seconds or as soon as BundleSize entries are waiting,
+using a single RPCClient for the whole life of the backend.
 """
 import threading
-import Queue
+from collections import OrderedDict
 from DIRAC.Core.Utilities import Time, Network
 from DIRAC.FrameworkSystem.private.logging.backends.BaseBackend import BaseBackend
 from DIRAC.FrameworkSystem.private.logging.LogLevels import LogLevels
@@ -17,64 +23,130 @@ class RemoteBackend( BaseBackend, threading.Thread ):
     threading.Thread.__init__( self )
     self.__interactive = optionsDictionary[ 'Interactive' ]
     self.__sleep = optionsDictionary[ 'SleepTime' ]
-    self._messageQueue = Queue.Queue()
-    self._Transactions = []
     self._alive = True
     self._site = optionsDictionary[ 'Site' ]
     self._hostname = Network.getFQDN()
     self._logLevels = LogLevels()
     self._negativeLevel = self._logLevels.getLevelValue( 'ERROR' )
     self._positiveLevel = self._logLevels.getLevelValue( 'ALWAYS' )
-    self._maxBundledMessages = 20
+    self._maxBundledMessages = self.__getIntOption( 'BundleSize', 100 )
+    self._maxBufferedMessages = self.__getIntOption( 'MaxBufferedMessages', 1000 )
+    self._maxPendingBundles = self.__getIntOption( 'MaxPendingBundles', 10 )
+    # ( systemName, subSystemName, level, fixedMessage ) -> [ first message, repetitions ]
+    self._buffer = OrderedDict()
+    self._bufferLock = threading.Lock()
+    self._sendLock = threading.Lock()
+    # ( bundle, number of messages in it ) that could not be sent yet, oldest first
+    self._Transactions = []
+    self._flushEvent = threading.Event()
+    self._rpcClient = None
+    self._stats = { 'Dropped' : 0, 'Aggregated' : 0, 'Sent' : 0 }
     self.setDaemon(1)
     self.start()
 
+  def __getIntOption( self, optionName, defaultValue ):
+    try:
+      return max( 1, int( self._optionsDictionary.get( optionName, defaultValue ) ) )
+    except ( TypeError, ValueError ):
+      return defaultValue
+
   def doMessage( self, messageObject ):
-    self._messageQueue.put( messageObject )
+    if not self._testLevel( messageObject.getLevel() ):
+      return
+    key = ( messageObject.getName(), messageObject.getSubSystemName(),
+            messageObject.getLevel(), messageObject.getFixedMessage() )
+    self._bufferLock.acquire()
+    try:
+      entry = self._buffer.get( key )
+      if entry is not None:
+        entry[1] += 1
+        self._stats[ 'Aggregated' ] += 1
+        return
+      if len( self._buffer ) >= self._maxBufferedMessages:
+        self._stats[ 'Dropped' ] += self._buffer.popitem( last = False )[1][1]
+      self._buffer[ key ] = [ messageObject, 1 ]
+      bufferFull = len( self._buffer ) >= self._maxBundledMessages
+    finally:
+      self._bufferLock.release()
+    if bufferFull:
+      self._flushEvent.set()
+
+  def getStats( self ):
+    """ Return the number of messages dropped, aggregated into a previous one and sent,
+        and the number of entries waiting in the buffer
+    """
+    self._bufferLock.acquire()
+    try:
+      stats = dict( self._stats )
+      stats[ 'Buffered' ] = len( self._buffer )
+    finally:
+      self._bufferLock.release()
+    return stats
+
+  def __count( self, counter, amount ):
+    self._bufferLock.acquire()
+    try:
+      self._stats[ counter ] += amount
+    finally:
+      self._bufferLock.release()
 
   def run( self ):
-    import time
     while self._alive:
+      self._flushEvent.wait( self.__sleep )
+      self._flushEvent.clear()
       self._bundleMessages()
-      time.sleep( self.__sleep )
 
   def _bundleMessages( self ):
-    while not self._messageQueue.empty():
-      bundle = []
-      while ( len( bundle ) < self._maxBundledMessages ) and \
-                ( not self._messageQueue.empty() ):
-        message = self._messageQueue.get()
-        if self._testLevel( message.getLevel() ):
-          bundle.append( message.toTuple() )
+    self._sendLock.acquire()
+    try:
+      self.__bundleMessages()
+    finally:
+      self._sendLock.release()
 
-      if len( bundle ):
-        self._sendMessageToServer( bundle )
+  def __bundleMessages( self ):
+    self._bufferLock.acquire()
+    try:
+      entries = self._buffer.values()
+      self._buffer = OrderedDict()
+    finally:
+      self._bufferLock.release()
 
-    if len( self._Transactions ):
+    for iP in range( 0, len( entries ), self._maxBundledMessages ):
+      bundle = []
+      numMessages = 0
+      for message, repetitions in entries[ iP:iP + self._maxBundledMessages ]:
+        numMessages += repetitions
+        messageTuple = message.toTuple()
+        if repetitions > 1:
+          variableText = "%s (repeated %s times)" % ( messageTuple[4], repetitions )
+          messageTuple = messageTuple[:4] + ( variableText.strip(), ) + messageTuple[5:]
+        bundle.append( messageTuple )
+      self._queueBundle( bundle, numMessages )
+
+    if self._Transactions:
       self._sendMessageToServer()
 
-  def _sendMessageToServer( self, messageBundle=None ):
-    from DIRAC.Core.DISET.RPCClient import RPCClient
-    if messageBundle:
-      self._Transactions.append( messageBundle )
-    TransactionsLength = len( self._Transactions )
-    if TransactionsLength > 100:
-      del self._Transactions[:TransactionsLength-100]
-      TransactionsLength = 100
+  def _queueBundle( self, bundle, numMessages ):
+    self._Transactions.append( ( bundle, numMessages ) )
+    while len( self._Transactions ) > self._maxPendingBundles:
+      self.__count( 'Dropped', self._Transactions.pop( 0 )[1] )
 
-    try:
-      oSock = RPCClient( "Framework/SystemLogging" )
-    except Exception,v:
-      return False
-
-    while TransactionsLength:
-      result = oSock.addMessages( self._Transactions[0],
-                                  self._site, self._hostname )
-      if result['OK']:
-        TransactionsLength = TransactionsLength - 1
-        self._Transactions.pop(0) 
-      else:
+  def _sendMessageToServer( self ):
+    if self._rpcClient is None:
+      from DIRAC.Core.DISET.RPCClient import RPCClient
+      try:
+        self._rpcClient = RPCClient( "Framework/SystemLogging" )
+      except Exception:
         return False
+
+    while self._Transactions:
+      try:
+        result = self._rpcClient.addMessages( self._Transactions[0][0], self._site, self._hostname )
+      except Exception:
+        return False
+      if not result['OK']:
+        return False
+      self.__count( 'Sent', self._Transactions.pop( 0 )[1] )
     return True
 
   def _testLevel( self, sLevel ):
@@ -84,7 +156,6 @@ class RemoteBackend( BaseBackend, threading.Thread ):
 
   def flush( self ):
     self._alive = False
-    if not self.__interactive and self._sendMessageToServer():
-      while not self._messageQueue.empty():
-        self._bundleMessages()
-
+    self._flushEvent.set()
+    if not self.__interactive:
+      self._bundleMessages()
@@ -0,0 +1,79 @@
+""" Test for the Logger level filtering and a microbenchmark of the suppressed log calls
+"""
+
+import timeit
+import unittest
+
+from DIRAC.FrameworkSystem.private.logging.Logger import Logger
+
+class LoggerTestCase( unittest.TestCase ):
+  """ Base class for the Logger test cases
+  """
+  def setUp( self ):
+    self.logger = Logger()
+    self.logger.setLevel( 'INFO' )
+    self.messages = []
+    self.logger._processMessage = self.messages.append
+
+class LoggerFiltering( LoggerTestCase ):
+
+  def test_levels( self ):
+    self.logger.debug( "debug" )
+    self.logger.verbose( "verbose" )
+    self.logger.info( "info" )
+    self.logger.error( "error" )
+    self.assertEqual( [ m.getFixedMessage() for m in self.messages ], [ "info", "error" ] )
+    self.assertTrue( self.logger.shown( 'INFO' ) )
+    self.assertFalse( self.logger.shown( 'DEBUG' ) )
+
+  def test_subLoggerLevel( self ):
+    subLogger = self.logger.getSubLogger( "Sub" )
+    subSubLogger = subLogger.getSubLogger( "SubSub" )
+    subLogger.debug( "hidden" )
+    subSubLogger.verbose( "hidden" )
+    self.assertEqual( self.messages, [] )
+    # Changing the master level refreshes the levels cached by the sub loggers
+    self.logger.setLevel( 'DEBUG' )
+    subLogger.debug( "shown" )
+    subSubLogger.verbose( "shown" )
+    self.assertEqual( [ m.getFixedMessage() for m in self.messages ], [ "shown", "shown" ] )
+
+  def test_lazyFormatting( self ):
+    self.logger.info( "Fixed", "job %s in TQ %s", 1, 2 )
+    self.logger.info( "Fixed", "no placeholders", 3 )
+    self.assertEqual( self.messages[0].getFixedMessage(), "Fixed" )
+    self.assertEqual( self.messages[0].getVariableMessage(), "job 1 in TQ 2" )
+    self.assertEqual( self.messages[1].getVariableMessage(), "no placeholders 3" )
+
+    class NotToBeFormatted( object ):
+      def __str__( self ):
+        raise AssertionError( "Suppressed messages must not be formatted" )
+    self.logger.debug( "Fixed", "%s", NotToBeFormatted() )
+
+class LoggerBenchmark( LoggerTestCase ):
+
+  def test_suppressedCallCost( self ):
+    """ A suppressed debug call has to cost about as much as a call doing nothing, measured in the same run
+    """
+    def noOp( *args ):
+      pass
+    subLogger = self.logger.getSubLogger( "Bench" )
+    numCalls = 100000
+    costs = []
+    for function in ( noOp, subLogger.debug ):
+      timer = timeit.Timer( lambda: function( "Fixed message", "value %s", numCalls ) )
+      costs.append( min( timer.repeat( repeat = 5, number = numCalls ) ) / numCalls )
+    noOpCost, callCost = costs
+    self.assertTrue( callCost < 5 * noOpCost, "Suppressed debug call: %.3f us, call doing nothing: %.3f us" % (
+                                                 callCost * 1e6, noOpCost * 1e6 ) )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( LoggerTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( LoggerFiltering ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( LoggerBenchmark ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
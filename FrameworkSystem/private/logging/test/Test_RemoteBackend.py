@@ -0,0 +1,71 @@
+""" Test for the buffering and aggregation of the RemoteBackend
+"""
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.Utilities import Time
+from DIRAC.FrameworkSystem.private.logging.Message import Message
+from DIRAC.FrameworkSystem.private.logging.backends.RemoteBackend import RemoteBackend
+
+def _message( fixedText, variableText = '', level = 'ERROR' ):
+  return Message( 'Framework', level, Time.dateTime(), fixedText, variableText, '', 'Sub' )
+
+class RemoteBackendTestCase( unittest.TestCase ):
+  """ Base class for the RemoteBackend test cases
+  """
+  def setUp( self ):
+    self.backend = RemoteBackend( { 'Interactive' : False, 'SleepTime' : 3600, 'Site' : 'DIRAC.Test.ch',
+                                    'BundleSize' : 2, 'MaxBufferedMessages' : 3, 'MaxPendingBundles' : 2 } )
+    self.backend._alive = False
+    self.backend._flushEvent.set()
+    self.backend.join()
+    self.backend._rpcClient = MagicMock()
+    self.backend._rpcClient.addMessages.return_value = S_OK()
+
+class RemoteBackendBuffering( RemoteBackendTestCase ):
+
+  def test_aggregation( self ):
+    for _ in range( 3 ):
+      self.backend.doMessage( _message( "Same error", "detail" ) )
+    self.backend.doMessage( _message( "Not sent", level = 'INFO' ) )
+    self.backend._bundleMessages()
+    bundle = self.backend._rpcClient.addMessages.call_args[0][0]
+    self.assertEqual( len( bundle ), 1 )
+    self.assertEqual( bundle[0][3], "Same error" )
+    self.assertEqual( bundle[0][4], "detail (repeated 3 times)" )
+    stats = self.backend.getStats()
+    # The repetitions are counted as sent messages
+    self.assertEqual( ( stats['Aggregated'], stats['Sent'], stats['Dropped'] ), ( 2, 3, 0 ) )
+
+  def test_backPressure( self ):
+    self.backend._rpcClient.addMessages.return_value = S_ERROR( "Server down" )
+    for i in range( 5 ):
+      self.backend.doMessage( _message( "Error %s" % i ) )
+    # The buffer only keeps the 3 most recent messages
+    self.assertEqual( self.backend.getStats()['Dropped'], 2 )
+    self.backend._bundleMessages()
+    self.assertEqual( len( self.backend._Transactions ), 2 )
+    for i in range( 2 ):
+      self.backend.doMessage( _message( "Other error %s" % i ) )
+    self.backend.doMessage( _message( "Other error 1" ) )
+    self.backend._bundleMessages()
+    # Only MaxPendingBundles bundles are kept while the server is unreachable
+    self.assertEqual( len( self.backend._Transactions ), 2 )
+    self.assertEqual( self.backend.getStats()['Dropped'], 4 )
+    self.backend._rpcClient.addMessages.return_value = S_OK()
+    self.backend._bundleMessages()
+    self.assertEqual( self.backend._Transactions, [] )
+    self.assertEqual( self.backend.getStats()['Sent'], 4 )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( RemoteBackendTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( RemoteBackendBuffering ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -11,7 +11,7 @@ import threading
 import time
 
 from DIRAC                          import S_OK, S_ERROR 
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.ShardedDictCache import ShardedDictCache
 
 __RCSID__  = '$Id:  $'
 
@@ -31,7 +31,7 @@ class RSSCache( object ):
     self.__updateFunc           = updateFunc
     
     # RSSCache
-    self.__rssCache       = DictCache()
+    self.__rssCache       = ShardedDictCache()
     self.__rssCacheStatus = [] # ( updateTime, message )
     self.__rssCacheLock   = threading.Lock()
     
@@ -12,7 +12,7 @@ import itertools
 import random
 
 from DIRAC                                                 import gLogger, S_OK, S_ERROR 
-from DIRAC.Core.Utilities.DictCache                        import DictCache
+from DIRAC.Core.Utilities.ShardedDictCache                 import ShardedDictCache
 from DIRAC.Core.Utilities.LockRing                         import LockRing
 from DIRAC.ResourceStatusSystem.Utilities.RssConfiguration import RssConfiguration
 
@@ -51,7 +51,7 @@ class Cache( object ):
     self.__validSeconds = 30
     
     # Cache
-    self.__cache       = DictCache()
+    self.__cache       = ShardedDictCache()
     self.__cacheLock   = LockRing()
     self.__cacheLock.getLock( self.__class__.__name__ )
   
@@ -14,9 +14,20 @@
     is called first. If it fails, no other plug-in is called to preserve consistency
     in the states of different catalogs. If no Master plug-in is declared, all the
     plug-ins are called (in case they implement the method) for the "write" methods.
+    With the /Services/Catalogs/ParallelWrite Operations option the plug-ins other than
+    the Master are called concurrently.
 
     For the "read" methods plug-ins are called one by one, starting with the Master
-    plug-in if declared, until getting a successful result.
+    plug-in if declared, until getting a successful result. The /Services/Catalogs/ReadMode
+    Operations option tells how:
+
+    - Sequential: each plug-in is called with all the LFNs ( default )
+    - Residual: each plug-in is called only with the LFNs the previous ones failed for
+    - Parallel: all the plug-ins are called concurrently with all the LFNs
+
+    In all the modes the result for an LFN is the one of the first plug-in that succeeded for it.
+    When plug-ins are called concurrently, the time saved compared to calling them one
+    by one is given in the LatencySaved key of the result.
 
     Most of the catalog plug-in methods are taking the first argument which represents
     the required LFNS. The LFNs argument can have one of the following forms:
@@ -45,9 +56,12 @@
 """
 
 import re
+import time
+import threading
 
 from DIRAC  import gLogger, gConfig, S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
+from DIRAC.Core.DISET.ThreadConfig                       import ThreadConfig
 from DIRAC.Core.Security.ProxyInfo                       import getVOfromProxyGroup
 from DIRAC.Resources.Catalog.Utilities                   import checkArgumentFormat
 from DIRAC.Resources.Catalog.FileCatalogFactory          import FileCatalogFactory
@@ -69,6 +83,8 @@ class FileCatalog( object ):
     self.vo = vo if vo else getVOfromProxyGroup().get( 'Value', None )
 
     self.opHelper = Operations( vo = self.vo )
+    self.readMode = self.opHelper.getValue( '/Services/Catalogs/ReadMode', 'Sequential' )
+    self.parallelWrite = self.opHelper.getValue( '/Services/Catalogs/ParallelWrite', False )
 
     if catalogs is None:
       catalogList = []
@@ -139,6 +155,40 @@ class FileCatalog( object ):
     else:
       raise AttributeError
 
+  def __executeConcurrently( self, calls ):
+    """ Execute the calls in parallel threads
+
+        :param list calls: list of ( catalogName, method, args, kws ) tuples
+        :return: ( { catalogName : result }, time saved compared to executing the calls one by one )
+    """
+    results = {}
+    times = {}
+    # The identity and setup of the caller go with the calls
+    threadConfig = ThreadConfig().dump()
+
+    def execute( catalogName, method, args, kws ):
+      ThreadConfig().load( threadConfig )
+      start = time.time()
+      try:
+        results[catalogName] = method( *args, **kws )
+      except Exception, x:
+        gLogger.exception( "FileCatalog: exception calling %s on %s" % ( self.call, catalogName ) )
+        results[catalogName] = S_ERROR( "Exception calling %s on %s: %s" % ( self.call, catalogName, str( x ) ) )
+      times[catalogName] = time.time() - start
+
+    start = time.time()
+    threads = [ threading.Thread( target = execute, args = call ) for call in calls ]
+    for thread in threads:
+      thread.setDaemon( True )
+      thread.start()
+    for thread in threads:
+      thread.join()
+    latencySaved = max( 0., sum( times.values() ) - ( time.time() - start ) )
+    gLogger.verbose( "FileCatalog: %s on %s catalogs concurrently saved %.3f s" % ( self.call,
+                                                                                 len( calls ),
+                                                                                 latencySaved ) )
+    return results, latencySaved
+
   def w_execute( self, *parms, **kws ):
     """ Write method executor.
     """
@@ -150,6 +200,7 @@ class FileCatalog( object ):
     allLfns = []
     lfnMapDict = {}
     masterResult = {}
+    latencySaved = None
     if not self.call in FileCatalog.no_lfn_methods:
       fileInfo = parms[0]
       result = checkArgumentFormat( fileInfo, generateMap = True )
@@ -161,6 +212,9 @@ class FileCatalog( object ):
       allLfns = fileInfo.keys()
       parms1 = parms[1:]
 
+    # ( catalogName, result ) in the order of the catalogs
+    results = []
+    concurrentCalls = []
     for catalogName, oCatalog, master in self.writeCatalogs:
 
       # Skip if the method is not implemented in this catalog
@@ -173,20 +227,36 @@ class FileCatalog( object ):
 
       method = getattr( oCatalog, self.call )
       if self.call in FileCatalog.no_lfn_methods:
-        result = method( *parms, **kws )
+        args = parms
       else:
-        result = method( fileInfo, *parms1, **kws )
+        args = ( fileInfo, ) + tuple( parms1 )
+      if self.parallelWrite and not master:
+        # The master catalog comes first, so these go once its failed LFNs are known
+        concurrentCalls.append( ( catalogName, method, args, kws ) )
+        continue
+
+      result = method( *args, **kws )
       if master:
         masterResult = result
-      if not result['OK']:
-        if master:
+        if not result['OK']:
           # If this is the master catalog and it fails we dont want to continue with the other catalogs
           gLogger.error( "FileCatalog.w_execute: Failed to execute call on master catalog",
                          "%s on %s: %s" % ( self.call, catalogName, result['Message'] ) )
           return result
-        else:
-          # Otherwise we keep the failed catalogs so we can update their state later
-          failedCatalogs[catalogName] = result['Message']
+        if allLfns:
+          # If this is the master catalog then we should not attempt the operation on other catalogs
+          for lfn in result['Value']['Failed']:
+            fileInfo.pop( lfn, None )
+      results.append( ( catalogName, result ) )
+
+    if concurrentCalls:
+      concurrentResults, latencySaved = self.__executeConcurrently( concurrentCalls )
+      results += [ ( call[0], concurrentResults[call[0]] ) for call in concurrentCalls ]
+
+    for catalogName, result in results:
+      if not result['OK']:
+        # We keep the failed catalogs so we can update their state later
+        failedCatalogs[catalogName] = result['Message']
       else:
         successfulCatalogs[catalogName] = result['Value']
 
@@ -195,9 +265,6 @@ class FileCatalog( object ):
           for lfn, message in result['Value']['Failed'].items():
             # Save the error message for the failed operations
             failed.setdefault( lfn, {} )[catalogName] = message
-            if master:
-              # If this is the master catalog then we should not attempt the operation on other catalogs
-              fileInfo.pop( lfn, None )
           for lfn, result in result['Value']['Successful'].items():
             # Save the result return for each file for the successful operations
             successful.setdefault( lfn, {} )[catalogName] = result
@@ -214,15 +281,17 @@ class FileCatalog( object ):
         for lfn in successful:
           successful[lfnMapDict.get( lfn, lfn )] = successful[lfn]
       resDict = {'Failed':failed, 'Successful':successful}
-      return S_OK( resDict )
+      result = S_OK( resDict )
     else:
       if failedCatalogs:
         result = S_ERROR( 'Failed to execute on some catalogs' )
         resDict = {'Failed':failedCatalogs, 'Successful':successfulCatalogs}
         result['Value'] = resDict
-        return result
       else:
-        return masterResult
+        result = masterResult
+    if result and latencySaved is not None:
+      result['LatencySaved'] = latencySaved
+    return result
 
 
   def r_execute( self, *parms, **kws ):
@@ -230,14 +299,28 @@ class FileCatalog( object ):
     """
     successful = {}
     failed = {}
-    for catalogName, oCatalog, _master in self.readCatalogs:
+    latencySaved = None
+    catalogs = [ ( catalogName, oCatalog ) for catalogName, oCatalog, _master in self.readCatalogs
+                 if oCatalog.hasCatalogMethod( self.call ) ]
 
-      # Skip if the method is not implemented in this catalog
-      if not oCatalog.hasCatalogMethod( self.call ):
-        continue
+    residual = self.readMode == 'Residual' and not self.call in FileCatalog.no_lfn_methods
+    if residual:
+      result = checkArgumentFormat( parms[0], generateMap = True )
+      if not result['OK']:
+        return result
+      fileInfo, lfnMapDict = result['Value']
+      # No need to check the LFNs again in the clients
+      kws['LFNChecking'] = False
 
-      method = getattr( oCatalog, self.call )
-      res = method( *parms, **kws )
+    if self.readMode == 'Parallel' and len( catalogs ) > 1:
+      calls = [ ( catalogName, getattr( oCatalog, self.call ), parms, kws ) for catalogName, oCatalog in catalogs ]
+      concurrentResults, latencySaved = self.__executeConcurrently( calls )
+      results = [ concurrentResults[catalogName] for catalogName, _oCatalog in catalogs ]
+    else:
+      # The results are got one at a time, as they are needed
+      results = self.__getReadResults( catalogs, successful, residual and fileInfo, parms, kws )
+
+    for res in results:
       if res['OK']:
         if 'Successful' in res['Value']:
           for key, item in res['Value']['Successful'].items():
@@ -250,7 +333,30 @@ class FileCatalog( object ):
           return res
     if not successful and not failed:
       return S_ERROR( "Failed to perform %s from any catalog" % self.call )
-    return S_OK( {'Failed':failed, 'Successful':successful} )
+    if residual and lfnMapDict:
+      # Restore original lfns if they were changed by normalization
+      for resDict in ( successful, failed ):
+        for lfn in resDict.keys():
+          if lfn in lfnMapDict:
+            resDict[lfnMapDict[lfn]] = resDict.pop( lfn )
+    result = S_OK( {'Failed':failed, 'Successful':successful} )
+    if latencySaved is not None:
+      result['LatencySaved'] = latencySaved
+    return result
+
+  def __getReadResults( self, catalogs, successful, fileInfo, parms, kws ):
+    """ Call the catalogs one by one. With fileInfo, only the LFNs that are not in successful,
+        as merged so far by the caller, are given to the next catalog
+    """
+    for catalogName, oCatalog in catalogs:
+      method = getattr( oCatalog, self.call )
+      if fileInfo:
+        lfns = dict( [ ( lfn, value ) for lfn, value in fileInfo.items() if lfn not in successful ] )
+        if not lfns:
+          break
+        yield method( lfns, *parms[1:], **kws )
+      else:
+        yield method( *parms, **kws )
 
   ###########################################################################################
   #
@@ -20,7 +20,8 @@ READ_METHODS = ['exists', 'isFile', 'getFileMetadata', 'getReplicas',
                 'findFilesByMetadata','getMetadataFields','getDirectoryUserMetadata',
                 'findDirectoriesByMetadata','getReplicasByMetadata','findFilesByMetadataDetailed',
                 'findFilesByMetadataWeb','getCompatibleMetadata','getMetadataSet', 'getDatasets',
-                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation']
+                'checkDataset', 'getDatasetParameters', 'getDatasetFiles', 'getDatasetAnnotation',
+                'getFileAncestors', 'getFileDescendents', 'getFileAncestorsBulk']
 
 WRITE_METHODS = ['createLink', 'removeLink', 'addFile', 'setFileStatus', 'addReplica', 'removeReplica',
                  'removeFile', 'setReplicaStatus', 'setReplicaHost', 'setReplicaProblematic', 'createDirectory',
@@ -172,6 +173,30 @@ class FileCatalogClient( FileCatalogClientBase ):
           entryDict[lfn] = detailsDict
     return result
 
+  def iterListDirectory( self, lfn, verbose = False, pageSize = 1000, timeout = 120 ):
+    """ Generator listing the given directory page by page, so that the contents of a huge
+        directory are never held in memory at once. Yields S_OK( page ) where the page is
+        the listDirectory dictionary of the directory, the SubDirs, Links and Datasets being
+        only in the first page, or S_ERROR after which it stops
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    lastFileID = 0
+    while True:
+      result = rpcClient.listDirectoryPage( lfn, verbose, lastFileID, pageSize )
+      if not result['OK']:
+        yield result
+        return
+      page = result['Value']
+      # Force returned directory entries to be LFNs
+      for entryType in ['Files', 'SubDirs', 'Links']:
+        entryDict = page[entryType]
+        for fname in entryDict.keys():
+          entryDict[os.path.join( lfn, os.path.basename( fname ) )] = entryDict.pop( fname )
+      lastFileID = page.pop( 'LastFileID' )
+      yield S_OK( page )
+      if not lastFileID:
+        return
+
   @checkCatalogArguments
   def getDirectoryMetadata( self, lfns, timeout = 120 ):
     ''' Get standard directory metadata
@@ -240,6 +265,24 @@ class FileCatalogClient( FileCatalogClientBase ):
     else:
       return S_ERROR( 'Illegal return value type %s' % type( result['Value'] ) )
 
+  def iterFindFilesByMetadata( self, metaDict, path = '/', pageSize = 1000, timeout = 120 ):
+    """ Generator finding the files given the meta data query and the path page by page.
+        Yields S_OK( list of LFNs ), or S_ERROR after which it stops
+    """
+    rpcClient = self._getRPC( timeout = timeout )
+    lastFileID = 0
+    selectionID = ''
+    while True:
+      result = rpcClient.findFilesByMetadataPage( metaDict, path, lastFileID, pageSize, selectionID )
+      if not result['OK']:
+        yield result
+        return
+      lastFileID = result['Value']['LastFileID']
+      selectionID = result['Value'].get( 'SelectionID', '' )
+      yield S_OK( result['Value']['LFNs'] )
+      if not lastFileID:
+        return
+
   @checkCatalogArguments
   def getFileUserMetadata( self, path, timeout = 120 ):
     """Get the meta data attached to a file, but also to
@@ -428,6 +471,12 @@ class FileCatalogClient( FileCatalogClientBase ):
     """ Get the status for the supplied replicas """
     return self._getRPC( timeout = timeout ).getFileAncestors( lfns, depths )
 
+  @checkCatalogArguments
+  def getFileAncestorsBulk( self, lfns, depths = [], timeout = 600 ):
+    """ Get the ancestors of a large number of files, e.g. the input files of a transformation
+    """
+    return self._getRPC( timeout = timeout ).getFileAncestorsBulk( lfns, depths )
+
   @checkCatalogArguments
   def getFileDescendents( self, lfns, depths, timeout = 120 ):
     """ Get the status for the supplied replicas """
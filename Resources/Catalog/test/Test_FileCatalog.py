@@ -0,0 +1,100 @@
+""" Test for the dispatching of the calls to the catalogs by the FileCatalog
+"""
+
+import time
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.Resources.Catalog.FileCatalog import FileCatalog
+
+class FakeCatalog( object ):
+  """ Catalog knowing some LFNs, and taking some time to answer
+  """
+  def __init__( self, lfns, delay = 0. ):
+    self.lfns = lfns
+    self.delay = delay
+    self.calls = []
+
+  def hasCatalogMethod( self, methodName ):
+    return True
+
+  def __call( self, lfns, **kws ):
+    self.calls.append( sorted( lfns ) )
+    time.sleep( self.delay )
+    successful = dict( [ ( lfn, self.lfns[lfn] ) for lfn in lfns if lfn in self.lfns ] )
+    failed = dict( [ ( lfn, 'No such file or directory' ) for lfn in lfns if lfn not in self.lfns ] )
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  getReplicas = __call
+  addFile = __call
+
+class FileCatalogTestCase( unittest.TestCase ):
+  """ Base class for the FileCatalog test cases
+  """
+  def setUp( self ):
+    FileCatalog.ro_methods.add( 'getReplicas' )
+    FileCatalog.write_methods.add( 'addFile' )
+    self.fc = FileCatalog.__new__( FileCatalog )
+    self.fc.readMode = 'Sequential'
+    self.fc.parallelWrite = False
+    self.lfc = FakeCatalog( { '/vo/a' : 'LFC', '/vo/b' : 'LFC' }, 0.2 )
+    self.dfc = FakeCatalog( { '/vo/a' : 'DFC', '/vo/c' : 'DFC' }, 0.2 )
+    self.fc.readCatalogs = [ ( 'LFC', self.lfc, True ), ( 'DFC', self.dfc, False ) ]
+    self.fc.writeCatalogs = [ ( 'LFC', self.lfc, True ), ( 'DFC', self.dfc, False ) ]
+
+class ReadModes( FileCatalogTestCase ):
+
+  def __check( self, result, missingLFN = '/vo/d' ):
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'], { '/vo/a' : 'LFC', '/vo/b' : 'LFC', '/vo/c' : 'DFC' } )
+    self.assertEqual( result['Value']['Failed'], { missingLFN : 'No such file or directory' } )
+
+  def test_sequential( self ):
+    self.__check( self.fc.getReplicas( [ '/vo/a', '/vo/b', '/vo/c', '/vo/d' ] ) )
+    self.assertEqual( self.dfc.calls, [ [ '/vo/a', '/vo/b', '/vo/c', '/vo/d' ] ] )
+
+  def test_residual( self ):
+    self.fc.readMode = 'Residual'
+    self.__check( self.fc.getReplicas( [ '/vo/a', '/vo/b', '/vo/c', '/vo//d' ] ), missingLFN = '/vo//d' )
+    # Only what the first catalog did not find goes to the second one, and the LFNs are given back as they came
+    self.assertEqual( self.dfc.calls, [ [ '/vo/c', '/vo/d' ] ] )
+
+  def test_parallel( self ):
+    self.fc.readMode = 'Parallel'
+    start = time.time()
+    result = self.fc.getReplicas( [ '/vo/a', '/vo/b', '/vo/c', '/vo/d' ] )
+    self.assertTrue( time.time() - start < 0.35 )
+    self.__check( result )
+    self.assertTrue( result['LatencySaved'] > 0.1 )
+
+class ParallelWrite( FileCatalogTestCase ):
+
+  def test_write( self ):
+    self.fc.parallelWrite = True
+    third = FakeCatalog( { '/vo/a' : 'Third' }, 0.2 )
+    self.fc.writeCatalogs.append( ( 'Third', third, False ) )
+    result = self.fc.addFile( { '/vo/a' : {}, '/vo/b' : {} } )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'], { '/vo/a' : { 'LFC' : 'LFC', 'DFC' : 'DFC', 'Third' : 'Third' },
+                                                       '/vo/b' : { 'LFC' : 'LFC' } } )
+    self.assertEqual( sorted( result['Value']['Failed']['/vo/b'] ), [ 'DFC', 'Third' ] )
+    self.assertTrue( result['LatencySaved'] > 0.1 )
+
+  def test_masterFailed( self ):
+    self.fc.parallelWrite = True
+    self.fc.addFile( { '/vo/a' : {}, '/vo/c' : {} } )
+    # The other catalogs do not get what the master failed for
+    self.assertEqual( self.dfc.calls, [ [ '/vo/a' ] ] )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( FileCatalogTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( ReadModes ) )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( ParallelWrite ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
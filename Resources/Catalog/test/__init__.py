@@ -0,0 +1 @@
+""" DIRAC.Resources.Catalog.test package """
@@ -18,7 +18,7 @@ from DIRAC.Core.Utilities.Pfn import pfnparse
 from DIRAC.Core.Utilities.SiteSEMapping import getSEsForSite
 from DIRAC.Core.Security.ProxyInfo import getVOfromProxyGroup
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.ShardedDictCache import ShardedDictCache
 from DIRAC.Resources.Storage.Utilities import checkArgumentFormat
 from DIRAC.Resources.Catalog.FileCatalog import FileCatalog
 from DIRAC.Core.Security.ProxyInfo import getProxyInfo
@@ -29,7 +29,7 @@ from DIRAC.AccountingSystem.Client.DataStoreClient import gDataStoreClient
 class StorageElementCache( object ):
 
   def __init__( self ):
-    self.seCache = DictCache()
+    self.seCache = ShardedDictCache()
 
   def __call__( self, name, protocols = None, vo = None, hideExceptions = False ):
     self.seCache.purgeExpired( expiredInSeconds = 60 )
@@ -1,6 +1,8 @@
 """
   JobReport class encapsulates various methods of the job status reporting blah, blah, blah...
 
+  The cached status of many JobReport objects can be sent with a single call by the
+  opt-in sendStoredStatusInfoBulk function, the JobReport methods send one job at a time.
 """
 
 __RCSID__ = "$Id$"
@@ -97,8 +99,9 @@ class JobReport( object ):
 
     return S_OK()
 
-  def sendStoredStatusInfo( self ):
-    """ Send the job status information stored in the internal cache
+  def getStoredStatusInfo( self ):
+    """ Get the job status information stored in the internal cache as the
+        statusDict expected by the JobStateUpdate service
     """
 
     statusDict = {}
@@ -112,14 +115,25 @@ class JobReport( object ):
                             'MinorStatus': '',
                             'ApplicationStatus': appStatus,
                             'Source': self.source }
+    return statusDict
+
+  def clearStoredStatusInfo( self ):
+    """ Empty the internal status containers once their content has been sent
+    """
+    self.jobStatusInfo = []
+    self.appStatusInfo = []
+
+  def sendStoredStatusInfo( self ):
+    """ Send the job status information stored in the internal cache
+    """
 
+    statusDict = self.getStoredStatusInfo()
     if statusDict:
       jobMonitor = RPCClient( 'WorkloadManagement/JobStateUpdate', timeout = 60 )
       result = jobMonitor.setJobStatusBulk( self.jobID, statusDict )
       if result['OK']:
         # Empty the internal status containers
-        self.jobStatusInfo = []
-        self.appStatusInfo = []
+        self.clearStoredStatusInfo()
       return result
 
     else:
@@ -202,3 +216,34 @@ class JobReport( object ):
         return S_ERROR( 'Could not create ForwardDISET operation' )
 
     return S_OK( forwardDISETOp )
+
+def sendStoredStatusInfoBulk( jobReports ):
+  """ Send the job status information stored in the internal cache of many JobReport
+      objects, e.g. of all the jobs of a node, with a single call to the JobStateUpdate service.
+      The caches of the jobs successfully updated are emptied.
+
+      This path is opt-in: JobReport.sendStoredStatusInfo, and so the JobWrapper and the
+      JobAgent, keep sending the status of their single job with setJobStatusBulk, whose
+      rpcStub is also the one used for the ForwardDISET failover requests. Components
+      reporting for many jobs have to keep their JobReport objects with sendFlag = False
+      and call this function to flush them together.
+  """
+  jobsStatusDict = {}
+  for jobReport in jobReports:
+    if not jobReport.jobID:
+      continue
+    statusDict = jobReport.getStoredStatusInfo()
+    if statusDict:
+      jobsStatusDict.setdefault( jobReport.jobID, {} ).update( statusDict )
+  if not jobsStatusDict:
+    return S_OK( 'Empty' )
+
+  jobMonitor = RPCClient( 'WorkloadManagement/JobStateUpdate', timeout = 120 )
+  result = jobMonitor.setJobsStatusBulk( jobsStatusDict )
+  if not result['OK']:
+    return result
+  successful = set( result['Value']['Successful'] )
+  for jobReport in jobReports:
+    if jobReport.jobID in successful:
+      jobReport.clearStoredStatusInfo()
+  return result
@@ -158,15 +158,10 @@ class Limiter( object ):
       if attName not in self.jobDB.jobAttributeNames:
         self.log.error( "Attribute %s does not exist. Check the job limits" % attName )
         continue
-      cK = "Running:%s:%s" % ( siteName, attName )
-      data = self.condCache.get( cK )
-      if not data:
-        result = self.jobDB.getCounters( 'Jobs', [ attName ], { 'Site' : siteName, 'Status' : [ 'Running', 'Matched', 'Stalled' ] } )
-        if not result[ 'OK' ]:
-          return result
-        data = result[ 'Value' ]
-        data = dict( [ ( k[0][ attName ], k[1] )  for k in data ] )
-        self.condCache.add( cK, 10, data )
+      result = self.__getRunningCounters( siteName, attName )
+      if not result[ 'OK' ]:
+        return result
+      data = result[ 'Value' ]
       for attValue in limitsDict[ attName ]:
         limit = limitsDict[ attName ][ attValue ]
         running = data.get( attValue, 0 )
@@ -179,6 +174,76 @@ class Limiter( object ):
     # negCond is something like : {'JobType': ['Merge']}
     return S_OK( negCond )
 
+  def __getRunningCounters( self, siteName, attName ):
+    """ Get the number of jobs deployed at the site for each value of the attribute
+    """
+    cK = "Running:%s:%s" % ( siteName, attName )
+    data = self.condCache.get( cK )
+    if data is None:
+      result = self.jobDB.getCounters( 'Jobs', [ attName ], { 'Site' : siteName, 'Status' : [ 'Running', 'Matched', 'Stalled' ] } )
+      if not result[ 'OK' ]:
+        return result
+      data = result[ 'Value' ]
+      data = dict( [ ( k[0][ attName ], k[1] )  for k in data ] )
+      self.condCache.add( cK, 10, data )
+    return S_OK( data )
+
+  def getMatchingMarginForSite( self, siteName ):
+    """ Get how many jobs can be matched for the site before the negative conditions have
+        to be generated again: the least number of jobs still missing to reach one of the
+        running limits, or 1 if there are matching delays for the site.
+        Returns None if the site has no limit
+    """
+    if self.__opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True ):
+      result = self.__extractCSData( "%s/%s" % ( self.__matchingDelaySection, siteName ) )
+      if not result[ 'OK' ] or result[ 'Value' ]:
+        return 1
+    if not self.__opsHelper.getValue( "JobScheduling/CheckJobLimits", True ):
+      return None
+    result = self.__extractCSData( "%s/%s" % ( self.__runningLimitSection, siteName ) )
+    if not result[ 'OK' ]:
+      return 1
+    limitsDict = result[ 'Value' ]
+    margin = None
+    for attName in limitsDict:
+      if attName not in self.jobDB.jobAttributeNames:
+        continue
+      result = self.__getRunningCounters( siteName, attName )
+      if not result[ 'OK' ]:
+        return 1
+      data = result[ 'Value' ]
+      for attValue in limitsDict[ attName ]:
+        missing = limitsDict[ attName ][ attValue ] - data.get( attValue, 0 )
+        # The limits already reached are in the negative conditions
+        if missing > 0 and ( margin is None or missing < margin ):
+          margin = missing
+    return margin
+
+  def addMatchedJobs( self, siteName, jobIDs ):
+    """ Count jobs just matched at the site in the cached number of deployed jobs,
+        so that the following matches of the cache lifetime see them
+    """
+    result = self.__extractCSData( "%s/%s" % ( self.__runningLimitSection, siteName ) )
+    if not result[ 'OK' ]:
+      return result
+    attNames = []
+    for attName in result[ 'Value' ]:
+      if self.condCache.get( "Running:%s:%s" % ( siteName, attName ) ) is not None:
+        attNames.append( attName )
+    if not attNames or not jobIDs:
+      return S_OK()
+    result = self.jobDB.getAttributesForJobList( jobIDs, attNames )
+    if not result[ 'OK' ]:
+      return result
+    for attName in attNames:
+      data = self.condCache.get( "Running:%s:%s" % ( siteName, attName ) )
+      if data is None:
+        continue
+      for jobAttrs in result[ 'Value' ].values():
+        attValue = jobAttrs.get( attName )
+        data[ attValue ] = data.get( attValue, 0 ) + 1
+    return S_OK()
+
   def updateDelayCounters( self, siteName, jid ):
     # Get the info from the CS
     siteSection = "%s/%s" % ( self.__matchingDelaySection, siteName )
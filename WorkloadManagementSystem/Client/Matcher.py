@@ -127,6 +127,125 @@ class Matcher( object ):
     return resultDict
 
 
+  def selectJobs( self, resourceDescription, credDict, maxJobs ):
+    """ Select up to maxJobs jobs matching the resource capacity in one go (for pilots with many slots).
+        The jobs are matched in rounds no larger than the margin left by the site limits, which
+        are evaluated again after each round. The job attributes, JDLs and optimizer parameters
+        are retrieved with bulk queries.
+        Returns a list of dictionaries like the one returned by selectJob
+    """
+
+    startTime = time.time()
+
+    resourceDict = self._getResourceDict( resourceDescription, credDict )
+    siteName = resourceDict['Site']
+    checkDelay = self.opsHelper.getValue( "JobScheduling/CheckMatchingDelay", True )
+
+    jobAttrs = {}
+    waitingJobIDs = []
+    numMatched = 0
+    while len( waitingJobIDs ) < maxJobs:
+      numJobs = maxJobs - len( waitingJobIDs )
+      margin = self.limiter.getMatchingMarginForSite( siteName )
+      if margin is not None:
+        numJobs = min( numJobs, margin )
+      negativeCond = self.limiter.getNegativeCondForSite( siteName )
+      result = self.tqDB.matchAndGetJobs( resourceDict, numJobs, negativeCond = negativeCond )
+      if not result['OK']:
+        if waitingJobIDs:
+          self.log.error( "Failed to match more jobs", result['Message'] )
+          break
+        raise RuntimeError( result['Message'] )
+      result = result['Value']
+      if not result['matchFound']:
+        break
+
+      jobIDs = [ jobID for jobID, _tqID in result['jobs'] ]
+      numMatched += len( jobIDs )
+      resAtt = self.jobDB.getAttributesForJobList( jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'] )
+      if not resAtt['OK']:
+        self.__rescheduleJobs( waitingJobIDs + jobIDs )
+        raise RuntimeError( 'Could not retrieve job attributes' )
+      jobAttrs.update( resAtt['Value'] )
+      roundJobIDs = []
+      for jobID in jobIDs:
+        if jobID not in jobAttrs:
+          self.log.error( 'No attributes returned for job', str( jobID ) )
+        elif jobAttrs[jobID]['Status'] != 'Waiting':
+          self.log.error( 'Job matched by the TQ is not in Waiting state', str( jobID ) )
+        else:
+          roundJobIDs.append( jobID )
+      waitingJobIDs.extend( roundJobIDs )
+
+      self.limiter.addMatchedJobs( siteName, roundJobIDs )
+      if checkDelay:
+        for jobID in roundJobIDs:
+          self.limiter.updateDelayCounters( siteName, jobID )
+      if len( jobIDs ) < numJobs:
+        # The matching task queues are exhausted
+        break
+
+    if not waitingJobIDs:
+      if numMatched:
+        raise RuntimeError( "None of the matched jobs is in Waiting state" )
+      self.log.info( "No match found" )
+      return []
+
+    # The JDLs are retrieved before the jobs are declared as matched, the jobs without
+    # a JDL are rescheduled instead of being left in the Matched state
+    result = self.jobDB.getJobsJDL( waitingJobIDs )
+    if not result['OK']:
+      self.__rescheduleJobs( waitingJobIDs )
+      raise RuntimeError( "Failed to get the job JDLs" )
+    jdls = result['Value']
+    missingJDLs = [ jobID for jobID in waitingJobIDs if jobID not in jdls ]
+    if missingJDLs:
+      self.log.error( "Failed to get the job JDLs", str( missingJDLs ) )
+      self.__rescheduleJobs( missingJDLs )
+      waitingJobIDs = [ jobID for jobID in waitingJobIDs if jobID in jdls ]
+      if not waitingJobIDs:
+        raise RuntimeError( "Failed to get the job JDLs" )
+
+    self._reportJobsStatus( resourceDict, waitingJobIDs )
+
+    resOpt = self.jobDB.getJobsOptParameters( waitingJobIDs )
+    optParams = resOpt['Value'] if resOpt['OK'] else {}
+
+    pilotInfoReportedFlag = resourceDict.get( 'PilotInfoReportedFlag', False )
+    if not pilotInfoReportedFlag:
+      self._updatePilotInfo( resourceDict )
+
+    resultList = []
+    for jobID in waitingJobIDs:
+      resultDict = {}
+      resultDict['JDL'] = jdls[jobID]
+      resultDict['JobID'] = jobID
+      resultDict.update( optParams.get( jobID, {} ) )
+      self._updatePilotJobMapping( resourceDict, jobID )
+      resultDict['DN'] = jobAttrs[jobID]['OwnerDN']
+      resultDict['Group'] = jobAttrs[jobID]['OwnerGroup']
+      resultDict['PilotInfoReportedFlag'] = True
+      resultList.append( resultDict )
+
+    matchTime = time.time() - startTime
+    self.log.info( "Match time for %s jobs: [%s]" % ( len( resultList ), str( matchTime ) ) )
+    gMonitor.addMark( "matchTime", matchTime )
+
+    return resultList
+
+  def __rescheduleJobs( self, jobIDs ):
+    """ Reschedule jobs taken out of the task queues that can not be served, so that
+        they are inserted again instead of being lost
+    """
+    if not jobIDs:
+      return
+    result = self.jobDB.rescheduleJobs( jobIDs )
+    if not result['OK']:
+      self.log.error( "Failed to reschedule jobs taken out of the task queues", "%s: %s" % ( jobIDs, result['Message'] ) )
+    else:
+      self.log.info( "Rescheduled jobs taken out of the task queues", str( jobIDs ) )
+
+
   def _getResourceDict( self, resourceDescription, credDict ):
     """ from resourceDescription to resourceDict (just various mods)
     """
@@ -237,6 +356,27 @@ class Matcher( object ):
     else:
       self.log.verbose( "Added logging record for jobID %s" % jobID )
 
+  def _reportJobsStatus( self, resourceDict, jobIDs ):
+    """ Reports the status of several matched jobs in jobDB (with a single update) and jobLoggingDB
+
+        Do not fail if errors happen here
+    """
+    attNames = ['Status', 'MinorStatus', 'ApplicationStatus', 'Site']
+    attValues = ['Matched', 'Assigned', 'Unknown', resourceDict['Site']]
+    result = self.jobDB.setJobsAttributes( jobIDs, attNames, attValues )
+    if not result['OK']:
+      self.log.error( "Problem reporting job status", "setJobsAttributes, jobIDs = %s: %s" % ( jobIDs, result['Message'] ) )
+    else:
+      self.log.verbose( "Set job attributes for jobIDs %s" % jobIDs )
+
+    for jobID in jobIDs:
+      result = self.jlDB.addLoggingRecord( jobID,
+                                           status = 'Matched',
+                                           minor = 'Assigned',
+                                           source = 'Matcher' )
+      if not result['OK']:
+        self.log.error( "Problem reporting job status", "addLoggingRecord, jobID = %s: %s" % ( jobID, result['Message'] ) )
+
 
   def _checkMask( self, resourceDict ):
     """ Check the mask: are we allowed to run normal jobs?
@@ -147,6 +147,61 @@ class MatcherTestCase( ClientsTestCase ):
 
     self.assertEqual( res, resExpected )
 
+  def test_selectJobs( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = {'Site': 'DIRAC.Jenkins.ch'} )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getMatchingMarginForSite.return_value = None
+    self.tqDBMock.matchAndGetJobs.side_effect = [ S_OK( {'matchFound': True,
+                                                         'jobs': [( 1, 10 ), ( 2, 10 ), ( 3, 11 )],
+                                                         'tqMatch': {}} ),
+                                                  S_OK( {'matchFound': False, 'jobs': [], 'tqMatch': {}} ) ]
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK( {1: {'OwnerDN': 'dn', 'OwnerGroup': 'g', 'Status': 'Waiting'},
+                                                                 2: {'OwnerDN': 'dn', 'OwnerGroup': 'g', 'Status': 'Killed'},
+                                                                 3: {'OwnerDN': 'dn3', 'OwnerGroup': 'g', 'Status': 'Waiting'}} )
+    self.jobDBMock.setJobsAttributes.return_value = S_OK( 2 )
+    self.jlDBMock.addLoggingRecord.return_value = S_OK()
+    self.jobDBMock.getJobsJDL.return_value = S_OK( {1: '[jdl1]', 3: '[jdl3]'} )
+    self.jobDBMock.getJobsOptParameters.return_value = S_OK( {1: {'opt': 'v'}, 3: {}} )
+    self.opsHelperMock.getValue.return_value = False
+
+    res = self.matcher.selectJobs( {}, {}, 3 )
+    self.assertEqual( [ r['JobID'] for r in res ], [1, 3] )
+    self.assertEqual( res[0]['JDL'], '[jdl1]' )
+    self.assertEqual( res[0]['opt'], 'v' )
+    self.assertEqual( res[1]['DN'], 'dn3' )
+    self.jobDBMock.setJobsAttributes.assert_called_once_with( [1, 3],
+                                                              ['Status', 'MinorStatus', 'ApplicationStatus', 'Site'],
+                                                              ['Matched', 'Assigned', 'Unknown', 'DIRAC.Jenkins.ch'] )
+    # The job not in Waiting state is replaced by a second round of one job
+    self.assertEqual( self.tqDBMock.matchAndGetJobs.call_args_list[1][0][1], 1 )
+
+  def test_selectJobsLimits( self ):
+
+    self.matcher._getResourceDict = MagicMock( return_value = {'Site': 'DIRAC.Jenkins.ch'} )
+    self.matcher.limiter = MagicMock()
+    self.matcher.limiter.getMatchingMarginForSite.side_effect = [ 2, 1, 1 ]
+    self.tqDBMock.matchAndGetJobs.side_effect = [ S_OK( {'matchFound': True, 'jobs': [( 1, 10 ), ( 2, 10 )], 'tqMatch': {}} ),
+                                                  S_OK( {'matchFound': True, 'jobs': [( 3, 11 )], 'tqMatch': {}} ),
+                                                  S_OK( {'matchFound': False, 'jobs': [], 'tqMatch': {}} ) ]
+    self.jobDBMock.getAttributesForJobList.return_value = S_OK( dict( [ ( jobID, {'OwnerDN': 'dn', 'OwnerGroup': 'g',
+                                                                                  'Status': 'Waiting'} )
+                                                                        for jobID in ( 1, 2, 3 ) ] ) )
+    self.jobDBMock.getJobsJDL.return_value = S_OK( {1: '[jdl1]', 2: '[jdl2]'} )
+    self.jobDBMock.getJobsOptParameters.return_value = S_OK( {} )
+    self.jobDBMock.rescheduleJobs.return_value = S_OK()
+    self.opsHelperMock.getValue.return_value = False
+
+    res = self.matcher.selectJobs( {}, {}, 5 )
+    # The limits are evaluated again after every round, the jobs without JDL are rescheduled
+    self.assertEqual( [ call[0][1] for call in self.tqDBMock.matchAndGetJobs.call_args_list ], [2, 1, 1] )
+    self.assertEqual( self.matcher.limiter.getNegativeCondForSite.call_count, 3 )
+    self.assertEqual( [ r['JobID'] for r in res ], [1, 2] )
+    self.jobDBMock.rescheduleJobs.assert_called_once_with( [3] )
+    self.jobDBMock.setJobsAttributes.assert_called_once_with( [1, 2],
+                                                              ['Status', 'MinorStatus', 'ApplicationStatus', 'Site'],
+                                                              ['Matched', 'Assigned', 'Unknown', 'DIRAC.Jenkins.ch'] )
+
 #############################################################################
 
 class SandboxStoreTestCaseSuccess( ClientsTestCase ):
@@ -480,6 +480,34 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.getJobOptParameters: failed to retrieve parameters' )
 
+#############################################################################
+  def getJobsOptParameters( self, jobIDList, paramList = None ):
+    """ Get optimizer parameters for the given jobs with a single query.
+        Returns an S_OK structure with a dictionary of dictionaries as its Value:
+        ValueDict[jobID][parameter_name] = parameter_value
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in (%s)" % jobList
+    if paramList:
+      ret = self._escapeValues( paramList )
+      if not ret['OK']:
+        return ret
+      cmd += " and Name in (%s)" % ','.join( ret['Value'] )
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return S_ERROR( 'JobDB.getJobsOptParameters: failed to retrieve parameters' )
+    resultDict = dict( [ ( int( jobID ), {} ) for jobID in jobIDList ] )
+    for jobID, name, value in result['Value']:
+      try:
+        resultDict[int( jobID )][name] = value.tostring()
+      except Exception:
+        resultDict[int( jobID )][name] = value
+    return S_OK( resultDict )
+
 #############################################################################
 
   def getInputData( self, jobID ):
@@ -660,6 +688,35 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.setAttributes: failed to set attribute' )
 
+#############################################################################
+  def setJobsAttributes( self, jobIDList, attrNames, attrValues, update = False ):
+    """ Set the same attribute values for all the jobs in jobIDList with a single UPDATE.
+        The LastUpdate time stamp is refreshed if explicitely requested
+    """
+    if not jobIDList:
+      return S_OK( 0 )
+    if len( attrNames ) != len( attrValues ):
+      return S_ERROR( 'JobDB.setJobsAttributes: incompatible Argument length' )
+
+    attr = []
+    for i in range( len( attrNames ) ):
+      ret = self._escapeString( attrValues[i] )
+      if not ret['OK']:
+        return ret
+      attr.append( "%s=%s" % ( attrNames[i], ret['Value'] ) )
+    if update:
+      attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
+    if len( attr ) == 0:
+      return S_ERROR( 'JobDB.setJobsAttributes: Nothing to do' )
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in ( %s )' % ( ', '.join( attr ), jobList )
+    res = self._update( cmd )
+    if res['OK']:
+      return res
+    else:
+      return S_ERROR( 'JobDB.setJobsAttributes: failed to set attributes' )
+
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
     """ Set status of the job specified by its jobID
@@ -733,6 +790,26 @@ class JobDB( DB ):
     result = self._update( req )
     return result
 
+#############################################################################
+  def setJobsExecTime( self, timeField, jobIDList, execDate ):
+    """ Set the StartExecTime or EndExecTime time stamp of all the jobs in jobIDList
+        that don't have it yet with a single UPDATE
+    """
+    if timeField not in ( 'StartExecTime', 'EndExecTime' ):
+      return S_ERROR( 'JobDB.setJobsExecTime: invalid time stamp %s' % timeField )
+    if not jobIDList:
+      return S_OK( 0 )
+
+    ret = self._escapeString( execDate )
+    if not ret['OK']:
+      return ret
+    execDate = ret['Value']
+
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    req = "UPDATE Jobs SET %s=%s WHERE JobID in ( %s ) AND %s IS NULL" % ( timeField, execDate,
+                                                                           jobList, timeField )
+    return self._update( req )
+
 #############################################################################
   def setJobParameter( self, jobID, key, value ):
     """ Set a parameter specified by name,value pair for the job JobID
@@ -974,6 +1051,24 @@ class JobDB( DB ):
     else:
       return result
 
+#############################################################################
+  def getJobsJDL( self, jobIDList, original = False ):
+    """ Get the JDLs for the jobs in jobIDList with a single query.
+        Returns S_OK( { jobID : JDL } )
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    if original:
+      cmd = "SELECT JobID, OriginalJDL FROM JobJDLs WHERE JobID in (%s)" % jobList
+    else:
+      cmd = "SELECT JobID, JDL FROM JobJDLs WHERE JobID in (%s)" % jobList
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    return S_OK( dict( [ ( int( jobID ), jdl ) for jobID, jdl in result['Value'] ] ) )
+
 #############################################################################
   def insertNewJobIntoDB( self, jdl, owner, ownerDN, ownerGroup, diracSetup ):
     """ Insert the initial JDL into the Job database,
@@ -2,8 +2,10 @@
     The following methods are provided
 
     addLoggingRecord()
+    addLoggingRecords()
     getJobLoggingInfo()
     getWMSTimeStamps()
+    getLastWMSTimeStamps()
 """
 
 import time
@@ -32,24 +34,10 @@ class JobLoggingDB( DB ):
     self.gLogger = gLogger
 
 #############################################################################
-  def addLoggingRecord( self,
-                       jobID,
-                       status = 'idem',
-                       minor = 'idem',
-                       application = 'idem',
-                       date = '',
-                       source = 'Unknown' ):
-
-    """ Add a new entry to the JobLoggingDB table. One, two or all the three status
-        components can be specified. Optionaly the time stamp of the status can
-        be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
-        as datetime.datetime object. If the time stamp is not provided the current
-        UTC time is used.
+  def __getStatusTime( self, date ):
+    """ Get the status time and its order number in the LoggingInfo table for a time stamp
+        given as a string or a datetime.datetime object, or the current UTC time if not given
     """
-
-    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
-    self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
-
     if not date:
       # Make the UTC datetime string and float
       _date = Time.dateTime()
@@ -77,12 +65,61 @@ class JobLoggingDB( DB ):
         epoc = time.mktime( _date.timetuple() ) - MAGIC_EPOC_NUMBER
         time_order = round( epoc, 3 )
 
+    return _date, time_order
+
+#############################################################################
+  def addLoggingRecord( self,
+                       jobID,
+                       status = 'idem',
+                       minor = 'idem',
+                       application = 'idem',
+                       date = '',
+                       source = 'Unknown' ):
+
+    """ Add a new entry to the JobLoggingDB table. One, two or all the three status
+        components can be specified. Optionaly the time stamp of the status can
+        be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
+        as datetime.datetime object. If the time stamp is not provided the current
+        UTC time is used.
+    """
+
+    event = 'status/minor/app=%s/%s/%s' % ( status, minor, application )
+    self.gLogger.info( "Adding record for job " + str( jobID ) + ": '" + event + "' from " + source )
+
+    _date, time_order = self.__getStatusTime( date )
+
     cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
           "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
            ( int( jobID ), status, minor, application, str( _date ), time_order, source )
 
     return self._update( cmd )
 
+#############################################################################
+  def addLoggingRecords( self, records ):
+    """ Add many entries to the JobLoggingDB table with a single INSERT. The records
+        are ( jobID, status, minor, application, date, source ) tuples with the same
+        meaning as the addLoggingRecord arguments
+    """
+    if not records:
+      return S_OK( 0 )
+
+    values = []
+    for jobID, status, minor, application, date, source in records:
+      _date, time_order = self.__getStatusTime( date )
+      result = self._escapeValues( [ status, minor, application, str( _date ), source ] )
+      if not result['OK']:
+        return result
+      status, minor, application, _date, source = result['Value']
+      values.append( "(%d,%s,%s,%s,%s,%f,%s)" % ( int( jobID ), status, minor, application,
+                                                 _date, time_order, source ) )
+    self.gLogger.info( "Adding %d logging records for %d jobs" % ( len( records ),
+                                                                   len( set( [ r[0] for r in records ] ) ) ) )
+
+    cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES %s" % ','.join( values )
+
+    return self._update( cmd )
+
 #############################################################################
   def getJobLoggingInfo( self, jobID ):
     """ Returns a Status,MinorStatus,ApplicationStatus,StatusTime,StatusSource tuple
@@ -160,3 +197,22 @@ class JobLoggingDB( DB ):
       result['LastTime'] = "Unknown"
 
     return S_OK( result )
+
+#############################################################################
+  def getLastWMSTimeStamps( self, jobIDList ):
+    """ Get the time stamp of the latest status transition of each job in the list
+        return a {jobID:timestamp} dictionary, without the jobs that have no logging info
+    """
+    if not jobIDList:
+      return S_OK( {} )
+
+    jobString = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = 'SELECT JobID,MAX(StatusTimeOrder) FROM LoggingInfo WHERE JobID IN (%s) GROUP BY JobID' % jobString
+    resCmd = self._query( cmd )
+    if not resCmd['OK']:
+      return resCmd
+
+    result = {}
+    for jobID, etime in resCmd['Value']:
+      result[int( jobID )] = str( etime + MAGIC_EPOC_NUMBER )
+    return S_OK( result )
@@ -8,9 +8,10 @@ import random
 from DIRAC  import gConfig, gLogger, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.private.SharesCorrector import SharesCorrector
 from DIRAC.WorkloadManagementSystem.private.Queues import maxCPUSegments
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
 from DIRAC.ConfigurationSystem.Client.Helpers.Operations import Operations
 from DIRAC.Core.Utilities import List
-from DIRAC.Core.Utilities.DictCache import DictCache
+from DIRAC.Core.Utilities.ShardedDictCache import ShardedDictCache
 from DIRAC.Core.Base.DB import DB
 from DIRAC.Core.Security import Properties, CS
 
@@ -36,12 +37,15 @@ class TaskQueueDB( DB ):
     self.__maxJobsInTQ = 5000
     self.__defaultCPUSegments = maxCPUSegments
     self.__maxMatchRetry = 3
+    self.__maxJobsPerBatchMatch = 100
     self.__jobPriorityBoundaries = ( 0.001, 10 )
     self.__groupShares = {}
-    self.__deleteTQWithDelay = DictCache( self.__deleteTQIfEmpty )
+    self.__deleteTQWithDelay = ShardedDictCache( self.__deleteTQIfEmpty )
     self.__opsHelper = Operations()
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector( self.__opsHelper )
+    self.__matchIndex = None
+    self.__matchIndexLastTQId = 0
     result = self.__initializeDB()
     if not result[ 'OK' ]:
       raise Exception( "Can't create tables: %s" % result[ 'Message' ] )
@@ -131,6 +135,132 @@ class TaskQueueDB( DB ):
       return result
     return self._createTables( self.__tablesDesc )
 
+  def enableMatchIndex( self ):
+    """
+    Keep an in-memory mirror of the task queues to match resources without
+    generating the matching SQL. The task queues created by other processes are
+    added before every match, the priority changes and deletions done by other
+    processes are only seen when the index is reconciled with reconcileMatchIndex
+    """
+    if self.__matchIndex is None:
+      self.__matchIndex = TaskQueueIndex( singleValueDefFields, multiValueDefFields, TQ_MIN_SHARE )
+    return self.reconcileMatchIndex()
+
+  def isMatchIndexEnabled( self ):
+    return self.__matchIndex is not None
+
+  def reconcileMatchIndex( self ):
+    """
+    Reload the match index from the tq_TaskQueues and tq_TQTo* tables
+    """
+    if self.__matchIndex is None:
+      return S_ERROR( "Match index is not enabled" )
+    retVal = self.__loadTaskQueuesForIndex()
+    if not retVal[ 'OK' ]:
+      return retVal
+    tqDict = retVal[ 'Value' ]
+    self.__matchIndex.load( tqDict )
+    if tqDict:
+      self.__matchIndexLastTQId = max( self.__matchIndexLastTQId, max( tqDict ) )
+    self.log.verbose( "Match index reconciled with %s task queues" % len( tqDict ) )
+    return S_OK( len( tqDict ) )
+
+  def __addNewTaskQueuesToIndex( self, connObj = False ):
+    """
+    Add to the match index the task queues created by other processes since the last load
+    """
+    retVal = self.__loadTaskQueuesForIndex( minTQId = self.__matchIndexLastTQId, connObj = connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    tqDict = retVal[ 'Value' ]
+    for tqId, tqDefDict in tqDict.items():
+      self.__matchIndex.addTaskQueue( tqId, tqDefDict, tqDefDict[ 'Priority' ] )
+      self.__matchIndexLastTQId = max( self.__matchIndexLastTQId, tqId )
+    if tqDict:
+      self.log.verbose( "Added %s new task queues to the match index" % len( tqDict ) )
+    return S_OK( len( tqDict ) )
+
+  def __loadTaskQueuesForIndex( self, minTQId = 0, connObj = False ):
+    """
+    Get the definitions of the task queues with a TQId greater than minTQId
+      Returns S_OK( { tqId : tqDefDict (including 'Priority') } ) / S_ERROR
+    """
+    sqlCmd = "SELECT TQId, Priority, %s FROM `tq_TaskQueues`" % ", ".join( singleValueDefFields )
+    if minTQId:
+      sqlCmd = "%s WHERE TQId > %d" % ( sqlCmd, minTQId )
+    retVal = self._query( sqlCmd, conn = connObj )
+    if not retVal[ 'OK' ]:
+      return S_ERROR( "Can't load task queues for the match index: %s" % retVal[ 'Message' ] )
+    tqDict = {}
+    for record in retVal[ 'Value' ]:
+      tqDefDict = { 'Priority' : record[1] }
+      for iP, field in enumerate( singleValueDefFields ):
+        value = record[ iP + 2 ]
+        if field != 'CPUTime':
+          # Keep the values as they are used in the match conditions
+          result = self._escapeString( value )
+          if not result[ 'OK' ]:
+            return result
+          value = result[ 'Value' ]
+        tqDefDict[ field ] = value
+      tqDict[ record[0] ] = tqDefDict
+    if not tqDict:
+      return S_OK( tqDict )
+    for field in multiValueDefFields:
+      sqlCmd = "SELECT TQId, Value FROM `tq_TQTo%s`" % field
+      if minTQId:
+        sqlCmd = "%s WHERE TQId > %d" % ( sqlCmd, minTQId )
+      retVal = self._query( sqlCmd, conn = connObj )
+      if not retVal[ 'OK' ]:
+        return S_ERROR( "Can't load task queues field %s for the match index: %s" % ( field, retVal[ 'Message' ] ) )
+      for tqId, value in retVal[ 'Value' ]:
+        if tqId not in tqDict:
+          continue
+        result = self._escapeString( value )
+        if not result[ 'OK' ]:
+          return result
+        tqDict[ tqId ].setdefault( field, [] ).append( result[ 'Value' ] )
+    return S_OK( tqDict )
+
+  def __escapeNegativeCond( self, negativeCond ):
+    """
+    Escape the values of a negative condition, a dict or a list of dicts, the way the
+    match index keeps the task queue values
+    """
+    if not negativeCond:
+      return S_OK( negativeCond )
+    if type( negativeCond ) == types.DictType:
+      negativeCond = [ negativeCond ]
+    escapedCond = []
+    for condDict in negativeCond:
+      escapedDict = {}
+      for field in condDict:
+        valList = condDict[ field ]
+        if type( valList ) not in ( types.TupleType, types.ListType ):
+          valList = ( valList, )
+        escapedDict[ field ] = []
+        for value in valList:
+          result = self._escapeString( value )
+          if not result[ 'OK' ]:
+            return result
+          escapedDict[ field ].append( result[ 'Value' ] )
+      escapedCond.append( escapedDict )
+    return S_OK( escapedCond )
+
+  def __matchTaskQueuesFromIndex( self, tqMatchDict, numQueuesPerTry, negativeCond, connObj = False ):
+    """
+    Get the task queues matching a checked match dictionary from the in-memory index,
+    the negative condition has to be escaped already
+    """
+    retVal = self.__addNewTaskQueuesToIndex( connObj = connObj )
+    if not retVal[ 'OK' ]:
+      self.log.warn( "Matching with the task queues already in the index", retVal[ 'Message' ] )
+    return self.__matchIndex.match( tqMatchDict, numQueuesToGet = numQueuesPerTry, negativeCond = negativeCond,
+                                    multiValueMatchFields = multiValueMatchFields,
+                                    tagMatchFields = tagMatchFields,
+                                    bannedJobMatchFields = bannedJobMatchFields,
+                                    strictRequireMatchFields = strictRequireMatchFields )
+
   def __strDict( self, dDict ):
     lines = []
     keyLength = 0
@@ -314,6 +444,9 @@ class TaskQueueDB( DB ):
         self.cleanOrphanedTaskQueues( connObj = connObj )
         return S_ERROR( "Can't insert values %s for field %s: %s" % ( str( values ), field, result[ 'Message' ] ) )
     self.log.info( "Created TQ %s" % tqId )
+    if self.__matchIndex is not None:
+      self.__matchIndex.addTaskQueue( tqId, tqDefDict, priority )
+      self.__matchIndexLastTQId = max( self.__matchIndexLastTQId, tqId )
     return S_OK( tqId )
 
   def cleanOrphanedTaskQueues( self, connObj = False ):
@@ -321,7 +454,14 @@ class TaskQueueDB( DB ):
     Delete all empty task queues
     """
     self.log.info( "Cleaning orphaned TQs" )
-    result = self._update( "DELETE FROM `tq_TaskQueues` WHERE Enabled >= 1 AND TQId not in ( SELECT DISTINCT TQId from `tq_Jobs` )", conn = connObj )
+    orphanedSQL = "`tq_TaskQueues` WHERE Enabled >= 1 AND TQId not in ( SELECT DISTINCT TQId from `tq_Jobs` )"
+    orphanedTQs = []
+    if self.__matchIndex is not None:
+      result = self._query( "SELECT TQId FROM %s" % orphanedSQL, conn = connObj )
+      if not result[ 'OK' ]:
+        return result
+      orphanedTQs = [ row[0] for row in result[ 'Value' ] ]
+    result = self._update( "DELETE FROM %s" % orphanedSQL, conn = connObj )
     if not result[ 'OK' ]:
       return result
     for mvField in multiValueDefFields:
@@ -329,6 +469,16 @@ class TaskQueueDB( DB ):
                              conn = connObj )
       if not result[ 'OK' ]:
         return result
+    if orphanedTQs:
+      # Some of them may have received jobs after they were selected and were kept
+      result = self._query( "SELECT TQId FROM `tq_TaskQueues` WHERE TQId in ( %s )" % ", ".join( [ str( tqId ) for tqId in orphanedTQs ] ),
+                            conn = connObj )
+      if not result[ 'OK' ]:
+        return result
+      keptTQs = set( [ row[0] for row in result[ 'Value' ] ] )
+      for tqId in orphanedTQs:
+        if tqId not in keptTQs:
+          self.__matchIndex.removeTaskQueue( tqId )
     return S_OK()
 
   def __setTaskQueueEnabled( self, tqId, enabled = True, connObj = False ):
@@ -506,6 +656,10 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
     connObj = retVal[ 'Value' ]
+    if self.__matchIndex is not None and 'JobID' not in tqMatchDict:
+      return self.__matchAndGetJobFromIndex( tqMatchDict, numJobsPerTry = numJobsPerTry,
+                                             numQueuesPerTry = numQueuesPerTry,
+                                             negativeCond = negativeCond, connObj = connObj )
     preJobSQL = "SELECT `tq_Jobs`.JobId, `tq_Jobs`.TQId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
     prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
     postJobSQL = " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s" % numJobsPerTry
@@ -560,6 +714,168 @@ class TaskQueueDB( DB ):
     self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
     return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
 
+  def __matchAndGetJobFromIndex( self, tqMatchDict, numJobsPerTry = 50, numQueuesPerTry = 10,
+                                 negativeCond = {}, connObj = False ):
+    """
+    Match a job using the in-memory index to select the task queues. The winning priority
+    is drawn once per TQ, as in the SQL path, and the job is taken out of the TQ with a
+    single DELETE
+    """
+    prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
+    jobSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
+    jobSQL += " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s"
+    retVal = self.__escapeNegativeCond( negativeCond )
+    if not retVal[ 'OK' ]:
+      return retVal
+    negativeCond = retVal[ 'Value' ]
+    for _ in range( self.__maxMatchRetry ):
+      tqList = self.__matchTaskQueuesFromIndex( tqMatchDict, numQueuesPerTry, negativeCond, connObj = connObj )
+      if len( tqList ) == 0:
+        self.log.info( "No TQ matches requirements" )
+        return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
+      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+        self.log.info( "Trying to extract jobs from TQ %s" % tqId )
+        retVal = self._query( prioSQL % tqId, conn = connObj )
+        if not retVal[ 'OK' ]:
+          return S_ERROR( "Can't retrieve winning priority for matching job: %s" % retVal[ 'Message' ] )
+        jobList = []
+        if retVal[ 'Value' ]:
+          retVal = self._query( jobSQL % ( tqId, retVal[ 'Value' ][0][0], numJobsPerTry ), conn = connObj )
+          if not retVal[ 'OK' ]:
+            return S_ERROR( "Can't retrieve jobs for matching: %s" % retVal[ 'Message' ] )
+          jobList = [ row[0] for row in retVal[ 'Value' ] ]
+        if len( jobList ) == 0:
+          gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
+          self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+        while len( jobList ) > 0:
+          jobId = jobList.pop( random.randint( 0, len( jobList ) - 1 ) )
+          self.log.info( "Trying to extract job %s from TQ %s" % ( jobId, tqId ) )
+          retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId = %s AND TQId = %s" % ( jobId, tqId ), conn = connObj )
+          if not retVal[ 'OK' ]:
+            msgFix = "Could not take job"
+            msgVar = " %s out from the TQ %s: %s" % ( jobId, tqId, retVal[ 'Message' ] )
+            self.log.error( msgFix, msgVar )
+            return S_ERROR( msgFix + msgVar )
+          if retVal[ 'Value' ] > 0:
+            self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+            self.log.info( "Extracted job %s from TQ %s" % ( jobId, tqId ) )
+            return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : tqMatchDict } )
+        self.log.info( "No jobs could be extracted from TQ %s" % tqId )
+    self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
+    return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
+
+  def matchAndGetJobs( self, tqMatchDict, maxJobs, numQueuesPerTry = 10, negativeCond = {} ):
+    """
+    Match up to maxJobs jobs (at most maxJobsPerBatchMatch) for the same resource. For every
+    matching TQ the winning priority is drawn as in matchAndGetJob, the jobs of that priority
+    are selected without locking them and each one is claimed with a conditional DELETE, so
+    concurrent matches only compete for single jobs. The negative conditions are evaluated
+    once, the caller has to limit maxJobs to what the site limits allow
+      Returns S_OK( { 'matchFound' : bool, 'jobs' : [ ( jobId, tqId ) ], 'tqMatch' : dict } ) / S_ERROR
+    """
+    if 'JobID' in tqMatchDict:
+      # A certain JobID is required by the resource, there is only one job to match
+      retVal = self.matchAndGetJob( tqMatchDict, numQueuesPerTry = numQueuesPerTry, negativeCond = negativeCond )
+      if not retVal[ 'OK' ]:
+        return retVal
+      match = retVal[ 'Value' ]
+      jobs = []
+      if match[ 'matchFound' ]:
+        jobs.append( ( match[ 'jobId' ], match[ 'taskQueueId' ] ) )
+      return S_OK( { 'matchFound' : match[ 'matchFound' ], 'jobs' : jobs, 'tqMatch' : match[ 'tqMatch' ] } )
+    if maxJobs > self.__maxJobsPerBatchMatch:
+      self.log.info( "Matching %s jobs instead of the %s requested" % ( self.__maxJobsPerBatchMatch, maxJobs ) )
+      maxJobs = self.__maxJobsPerBatchMatch
+    tqMatchDict = dict( tqMatchDict )
+    self.log.info( "Starting match of %s jobs for requirements" % maxJobs, self.__strDict( tqMatchDict ) )
+    retVal = self._checkMatchDefinition( tqMatchDict )
+    if not retVal[ 'OK' ]:
+      self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
+      return retVal
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
+    connObj = retVal[ 'Value' ]
+    retVal = self.__escapeNegativeCond( negativeCond )
+    if not retVal[ 'OK' ]:
+      return retVal
+    escapedNegativeCond = retVal[ 'Value' ]
+
+    matchedJobs = []
+    for _ in range( self.__maxMatchRetry ):
+      if self.__matchIndex is not None:
+        tqList = self.__matchTaskQueuesFromIndex( tqMatchDict, numQueuesPerTry, escapedNegativeCond, connObj = connObj )
+      else:
+        retVal = self.matchAndGetTaskQueue( tqMatchDict,
+                                            numQueuesToGet = numQueuesPerTry,
+                                            skipMatchDictDef = True,
+                                            negativeCond = negativeCond,
+                                            connObj = connObj )
+        if not retVal[ 'OK' ]:
+          if matchedJobs:
+            break
+          return retVal
+        tqList = retVal[ 'Value' ]
+      if len( tqList ) == 0:
+        break
+      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+        if len( matchedJobs ) >= maxJobs:
+          break
+        retVal = self.__takeJobsFromTaskQueue( tqId, maxJobs - len( matchedJobs ), connObj = connObj )
+        self.__deleteTQWithDelay.add( tqId, 300, ( tqId, tqOwnerDN, tqOwnerGroup ) )
+        if not retVal[ 'OK' ]:
+          # The jobs already claimed are out of the TQs, they have to be returned
+          self.log.error( "Could not take jobs out from the TQ %s" % tqId, retVal[ 'Message' ] )
+          if not matchedJobs:
+            return retVal
+          break
+        matchedJobs.extend( [ ( jobId, tqId ) for jobId in retVal[ 'Value' ] ] )
+      else:
+        if not matchedJobs:
+          continue
+      break
+    if not matchedJobs:
+      self.log.info( "No jobs matched after trying %s TQs" % len( tqList ) )
+    else:
+      self.log.info( "Extracted %s jobs from %s TQs" % ( len( matchedJobs ), len( set( [ job[1] for job in matchedJobs ] ) ) ) )
+    return S_OK( { 'matchFound' : len( matchedJobs ) > 0, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+
+  def __takeJobsFromTaskQueue( self, tqId, numJobs, connObj = False ):
+    """
+    Take up to numJobs jobs out of a TQ, drawing the winning priority again every time
+    the jobs of the previous one are exhausted
+      Returns S_OK( [ jobId ] ) / S_ERROR
+    """
+    prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
+    jobSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
+    jobSQL += " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s"
+    jobList = []
+    while len( jobList ) < numJobs:
+      retVal = self._query( prioSQL % tqId, conn = connObj )
+      if not retVal[ 'OK' ]:
+        return S_ERROR( "Can't retrieve winning priority for matching job: %s" % retVal[ 'Message' ] )
+      if not retVal[ 'Value' ]:
+        break
+      prio = retVal[ 'Value' ][0][0]
+      retVal = self._query( jobSQL % ( tqId, prio, numJobs - len( jobList ) ), conn = connObj )
+      if not retVal[ 'OK' ]:
+        return S_ERROR( "Can't retrieve jobs for matching: %s" % retVal[ 'Message' ] )
+      claimed = 0
+      for row in retVal[ 'Value' ]:
+        # Jobs taken by concurrent matches are not deleted again
+        retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId = %s AND TQId = %s" % ( row[0], tqId ), conn = connObj )
+        if not retVal[ 'OK' ]:
+          if jobList:
+            self.log.error( "Could not take job %s out from the TQ %s" % ( row[0], tqId ), retVal[ 'Message' ] )
+            return S_OK( jobList )
+          return retVal
+        if retVal[ 'Value' ] > 0:
+          jobList.append( row[0] )
+          claimed += 1
+      if not claimed:
+        break
+    return S_OK( jobList )
+
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False,
                             negativeCond = {}, connObj = False ):
     """ Get a queue that matches the requirements
@@ -891,6 +1207,8 @@ class TaskQueueDB( DB ):
         retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
         if not retVal[ 'OK' ]:
           return retVal
+      if self.__matchIndex is not None:
+        self.__matchIndex.removeTaskQueue( tqId )
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       self.log.info( "Deleted empty and enabled TQ %s" % tqId )
       return S_OK( True )
@@ -927,6 +1245,8 @@ class TaskQueueDB( DB ):
       retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( field, tqId ), conn = connObj )
       if not retVal[ 'OK' ]:
         return retVal
+    if self.__matchIndex is not None:
+      self.__matchIndex.removeTaskQueue( tqId )
     if delTQ > 0:
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       return S_OK( True )
@@ -1171,6 +1491,8 @@ class TaskQueueDB( DB ):
       tqList = ", ".join( [ str( tqId ) for tqId in prioDict[ prio ] ] )
       updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in ( %s )" % ( prio, tqList )
       self._update( updateSQL, conn = connObj )
+    if self.__matchIndex is not None:
+      self.__matchIndex.setPriorities( tqDict )
     return S_OK()
 
   def getGroupShares( self ):
@@ -0,0 +1,182 @@
+""" Test for the job matching of TaskQueueDB, run on an in-memory SQLite database
+"""
+
+import random
+import sqlite3
+import threading
+import unittest
+
+from mock import patch
+
+from DIRAC import gLogger, S_OK, S_ERROR
+from DIRAC.Core.Base.DB import DB
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB, multiValueDefFields
+
+class SQLiteTaskQueueDB( TaskQueueDB ):
+  """ TaskQueueDB executing its statements on SQLite instead of MySQL
+  """
+
+  def __init__( self ):
+    self.dbConn = sqlite3.connect( ':memory:', check_same_thread = False, isolation_level = None )
+    self.dbConn.create_function( 'RAND', 0, random.random )
+    self.dbLock = threading.RLock()
+    self.statements = []
+    with patch.object( DB, '__init__', side_effect = self.__initDB ):
+      TaskQueueDB.__init__( self )
+
+  def __initDB( self, _tqDB, dbName, _fullName ):
+    self.log = gLogger.getSubLogger( dbName )
+
+  def __execute( self, cmd ):
+    self.statements.append( cmd )
+    if cmd == "show tables":
+      cmd = "SELECT name FROM sqlite_master WHERE type='table'"
+    with self.dbLock:
+      try:
+        cursor = self.dbConn.execute( cmd )
+        return S_OK( ( tuple( [ tuple( row ) for row in cursor.fetchall() ] ), cursor.rowcount ) )
+      except sqlite3.Error, error:
+        return S_ERROR( "%s: %s" % ( error, cmd ) )
+
+  def _query( self, cmd, conn = None, debug = False ):
+    result = self.__execute( cmd )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( result[ 'Value' ][0] )
+
+  def _update( self, cmd, conn = None, debug = False ):
+    result = self.__execute( cmd )
+    if not result[ 'OK' ]:
+      return result
+    return S_OK( result[ 'Value' ][1] )
+
+  def _escapeString( self, myString, conn = None ):
+    return S_OK( "'%s'" % str( myString ).replace( "'", "''" ) )
+
+  def _getConnection( self ):
+    return S_OK( self.dbConn )
+
+  def _createTables( self, tableDict, force = False ):
+    for tableName, tableDef in tableDict.items():
+      fields = []
+      for field, fieldType in tableDef[ 'Fields' ].items():
+        if 'AUTO_INCREMENT' in fieldType:
+          fields.append( "%s INTEGER PRIMARY KEY AUTOINCREMENT" % field )
+        elif field == tableDef.get( 'PrimaryKey' ):
+          fields.append( "%s %s PRIMARY KEY" % ( field, fieldType.split( '(' )[0] ) )
+        else:
+          fields.append( "%s %s" % ( field, fieldType.split( '(' )[0] ) )
+      result = self._update( "CREATE TABLE `%s` ( %s )" % ( tableName, ", ".join( fields ) ) )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK()
+
+class TaskQueueDBTestCase( unittest.TestCase ):
+  """ Base class for the TaskQueueDB test cases
+  """
+  def setUp( self ):
+    self.tqDB = SQLiteTaskQueueDB()
+    self.matchDict = { 'Setup' : 'Prod', 'CPUTime' : 100000, 'Site' : 'Site.A' }
+
+  def tearDown( self ):
+    self.tqDB.dbConn.close()
+
+  def _addTQ( self, tqId, jobs, priority = 1, **multiValues ):
+    """ Add a TQ with the jobs given as { jobId : jobPriority }
+    """
+    self.__execute( "INSERT INTO `tq_TaskQueues` ( TQId, OwnerDN, OwnerGroup, Setup, CPUTime, Priority, Enabled ) "
+                    "VALUES ( %s, '/DN/user', 'user', 'Prod', 86400, %s, 1 )" % ( tqId, priority ) )
+    for field, values in multiValues.items():
+      for value in values:
+        self.__execute( "INSERT INTO `tq_TQTo%s` ( TQId, Value ) VALUES ( %s, '%s' )" % ( field, tqId, value ) )
+    for jobId, jobPriority in jobs.items():
+      self.__execute( "INSERT INTO `tq_Jobs` ( TQId, JobId, Priority, RealPriority ) VALUES ( %s, %s, %s, %s )" % ( tqId, jobId,
+                                                                                                      jobPriority,
+                                                                                                      jobPriority ) )
+
+  def __execute( self, cmd ):
+    result = self.tqDB._update( cmd )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+
+  def _jobsInTQs( self ):
+    result = self.tqDB._query( "SELECT JobId FROM `tq_Jobs`" )
+    self.assertTrue( result[ 'OK' ] )
+    return set( [ row[0] for row in result[ 'Value' ] ] )
+
+class MatchAndGetJobs( TaskQueueDBTestCase ):
+
+  def test_jobsAreTakenOut( self ):
+    self._addTQ( 1, dict( [ ( jobId, 1 ) for jobId in range( 1, 6 ) ] ) )
+    self._addTQ( 2, { 10 : 1 }, Sites = [ 'Site.B' ] )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 3 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    jobs = result[ 'Value' ][ 'jobs' ]
+    self.assertTrue( result[ 'Value' ][ 'matchFound' ] )
+    self.assertEqual( len( jobs ), 3 )
+    self.assertEqual( set( [ tqId for _jobId, tqId in jobs ] ), set( [ 1 ] ) )
+    self.assertEqual( self._jobsInTQs(), set( [ 1, 2, 3, 4, 5, 10 ] ) - set( [ jobId for jobId, _tqId in jobs ] ) )
+    # No statement locks the candidate jobs
+    self.assertFalse( [ cmd for cmd in self.tqDB.statements if 'FOR UPDATE' in cmd ] )
+
+  def test_priorityLevels( self ):
+    # The jobs of the winning priority are taken first, the other levels are used when it is exhausted
+    self._addTQ( 1, { 1 : 1, 2 : 1000000, 3 : 1000000 } )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 2 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( sorted( [ jobId for jobId, _tqId in result[ 'Value' ][ 'jobs' ] ] ), [ 2, 3 ] )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 2 )
+    self.assertEqual( [ jobId for jobId, _tqId in result[ 'Value' ][ 'jobs' ] ], [ 1 ] )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 2 )
+    self.assertTrue( result[ 'OK' ] )
+    self.assertFalse( result[ 'Value' ][ 'matchFound' ] )
+
+  def test_negativeCond( self ):
+    self._addTQ( 1, { 1 : 1 }, JobTypes = [ 'MCSimulation' ] )
+    self._addTQ( 2, { 2 : 1 }, JobTypes = [ 'User' ] )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 5, negativeCond = { 'JobType' : [ 'MCSimulation' ] } )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( result[ 'Value' ][ 'jobs' ], [ ( 2, 2 ) ] )
+
+  def test_maxJobs( self ):
+    self._addTQ( 1, dict( [ ( jobId, 1 ) for jobId in range( 1, 151 ) ] ) )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 1000 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( len( result[ 'Value' ][ 'jobs' ] ), 100 )
+    self.assertEqual( len( self._jobsInTQs() ), 50 )
+
+  def test_jobID( self ):
+    self._addTQ( 1, { 1 : 1, 2 : 1, 3 : 1 } )
+    matchDict = dict( self.matchDict )
+    matchDict[ 'JobID' ] = 2
+    result = self.tqDB.matchAndGetJobs( matchDict, 3 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( result[ 'Value' ][ 'jobs' ], [ ( 2, 1 ) ] )
+    self.assertEqual( self._jobsInTQs(), set( [ 1, 3 ] ) )
+
+  def test_concurrentClaims( self ):
+    # Jobs deleted by a concurrent match between the selection and the claim are not returned
+    self._addTQ( 1, { 1 : 1, 2 : 1, 3 : 1, 4 : 1 } )
+    update = self.tqDB._update
+    def stealingUpdate( cmd, conn = None, debug = False ):
+      if cmd.startswith( "DELETE FROM `tq_Jobs` WHERE JobId = 1 " ):
+        update( "DELETE FROM `tq_Jobs` WHERE JobId IN ( 1, 2 )" )
+      return update( cmd, conn = conn )
+    self.tqDB._update = stealingUpdate
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 4 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( sorted( result[ 'Value' ][ 'jobs' ] ), [ ( 3, 1 ), ( 4, 1 ) ] )
+    self.assertEqual( self._jobsInTQs(), set() )
+
+  def test_matchIndex( self ):
+    self._addTQ( 1, { 1 : 1 } )
+    result = self.tqDB.enableMatchIndex()
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    # TQs created by other processes are seen without reconciling the index
+    self._addTQ( 2, { 2 : 1 } )
+    result = self.tqDB.matchAndGetJobs( self.matchDict, 5 )
+    self.assertTrue( result[ 'OK' ], result.get( 'Message' ) )
+    self.assertEqual( sorted( result[ 'Value' ][ 'jobs' ] ), [ ( 1, 1 ), ( 2, 2 ) ] )
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( MatchAndGetJobs )
+  unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -132,13 +132,6 @@ class JobStateUpdateHandler( RequestHandler ):
         as a key and status information dictionary as values
     """
 
-    status = ""
-    minor = ""
-    application = ""
-    appCounter = ""
-    endDate = ''
-    startDate = ''
-    startFlag = ''
     jobID = int( jobID )
 
     result = jobDB.getJobAttributes( jobID, ['Status'] )
@@ -149,9 +142,7 @@ class JobStateUpdateHandler( RequestHandler ):
       # if there is no matching Job it returns an empty dictionary
       return S_ERROR( 'No Matching Job' )
 
-    new_status = result['Value']['Status']
-    if new_status == "Stalled":
-      status = 'Running'
+    currentStatus = result['Value']['Status']
 
     # Get the latest WN time stamps of status updates
     result = logDB.getWMSTimeStamps( int( jobID ) )
@@ -160,6 +151,116 @@ class JobStateUpdateHandler( RequestHandler ):
     lastTime = max( [float( t ) for s, t in result['Value'].items() if s != 'LastTime'] )
     lastTime = Time.toString( Time.fromEpoch( lastTime ) )
 
+    attrNames, attrValues, startDate, endDate = self.__getStatusUpdate( currentStatus, lastTime, statusDict )
+    result = jobDB.setJobAttributes( jobID, attrNames, attrValues, update = True )
+    if not result['OK']:
+      return result
+
+    if endDate:
+      result = jobDB.setEndExecTime( jobID, endDate )
+    if startDate:
+      result = jobDB.setStartExecTime( jobID, startDate )
+
+    # Update the JobLoggingDB records
+    for record in self.__getLoggingRecords( jobID, statusDict ):
+      result = logDB.addLoggingRecord( *record )
+      if not result['OK']:
+        return result
+
+    return S_OK()
+
+  ###########################################################################
+  types_setJobsStatusBulk = [DictType]
+  def export_setJobsStatusBulk( self, jobsStatusDict ):
+    """ Set various status fields for many jobs at once. The jobsStatusDict has
+        the JobIds as keys and the statusDict of setJobStatusBulk as values.
+        The jobs are read with one query per table, the jobs ending up with the
+        same attributes are updated together and all the status logging records
+        are inserted at once.
+        Returns a dictionary with the list of Successful jobs and the Failed ones
+        with the reason of the failure
+    """
+    statusDicts = {}
+    for jobID, statusDict in jobsStatusDict.items():
+      try:
+        statusDicts[int( jobID )] = statusDict
+      except ( ValueError, TypeError ):
+        return S_ERROR( 'Invalid JobId %s' % jobID )
+    failed = {}
+    jobIDs = sorted( statusDicts )
+    if not jobIDs:
+      return S_OK( { 'Successful' : [], 'Failed' : failed } )
+
+    result = jobDB.getAttributesForJobList( jobIDs, ['Status'] )
+    if not result['OK']:
+      return result
+    jobAttributes = result['Value']
+
+    # Get the latest WN time stamps of status updates
+    result = logDB.getLastWMSTimeStamps( jobIDs )
+    if not result['OK']:
+      return result
+    lastTimes = result['Value']
+
+    # ( attrNames, attrValues ) -> [ jobIDs ]
+    attrUpdates = {}
+    # ( StartExecTime|EndExecTime, date ) -> [ jobIDs ]
+    execTimeUpdates = {}
+    for jobID in jobIDs:
+      if jobID not in jobAttributes:
+        failed[jobID] = 'No Matching Job'
+        continue
+      if jobID not in lastTimes:
+        failed[jobID] = 'No Logging Info for job %d' % jobID
+        continue
+      lastTime = Time.toString( Time.fromEpoch( float( lastTimes[jobID] ) ) )
+      attrNames, attrValues, startDate, endDate = self.__getStatusUpdate( jobAttributes[jobID]['Status'],
+                                                                          lastTime, statusDicts[jobID] )
+      attrUpdates.setdefault( ( tuple( attrNames ), tuple( attrValues ) ), [] ).append( jobID )
+      if endDate:
+        execTimeUpdates.setdefault( ( 'EndExecTime', endDate ), [] ).append( jobID )
+      if startDate:
+        execTimeUpdates.setdefault( ( 'StartExecTime', startDate ), [] ).append( jobID )
+
+    for ( attrNames, attrValues ), jobList in attrUpdates.items():
+      result = jobDB.setJobsAttributes( jobList, list( attrNames ), list( attrValues ), update = True )
+      if not result['OK']:
+        for jobID in jobList:
+          failed[jobID] = result['Message']
+
+    for ( timeField, execDate ), jobList in execTimeUpdates.items():
+      result = jobDB.setJobsExecTime( timeField, [ jobID for jobID in jobList if jobID not in failed ], execDate )
+      if not result['OK']:
+        gLogger.error( 'Failed to set %s' % timeField, result['Message'] )
+
+    # Update the JobLoggingDB records
+    successful = [ jobID for jobID in jobIDs if jobID not in failed ]
+    records = []
+    for jobID in successful:
+      records.extend( self.__getLoggingRecords( jobID, statusDicts[jobID] ) )
+    result = logDB.addLoggingRecords( records )
+    if not result['OK']:
+      for jobID in successful:
+        failed[jobID] = result['Message']
+      successful = []
+
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  def __getStatusUpdate( self, currentStatus, lastTime, statusDict ):
+    """ Get the job attributes to set from the status updates more recent than lastTime,
+        and the dates the job started and ended its execution if they are among them
+    """
+    status = ""
+    minor = ""
+    application = ""
+    appCounter = ""
+    endDate = ''
+    startDate = ''
+    startFlag = ''
+
+    if currentStatus == "Stalled":
+      status = 'Running'
+
     # Get the last status values
     dates = sorted( statusDict )
     # We should only update the status if its time stamp is more recent than the last update
@@ -194,17 +295,14 @@ class JobStateUpdateHandler( RequestHandler ):
     if appCounter:
       attrNames.append( 'ApplicationCounter' )
       attrValues.append( appCounter )
-    result = jobDB.setJobAttributes( jobID, attrNames, attrValues, update = True )
-    if not result['OK']:
-      return result
-
-    if endDate:
-      result = jobDB.setEndExecTime( jobID, endDate )
-    if startDate:
-      result = jobDB.setStartExecTime( jobID, startDate )
+    return attrNames, attrValues, startDate, endDate
 
-    # Update the JobLoggingDB records
-    for date in dates:
+  def __getLoggingRecords( self, jobID, statusDict ):
+    """ Get the ( jobID, status, minor, application, date, source ) JobLoggingDB records
+        of all the status updates
+    """
+    records = []
+    for date in sorted( statusDict ):
       sDict = statusDict[date]
       status = sDict['Status']
       if not status:
@@ -219,11 +317,8 @@ class JobStateUpdateHandler( RequestHandler ):
         status = "Running"
         minor = "Application"
       source = sDict['Source']
-      result = logDB.addLoggingRecord( jobID, status, minor, application, date, source )
-      if not result['OK']:
-        return result
-
-    return S_OK()
+      records.append( ( jobID, status, minor, application, date, source ) )
+    return records
 
   ###########################################################################
   types_setJobSite = [[StringType, IntType, LongType], StringType]
@@ -6,12 +6,12 @@
 
 __RCSID__ = "$Id$"
 
-from types import StringType, DictType, StringTypes
+from types import StringType, DictType, StringTypes, IntType, LongType
 
 from DIRAC                                               import gLogger, S_OK, S_ERROR
 
 from DIRAC.Core.Utilities.ThreadScheduler                import gThreadScheduler
-from DIRAC.Core.DISET.RequestHandler                     import RequestHandler
+from DIRAC.Core.DISET.RequestHandler                     import RequestHandler, getServiceOption
 
 from DIRAC.FrameworkSystem.Client.MonitoringClient       import gMonitor
 
@@ -55,6 +55,14 @@ def initializeMatcherHandler( serviceInfo ):
   gThreadScheduler.addPeriodicTask( 120, gTaskQueueDB.recalculateTQSharesForAll )
   gThreadScheduler.addPeriodicTask( 60, sendNumTaskQueues )
 
+  if getServiceOption( serviceInfo, "UseMatchIndex", False ):
+    result = gTaskQueueDB.enableMatchIndex()
+    if not result[ 'OK' ]:
+      return result
+    gLogger.info( "Matching with the in-memory index of %s task queues" % result[ 'Value' ] )
+    reconcileTime = getServiceOption( serviceInfo, "MatchIndexReconcileTime", 30 )
+    gThreadScheduler.addPeriodicTask( reconcileTime, gTaskQueueDB.reconcileMatchIndex )
+
   sendNumTaskQueues()
 
   return S_OK()
@@ -102,6 +110,36 @@ class MatcherHandler( RequestHandler ):
       # FIXME: This is correctly interpreted by the JobAgent, but DErrno should be used instead
       return S_ERROR( "No match found" )
 
+##############################################################################
+  types_requestJobs = [ [StringType, DictType], [IntType, LongType] ]
+  def export_requestJobs( self, resourceDescription, maxJobs ):
+    """ Serve up to maxJobs jobs to a resource with several slots in a single request
+    """
+
+    if maxJobs < 1:
+      return S_ERROR( "The number of requested jobs has to be positive" )
+    resourceDescription['Setup'] = self.serviceInfoDict['clientSetup']
+    credDict = self.getRemoteCredentials()
+
+    try:
+      opsHelper = Operations( group = credDict['group'] )
+      matcher = Matcher( pilotAgentsDB = pilotAgentsDB,
+                         jobDB = gJobDB,
+                         tqDB = gTaskQueueDB,
+                         jlDB = jlDB,
+                         opsHelper = opsHelper )
+      result = matcher.selectJobs( resourceDescription, credDict, maxJobs )
+    except RuntimeError, rte:
+      self.log.error( "Error requesting jobs: ", rte )
+      return S_ERROR( "Error requesting jobs" )
+
+    if result:
+      gMonitor.addMark( "matchesDone" )
+      gMonitor.addMark( "matchesOK", len( result ) )
+      return S_OK( result )
+    else:
+      return S_ERROR( "No match found" )
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
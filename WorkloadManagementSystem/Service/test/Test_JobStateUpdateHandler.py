@@ -0,0 +1,77 @@
+""" Test for the bulk status update of the JobStateUpdate service
+"""
+
+import unittest
+
+from mock import MagicMock
+
+from DIRAC import S_OK
+from DIRAC.Core.Utilities import Time
+import DIRAC.WorkloadManagementSystem.Service.JobStateUpdateHandler as moduleTested
+
+def _statusDict( *updates ):
+  statusDict = {}
+  for date, status, minor, application in updates:
+    statusDict[date] = { 'Status' : status, 'MinorStatus' : minor, 'ApplicationStatus' : application,
+                         'Source' : 'JobWrapper' }
+  return statusDict
+
+class JobStateUpdateTestCase( unittest.TestCase ):
+  """ Base class for the JobStateUpdateHandler test cases
+  """
+  def setUp( self ):
+    moduleTested.jobDB = MagicMock()
+    moduleTested.logDB = MagicMock()
+    moduleTested.jobDB.getAttributesForJobList.return_value = S_OK( { 1 : { 'Status' : 'Running' },
+                                                                      2 : { 'Status' : 'Running' },
+                                                                      3 : { 'Status' : 'Stalled' } } )
+    lastTime = Time.toEpoch( Time.fromString( '2015-03-01 10:00:00' ) )
+    moduleTested.logDB.getLastWMSTimeStamps.return_value = S_OK( { 1 : str( lastTime ), 2 : str( lastTime ),
+                                                                   3 : str( lastTime ) } )
+    moduleTested.jobDB.setJobsAttributes.return_value = S_OK()
+    moduleTested.jobDB.setJobsExecTime.return_value = S_OK()
+    moduleTested.logDB.addLoggingRecords.return_value = S_OK()
+    self.handler = object.__new__( moduleTested.JobStateUpdateHandler )
+
+class JobsStatusBulk( JobStateUpdateTestCase ):
+
+  def test_bulkUpdate( self ):
+    done = _statusDict( ( '2015-03-01 11:00:00', 'Done', 'Execution Complete', '' ),
+                        ( '2015-03-01 09:00:00', 'Running', 'Old', '' ) )
+    result = self.handler.export_setJobsStatusBulk( { 1 : done, '2' : done,
+                                                      3 : _statusDict( ( '2015-03-01 11:00:00', '', '', 'Step 1' ) ),
+                                                      4 : done } )
+    self.assertTrue( result['OK'] )
+    self.assertEqual( result['Value']['Successful'], [ 1, 2, 3 ] )
+    self.assertEqual( result['Value']['Failed'], { 4 : 'No Matching Job' } )
+
+    # All the reads are done with one query per table
+    moduleTested.jobDB.getAttributesForJobList.assert_called_once_with( [ 1, 2, 3, 4 ], [ 'Status' ] )
+    moduleTested.logDB.getLastWMSTimeStamps.assert_called_once_with( [ 1, 2, 3, 4 ] )
+    # The jobs with the same new attributes are updated together, the old updates are ignored
+    updates = sorted( [ call[0] for call in moduleTested.jobDB.setJobsAttributes.call_args_list ] )
+    self.assertEqual( updates, [ ( [ 1, 2 ], [ 'Status', 'MinorStatus' ], [ 'Done', 'Execution Complete' ] ),
+                                 ( [ 3 ], [ 'Status', 'ApplicationStatus' ], [ 'Running', 'Step 1' ] ) ] )
+    moduleTested.jobDB.setJobsExecTime.assert_called_once_with( 'EndExecTime', [ 1, 2 ], '2015-03-01 11:00:00' )
+    # All the logging records are inserted at once
+    records = moduleTested.logDB.addLoggingRecords.call_args[0][0]
+    self.assertEqual( len( records ), 5 )
+    self.assertEqual( records[0], ( 1, 'Running', 'Old', 'idem', '2015-03-01 09:00:00', 'JobWrapper' ) )
+    self.assertEqual( records[-1], ( 3, 'Running', 'Application', 'Step 1', '2015-03-01 11:00:00', 'JobWrapper' ) )
+
+  def test_invalidJobID( self ):
+    done = _statusDict( ( '2015-03-01 11:00:00', 'Done', 'Execution Complete', '' ) )
+    for jobID in ( None, 'job' ):
+      result = self.handler.export_setJobsStatusBulk( { 1 : done, jobID : done } )
+      self.assertFalse( result['OK'] )
+    self.assertFalse( moduleTested.jobDB.getAttributesForJobList.called )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( JobStateUpdateTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( JobsStatusBulk ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )
@@ -0,0 +1,237 @@
+""" In-memory mirror of the task queue definitions used to match resources
+    without regenerating the full matching SQL for every request.
+
+    The index keeps, for every task queue, its single value fields, its priority and
+    the sets of values of the multi value fields (the tq_TQTo* tables). Values are kept
+    exactly as they are found in TaskQueueDB (that is, already escaped), so the match
+    dictionaries must be checked with TaskQueueDB._checkMatchDefinition before use.
+"""
+
+__RCSID__ = "$Id$"
+
+import random
+import threading
+
+from DIRAC.Core.Security import Properties, CS
+
+class TaskQueueIndex( object ):
+  """ Mirror of tq_TaskQueues and the tq_TQTo* tables with inverted indexes
+  """
+
+  def __init__( self, singleValueFields, multiValueFields, minPriority = 0.001 ):
+    self.__singleValueFields = tuple( singleValueFields )
+    self.__multiValueFields = tuple( multiValueFields )
+    self.__minPriority = minPriority
+    self.__lock = threading.Lock()
+    self.__clear()
+
+  def __clear( self ):
+    # tqId -> dict with the single value fields and the Priority
+    self.__tqs = {}
+    # multi value field -> { tqId : frozenset( values ) }
+    self.__tqValues = dict( [ ( field, {} ) for field in self.__multiValueFields ] )
+    # multi value field -> { value : set( tqIds ) }
+    self.__byValue = dict( [ ( field, {} ) for field in self.__multiValueFields ] )
+
+  def __len__( self ):
+    return len( self.__tqs )
+
+  def __contains__( self, tqId ):
+    return tqId in self.__tqs
+
+  def __addTQ( self, tqId, tqDefDict, priority ):
+    tqData = { 'Priority' : priority }
+    for field in self.__singleValueFields:
+      tqData[ field ] = tqDefDict.get( field )
+    self.__tqs[ tqId ] = tqData
+    for field in self.__multiValueFields:
+      values = frozenset( [ value for value in tqDefDict.get( field, [] ) if str( value ).strip() ] )
+      if not values:
+        continue
+      self.__tqValues[ field ][ tqId ] = values
+      byValue = self.__byValue[ field ]
+      for value in values:
+        byValue.setdefault( value, set() ).add( tqId )
+
+  def __removeTQ( self, tqId ):
+    if tqId not in self.__tqs:
+      return False
+    del self.__tqs[ tqId ]
+    for field in self.__multiValueFields:
+      values = self.__tqValues[ field ].pop( tqId, () )
+      byValue = self.__byValue[ field ]
+      for value in values:
+        tqIds = byValue.get( value )
+        if tqIds is None:
+          continue
+        tqIds.discard( tqId )
+        if not tqIds:
+          del byValue[ value ]
+    return True
+
+  def addTaskQueue( self, tqId, tqDefDict, priority = 1 ):
+    """ Add (or replace) a task queue definition
+    """
+    with self.__lock:
+      self.__removeTQ( tqId )
+      self.__addTQ( tqId, tqDefDict, priority )
+
+  def removeTaskQueue( self, tqId ):
+    """ Remove a task queue from the index. Returns True if it was known
+    """
+    with self.__lock:
+      return self.__removeTQ( tqId )
+
+  def setPriorities( self, prioDict ):
+    """ Update the priorities of the task queues given as { tqId : priority }
+    """
+    with self.__lock:
+      for tqId, priority in prioDict.items():
+        if tqId in self.__tqs:
+          self.__tqs[ tqId ][ 'Priority' ] = priority
+
+  def load( self, tqDict ):
+    """ Atomically replace the contents of the index with
+        { tqId : tqDefDict (including 'Priority') }
+    """
+    newIndex = TaskQueueIndex( self.__singleValueFields, self.__multiValueFields, self.__minPriority )
+    for tqId, tqDefDict in tqDict.items():
+      newIndex.__addTQ( tqId, tqDefDict, tqDefDict.get( 'Priority', 1 ) )
+    with self.__lock:
+      self.__tqs = newIndex.__tqs
+      self.__tqValues = newIndex.__tqValues
+      self.__byValue = newIndex.__byValue
+
+  def getTaskQueueIDs( self ):
+    with self.__lock:
+      return list( self.__tqs )
+
+  @staticmethod
+  def __toList( value ):
+    if isinstance( value, ( list, tuple ) ):
+      return list( value )
+    return [ value ]
+
+  def __valuesOf( self, field, tqId ):
+    return self.__tqValues[ field ].get( tqId, frozenset() )
+
+  def __withAnyOf( self, field, values ):
+    """ TQs that have at least one of the values for the field
+    """
+    byValue = self.__byValue[ field ]
+    result = set()
+    for value in values:
+      result.update( byValue.get( value, () ) )
+    return result
+
+  def __withoutValues( self, field, candidates ):
+    """ TQs of the candidates that do not define the field at all
+    """
+    tqValues = self.__tqValues[ field ]
+    return set( [ tqId for tqId in candidates if tqId not in tqValues ] )
+
+  def __ownerFilter( self, tqMatchDict, candidates ):
+    tqs = self.__tqs
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      dns = set( self.__toList( tqMatchDict[ 'OwnerDN' ] ) )
+      sharingGroups = set()
+      dnGroups = set()
+      for group in self.__toList( tqMatchDict[ 'OwnerGroup' ] ):
+        if Properties.JOB_SHARING in CS.getPropertiesForGroup( group.replace( '"', "" ) ):
+          sharingGroups.add( group )
+        else:
+          dnGroups.add( group )
+      return set( [ tqId for tqId in candidates
+                    if tqs[ tqId ][ 'OwnerGroup' ] in sharingGroups or
+                    ( tqs[ tqId ][ 'OwnerGroup' ] in dnGroups and tqs[ tqId ][ 'OwnerDN' ] in dns ) ] )
+    for field in ( 'OwnerGroup', 'OwnerDN' ):
+      if field in tqMatchDict:
+        values = set( self.__toList( tqMatchDict[ field ] ) )
+        candidates = set( [ tqId for tqId in candidates if tqs[ tqId ][ field ] in values ] )
+    return candidates
+
+  def __negativeDictFilter( self, negativeCond, tqId ):
+    """ Evaluate a negative condition dict for a TQ the same way TaskQueueDB does in SQL
+    """
+    conds = []
+    for field in negativeCond:
+      tableField = "%ss" % field
+      if tableField in self.__tqValues:
+        tqValues = self.__valuesOf( tableField, tqId )
+        conds.append( all( [ value not in tqValues for value in self.__toList( negativeCond[ field ] ) ] ) )
+      elif field in self.__singleValueFields:
+        for value in negativeCond[ field ]:
+          conds.append( value != self.__tqs[ tqId ][ field ] )
+    return any( conds )
+
+  def match( self, tqMatchDict, numQueuesToGet = 1, negativeCond = None,
+             multiValueMatchFields = (), tagMatchFields = (), bannedJobMatchFields = (),
+             strictRequireMatchFields = () ):
+    """ Get the TQs that match a (checked) match dictionary, mimicking TaskQueueDB.__generateTQMatchSQL.
+        Returns a list of ( tqId, ownerDN, ownerGroup ) sorted by RAND() / Priority
+    """
+    with self.__lock:
+      candidates = self.__ownerFilter( tqMatchDict, set( self.__tqs ) )
+      tqs = self.__tqs
+
+      if 'CPUTime' in tqMatchDict:
+        maxCPU = max( self.__toList( tqMatchDict[ 'CPUTime' ] ) )
+        candidates = set( [ tqId for tqId in candidates if tqs[ tqId ][ 'CPUTime' ] <= maxCPU ] )
+      if 'Setup' in tqMatchDict:
+        setups = set( self.__toList( tqMatchDict[ 'Setup' ] ) )
+        candidates = set( [ tqId for tqId in candidates if tqs[ tqId ][ 'Setup' ] in setups ] )
+
+      for field in multiValueMatchFields:
+        tableField = "%ss" % field
+        if not candidates:
+          break
+        if field in tqMatchDict and tqMatchDict[ field ]:
+          values = self.__toList( tqMatchDict[ field ] )
+          if field in tagMatchFields:
+            if tqMatchDict[ field ] != '"Any"':
+              # All the TQ tags have to be provided by the resource
+              provided = set( values )
+              matching = set( [ tqId for tqId in candidates
+                                if self.__valuesOf( tableField, tqId ).issubset( provided ) ] )
+            else:
+              matching = set( candidates )
+            for tagField in tagMatchFields:
+              requiredTags = tqMatchDict.get( "Required%s" % tagField, '' )
+              if requiredTags:
+                required = set( self.__toList( requiredTags ) )
+                candidates = set( [ tqId for tqId in candidates
+                                    if required.issubset( self.__valuesOf( tableField, tqId ) ) ] )
+          else:
+            matching = self.__withAnyOf( tableField, values )
+          candidates = ( candidates & matching ) | self.__withoutValues( tableField, candidates )
+          if field in bannedJobMatchFields:
+            bannedField = "Banned%ss" % field
+            candidates = set( [ tqId for tqId in candidates
+                                if [ value for value in values if value not in self.__valuesOf( bannedField, tqId ) ] ] )
+        bannedValues = tqMatchDict.get( "Banned%s" % field )
+        if bannedValues:
+          bannedValues = self.__toList( bannedValues )
+          candidates = set( [ tqId for tqId in candidates
+                              if [ value for value in bannedValues if value not in self.__valuesOf( tableField, tqId ) ] ] )
+
+      for field in strictRequireMatchFields:
+        if field in tqMatchDict:
+          continue
+        candidates = self.__withoutValues( "%ss" % field, candidates )
+
+      if negativeCond:
+        if isinstance( negativeCond, dict ):
+          negativeCond = [ negativeCond ]
+        candidates = set( [ tqId for tqId in candidates
+                            if any( [ self.__negativeDictFilter( cD, tqId ) for cD in negativeCond ] ) ] )
+
+      weighted = []
+      for tqId in candidates:
+        tqData = tqs[ tqId ]
+        weighted.append( ( random.random() / max( tqData[ 'Priority' ], self.__minPriority ),
+                           ( tqId, tqData[ 'OwnerDN' ], tqData[ 'OwnerGroup' ] ) ) )
+
+    weighted.sort()
+    if numQueuesToGet:
+      weighted = weighted[:numQueuesToGet]
+    return [ tqTuple for _, tqTuple in weighted ]
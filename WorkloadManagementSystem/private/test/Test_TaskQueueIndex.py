@@ -0,0 +1,110 @@
+""" Test for the in-memory task queue match index
+"""
+
+import unittest
+
+from DIRAC import S_OK
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB, singleValueDefFields, multiValueDefFields, \
+                                                          multiValueMatchFields, tagMatchFields, \
+                                                          bannedJobMatchFields, strictRequireMatchFields
+from DIRAC.WorkloadManagementSystem.private.TaskQueueIndex import TaskQueueIndex
+
+class TaskQueueIndexTestCase( unittest.TestCase ):
+  """ Base class for the TaskQueueIndex test cases
+  """
+  def setUp( self ):
+    self.index = TaskQueueIndex( singleValueDefFields, multiValueDefFields )
+    self.baseDef = { 'OwnerDN' : '"/DN/user"', 'OwnerGroup' : '"user"', 'Setup' : '"Prod"', 'CPUTime' : 86400 }
+    self.baseMatch = { 'Setup' : '"Prod"', 'CPUTime' : 100000 }
+
+  def _addTQ( self, tqId, **kwargs ):
+    tqDef = dict( self.baseDef )
+    tqDef.update( kwargs )
+    self.index.addTaskQueue( tqId, tqDef )
+
+  def _match( self, **kwargs ):
+    matchDict = dict( self.baseMatch )
+    negativeCond = kwargs.pop( 'negativeCond', None )
+    if negativeCond:
+      # The negative conditions come unescaped from the Limiter, TaskQueueDB escapes them
+      tqDB = TaskQueueDB.__new__( TaskQueueDB )
+      tqDB._escapeString = lambda value: S_OK( '"%s"' % value )
+      negativeCond = tqDB._TaskQueueDB__escapeNegativeCond( negativeCond )[ 'Value' ]
+    matchDict.update( kwargs )
+    return sorted( [ tq[0] for tq in self.index.match( matchDict, numQueuesToGet = 0, negativeCond = negativeCond,
+                                                       multiValueMatchFields = multiValueMatchFields,
+                                                       tagMatchFields = tagMatchFields,
+                                                       bannedJobMatchFields = bannedJobMatchFields,
+                                                       strictRequireMatchFields = strictRequireMatchFields ) ] )
+
+class TaskQueueIndexMatch( TaskQueueIndexTestCase ):
+
+  def test_singleValues( self ):
+    self._addTQ( 1 )
+    self._addTQ( 2, CPUTime = 200000 )
+    self._addTQ( 3, Setup = '"Cert"' )
+    self.assertEqual( self._match(), [ 1 ] )
+    self.assertEqual( self._match( CPUTime = 300000 ), [ 1, 2 ] )
+    self.assertEqual( self._match( OwnerGroup = '"other"' ), [] )
+
+  def test_sites( self ):
+    self._addTQ( 1, Sites = [ '"Site.A"' ] )
+    self._addTQ( 2, Sites = [ '"Site.B"', '"Site.C"' ] )
+    self._addTQ( 3 )
+    self._addTQ( 4, BannedSites = [ '"Site.A"' ] )
+    self.assertEqual( self._match( Site = '"Site.A"' ), [ 1, 3 ] )
+    self.assertEqual( self._match( Site = '"Site.C"' ), [ 2, 3, 4 ] )
+    self.assertEqual( self._match(), [ 1, 2, 3, 4 ] )
+    self.assertEqual( self._match( Site = '"Site.C"', BannedSite = [ '"Site.B"' ] ), [ 3, 4 ] )
+
+  def test_strictFields( self ):
+    self._addTQ( 1, Platforms = [ '"x86_64"' ] )
+    self._addTQ( 2 )
+    self.assertEqual( self._match(), [ 2 ] )
+    self.assertEqual( self._match( Platform = '"x86_64"' ), [ 1, 2 ] )
+    self.assertEqual( self._match( Platform = '"i686"' ), [ 2 ] )
+
+  def test_tags( self ):
+    self._addTQ( 1, Tags = [ '"MultiProcessor"' ] )
+    self._addTQ( 2, Tags = [ '"MultiProcessor"', '"GPU"' ] )
+    self._addTQ( 3 )
+    self.assertEqual( self._match(), [ 3 ] )
+    self.assertEqual( self._match( Tag = [ '"MultiProcessor"' ] ), [ 1, 3 ] )
+    self.assertEqual( self._match( Tag = [ '"MultiProcessor"', '"GPU"' ] ), [ 1, 2, 3 ] )
+    self.assertEqual( self._match( Tag = [ '"MultiProcessor"', '"GPU"' ], RequiredTag = [ '"GPU"' ] ), [ 2 ] )
+
+  def test_negativeCond( self ):
+    self._addTQ( 1, JobTypes = [ '"User"' ] )
+    self._addTQ( 2, JobTypes = [ '"MCSimulation"' ] )
+    self._addTQ( 3, JobTypes = [ '"User"' ], OwnerGroup = '"other"' )
+    self.assertEqual( self._match( negativeCond = { 'JobType' : [ 'User' ] } ), [ 2 ] )
+    self.assertEqual( self._match( negativeCond = { 'JobType' : 'User' } ), [ 2 ] )
+    self.assertEqual( self._match( negativeCond = [ { 'JobType' : 'User' },
+                                                    { 'JobType' : 'MCSimulation' } ] ), [ 1, 2, 3 ] )
+    # Running limits on a single value field, the conditions of a dict all have to hold
+    self.assertEqual( self._match( negativeCond = { 'OwnerGroup' : [ 'user' ] } ), [ 3 ] )
+    self.assertEqual( self._match( negativeCond = { 'JobType' : 'User', 'OwnerGroup' : [ 'other' ] } ), [ 1, 2 ] )
+    self.assertEqual( self._match( negativeCond = {} ), [ 1, 2, 3 ] )
+
+  def test_updates( self ):
+    self._addTQ( 1 )
+    self._addTQ( 2 )
+    self.index.removeTaskQueue( 1 )
+    self.assertEqual( self._match(), [ 2 ] )
+    tqDef = dict( self.baseDef )
+    tqDef[ 'Priority' ] = 5
+    self.index.load( { 3 : tqDef } )
+    self.assertEqual( self._match(), [ 3 ] )
+    self.index.setPriorities( { 3 : 10 } )
+    self.assertEqual( len( self.index ), 1 )
+    self.assertTrue( 3 in self.index )
+
+
+#############################################################################
+# Test Suite run
+#############################################################################
+
+if __name__ == '__main__':
+  suite = unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueIndexTestCase )
+  suite.addTest( unittest.defaultTestLoader.loadTestsFromTestCase( TaskQueueIndexMatch ) )
+  testResult = unittest.TextTestRunner( verbosity = 2 ).run( suite )